@@ -1,11 +1,49 @@
 # app/api/dependencies.py
 """Shared dependencies for API routes"""
-from fastapi import Depends
+from fastapi import Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models.database import get_db, get_mongo, get_redis
+import redis.asyncio as aioredis
+from app.models.database import get_db
+from app.storage.registry import ConnectionRegistry
+from app.storage.mongodb import MongoDBStorage
+from app.storage.s3_handler import S3Handler
+from app.storage.lake import ParquetLake
+from app.core.etl.pipeline import ETLPipeline
+from app.core.query.llm_translator import LLMQueryTranslator, llm_translator
 
 
 async def get_current_user():
     """Get current authenticated user (placeholder)"""
     # TODO: Implement authentication
     return {"user_id": "anonymous"}
+
+
+def get_registry(request: Request) -> ConnectionRegistry:
+    """Connection registry created in the app lifespan"""
+    return request.app.state.registry
+
+
+def get_mongo(registry: ConnectionRegistry = Depends(get_registry)) -> MongoDBStorage:
+    return registry.mongo
+
+
+def get_redis(registry: ConnectionRegistry = Depends(get_registry)) -> aioredis.Redis:
+    return registry.redis
+
+
+def get_s3(registry: ConnectionRegistry = Depends(get_registry)) -> S3Handler:
+    return registry.s3
+
+
+def get_lake(registry: ConnectionRegistry = Depends(get_registry)) -> ParquetLake:
+    return registry.lake
+
+
+def get_pipeline(registry: ConnectionRegistry = Depends(get_registry)) -> ETLPipeline:
+    """ETL pipeline wired to the shared pooled clients"""
+    return ETLPipeline(mongo=registry.mongo, s3=registry.s3, lake=registry.lake, redis=registry.redis)
+
+
+def get_translator() -> LLMQueryTranslator:
+    """NL → query translator (overridden with a fake model client in tests)"""
+    return llm_translator
@@ -0,0 +1,184 @@
+# app/api/routes/admin.py
+
+from fastapi import APIRouter, HTTPException, Depends, Query, BackgroundTasks
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import structlog
+
+from app.models.database import get_db
+from app.models.query_models import IndexCandidate
+from app.models.source_models import BackfillJob, TieringState, TieringStateDB
+from app.core.etl.backfill import backfill_engine
+from app.core.query.index_advisor import index_advisor
+from app.core.query.rollups import rollups
+from app.storage.tiering import tiering
+from app.storage.registry import ConnectionRegistry, get_registry as current_registry
+from app.api.dependencies import get_registry
+
+router = APIRouter()
+logger = structlog.get_logger()
+
+
+async def _build_index(candidate_id: int):
+    """Background build with its own session (the request's is closed by then)."""
+    registry = current_registry()
+    async with registry.session_factory() as session:
+        await index_advisor.build(session, registry.engine, registry.mongo_db, candidate_id)
+
+
+async def _run_backfill(job_id: int):
+    await backfill_engine.run(current_registry(), job_id)
+
+
+# ---------------------------------------------------------
+# GET /admin/indexes — ranked index candidates
+# ---------------------------------------------------------
+@router.get("/indexes", response_model=List[IndexCandidate])
+async def list_indexes(
+    source_id: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    List index candidates learned from /query traffic, best first.
+    Score = (filter + sort hits) × selectivity from field statistics.
+    """
+    return await index_advisor.candidates(db, source_id)
+
+
+# ---------------------------------------------------------
+# POST /admin/indexes/{id}/approve — build online
+# ---------------------------------------------------------
+@router.post("/indexes/{candidate_id}/approve", response_model=IndexCandidate)
+async def approve_index(
+    candidate_id: int,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Approve a candidate. The index is built in the background
+    (CREATE INDEX CONCURRENTLY / background Mongo build).
+    """
+    row = await index_advisor.get(db, candidate_id)
+    if row is None:
+        raise HTTPException(404, f"Index candidate {candidate_id} not found")
+    if not await index_advisor.claim(db, candidate_id):
+        raise HTTPException(409, f"Index candidate {candidate_id} is already {row.status}")
+
+    background_tasks.add_task(_build_index, candidate_id)
+    return IndexCandidate.model_validate(row)
+
+
+# ---------------------------------------------------------
+# DELETE /admin/indexes/{id} — drop a built index
+# ---------------------------------------------------------
+@router.delete("/indexes/{candidate_id}", response_model=IndexCandidate)
+async def drop_index(
+    candidate_id: int,
+    db: AsyncSession = Depends(get_db),
+    registry: ConnectionRegistry = Depends(get_registry)
+):
+    """
+    Drop the index built for a candidate (DROP INDEX CONCURRENTLY in Postgres).
+    """
+    row = await index_advisor.drop(db, registry.engine, registry.mongo_db, candidate_id)
+    if row is None:
+        raise HTTPException(404, f"Index candidate {candidate_id} not found")
+    return IndexCandidate.model_validate(row)
+
+
+# ---------------------------------------------------------
+# POST /admin/sources/{source_id}/backfill — re-derive records
+# ---------------------------------------------------------
+@router.post("/sources/{source_id}/backfill", response_model=BackfillJob)
+async def start_backfill(
+    source_id: str,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Re-run the current parser over every archived file of a source into a
+    new table generation, swapped in when complete. An unfinished job for
+    the source is resumed from its checkpoint instead of starting over.
+    """
+    try:
+        job = await backfill_engine.start(db, source_id)
+    except LookupError as e:
+        raise HTTPException(404, str(e))
+
+    background_tasks.add_task(_run_backfill, job.id)
+    return BackfillJob.model_validate(job)
+
+
+# ---------------------------------------------------------
+# GET /admin/backfill — job progress
+# ---------------------------------------------------------
+@router.get("/backfill", response_model=List[BackfillJob])
+async def list_backfills(
+    source_id: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    return [BackfillJob.model_validate(job) for job in await backfill_engine.list(db, source_id)]
+
+
+@router.get("/backfill/{job_id}", response_model=BackfillJob)
+async def get_backfill(job_id: int, db: AsyncSession = Depends(get_db)):
+    job = await backfill_engine.get(db, job_id)
+    if job is None:
+        raise HTTPException(404, f"Backfill job {job_id} not found")
+    return BackfillJob.model_validate(job)
+
+
+# ---------------------------------------------------------
+# POST /admin/sources/{source_id}/lake/compact — merge small lake files
+# ---------------------------------------------------------
+@router.post("/sources/{source_id}/lake/compact")
+async def compact_lake(source_id: str, registry: ConnectionRegistry = Depends(get_registry)):
+    """Run Parquet lake compaction for one source now (it also runs periodically)."""
+    if not registry.lake.available:
+        raise HTTPException(501, "Parquet lake requires pyarrow")
+    merged = await registry.lake.compact(source_id, registry.engine)
+    return {"source_id": source_id, "files_merged": merged}
+
+
+# ---------------------------------------------------------
+# Hot/cold tiering
+# ---------------------------------------------------------
+async def _run_tiering(source_id: str):
+    try:
+        await tiering.tier(current_registry(), source_id)
+    except Exception as e:
+        logger.error("Tiering failed", exc_info=e, source_id=source_id)
+
+
+@router.post("/sources/{source_id}/tier", status_code=202)
+async def start_tiering(source_id: str, background_tasks: BackgroundTasks):
+    """Move records past the source's tiering threshold to the cold tier now."""
+    if tiering.threshold_days(source_id) is None:
+        raise HTTPException(404, f"No tiering policy for source_id={source_id}")
+    background_tasks.add_task(_run_tiering, source_id)
+    return {"source_id": source_id, "status": "scheduled"}
+
+
+@router.get("/tiering", response_model=List[TieringState])
+async def list_tiering(db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(TieringStateDB).order_by(TieringStateDB.source_id))
+    return [TieringState.model_validate(s) for s in result.scalars().all()]
+
+
+# ---------------------------------------------------------
+# Rollups
+# ---------------------------------------------------------
+@router.get("/rollups")
+async def list_rollups():
+    return [spec._asdict() for spec in rollups.specs]
+
+
+@router.post("/rollups/{name}/rebuild")
+async def rebuild_rollup(name: str, registry: ConnectionRegistry = Depends(get_registry)):
+    """Recompute a rollup from the hot and cold tiers (e.g. after its definition changed)."""
+    spec = rollups.get(name)
+    if spec is None:
+        raise HTTPException(404, f"Rollup {name} not found")
+    written = await rollups.rebuild(registry, spec)
+    return {"rollup": name, "rows": written}
@@ -1,17 +1,51 @@
 # app/api/routes/query.py
 
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text as sql_text
-from typing import Any, Dict, List, Optional
+from sqlalchemy import select, desc, text as sql_text
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
 import structlog
 
 from app.models.database import get_db
 from app.models.query_models import (
+    AggregateRequest,
+    AggregateResponse,
+    AsyncQueryResponse,
+    NLBatchRequest,
+    NLQueryRequest,
+    NLQueryResponse,
+    PaginatedQueryResponse,
+    QueryExecution,
+    QueryJobDB,
     QueryRequest,
     QueryResponse,
+    QueryStatus,
 )
+from app.models.schema_models import SchemaVersionDB, SchemaResponse
 from app.storage.mongodb import MongoDBStorage
+from app.storage.mongo_buckets import bucket_layout
+from app.api.dependencies import get_mongo, get_registry, get_translator
+from app.storage.registry import ConnectionRegistry
+from app.storage.tiering import tiering
+from app.storage.redis_cache import query_cache
+from app.config import settings
+from app.storage.postgres import sanitize_column_name, migrations
+from app.storage.hybrid import hybrid_layout
+from app.core.schema.migration import EXTRAS_COLUMN
+from app.core.schema.versioning import projector
+from app.core.query.index_advisor import index_advisor
+from app.core.query.dsl import (
+    compile_aggregate_sql, compile_mongo, compile_mongo_group, compile_mongo_pipeline, compile_sql,
+    field_types, matches, mongo_group_row, parse_filters, typed_conditions, validate_aggregates,
+    validate_fields
+)
+from app.core.query.async_jobs import query_jobs
+from app.core.query.result_normalizer import build_response, render
+from app.core.query.rollups import rollups
+from app.core.query.llm_translator import LLMQueryTranslator, Translation
+from app.core.schema.statistics import StatisticsStore
+from app.core.query.query_executor import QueryExecutor, QueryRejected
 
 router = APIRouter()
 logger = structlog.get_logger()
@@ -23,92 +57,589 @@ logger = structlog.get_logger()
 @router.post("/", response_model=QueryResponse)
 async def run_query(
     request: QueryRequest,
+    http_request: Request,
     use_mongo: bool = Query(False),
-    db: AsyncSession = Depends(get_db)
+    shape: str = Query("rows", regex="^(rows|columns)$", description="columns → {columns, rows}"),
+    db: AsyncSession = Depends(get_db),
+    mongo: MongoDBStorage = Depends(get_mongo),
+    registry: ConnectionRegistry = Depends(get_registry)
 ):
     """
-    Execute a simple structured query on the parsed records.
+    Cached front of `execute_query`. The key covers the normalized request,
+    backend, schema version and the source's write watermark, so any
+    write makes older entries unreachable (no deletes needed).
+    """
+    accept = http_request.headers.get("accept-encoding")
+    if not settings.QUERY_CACHE_ENABLED:
+        response = await execute_query(request, use_mongo, db, mongo, registry)
+        return render({"count": response.count, "records": response.records}, accept, shape)
+
+    backend = "mongodb" if use_mongo else "postgresql"
+    try:
+        # read before executing: a write landing meanwhile moves the key on
+        key = await query_cache.key(registry.redis, request.source, request.model_dump(), backend)
+    except Exception as e:
+        logger.warning("Query cache unavailable", error=str(e))
+        response = await execute_query(request, use_mongo, db, mongo, registry)
+        return render({"count": response.count, "records": response.records}, accept, shape)
+
+    cached = await query_cache.get(registry.redis, request.source, key)
+    if cached is not None:
+        index_advisor.record(request.source, backend, (request.filters or {}).keys())
+        return render(cached, accept, shape)
+
+    response = await execute_query(request, use_mongo, db, mongo, registry)
+    payload = {"count": response.count, "records": response.records}
+    await query_cache.set(registry.redis, request.source, key, payload)
+    return render(payload, accept, shape)
+
+
+async def execute_query(
+    request: QueryRequest,
+    use_mongo: bool,
+    db: AsyncSession,
+    mongo: MongoDBStorage,
+    registry: ConnectionRegistry
+) -> QueryResponse:
+    """All rows of `iter_query` as one response."""
+    rows = []
+    async for chunk in iter_query(request, use_mongo, db, mongo, registry, request.limit or 100):
+        rows.extend(chunk)
+    return build_response(QueryResponse, rows, count=len(rows), records=rows)
+
+
+async def iter_query(
+    request: QueryRequest,
+    use_mongo: bool,
+    db: AsyncSession,
+    mongo: MongoDBStorage,
+    registry: ConnectionRegistry,
+    chunk_rows: int
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Execute a structured query on the parsed records, yielding the result
+    rows `chunk_rows` at a time.
 
     - If use_mongo=True → query MongoDB parsed documents
     - Else → query Postgres dynamic table for the source_id
 
     QueryRequest:
         source: str          → source_id
-        fields: List[str]    → which fields to return
-        filters: dict        → exact match filters
+        fields: List[str]    → which fields to return (projection)
+        filters: dict        → {field: value} equality, or typed operators
+                               {field: {"gt"|"lt"|"in"|"between"|"prefix"|"is_null"...}}
+        sort: list           → [{"field", "direction"}], multi-key
         limit: int           → result limit
+        target_version: int  → project records to this schema version
+        ingested_from/to     → ingestion-time window (partition pruning)
+
+    Field names are validated against the latest (cached) schema, and
+    filters, sort and projection compile to parameterized SQL or a Mongo
+    find/aggregation, so all of them run inside the database. Postgres
+    rows come from a server-side cursor, so only one chunk is held here.
+
+    Records past the source's tiering watermark live in cold Parquet
+    files; they are read (after the hot results, filtered in process)
+    only when the window reaches below the watermark.
     """
 
     source_id = request.source
-    filters = request.filters or {}
     limit = request.limit or 100
     fields = request.fields or []
+    sort = request.sort or []
+    target_version = request.target_version
+    # projecting to another version needs the full stored record
+    projected = [] if target_version else fields
+
+    try:
+        types = await field_types(db, source_id)
+        conditions = parse_filters(request.filters)
+        validate_fields(types, [c.field for c in conditions] + [k.field for k in sort] + projected)
+        conditions = typed_conditions(conditions, types)
+    except LookupError as e:
+        raise HTTPException(404, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    index_advisor.record(
+        source_id,
+        "mongodb" if use_mongo else "postgresql",
+        [c.field for c in conditions],
+        sort_fields=[k.field for k in sort]
+    )
+
+    # Hot tier only holds rows at/after the watermark; older ones are cold
+    watermark = await tiering.watermark(db, source_id)
+    fan_out = tiering.needs_cold(watermark, request.ingested_from)
+    hot_from = watermark if fan_out else request.ingested_from
+    equality = {c.field: c.value for c in conditions if c.op == "eq"}
+
+    async def cold_rows(wanted: int) -> AsyncIterator[Dict[str, Any]]:
+        """Up to `wanted` cold rows matching the filters"""
+        if not fan_out or wanted <= 0:
+            return
+        async for cold in tiering.cold_rows(
+            registry.cold, source_id, watermark, equality, request.ingested_from, request.ingested_to
+        ):
+            if not matches(conditions, cold["row"], sanitize_column_name):
+                continue
+            yield cold
+            wanted -= 1
+            if wanted <= 0:
+                break
 
     # --------------------------------------------------------
     # MONGO MODE (simplest & recommended for your ETL)
     # --------------------------------------------------------
     if use_mongo:
         try:
-            mongo = MongoDBStorage()
             collection = f"{source_id}_records"
+            window = {}
+            if hot_from:
+                window["$gte"] = hot_from
+            if request.ingested_to:
+                window["$lt"] = request.ingested_to
 
-            # Build Mongo filters
-            mongo_filter = {f"record.{k}": v for k, v in filters.items()}
+            # Buckets are pruned by their min/max summaries, then unwound server-side
+            if bucket_layout.enabled_for(source_id):
+                prefilter = bucket_layout.document_query(equality, hot_from, request.ingested_to)
+                cursor = mongo.iter_query(
+                    collection,
+                    pipeline=compile_mongo_pipeline(conditions, sort, projected, prefilter, window, limit)
+                )
+            else:
+                cursor = mongo.iter_query(collection, limit=limit, **compile_mongo(conditions, sort, projected, window))
 
-            docs = await mongo.db[collection].find(mongo_filter).limit(limit).to_list(length=limit)
+            async def documents() -> AsyncIterator[Dict[str, Any]]:
+                hot = 0
+                async for doc in cursor:
+                    hot += 1
+                    yield doc
+                async for cold in cold_rows(limit - hot):
+                    row = cold["row"]
+                    row.pop("ingested_at", None)
+                    yield {"schema_version": cold["schema_version"], "record": row}
 
-            results = []
-            for d in docs:
-                rec = d.get("record", {})
+            async for docs in _chunks(documents(), chunk_rows):
+                if target_version:
+                    records = await projector.project_documents(db, source_id, docs, target_version)
+                else:
+                    records = [d.get("record", {}) for d in docs]
                 if fields:
-                    rec = {k: rec.get(k) for k in fields}
-                results.append(rec)
-
-            return QueryResponse(count=len(results), records=results)
+                    records = [{k: rec.get(k) for k in fields} for rec in records]
+                yield records
 
+        except LookupError as e:
+            raise HTTPException(404, str(e))
         except Exception as e:
             logger.error("Mongo query failed", exc_info=e)
             raise HTTPException(500, f"MongoDB query failed: {str(e)}")
+        return
 
     # --------------------------------------------------------
     # POSTGRES MODE (query dynamic tables)
     # --------------------------------------------------------
     table_name = f"data_{source_id}"
 
-    try:
-        # Build SELECT clause
-        if fields:
-            select_cols = ", ".join(f'"{f}"' for f in fields)
-        else:
-            select_cols = "*"
-
-        # Build WHERE clause
-        where_clauses = []
-        params = {}
+    async def finish(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # rows are keyed by column; answer with the requested field names
+        if projected:
+            rows = [{f: r.get(sanitize_column_name(f)) for f in fields} for r in rows]
 
-        for i, (key, val) in enumerate(filters.items()):
-            param_name = f"p{i}"
-            where_clauses.append(f'"{key}" = :{param_name}')
-            params[param_name] = val
+        if target_version:
+            rows = await projector.project_rows(
+                db, source_id, rows, target_version, source_key=sanitize_column_name
+            )
+            if fields:
+                rows = [{k: r.get(k) for k in fields} for r in rows]
+        return rows
 
-        where_sql = " AND ".join(where_clauses)
-        if where_sql:
-            where_sql = "WHERE " + where_sql
+    try:
+        # Hybrid tables keep sparse fields in the extras JSONB column
+        columns = await migrations.columns(db.bind, table_name) or {}
+        hybrid = EXTRAS_COLUMN in columns
+        # fields mid-promotion are read from both places
+        promoting = await hybrid_layout.promoting(db, table_name) if hybrid else set()
 
-        query_sql = f"""
-            SELECT {select_cols}
-            FROM "{table_name}"
-            {where_sql}
-            LIMIT :limit
-        """
+        # Bounds on the partition key let the planner skip partitions
+        where, params = [], {}
+        if hot_from:
+            where.append('"ingested_at" >= :ingested_from')
+            params["ingested_from"] = hot_from
+        if request.ingested_to:
+            where.append('"ingested_at" < :ingested_to')
+            params["ingested_to"] = request.ingested_to
 
-        params["limit"] = limit
+        query_sql, params = compile_sql(
+            table_name,
+            conditions,
+            sort,
+            projected,
+            set(columns),
+            types,
+            sanitize_column_name,
+            promoting=promoting,
+            where=where,
+            params=params,
+            limit=limit
+        )
 
-        result = await db.execute(sql_text(query_sql), params)
-        rows = [dict(r) for r in result.mappings().all()]
+        hot = 0
+        result = await db.stream(sql_text(query_sql).execution_options(yield_per=chunk_rows), params)
+        async for part in result.mappings().partitions(chunk_rows):
+            rows = [dict(r) for r in part]
+            if hybrid:
+                rows = [hybrid_layout.flatten(r) for r in rows]
+            hot += len(rows)
+            yield await finish(rows)
 
-        return QueryResponse(count=len(rows), records=rows)
+        async for rows in _chunks((cold["row"] async for cold in cold_rows(limit - hot)), chunk_rows):
+            yield await finish(rows)
 
+    except LookupError as e:
+        raise HTTPException(404, str(e))
     except Exception as e:
         logger.error("Postgres query failed", exc_info=e)
         raise HTTPException(500, f"PostgreSQL query failed: {str(e)}")
+
+
+async def _chunks(items: AsyncIterator[Dict[str, Any]], size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    chunk = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ------------------------------------------------------------
+# POST /query/async — run a query in the background
+# ------------------------------------------------------------
+@router.post("/async", response_model=AsyncQueryResponse, status_code=202)
+async def submit_async_query(
+    request: QueryRequest,
+    use_mongo: bool = Query(False),
+    db: AsyncSession = Depends(get_db),
+    registry: ConnectionRegistry = Depends(get_registry)
+):
+    """
+    Queue `request` and return its id at once. The query runs like
+    POST /query (bounded concurrency, own session); poll GET /query/{id}
+    for status and pages of results.
+    """
+    backend = "mongodb" if use_mongo else "postgresql"
+
+    def run(session: AsyncSession, chunk_rows: int) -> AsyncIterator[List[Dict[str, Any]]]:
+        return iter_query(request, use_mongo, session, registry.mongo, registry, chunk_rows)
+
+    job = await query_jobs.submit(
+        db, registry.session_factory, registry.s3.store, request.source, backend, request.model_dump(), run
+    )
+    return _job_response(job)
+
+
+@router.get("/{query_id}", response_model=AsyncQueryResponse)
+async def get_async_query(
+    query_id: str,
+    page: int = Query(1, ge=1, description="Result page (one spooled chunk)"),
+    db: AsyncSession = Depends(get_db),
+    registry: ConnectionRegistry = Depends(get_registry)
+):
+    job = await query_jobs.get(db, query_id)
+    if job is None:
+        raise HTTPException(404, f"Query job {query_id} not found")
+
+    results = None
+    if job.status == "completed":
+        try:
+            rows = await query_jobs.read_chunk(registry.s3.store, job, page)
+        except LookupError as e:
+            raise HTTPException(404, str(e))
+        results = PaginatedQueryResponse(
+            page=page,
+            page_size=len(rows),
+            total_count=job.result_count,
+            next_cursor=str(page + 1) if page < job.chunks else None,
+            results=rows
+        )
+    return _job_response(job, results)
+
+
+@router.post("/{query_id}/cancel", response_model=AsyncQueryResponse)
+async def cancel_async_query(query_id: str, db: AsyncSession = Depends(get_db)):
+    try:
+        job = await query_jobs.cancel(db, query_id)
+    except LookupError as e:
+        raise HTTPException(404, str(e))
+    except ValueError as e:
+        raise HTTPException(409, str(e))
+    return _job_response(job)
+
+
+def _job_response(job: QueryJobDB, results: Optional[PaginatedQueryResponse] = None) -> AsyncQueryResponse:
+    started = job.started_at.isoformat() if job.started_at else None
+    duration_ms = None
+    if job.started_at:
+        duration_ms = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds() * 1000
+
+    execution = None
+    if job.status == "completed":
+        execution = QueryExecution(
+            query=job.request, executed_at=started, duration_ms=duration_ms, result_count=job.result_count
+        )
+    return AsyncQueryResponse(
+        id=job.id,
+        status=QueryStatus(status=job.status, message=job.error, executed_at=started, duration_ms=duration_ms),
+        execution=execution,
+        results=results
+    )
+
+
+# ------------------------------------------------------------
+# POST /query/aggregate — GROUP BY pushed down, or read from a rollup
+# ------------------------------------------------------------
+@router.post("/aggregate", response_model=AggregateResponse)
+async def run_aggregate(
+    request: AggregateRequest,
+    http_request: Request,
+    use_mongo: bool = Query(False),
+    shape: str = Query("rows", regex="^(rows|columns)$", description="columns → {columns, rows}"),
+    db: AsyncSession = Depends(get_db),
+    mongo: MongoDBStorage = Depends(get_mongo)
+):
+    """
+    count/sum/avg/min/max per group (and per time bucket of ingested_at).
+
+    A declared rollup covering the request answers it from pre-aggregated
+    rows; otherwise the aggregation runs inside the database (GROUP BY or
+    a $group pipeline) and only the groups come back. Rollups also cover
+    rows tiered out since; direct aggregation reads the hot tier from the
+    tiering watermark on, so a window reaching below it is rejected
+    unless a rollup answers it.
+    """
+    source_id = request.source
+    try:
+        types = await field_types(db, source_id)
+        conditions = parse_filters(request.filters)
+        validate_fields(types, [c.field for c in conditions])
+        validate_aggregates(types, request.group_by, request.aggregates)
+        conditions = typed_conditions(conditions, types)
+    except LookupError as e:
+        raise HTTPException(404, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    spec = rollups.match(request, conditions)
+    if spec is not None:
+        groups = await rollups.answer(db, spec, request, conditions)
+        return render(
+            {"count": len(groups), "groups": groups, "answered_by": f"rollup:{spec.name}"},
+            http_request.headers.get("accept-encoding"), shape, rows_key="groups"
+        )
+
+    # hot rows below the watermark are already counted in the cold tier
+    watermark = await tiering.watermark(db, source_id)
+    if tiering.needs_cold(watermark, request.ingested_from):
+        raise HTTPException(
+            400,
+            f"Records of {source_id} ingested before {watermark.isoformat()} are in the cold tier; "
+            "set ingested_from at or after it, or declare a rollup covering this aggregation"
+        )
+
+    backend = "mongodb" if use_mongo else "postgresql"
+    index_advisor.record(source_id, backend, [c.field for c in conditions] + list(request.group_by))
+
+    if use_mongo:
+        window = {}
+        if request.ingested_from:
+            window["$gte"] = request.ingested_from
+        if request.ingested_to:
+            window["$lt"] = request.ingested_to
+        bucketed = bucket_layout.enabled_for(source_id)
+        equality = {c.field: c.value for c in conditions if c.op == "eq"}
+        pipeline = compile_mongo_group(
+            conditions,
+            request.group_by,
+            request.aggregates,
+            time_bucket=request.time_bucket,
+            window=window,
+            bucketed=bucketed,
+            prefilter=bucket_layout.document_query(equality, request.ingested_from, request.ingested_to)
+            if bucketed else None,
+            limit=request.limit
+        )
+        try:
+            groups = [mongo_group_row(d) async for d in mongo.iter_query(f"{source_id}_records", pipeline=pipeline)]
+        except Exception as e:
+            logger.error("Mongo aggregation failed", exc_info=e)
+            raise HTTPException(500, f"MongoDB aggregation failed: {str(e)}")
+        return render(
+            {"count": len(groups), "groups": groups, "answered_by": backend},
+            http_request.headers.get("accept-encoding"), shape, rows_key="groups"
+        )
+
+    table_name = f"data_{source_id}"
+    try:
+        columns = await migrations.columns(db.bind, table_name) or {}
+        promoting = await hybrid_layout.promoting(db, table_name) if EXTRAS_COLUMN in columns else set()
+        where, params = [], {}
+        if request.ingested_from:
+            where.append('"ingested_at" >= :ingested_from')
+            params["ingested_from"] = request.ingested_from
+        if request.ingested_to:
+            where.append('"ingested_at" < :ingested_to')
+            params["ingested_to"] = request.ingested_to
+
+        sql, params = compile_aggregate_sql(
+            table_name,
+            conditions,
+            request.group_by,
+            request.aggregates,
+            set(columns),
+            types,
+            sanitize_column_name,
+            time_bucket=request.time_bucket,
+            promoting=promoting,
+            where=where,
+            params=params,
+            limit=request.limit
+        )
+        result = await db.execute(sql_text(sql), params)
+        groups = [dict(r) for r in result.mappings().all()]
+    except Exception as e:
+        logger.error("Postgres aggregation failed", exc_info=e)
+        raise HTTPException(500, f"PostgreSQL aggregation failed: {str(e)}")
+    return render(
+        {"count": len(groups), "groups": groups, "answered_by": backend},
+        http_request.headers.get("accept-encoding"), shape, rows_key="groups"
+    )
+
+
+# ------------------------------------------------------------
+# POST /query/nl — Translate a question, then execute it
+# ------------------------------------------------------------
+@router.post("/nl", response_model=NLQueryResponse)
+async def run_nl_query(
+    request: NLQueryRequest,
+    db: AsyncSession = Depends(get_db),
+    registry: ConnectionRegistry = Depends(get_registry),
+    translator: LLMQueryTranslator = Depends(get_translator)
+):
+    """
+    Translate a natural-language question against the source's latest
+    schema and run it. Literals are pulled out as bind parameters first,
+    so questions differing only in values reuse one cached translation.
+    """
+    if request.target_db not in ("postgresql", "mongodb"):
+        raise HTTPException(400, f"Unsupported target_db: {request.target_db}")
+
+    schema, field_stats = await _nl_context(db, request.source)
+
+    try:
+        translation = await translator.translate(
+            request.question, schema, request.target_db, redis=registry.redis, field_stats=field_stats
+        )
+    except ValueError as e:
+        raise HTTPException(422, f"Query translation failed: {e}")
+    except Exception as e:
+        raise HTTPException(502, f"Query translation failed: {e}")
+
+    records = await _execute_translation(translation, request.source, request.target_db, db, registry)
+
+    return NLQueryResponse(
+        question=request.question,
+        query=translation.query,
+        params=translation.params,
+        cached=translation.cached,
+        count=len(records),
+        records=records
+    )
+
+
+# ------------------------------------------------------------
+# POST /query/nl/batch — Several questions, one model call
+# ------------------------------------------------------------
+@router.post("/nl/batch", response_model=List[NLQueryResponse])
+async def run_nl_batch(
+    request: NLBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    registry: ConnectionRegistry = Depends(get_registry),
+    translator: LLMQueryTranslator = Depends(get_translator)
+):
+    """
+    Translate a batch of questions for one source — cache misses go to
+    the model together, under one token budget — then run each.
+    """
+    if request.target_db not in ("postgresql", "mongodb"):
+        raise HTTPException(400, f"Unsupported target_db: {request.target_db}")
+    if not request.questions or len(request.questions) > settings.NL_BATCH_MAX_QUESTIONS:
+        raise HTTPException(400, f"Send between 1 and {settings.NL_BATCH_MAX_QUESTIONS} questions")
+
+    schema, field_stats = await _nl_context(db, request.source)
+
+    try:
+        translations = await translator.translate_many(
+            request.questions, schema, request.target_db, redis=registry.redis, field_stats=field_stats
+        )
+    except ValueError as e:
+        raise HTTPException(422, f"Query translation failed: {e}")
+    except Exception as e:
+        raise HTTPException(502, f"Query translation failed: {e}")
+
+    responses = []
+    for question, translation in zip(request.questions, translations):
+        records = await _execute_translation(translation, request.source, request.target_db, db, registry)
+        responses.append(NLQueryResponse(
+            question=question,
+            query=translation.query,
+            params=translation.params,
+            cached=translation.cached,
+            count=len(records),
+            records=records
+        ))
+    return responses
+
+
+async def _nl_context(db: AsyncSession, source_id: str):
+    """Latest schema (404 if none) and the field statistics used for pruning."""
+    result = await db.execute(
+        select(SchemaVersionDB)
+        .where(SchemaVersionDB.source_id == source_id)
+        .order_by(desc(SchemaVersionDB.version))
+        .limit(1)
+    )
+    row = result.scalars().first()
+    if row is None:
+        raise HTTPException(404, f"No schema found for source_id={source_id}")
+    schema = SchemaResponse(source_id=row.source_id, current_version=row.version, schema=row.schema)
+
+    stats = await StatisticsStore().get(db, source_id)
+    return schema, (stats.summary or {}).get("fields") if stats else None
+
+
+async def _execute_translation(
+    translation: Translation,
+    source_id: str,
+    target_db: str,
+    db: AsyncSession,
+    registry: ConnectionRegistry
+) -> List[Dict[str, Any]]:
+    try:
+        return await QueryExecutor().execute(
+            translation.query,
+            source_id,
+            target_db,
+            db,
+            mongo_db=registry.mongo_db,
+            params=translation.params
+        )
+    except QueryRejected as e:
+        raise HTTPException(422, {"error": str(e), "query": translation.query, "plan": e.plan})
+    except TimeoutError as e:
+        raise HTTPException(504, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except Exception as e:
+        raise HTTPException(500, f"Query execution failed: {e}")
@@ -1,97 +1,409 @@
 # app/api/routes/records.py
 
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import JSONResponse, StreamingResponse
-from typing import Optional, Dict, Any, List
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text as sql_text
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
+from datetime import datetime
 import csv
+import json
 from io import StringIO
 import structlog
 
+from bson import ObjectId
+from bson.errors import InvalidId
+
 from app.storage.mongodb import MongoDBStorage
-from app.models.query_models import QueryResponse
+from app.storage.mongo_buckets import bucket_layout
+from app.storage.lake import ParquetLake, export_schema, stream_ipc
+from app.storage.hybrid import hybrid_layout
+from app.storage.postgres import PostgresStorage, migrations, sanitize_column_name
+from app.storage.registry import ConnectionRegistry
+from app.storage.tiering import tiering
+from app.api.dependencies import get_mongo, get_lake, get_registry
+from app.models.database import get_db
+from app.models.query_models import PaginatedQueryResponse
+from app.core.query.result_normalizer import render
+from app.core.query.pagination import PageCursor, decode_cursor, encode_cursor
+from app.core.schema.migration import EXTRAS_COLUMN
+from app.core.schema.versioning import projector
 
 router = APIRouter()
 logger = structlog.get_logger()
 
 
 # ---------------------------------------------------------
-# GET /records — return parsed records from MongoDB
+# GET /records — keyset-paginated parsed records
 # ---------------------------------------------------------
-@router.get("/", response_model=QueryResponse)
+@router.get("/", response_model=PaginatedQueryResponse)
 async def get_records(
+    http_request: Request,
     source_id: str = Query(..., description="Source identifier"),
     limit: int = Query(100, ge=1, le=500),
-    offset: int = Query(0, ge=0)
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    backend: str = Query("mongodb", regex="^(mongodb|postgresql)$"),
+    total: Optional[str] = Query(None, regex="^(exact|estimate)$", description="Also return total_count"),
+    target_version: Optional[int] = Query(None, ge=1, description="Project records to this schema version"),
+    shape: str = Query("rows", regex="^(rows|columns)$", description="columns → {columns, rows}"),
+    db: AsyncSession = Depends(get_db),
+    mongo: MongoDBStorage = Depends(get_mongo),
+    registry: ConnectionRegistry = Depends(get_registry)
 ):
     """
-    Return parsed cleaned records from MongoDB for a given source_id.
-    This returns the raw extracted & cleaned records stored by ETL.
+    Return parsed cleaned records for a given source_id, a page at a time,
+    optionally upcast to `target_version` at read time.
+
+    Pages follow `_id` (Mongo) or `id` (Postgres) order and resume after
+    the last key of the previous page, so page N costs the same as page 1.
+    New records sort after existing ones and never shift a page; records
+    appended to a bucket an earlier page passed lead the next page.
+
+    Only the hot tier is paged: records older than the source's tiering
+    watermark are in cold storage (reach them through /query or export).
     """
     try:
-        mongo = MongoDBStorage()
-        collection = f"{source_id}_records"
+        position = decode_cursor(cursor, backend) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    page = position.page + 1 if position else 1
 
-        cursor = mongo.db[collection].find({}).skip(offset).limit(limit)
-        docs = await cursor.to_list(length=limit)
+    try:
+        # rows below the watermark may still await their hot-tier delete
+        watermark = await tiering.watermark(db, source_id)
 
-        if not docs:
-            raise HTTPException(status_code=404, detail=f"No records found for source_id: {source_id}")
+        if backend == "postgresql":
+            table_name = f"data_{source_id}"
+            pg = PostgresStorage(db, registry.engine)
+            if not await pg.ensure_table_exists(table_name):
+                raise HTTPException(status_code=404, detail=f"No records found for source_id: {source_id}")
+
+            rows = await pg.rows_after(table_name, position.key if position else None, limit + 1, watermark)
+            more = len(rows) > limit
+            rows = rows[:limit]
+            next_cursor = encode_cursor(PageCursor(backend, rows[-1]["id"], None, page)) if more else None
+            if rows and EXTRAS_COLUMN in rows[0]:
+                rows = [hybrid_layout.flatten(r) for r in rows]
+            if target_version:
+                rows = await projector.project_rows(
+                    db, source_id, rows, target_version, source_key=sanitize_column_name
+                )
+            records = rows
+            total_count = await pg.count_rows(
+                table_name, estimate=total == "estimate", ingested_from=watermark
+            ) if total else None
+        else:
+            collection = f"{source_id}_records"
+            after = None
+            if position:
+                try:
+                    after = (ObjectId(position.key), position.entry)
+                    for key in position.open or {}:
+                        ObjectId(key)
+                except InvalidId as e:
+                    raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+            docs, resume = await mongo.page_after(
+                collection, after, limit, ingested_from=watermark, open_buckets=position.open if position else None
+            )
+            if resume:
+                (last_id, last_entry), open_buckets = resume
+                next_cursor = encode_cursor(PageCursor(backend, str(last_id), last_entry, page, open_buckets or None))
+            else:
+                next_cursor = None
+
+            if target_version:
+                records = await projector.project_documents(db, source_id, docs, target_version)
+            else:
+                records = [d.get("record", {}) for d in docs]
+            total_count = await mongo.count_records(
+                collection, bucketed=bucket_layout.enabled_for(source_id), estimate=total == "estimate",
+                ingested_from=watermark
+            ) if total else None
 
-        # Extract only the record dict
-        records = [d.get("record", {}) for d in docs]
+        if not records and position is None:
+            raise HTTPException(status_code=404, detail=f"No records found for source_id: {source_id}")
 
-        return QueryResponse(
-            count=len(records),
-            records=records
+        return render(
+            {
+                "page": page,
+                "page_size": len(records),
+                "total_count": total_count,
+                "total_estimated": total == "estimate",
+                "next_cursor": next_cursor,
+                "results": records,
+            },
+            http_request.headers.get("accept-encoding"),
+            shape,
+            rows_key="results"
         )
 
+    except HTTPException:
+        raise
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error("Failed to fetch records", exc_info=e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ---------------------------------------------------------
-# GET /records/export — export cleaned records
+# GET /records/export — stream cleaned records
 # ---------------------------------------------------------
 @router.get("/export")
 async def export_records(
     source_id: str = Query(..., description="Source identifier"),
-    format: str = Query("json", regex="^(json|csv)$"),
-    limit: int = Query(1000, ge=1, le=5000)
+    format: str = Query("json", regex="^(json|ndjson|csv|arrow|parquet)$"),
+    backend: str = Query("mongodb", regex="^(mongodb|postgresql)$"),
+    limit: Optional[int] = Query(None, ge=1, description="Stop after this many records (default: all)"),
+    db: AsyncSession = Depends(get_db),
+    mongo: MongoDBStorage = Depends(get_mongo),
+    lake: ParquetLake = Depends(get_lake),
+    registry: ConnectionRegistry = Depends(get_registry)
 ):
     """
-    Export raw cleaned records in JSON or CSV format.
+    Export cleaned records as JSON, NDJSON, CSV, Arrow IPC or Parquet.
+
+    Records are read from a server-side cursor (Mongo, or a Postgres
+    streaming cursor) and encoded a batch at a time as they arrive, so
+    memory stays flat whatever the export size. The CSV header and Arrow
+    schema cover every field of every schema version. Parquet is streamed
+    from the lake files, not from the databases.
+
+    Records past the source's tiering watermark are read from the cold
+    tier first, then the hot store from the watermark on.
     """
+    if format == "parquet":
+        if not lake.available:
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+        keys = await lake.files(source_id)
+        if not keys:
+            raise HTTPException(status_code=404, detail="No lake files to export")
+        return StreamingResponse(
+            lake.stream_export(keys, limit),
+            media_type="application/vnd.apache.parquet",
+            headers={
+                "Content-Disposition": f"attachment; filename={source_id}.parquet"
+            }
+        )
+    if format == "arrow" and not lake.available:
+        raise HTTPException(status_code=501, detail="Arrow export requires pyarrow")
+
     try:
-        mongo = MongoDBStorage()
-        collection = f"{source_id}_records"
-
-        docs = await mongo.db[collection].find({}).limit(limit).to_list(length=limit)
-        records = [d.get("record", {}) for d in docs]
-
-        if not records:
-            raise HTTPException(status_code=404, detail="No data to export")
-
-        # JSON export
-        if format == "json":
-            return JSONResponse(content={"data": records})
-
-        # CSV export
-        if format == "csv":
-            output = StringIO()
-            writer = csv.DictWriter(output, fieldnames=records[0].keys())
-            writer.writeheader()
-            writer.writerows(records)
-            output.seek(0)
-
-            return StreamingResponse(
-                iter([output.getvalue()]),
-                media_type="text/csv",
-                headers={
-                    "Content-Disposition": f"attachment; filename={source_id}.csv"
-                }
-            )
+        schema = await _export_schema(db, source_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    watermark = await tiering.watermark(db, source_id)
+
+    if backend == "postgresql":
+        hot = _postgres_documents(registry, source_id, list(schema), ingested_from=watermark)
+    else:
+        hot = mongo.iter_documents(
+            f"{source_id}_records", ingested_from=watermark, bucketed=bucket_layout.enabled_for(source_id)
+        )
+    if watermark is None:
+        docs = _take(limit, hot)
+    else:
+        docs = _take(limit, _cold_documents(registry, source_id, list(schema), watermark), hot)
 
+    # Pull the first document before answering: errors still get a status code
+    try:
+        first = await docs.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=404, detail="No data to export")
     except Exception as e:
         logger.error("Export failed", exc_info=e)
         raise HTTPException(status_code=500, detail=str(e))
+
+    async def documents():
+        yield first
+        async for doc in docs:
+            yield doc
+
+    async def records():
+        async for doc in documents():
+            yield doc.get("record", {})
+
+    if format == "json":
+        return StreamingResponse(_json_chunks(records()), media_type="application/json")
+
+    if format == "ndjson":
+        return StreamingResponse(_ndjson_chunks(records()), media_type="application/x-ndjson")
+
+    if format == "arrow":
+        return StreamingResponse(
+            stream_ipc(_batches(documents()), export_schema(schema)),
+            media_type="application/vnd.apache.arrow.stream",
+            headers={
+                "Content-Disposition": f"attachment; filename={source_id}.arrows"
+            }
+        )
+
+    # CSV export
+    return StreamingResponse(
+        _csv_chunks(records(), list(schema)),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f"attachment; filename={source_id}.csv"
+        }
+    )
+
+
+async def _export_schema(db: AsyncSession, source_id: str) -> Dict[str, Dict[str, Any]]:
+    """Fields of every schema version: latest order and types first, then fields since dropped."""
+    latest = await projector.latest_version(db, source_id)
+    if latest is None:
+        raise LookupError(f"No schema found for source_id={source_id}")
+    schemas = await projector.load_schemas(db, source_id, range(1, latest + 1))
+    merged: Dict[str, Dict[str, Any]] = {}
+    for version in sorted(schemas, reverse=True):
+        for name, meta in schemas[version].items():
+            merged.setdefault(name, meta)
+    return merged
+
+
+async def _take(limit: Optional[int], *sources: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """Documents of each source in turn, up to `limit` in total."""
+    n = 0
+    for source in sources:
+        async for doc in source:
+            if limit is not None and n >= limit:
+                return
+            yield doc
+            n += 1
+
+
+async def _cold_documents(
+    registry: ConnectionRegistry,
+    source_id: str,
+    fields: List[str],
+    watermark: datetime
+) -> AsyncIterator[Dict[str, Any]]:
+    """Cold-tier rows (ingested before `watermark`) in the {ingested_at, record} shape."""
+    async for cold in tiering.cold_rows(registry.cold, source_id, watermark):
+        row = cold["row"]
+        yield {
+            "ingested_at": row.get("ingested_at"),
+            "record": {f: row.get(sanitize_column_name(f)) for f in fields},
+        }
+
+
+async def _postgres_documents(
+    registry: ConnectionRegistry,
+    source_id: str,
+    fields: List[str],
+    limit: Optional[int] = None,
+    batch: int = 500,
+    ingested_from: Optional[datetime] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Rows of the source table through a server-side cursor, `batch` rows
+    per fetch, in the {ingested_at, record} shape of Mongo documents.
+    The stream owns its session: it outlives the request handler.
+    """
+    table_name = f"data_{source_id}"
+    if not await migrations.columns(registry.engine, table_name):
+        return
+
+    stmt = f'SELECT * FROM "{table_name}"'
+    params: Dict[str, Any] = {}
+    if ingested_from is not None:
+        stmt += ' WHERE "ingested_at" >= :ingested_from'
+        params["ingested_from"] = ingested_from
+    stmt += ' ORDER BY "id"'
+    if limit:
+        stmt += " LIMIT :limit"
+        params["limit"] = limit
+    async with registry.session_factory() as session:
+        result = await session.stream(sql_text(stmt).execution_options(yield_per=batch), params)
+        async for row in result.mappings():
+            row = dict(row)
+            if EXTRAS_COLUMN in row:
+                row = hybrid_layout.flatten(row)
+            yield {
+                "ingested_at": row.get("ingested_at"),
+                "record": {f: row.get(sanitize_column_name(f)) for f in fields},
+            }
+
+
+# ---------------------------------------------------------
+# Export encoders
+# ---------------------------------------------------------
+async def _json_chunks(records: AsyncIterator[Dict[str, Any]], batch: int = 500) -> AsyncIterator[str]:
+    """{"data": [...]} written a batch of records at a time"""
+    yield '{"data": ['
+    buf: List[str] = []
+    first = True
+    try:
+        async for rec in records:
+            buf.append(json.dumps(rec, default=str))
+            if len(buf) >= batch:
+                yield ("" if first else ",") + ",".join(buf)
+                first, buf = False, []
+        if buf:
+            yield ("" if first else ",") + ",".join(buf)
+    except Exception as e:
+        # headers are already sent; the truncated body is the error signal
+        logger.error("Export stream failed", exc_info=e)
+        raise
+    yield "]}"
+
+
+async def _ndjson_chunks(records: AsyncIterator[Dict[str, Any]], batch: int = 500) -> AsyncIterator[str]:
+    """One JSON object per line, written a batch of records at a time"""
+    buf: List[str] = []
+    try:
+        async for rec in records:
+            buf.append(json.dumps(rec, default=str))
+            if len(buf) >= batch:
+                yield "\n".join(buf) + "\n"
+                buf = []
+    except Exception as e:
+        logger.error("Export stream failed", exc_info=e)
+        raise
+    if buf:
+        yield "\n".join(buf) + "\n"
+
+
+async def _batches(
+    documents: AsyncIterator[Dict[str, Any]],
+    batch: int = 500
+) -> AsyncIterator[Tuple[List[Dict[str, Any]], List[Any]]]:
+    """(records, ingestion times) lists of up to `batch` documents, for the Arrow encoder"""
+    records, stamps = [], []
+    try:
+        async for doc in documents:
+            records.append(doc.get("record", {}))
+            stamps.append(doc.get("ingested_at"))
+            if len(records) >= batch:
+                yield records, stamps
+                records, stamps = [], []
+    except Exception as e:
+        logger.error("Export stream failed", exc_info=e)
+        raise
+    if records:
+        yield records, stamps
+
+
+async def _csv_chunks(
+    records: AsyncIterator[Dict[str, Any]],
+    fieldnames: List[str],
+    batch: int = 500
+) -> AsyncIterator[str]:
+    output = StringIO()
+    writer = csv.DictWriter(output, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    n = 0
+    try:
+        async for rec in records:
+            # nested values as JSON rather than Python reprs
+            writer.writerow({k: json.dumps(v, default=str) if isinstance(v, (dict, list)) else v for k, v in rec.items()})
+            n += 1
+            if n % batch == 0:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+    except Exception as e:
+        logger.error("Export stream failed", exc_info=e)
+        raise
+    yield output.getvalue()
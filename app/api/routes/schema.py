@@ -2,6 +2,7 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
+from typing import List
 import structlog
 
 from app.models.database import get_db
@@ -9,8 +10,14 @@ from app.models.schema_models import (
     SchemaVersionDB,
     SchemaResponse,
     SchemaHistoryResponse,
-    SchemaDiff
+    SchemaDiff,
+    FieldDeclaration,
+    FieldStatsResponse,
+    MigrationProgress
 )
+from app.core.schema.generator import SchemaGenerator
+from app.core.schema.statistics import StatisticsStore
+from app.storage.postgres import migrations
 
 router = APIRouter()
 logger = structlog.get_logger()
@@ -162,3 +169,70 @@ async def get_schema_diff(
     except Exception as e:
         logger.error("Schema diff failed", exc_info=e)
         raise HTTPException(500, str(e))
+
+
+# ---------------------------------------------------------
+# POST field rename / default declaration
+# ---------------------------------------------------------
+@router.post("/fields", response_model=SchemaResponse)
+async def declare_field(request: FieldDeclaration):
+    """
+    Declare that a field was renamed and/or has a default. Registers a new
+    schema version; reads projecting older records apply it.
+    """
+    if request.renamed_from is None and request.default is None:
+        raise HTTPException(400, "Nothing to declare: give renamed_from and/or default")
+
+    try:
+        version, declared = await SchemaGenerator().declare_field(
+            request.source_id, request.field, request.renamed_from, request.default
+        )
+    except LookupError as e:
+        raise HTTPException(404, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    return SchemaResponse(
+        source_id=request.source_id,
+        current_version=version,
+        schema=declared
+    )
+
+
+# ---------------------------------------------------------
+# GET per-field statistics (precomputed during ingestion)
+# ---------------------------------------------------------
+@router.get("/stats", response_model=FieldStatsResponse)
+async def get_schema_stats(
+    source_id: str = Query(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Return cardinality, null ratio, range, quantiles and top values per
+    field. Served from a single precomputed row.
+    """
+    row = await StatisticsStore().get(db, source_id)
+    if row is None:
+        raise HTTPException(404, f"No statistics for source_id={source_id}")
+
+    return FieldStatsResponse(
+        source_id=row.source_id,
+        schema_version=row.schema_version,
+        records=row.summary.get("records", 0),
+        updated_at=row.updated_at,
+        fields=row.summary.get("fields", {})
+    )
+
+
+# ---------------------------------------------------------
+# GET online column migrations (type widenings)
+# ---------------------------------------------------------
+@router.get("/migrations", response_model=List[MigrationProgress])
+async def get_schema_migrations(
+    source_id: str | None = Query(None)
+):
+    """
+    Report progress of online column widenings, optionally for one source.
+    """
+    table_name = f"data_{source_id}" if source_id else None
+    return migrations.list_progress(table_name)
@@ -6,6 +6,9 @@ import structlog
 from app.models.source_models import SourceFile
 from app.models.database import get_db
 from app.core.etl.pipeline import ETLPipeline
+from app.core.etl.backfill import ingesting
+from app.api.dependencies import get_pipeline, get_registry
+from app.storage.registry import ConnectionRegistry
 
 import io
 from pypdf import PdfReader
@@ -29,7 +32,9 @@ async def upload_health():
 async def upload_file(
     file: UploadFile = File(...),
     source_id: str = Form(...),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    etl: ETLPipeline = Depends(get_pipeline),
+    registry: ConnectionRegistry = Depends(get_registry)
 ):
     
     allowed_ext = [".txt", ".md", ".pdf"]
@@ -69,41 +74,43 @@ async def upload_file(
                 detail="Unable to decode file as UTF-8 text"
             )
 
-    # -----------------------
-    # 2. RUN ETL
-    # -----------------------
-    etl = ETLPipeline()
-
-    try:
-        await etl.process_text(
-            source_id=source_id,
-            text=text,
-            filename=file.filename
-        )
-    except Exception as e:
-        logger.error("ETL failed", error=str(e))
-        raise HTTPException(status_code=500, detail=f"ETL failed: {e}")
-
-    # -----------------------
-    # 3. INSERT METADATA INTO POSTGRES
-    # -----------------------
-    stmt = (
-        insert(SourceFile)
-        .values(
-            source_id=source_id,
-            filename=file.filename,
-            file_type=file.content_type,
-            storage_path=f"uploads/{file.filename}",
+    # a backfill swap waits until the rows and their metadata are both in
+    async with ingesting(registry.engine, source_id):
+        # -----------------------
+        # 2. RUN ETL
+        # -----------------------
+        try:
+            etl_result = await etl.process_text(
+                source_id=source_id,
+                text=text,
+                filename=file.filename
+            )
+        except Exception as e:
+            logger.error("ETL failed", error=str(e))
+            raise HTTPException(status_code=500, detail=f"ETL failed: {e}")
+
+        # -----------------------
+        # 3. INSERT METADATA INTO POSTGRES
+        # -----------------------
+        stmt = (
+            insert(SourceFile)
+            .values(
+                source_id=source_id,
+                filename=file.filename,
+                file_type=file.content_type,
+                storage_path=etl_result["storage_path"],
+                codec=etl_result["codec"],
+                original_size=etl_result["original_size"],
+            )
+            .returning(SourceFile.id, SourceFile.uploaded_at)
         )
-        .returning(SourceFile.id, SourceFile.uploaded_at)
-    )
 
-    try:
-        result = await db.execute(stmt)
-        await db.commit()
-    except Exception as e:
-        logger.error("DB insert failed", error=str(e))
-        raise HTTPException(status_code=500, detail="Failed to store metadata")
+        try:
+            result = await db.execute(stmt)
+            await db.commit()
+        except Exception as e:
+            logger.error("DB insert failed", error=str(e))
+            raise HTTPException(status_code=500, detail="Failed to store metadata")
 
     row = result.first()
     if not row:
@@ -119,6 +126,9 @@ async def upload_file(
         "source_id": source_id,
         "filename": file.filename,
         "file_type": file.content_type,
-        "storage_path": f"uploads/{file.filename}",
+        "storage_path": etl_result["storage_path"],
+        "codec": etl_result["codec"],
+        "original_size": etl_result["original_size"],
+        "spooled": etl_result["spooled"],
         "uploaded_at": uploaded_at
     }
@@ -8,16 +8,46 @@ class Settings(BaseSettings):
     MONGODB_URL: str
     REDIS_URL: str
 
+    # Connection pools
+    PG_POOL_SIZE: int = 10
+    PG_MAX_OVERFLOW: int = 20
+    PG_POOL_TIMEOUT: int = 30
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    REDIS_MAX_CONNECTIONS: int = 50
+
     # Storage
     MINIO_ENDPOINT: str
     MINIO_ACCESS_KEY: str
     MINIO_SECRET_KEY: str
     MINIO_BUCKET: str
     MINIO_SECURE: bool = False  # default false unless explicitly set
+    OBJECT_STORE_BACKEND: str = "s3"          # "s3" | "local"
+    OBJECT_STORE_LOCAL_PATH: str = "./data/objects"
+    OBJECT_STORE_MAX_WORKERS: int = 8
+    OBJECT_STORE_PART_SIZE: int = 8388608     # 8 MiB multipart parts
+    OBJECT_STORE_PARALLEL_PARTS: int = 4
+    OBJECT_STORE_RETRIES: int = 3
+    RAW_COMPRESSION: str = "auto"             # "auto" (zstd, else gzip) | "zstd" | "gzip" | "none"
+    RAW_COMPRESSION_LEVEL: int | None = None  # codec default when unset
 
     # LLM
     ANTHROPIC_API_KEY: str | None = None
     OPENAI_API_KEY: str | None = None
+    LLM_MODEL: str = "claude-sonnet-4-20250514"
+    LLM_MAX_TOKENS: int = 1000
+    NL_TRANSLATION_TTL_S: int = 86400      # cached NL → query templates
+    NL_PROMPT_TOKEN_BUDGET: int = 4000     # estimated prompt tokens per model call
+    NL_PROMPT_PRUNE_OVER: int = 30         # schemas wider than this are pruned per question
+    NL_PROMPT_MAX_FIELDS: int = 40         # relevant fields kept after pruning
+    NL_PROMPT_KEY_FIELDS: int = 5          # ids/timestamps/densest fields always kept
+    NL_BATCH_MAX_QUESTIONS: int = 20
+
+    # Guardrails for generated SQL (EXPLAIN before execution)
+    SQL_MAX_PLAN_COST: float = 1000000.0   # planner cost units
+    SQL_MAX_PLAN_ROWS: int = 100000        # estimated rows returned
+    SQL_STATEMENT_TIMEOUT_MS: int = 15000  # per statement; Mongo finds get maxTimeMS
+    SQL_DEFAULT_LIMIT: int = 1000          # injected when the statement has no LIMIT
 
     # App Settings
     DEBUG: bool = False
@@ -25,6 +55,71 @@ class Settings(BaseSettings):
     MAX_UPLOAD_SIZE: int = 104857600
     ALLOWED_EXTENSIONS: str = ".txt,.pdf,.md"
 
+    # Range partitioning of dynamic tables by ingested_at
+    PARTITIONED_SOURCES: str = ""          # comma-separated source ids, or "*" for all
+    PARTITION_INTERVAL: str = "month"      # "day" | "week" | "month"
+    PARTITION_PREMAKE: int = 3             # future partitions kept ready
+    PARTITION_RETENTION: int = 0           # intervals kept; 0 = keep forever
+    PARTITION_MAINTENANCE_INTERVAL_S: int = 3600
+
+    # Hybrid layout: typed columns for dense fields, extras JSONB for the tail
+    HYBRID_SOURCES: str = ""               # comma-separated source ids, or "*" for all
+    HYBRID_PROMOTE_MIN_RATIO: float = 0.2  # non-null share of records to get a column
+    HYBRID_PROMOTE_MIN_RECORDS: int = 100  # records seen before promoting anything
+
+    # Bucketed Mongo layout: many records per document
+    MONGO_BUCKETED_SOURCES: str = ""       # comma-separated source ids, or "*" for all
+    MONGO_BUCKET_SIZE: int = 200           # records per bucket document
+    MONGO_BUCKET_WINDOW_S: int = 3600      # ingestion window a bucket covers
+
+    # Parquet lake sink (analytics offload; needs pyarrow)
+    LAKE_SOURCES: str = ""                 # comma-separated source ids, or "*" for all
+    LAKE_LOCAL_PATH: str = ""              # local directory; empty = the object store
+    LAKE_COMPACT_MIN_FILES: int = 8        # part files per day before they are merged
+    LAKE_COMPACTION_INTERVAL_S: int = 3600
+
+    # Hot/cold tiering: old records move to Parquet files in the object store
+    TIERING_POLICY: str = ""               # "source:days,..."; "*:days" for every source
+    TIERING_INTERVAL_S: int = 3600
+
+    # Durable local spool for sink writes that fail (replayed in order)
+    SPOOL_DIR: str = "./data/spool"
+    SPOOL_SEGMENT_BYTES: int = 67108864    # 64 MiB per segment file
+    SPOOL_REPLAY_BATCH: int = 500          # entries per replay pass
+    SPOOL_REPLAY_INTERVAL_S: float = 5.0
+
+    # POST /query result cache (Redis)
+    QUERY_CACHE_ENABLED: bool = True
+    QUERY_CACHE_TTL_S: int = 300
+    QUERY_CACHE_SOURCE_BUDGET_BYTES: int = 8388608   # per source, LRU-evicted
+    QUERY_CACHE_COMPRESS_BYTES: int = 16384          # larger results are stored compressed
+
+    # Result serialization (app/core/query/result_normalizer.py)
+    RESULT_VALIDATE_MAX_ROWS: int = 1000         # larger results skip response-model validation
+    RESPONSE_COMPRESS_MIN_BYTES: int = 1024      # smaller bodies are sent uncompressed
+
+    # POST /query/async jobs
+    ASYNC_QUERY_MAX_CONCURRENT: int = 4          # per process; later jobs wait queued
+    ASYNC_QUERY_CHUNK_ROWS: int = 1000           # rows per spooled result chunk (= page)
+    ASYNC_QUERY_RESULT_TTL_S: int = 86400        # finished jobs and their chunks are deleted after this
+    ASYNC_QUERY_SWEEP_INTERVAL_S: int = 900
+    ASYNC_QUERY_HEARTBEAT_S: int = 30            # owning process renews its jobs' lease this often
+    ASYNC_QUERY_LEASE_S: int = 300               # unfinished jobs not renewed for this long are expired
+
+    # Index advisor: /query filter + sort hit counters
+    INDEX_HITS_FLUSH_INTERVAL_S: int = 60  # counters are written to index_candidates this often
+
+    # Incremental rollups answering /query/aggregate
+    ROLLUPS: str = ""                      # "source:bucket:group[+group][:metric[+metric]],..."
+
+    # Backfill / reprocessing
+    BACKFILL_WORKERS: int = 4     # parser processes
+    BACKFILL_WINDOW: int = 8      # files downloaded + parsed ahead of the writer
+
+    # Schema migrations
+    MIGRATION_BATCH_SIZE: int = 5000
+    MIGRATION_LOCK_TIMEOUT_MS: int = 2000
+
     # Security
     SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
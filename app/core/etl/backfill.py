@@ -0,0 +1,412 @@
+# app/core/etl/backfill.py
+
+import asyncio
+import multiprocessing
+import structlog
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select, update, func, case, text as sql_text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.config import settings
+from app.core.etl.pipeline import derive_records
+from app.core.query.rollups import rollups
+from app.core.schema.generator import SchemaGenerator, merge_field_definitions
+from app.core.schema.statistics import StatisticsStore
+from app.models.query_models import IndexCandidateDB
+from app.models.source_models import SourceFile, BackfillJobDB, TieringStateDB
+from app.storage.hybrid import hybrid_layout
+from app.storage.mongo_buckets import bucket_layout
+from app.storage.partitions import partition_manager
+from app.storage.postgres import PostgresStorage, migrations
+from app.storage.redis_cache import query_cache
+from app.storage.s3_handler import S3Handler
+
+logger = structlog.get_logger()
+
+# Jobs in these states are picked up again instead of starting a new one
+RESUMABLE = ("pending", "running", "swapping", "swapped", "failed")
+
+
+class _LateFiles(Exception):
+    """Files arrived after the last pass; raised to roll the swap back."""
+
+
+def generation_table(source_id: str, generation: int) -> str:
+    return f"data_{source_id}__g{generation}"
+
+
+def generation_collection(source_id: str, generation: int) -> str:
+    return f"{source_id}_records__g{generation}"
+
+
+def _ingest_key(source_id: str) -> str:
+    return f"ingest:{source_id}"
+
+
+@asynccontextmanager
+async def ingesting(engine: AsyncEngine, source_id: str):
+    """
+    Held (shared) by an upload from its first row write until its
+    SourceFile row has committed. The swap takes it exclusively before
+    looking for late files, so rows never reach the live table unseen.
+    """
+    async with engine.connect() as conn:
+        await conn.execute(sql_text("SELECT pg_advisory_lock_shared(hashtext(:key))"), {"key": _ingest_key(source_id)})
+        await conn.commit()
+        try:
+            yield
+        finally:
+            await conn.execute(sql_text("SELECT pg_advisory_unlock_shared(hashtext(:key))"), {"key": _ingest_key(source_id)})
+            await conn.commit()
+
+
+# -------------------------------------------------------------
+# Process-pool worker (parsing is CPU-bound)
+# -------------------------------------------------------------
+_components: Optional[Tuple] = None
+
+
+def _derive_in_worker(text: str) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """Runs in a pool process; parser components are built once per process."""
+    global _components
+    if _components is None:
+        from app.core.parsing.fragment_detector import FragmentDetector
+        from app.core.parsing.field_extractor import FieldExtractor
+        from app.core.parsing.data_cleaner import DataCleaner
+        _components = (FragmentDetector(), FieldExtractor(), DataCleaner())
+    return derive_records(text, *_components)
+
+
+class BackfillEngine:
+    """
+    Re-derives a source's records from its archived files with the current
+    parser, into a new table generation (data_<source>__g<N> and
+    <source>_records__g<N>) that replaces the live one atomically.
+
+      - files are read in SourceFile.id order, streamed (and decompressed)
+        from the object store and parsed in a process pool, a window ahead
+        of the writer
+      - each file's Postgres rows commit together with the job checkpoint
+        (last_file_id), so a resumed job never duplicates them; Mongo
+        documents past the checkpoint are deleted on resume
+      - the swap renames tables inside one transaction, then renames the
+        Mongo collection with dropTarget
+    """
+
+    def __init__(self, workers: Optional[int] = None, window: Optional[int] = None, max_rounds: int = 3):
+        self.workers = workers or settings.BACKFILL_WORKERS
+        self.window = window or settings.BACKFILL_WINDOW
+        self.max_rounds = max_rounds
+        self._running: Set[int] = set()
+
+    # ---------------------------------------------------------
+    # Jobs
+    # ---------------------------------------------------------
+    async def start(self, session: AsyncSession, source_id: str) -> BackfillJobDB:
+        """Resume the source's unfinished job, or create the next generation."""
+        result = await session.execute(
+            select(BackfillJobDB)
+            .where(BackfillJobDB.source_id == source_id, BackfillJobDB.status.in_(RESUMABLE))
+            .order_by(BackfillJobDB.id.desc())
+        )
+        job = result.scalars().first()
+        if job is not None:
+            logger.info("Resuming backfill", job_id=job.id, source_id=source_id, last_file_id=job.last_file_id)
+            return job
+
+        files = await self._count_files(session, source_id)
+        if not files:
+            raise LookupError(f"No archived files for source_id={source_id}")
+
+        latest = await session.execute(
+            select(func.max(BackfillJobDB.generation)).where(BackfillJobDB.source_id == source_id)
+        )
+        job = BackfillJobDB(
+            source_id=source_id,
+            generation=(latest.scalar() or 0) + 1,
+            status="pending",
+            schema={},
+            last_file_id=0,
+            files_total=files,
+            files_done=0,
+            records_written=0
+        )
+        session.add(job)
+        await session.commit()
+        await session.refresh(job)
+        logger.info("Backfill created", job_id=job.id, source_id=source_id, generation=job.generation)
+        return job
+
+    async def get(self, session: AsyncSession, job_id: int) -> Optional[BackfillJobDB]:
+        return await session.get(BackfillJobDB, job_id)
+
+    async def list(self, session: AsyncSession, source_id: Optional[str] = None) -> List[BackfillJobDB]:
+        query = select(BackfillJobDB).order_by(BackfillJobDB.id.desc())
+        if source_id:
+            query = query.where(BackfillJobDB.source_id == source_id)
+        return (await session.execute(query)).scalars().all()
+
+    @staticmethod
+    async def _count_files(session: AsyncSession, source_id: str) -> int:
+        result = await session.execute(
+            select(func.count()).select_from(SourceFile).where(SourceFile.source_id == source_id)
+        )
+        return result.scalar() or 0
+
+    # ---------------------------------------------------------
+    # Run
+    # ---------------------------------------------------------
+    async def run(self, registry, job_id: int):
+        """Run (or resume) a job to completion. Errors mark the job failed."""
+        if job_id in self._running:
+            return
+        self._running.add(job_id)
+
+        try:
+            async with registry.session_factory() as session:
+                job = await self.get(session, job_id)
+                if job is None or job.status == "done":
+                    return
+                try:
+                    for _ in range(self.max_rounds):
+                        if job.status not in ("swapping", "swapped"):
+                            await self._rederive(session, registry, job)
+                        if await self._swap(session, registry, job):
+                            break
+                    else:
+                        raise RuntimeError("Source kept receiving files; swap not attempted again")
+                except Exception as e:
+                    await session.rollback()
+                    await session.execute(
+                        update(BackfillJobDB)
+                        .where(BackfillJobDB.id == job_id)
+                        .values(
+                            error=str(e),
+                            # once the tables are swapped, only the Mongo step is left to retry
+                            status=case((BackfillJobDB.status == "swapped", "swapped"), else_="failed")
+                        )
+                    )
+                    await session.commit()
+                    logger.error("Backfill failed", exc_info=e, job_id=job_id)
+        finally:
+            self._running.discard(job_id)
+
+    async def _rederive(self, session: AsyncSession, registry, job: BackfillJobDB):
+        collection = registry.mongo_db[generation_collection(job.source_id, job.generation)]
+
+        # Postgres rows past the checkpoint never committed; Mongo docs may have
+        await collection.delete_many({"source_file_id": {"$gt": job.last_file_id}})
+
+        job.status = "running"
+        job.error = None
+        await session.commit()
+
+        loop = asyncio.get_running_loop()
+        # spawn: forked children would inherit the object-store thread pool
+        with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            while True:
+                result = await session.execute(
+                    select(SourceFile)
+                    .where(SourceFile.source_id == job.source_id, SourceFile.id > job.last_file_id)
+                    .order_by(SourceFile.id)
+                    .limit(self.window)
+                )
+                files = result.scalars().all()
+                if not files:
+                    break
+
+                job.files_total = await self._count_files(session, job.source_id)
+
+                # download + parse the whole window ahead; write strictly in order
+                parsed = [
+                    asyncio.ensure_future(self._derive(registry.s3, pool, loop, f))
+                    for f in files
+                ]
+                try:
+                    for source_file, future in zip(files, parsed):
+                        records, schema = await future
+                        await self._write(session, registry, job, source_file, records, schema)
+                finally:
+                    for future in parsed:
+                        future.cancel()
+
+    async def _derive(self, s3: S3Handler, pool: ProcessPoolExecutor, loop, source_file: SourceFile):
+        try:
+            raw = b"".join([chunk async for chunk in s3.stream_file(source_file.storage_path, source_file.codec)])
+        except Exception as e:
+            raise LookupError(
+                f"Cannot read archived file {source_file.id} ({source_file.storage_path}): {e}"
+            ) from e
+        return await loop.run_in_executor(pool, _derive_in_worker, raw.decode("utf-8", errors="ignore"))
+
+    async def _write(
+        self,
+        session: AsyncSession,
+        registry,
+        job: BackfillJobDB,
+        source_file: SourceFile,
+        records: List[Dict[str, Any]],
+        schema: Dict[str, Dict[str, Any]]
+    ):
+        table = generation_table(job.source_id, job.generation)
+
+        # rows keep their original ingestion time (retention / partition pruning)
+        ingested_at = (source_file.uploaded_at or datetime.utcnow()).replace(tzinfo=timezone.utc)
+
+        hybrid = hybrid_layout.enabled_for(job.source_id)
+        field_stats = None
+        if hybrid:
+            stats_row = await StatisticsStore().get(session, job.source_id)
+            field_stats = stats_row.summary if stats_row else None
+
+        job.schema = merge_field_definitions(job.schema or {}, schema)
+        pg = PostgresStorage(session, registry.engine)
+        await pg.create_table_for_schema(
+            table, job.schema,
+            partitioned=partition_manager.enabled_for(job.source_id),
+            ingested_at=ingested_at,
+            hybrid=hybrid,
+            field_stats=field_stats
+        )
+
+        for rec in records:
+            await pg.insert_record(table, {**rec, "ingested_at": ingested_at}, commit=False)
+
+        collection = generation_collection(job.source_id, job.generation)
+        if records and bucket_layout.enabled_for(job.source_id):
+            # buckets never span files, so the checkpoint cleanup stays exact
+            await registry.mongo.insert_bucketed(
+                collection, job.source_id, None, records, ingested_at,
+                bucket_key={"source_file_id": source_file.id}
+            )
+        elif records:
+            await registry.mongo_db[collection].insert_many([
+                {
+                    "source_id": job.source_id,
+                    "schema_version": None,     # set once the schema is registered at swap
+                    "source_file_id": source_file.id,
+                    "ingested_at": ingested_at,
+                    "record": rec
+                }
+                for rec in records
+            ])
+
+        # checkpoint commits with the rows
+        job.last_file_id = source_file.id
+        job.files_done += 1
+        job.records_written += len(records)
+        await session.commit()
+
+    # ---------------------------------------------------------
+    # Swap
+    # ---------------------------------------------------------
+    async def _swap(self, session: AsyncSession, registry, job: BackfillJobDB) -> bool:
+        """
+        Replace the live generation. Returns False (nothing swapped) when
+        files arrived after the last pass, so the caller derives them first.
+        """
+        if job.schema_version is None:
+            job.schema_version, _ = await SchemaGenerator().register_schema(
+                job.source_id, job.schema or {}, comment=f"backfill generation {job.generation}"
+            )
+        if job.status != "swapped":
+            job.status = "swapping"
+        await session.commit()
+
+        live = f"data_{job.source_id}"
+        shadow = generation_table(job.source_id, job.generation)
+        retired = f"{live}__retired_g{job.generation}"
+
+        if job.status == "swapping":
+            await migrations.wait_idle(live)
+            await migrations.wait_idle(shadow)
+            try:
+                await self._swap_tables(registry.engine, job, live, shadow, retired)
+            except _LateFiles as e:
+                job.status = "running"
+                await session.commit()
+                logger.info("Files arrived during backfill, catching up", job_id=job.id, files=str(e))
+                return False
+            job.status = "swapped"
+            await session.commit()
+
+        for table in (live, shadow, retired):
+            migrations.forget(table)
+            partition_manager.forget(table)
+        if hybrid_layout.enabled_for(job.source_id):
+            # promotions the generation table had not finished continue under the live name
+            hybrid_layout.start_promotion(registry.engine, live)
+
+        # Mongo: stamp the registered version, then rename over the live collection
+        db = registry.mongo_db
+        collection = generation_collection(job.source_id, job.generation)
+        if collection in await db.list_collection_names():
+            await db[collection].update_many({}, {"$set": {"schema_version": job.schema_version}})
+            await db[collection].rename(f"{job.source_id}_records", dropTarget=True)
+            bucket_layout.forget(collection)
+            bucket_layout.forget(f"{job.source_id}_records")
+
+        # Indexes lived on the replaced table / collection → candidates again
+        await session.execute(
+            update(IndexCandidateDB)
+            .where(IndexCandidateDB.source_id == job.source_id, IndexCandidateDB.status == "built")
+            .values(status="candidate", index_name=None)
+        )
+
+        job.status = "done"
+        job.finished_at = datetime.utcnow()
+        await session.commit()
+        await query_cache.bump(registry.redis, job.source_id, job.schema_version)
+        for spec in rollups.for_source(job.source_id):
+            await rollups.rebuild(registry, spec)
+        logger.info(
+            "Backfill swapped in",
+            job_id=job.id,
+            source_id=job.source_id,
+            generation=job.generation,
+            records=job.records_written
+        )
+        return True
+
+    @staticmethod
+    async def _swap_tables(engine, job: BackfillJobDB, live: str, shadow: str, retired: str):
+        """Rename shadow → live in one transaction, recording the swap in the same commit."""
+        async with engine.begin() as conn:
+            if await conn.scalar(sql_text("SELECT to_regclass(:t)"), {"t": f'"{shadow}"'}) is not None:
+                await conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{settings.MIGRATION_LOCK_TIMEOUT_MS}ms'")
+                # waits out uploads between their row writes and their SourceFile insert
+                await conn.execute(
+                    sql_text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": _ingest_key(job.source_id)}
+                )
+                if await conn.scalar(sql_text("SELECT to_regclass(:t)"), {"t": f'"{live}"'}) is not None:
+                    # blocks ingestion into the live table until commit
+                    await conn.exec_driver_sql(f'LOCK TABLE "{live}" IN ACCESS EXCLUSIVE MODE')
+
+                    late = await conn.scalar(
+                        select(func.count()).select_from(SourceFile).where(
+                            SourceFile.source_id == job.source_id, SourceFile.id > job.last_file_id
+                        )
+                    )
+                    if late:
+                        raise _LateFiles(late)
+
+                    await conn.exec_driver_sql(f'ALTER TABLE "{live}" RENAME TO "{retired}"')
+                await conn.exec_driver_sql(f'ALTER TABLE "{shadow}" RENAME TO "{live}"')
+                await hybrid_layout.rename_promotions(conn, shadow, live)
+                # the new generation's rows below the watermark replace their cold day files
+                await conn.execute(
+                    update(TieringStateDB).where(TieringStateDB.source_id == job.source_id).values(rewrite_cold=True)
+                )
+                await conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{retired}"')
+
+            await conn.execute(
+                update(BackfillJobDB).where(BackfillJobDB.id == job.id).values(status="swapped")
+            )
+
+
+# Shared engine — the admin endpoint and scripts/backfill.py both use it
+backfill_engine = BackfillEngine()
@@ -2,18 +2,32 @@
 
 import uuid
 import structlog
-from typing import Dict, Any, List
+from datetime import datetime, timezone
+from functools import partial
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.parsing.fragment_detector import FragmentDetector
 from app.core.parsing.field_extractor import FieldExtractor
 from app.core.parsing.data_cleaner import DataCleaner
-from app.core.schema.generator import SchemaGenerator
+from app.core.schema.generator import SchemaGenerator, merge_field_definitions, widen_type
+from app.core.schema.statistics import StatisticsStore
 
 from app.storage.s3_handler import S3Handler
 from app.storage.postgres import PostgresStorage
 from app.storage.mongodb import MongoDBStorage
+from app.storage.mongo_buckets import bucket_layout
+from app.storage.hybrid import hybrid_layout
+from app.storage.lake import ParquetLake
+from app.storage.partitions import partition_manager
+from app.storage.spool import spool
+from app.storage.redis_cache import query_cache
+from app.core.query.rollups import rollups
 
 from app.models.database import AsyncSessionLocal, engine
 
@@ -21,18 +35,195 @@ from app.models.database import AsyncSessionLocal, engine
 logger = structlog.get_logger()
 
 
+# -------------------------------------------------------------
+# Pure parsing stage (no I/O) — shared with the backfill workers
+# -------------------------------------------------------------
+def derive_records(
+    text: str,
+    detector: Optional[FragmentDetector] = None,
+    extractor: Optional[FieldExtractor] = None,
+    cleaner: Optional[DataCleaner] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    Detect fragments, extract field groups and clean them.
+    Returns (cleaned_records, unified_schema); types widen across groups.
+    """
+    detector = detector or FragmentDetector()
+    extractor = extractor or FieldExtractor()
+    cleaner = cleaner or DataCleaner()
+
+    fragments = detector.detect_fragments(text)
+    extracted_groups = extractor.extract_fields(fragments)
+
+    cleaned_records: List[Dict[str, Any]] = []
+    unified_schema: Dict[str, Dict[str, Any]] = {}
+
+    for group in extracted_groups:
+        raw_fields = group.get("fields", {})
+
+        # clean values → {field: cleaned_value}
+        cleaned_records.append(cleaner.clean(raw_fields))
+
+        # push schema metadata (types widen across groups in the batch)
+        for k, meta in raw_fields.items():
+            field_type = meta.get("type", "string")
+            if k in unified_schema:
+                field_type = widen_type(unified_schema[k]["type"], field_type)
+            unified_schema[k] = {
+                "type": field_type,
+                "nullable": (meta.get("value") is None),
+                "example": meta.get("value")
+            }
+
+    return cleaned_records, unified_schema
+
+
+# -------------------------------------------------------------
+# Sink writers — used for live batches and spool replay alike
+# -------------------------------------------------------------
+async def write_postgres(batches: List[Dict[str, Any]]):
+    """Ensure the table and insert every batch's rows (and rollup deltas) in one transaction."""
+    source_id = batches[0]["source_id"]
+    table_name = f"data_{source_id}"
+    schema: Dict[str, Dict[str, Any]] = {}
+    for b in batches:
+        schema = merge_field_definitions(schema, b["schema"])
+    stamps = [b["ingested_at"].replace(tzinfo=timezone.utc) for b in batches]
+    partitioned = partition_manager.enabled_for(source_id)
+
+    async with AsyncSessionLocal() as session:
+        pg = PostgresStorage(session, engine)
+
+        # hybrid sources decide columns from the field statistics so far
+        hybrid = hybrid_layout.enabled_for(source_id)
+        field_stats = None
+        if hybrid:
+            stats_row = await StatisticsStore().get(session, source_id)
+            field_stats = stats_row.summary if stats_row else None
+
+        # ensure table exists with the schema of latest version
+        await pg.create_table_for_schema(
+            table_name,
+            schema,
+            partitioned=partitioned,
+            ingested_at=stamps[0],
+            hybrid=hybrid,
+            field_stats=field_stats
+        )
+        if partitioned:
+            for ts in set(stamps[1:]):
+                await partition_manager.ensure(engine, table_name, ts)
+
+        for b, ts in zip(batches, stamps):
+            for rec in b["records"]:
+                await pg.insert_record(table_name, {**rec, "ingested_at": ts}, commit=False)
+
+        # declared rollups move in the same transaction as the rows
+        await rollups.apply(session, source_id, [(b["records"], ts) for b, ts in zip(batches, stamps)])
+        await session.commit()
+
+    # Field statistics follow the rows into Postgres (live or replayed);
+    # they are advisory → never fail the write
+    async with AsyncSessionLocal() as session:
+        for b in batches:
+            try:
+                await StatisticsStore().update(session, source_id, b["schema_version"], b["records"])
+            except Exception as e:
+                await session.rollback()
+                logger.warning("Field statistics update failed", error=str(e), source_id=source_id)
+
+
+async def write_mongo(mongo: MongoDBStorage, batches: List[Dict[str, Any]]):
+    source_id = batches[0]["source_id"]
+    collection = f"{source_id}_records"
+
+    if bucket_layout.enabled_for(source_id):
+        for b in batches:
+            await mongo.insert_bucketed(
+                collection, source_id, b["schema_version"], b["records"], b["ingested_at"]
+            )
+        return
+
+    docs = [
+        {
+            "_id": ObjectId(doc_id),
+            "source_id": source_id,
+            "schema_version": b["schema_version"],
+            "ingested_at": b["ingested_at"],
+            "record": rec
+        }
+        for b in batches
+        for doc_id, rec in zip(b["doc_ids"], b["records"])
+    ]
+    if not docs:
+        return
+    try:
+        await mongo.db[collection].insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # documents already written by an earlier, partly failed attempt
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+
+
+async def write_lake(lake: ParquetLake, batches: List[Dict[str, Any]]):
+    source_id = batches[0]["source_id"]
+    if not lake.enabled_for(source_id):
+        return
+    for b in batches:
+        # keyed by the batch's first doc id: a replay overwrites its own file
+        await lake.write_batch(
+            source_id, b["schema_version"], b["records"], b["schema"], b["ingested_at"],
+            batch_id=b["doc_ids"][0] if b.get("doc_ids") else None
+        )
+
+
+def sink_writers(
+    mongo: MongoDBStorage,
+    redis: Optional[aioredis.Redis] = None,
+    lake: Optional[ParquetLake] = None
+) -> Dict[str, Callable[[List[Dict[str, Any]]], Awaitable[None]]]:
+    """
+    Writers per sink (the lake only when given); with `redis`, each
+    Postgres / Mongo write advances the query-cache watermark.
+    """
+    writers = {"postgres": write_postgres, "mongo": partial(write_mongo, mongo)}
+    if redis is not None:
+        writers = {sink: _bumping(redis, write) for sink, write in writers.items()}
+    if lake is not None:
+        writers["lake"] = partial(write_lake, lake)
+    return writers
+
+
+def _bumping(redis: aioredis.Redis, write):
+    async def run(batches: List[Dict[str, Any]]):
+        await write(batches)
+        await query_cache.bump(
+            redis, batches[0]["source_id"], max(b["schema_version"] or 0 for b in batches) or None
+        )
+    return run
+
+
 class ETLPipeline:
     """
     Full end-to-end ETL pipeline for text-based uploads.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        mongo: MongoDBStorage,
+        s3: S3Handler,
+        lake: Optional[ParquetLake] = None,
+        redis: Optional[aioredis.Redis] = None
+    ):
+        # Storage clients are shared, pooled ones from the ConnectionRegistry
         self.detector = FragmentDetector()
         self.extractor = FieldExtractor()
         self.cleaner = DataCleaner()
         self.schema_gen = SchemaGenerator()
-        self.s3 = S3Handler()
-        self.mongo = MongoDBStorage()
+        self.s3 = s3
+        self.mongo = mongo
+        self.lake = lake
+        self.redis = redis
 
     # -------------------------------------------------------------
     # MAIN ENTRY: PROCESS A TEXT FILE
@@ -46,40 +237,18 @@ class ETLPipeline:
           4. compute + register schema
           5. ensure Postgres dynamic table exists
           6. insert cleaned rows into Postgres
-          7. insert cleaned rows into MongoDB
+          7. insert cleaned rows into MongoDB (and the Parquet lake)
+             (5-7: a failed sink write is spooled and replayed later)
+             (per-field statistics are folded in with the Postgres write)
           8. store raw file in S3
         """
 
         # ----------------------------------
-        # 1. Fragment detection
-        # ----------------------------------
-        fragments = self.detector.detect_fragments(text)
-
-        # ----------------------------------
-        # 2. Extract candidate field groups
-        # ----------------------------------
-        extracted_groups = self.extractor.extract_fields(fragments)
-
-        cleaned_records: List[Dict[str, Any]] = []
-        unified_schema: Dict[str, Dict[str, Any]] = {}
-
-        # ----------------------------------
-        # 3. Clean + assemble schema
+        # 1-3. Fragments → field groups → cleaned records + schema
         # ----------------------------------
-        for group in extracted_groups:
-            raw_fields = group.get("fields", {})
-
-            # clean values → {field: cleaned_value}
-            cleaned = self.cleaner.clean(raw_fields)
-            cleaned_records.append(cleaned)
-
-            # push schema metadata
-            for k, meta in raw_fields.items():
-                unified_schema[k] = {
-                    "type": meta.get("type", "string"),
-                    "nullable": (meta.get("value") is None),
-                    "example": meta.get("value")
-                }
+        cleaned_records, unified_schema = derive_records(
+            text, self.detector, self.extractor, self.cleaner
+        )
 
         # ----------------------------------
         # 4. Register schema version
@@ -87,56 +256,62 @@ class ETLPipeline:
         version, diff = await self.schema_gen.register_schema(source_id, unified_schema)
 
         # ----------------------------------
-        # 5. Store records (Postgres + Mongo)
+        # 5. Store records (Postgres + Mongo + lake); a sink that is down gets
+        #    the batch spooled locally and replayed later
         # ----------------------------------
-        async with AsyncSessionLocal() as session:
-
-            pg = PostgresStorage(session, engine)
-            table_name = f"data_{source_id}"
-
-            # ensure table exists with the schema of latest version
-            await pg.create_table_for_schema(table_name, unified_schema)
-
-            # INSERT rows into Postgres
-            for rec in cleaned_records:
-                await pg.insert_record(table_name, rec)
-
-            # INSERT rows into Mongo
-            for rec in cleaned_records:
-                await self.mongo.insert_record(
-                    collection=f"{source_id}_records",
-                    document={
-                        "source_id": source_id,
-                        "schema_version": version,
-                        "record": rec
-                    }
-                )
+        ingested_at = datetime.utcnow()
+        batch = {
+            "source_id": source_id,
+            "schema_version": version,
+            "schema": unified_schema,
+            "records": cleaned_records,
+            "ingested_at": ingested_at,
+            # fixed ids make Mongo replays idempotent
+            "doc_ids": [str(ObjectId()) for _ in cleaned_records],
+        }
+        accepted, spooled = await self._store(batch)
 
         # ----------------------------------
         # 6. Store raw file in S3
         # ----------------------------------
+        stored = None
         if filename:
             file_id = str(uuid.uuid4())
-            # S3 client is synchronous → DO NOT await the call
-            await self._upload_async(file_id, text.encode("utf-8"), filename)
+            stored = await self.s3.upload_file(file_id, text.encode("utf-8"), filename)
 
         return {
             "source_id": source_id,
             "schema_version": version,
             "diff": diff,
             "records_added": len(cleaned_records),
+            "storage_path": stored.storage_path if stored else None,
+            "codec": stored.codec if stored else None,
+            "original_size": stored.original_size if stored else None,
+            "spooled": spooled,
         }
 
-    # -------------------------------------------------------------
-    # Helper to wrap sync S3 upload inside async
-    # -------------------------------------------------------------
-    async def _upload_async(self, file_id: str, content: bytes, filename: str):
+    async def _store(self, batch: Dict[str, Any]) -> Tuple[List[str], List[str]]:
         """
-        Run blocking MinIO upload in an async manner using a threadpool.
+        Write the batch to every sink. A sink that fails (or still has
+        spooled batches, to keep its order) gets the batch spooled. Raises
+        only if no sink — spool included — durably took the batch.
         """
-        import asyncio
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: self.s3.upload_file(file_id, content, filename)
-        )
+        accepted, spooled, errors = [], [], []
+        for sink, write in sink_writers(self.mongo, self.redis, self.lake).items():
+            if spool.depth(sink) == 0:
+                try:
+                    await write([batch])
+                    accepted.append(sink)
+                    continue
+                except Exception as e:
+                    logger.warning("Sink write failed, spooling batch", sink=sink, error=str(e))
+            try:
+                await spool.append(sink, batch)
+                spooled.append(sink)
+            except Exception as e:
+                logger.error("Spool append failed; batch lost for sink", exc_info=e, sink=sink)
+                errors.append(f"{sink}: {e}")
+
+        if not accepted and not spooled:
+            raise RuntimeError(f"No sink accepted the batch ({'; '.join(errors)})")
+        return accepted, spooled
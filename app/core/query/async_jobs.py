@@ -0,0 +1,330 @@
+# app/core/query/async_jobs.py
+
+import asyncio
+import json
+import uuid
+import structlog
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.core.query.result_normalizer import dumps
+from app.models.query_models import QueryJobDB
+from app.storage.compression import EXTENSIONS, compress_bytes, decompress_bytes, resolve_codec
+from app.storage.object_store import ObjectStore
+
+logger = structlog.get_logger()
+
+RESULTS_PREFIX = "query-results"
+FINISHED = ("completed", "failed", "cancelled")
+
+# Runs the query in the given session, yielding its rows a chunk (up to
+# the given row count) at a time
+QueryRunner = Callable[[AsyncSession, int], AsyncIterator[List[Dict[str, Any]]]]
+
+
+def chunk_key(job_id: str, index: int, codec: Optional[str]) -> str:
+    return f"{RESULTS_PREFIX}/{job_id}/chunk-{index:05d}.json{EXTENSIONS.get(codec, '')}"
+
+
+class QueryJobManager:
+    """
+    Runs /query requests in the background (POST /query/async).
+
+    A job row (query_jobs) is created before the request returns; the
+    query itself waits for one of `max_concurrent` slots, runs in its own
+    session, and its rows are spooled to the object store as compressed
+    JSON chunks of `chunk_rows` rows, each written as soon as the query
+    has streamed it. GET /query/{id} reads one chunk per page, so a result
+    never has to fit in memory or in a response. The codec is recorded
+    on the job row, and `sweep` drops results older than a TTL.
+
+    Each process renews a lease (heartbeat_at) on the jobs it holds, and
+    a running job records its progress after every chunk. Cancelling a
+    job cancels its task (queued or running). A job whose task lives in
+    another process is marked cancelled; that process sees the flag after
+    its next chunk, deletes what it spooled and finishes the job. `sweep`
+    does the same for jobs whose lease expired (their process is gone).
+    """
+
+    def __init__(self, max_concurrent: int = 4, chunk_rows: int = 1000, codec: Optional[str] = None):
+        self.max_concurrent = max_concurrent
+        self.chunk_rows = chunk_rows
+        self.codec = resolve_codec(codec if codec is not None else settings.RAW_COMPRESSION)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        # created lazily: it binds to the running loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        return self._slots
+
+    # ---------------------------------------------------------
+    # Jobs
+    # ---------------------------------------------------------
+    async def submit(
+        self,
+        session: AsyncSession,
+        session_factory: sessionmaker,
+        store: ObjectStore,
+        source_id: str,
+        backend: str,
+        request: Dict[str, Any],
+        run: QueryRunner
+    ) -> QueryJobDB:
+        job_id = uuid.uuid4().hex
+        job = QueryJobDB(
+            id=job_id,
+            source_id=source_id,
+            backend=backend,
+            request=json.loads(dumps(request)),
+            status="queued",
+            chunk_rows=self.chunk_rows,
+            codec=self.codec,
+            heartbeat_at=datetime.utcnow(),
+        )
+        session.add(job)
+        await session.commit()
+
+        task = asyncio.create_task(self._run(session_factory, store, job_id, run))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        logger.info("Query job queued", job_id=job_id, source_id=source_id, backend=backend)
+        return job
+
+    async def get(self, session: AsyncSession, job_id: str) -> Optional[QueryJobDB]:
+        return await session.get(QueryJobDB, job_id)
+
+    async def cancel(self, session: AsyncSession, job_id: str) -> QueryJobDB:
+        job = await self.get(session, job_id)
+        if job is None:
+            raise LookupError(f"Query job {job_id} not found")
+        if job.status in FINISHED:
+            raise ValueError(f"Query job {job_id} is already {job.status}")
+
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            await session.refresh(job)
+        else:
+            # finished_at stays unset until the owner (or the sweep) drops its chunks
+            job.status = "cancelled"
+            await session.commit()
+        return job
+
+    async def _run(self, session_factory: sessionmaker, store: ObjectStore, job_id: str, run: QueryRunner):
+        written = 0
+        try:
+            async with self.slots:
+                async with session_factory() as session:
+                    job = await session.get(QueryJobDB, job_id)
+                    if job.status == "cancelled":
+                        await self._update(session, job_id, finished_at=datetime.utcnow())
+                        return
+                    codec, chunk_rows = job.codec, job.chunk_rows
+                    await self._update(session, job_id, status="running", started_at=datetime.utcnow())
+
+                    # rows arrive from a server-side cursor: spool each full chunk right away
+                    count, pending = 0, []
+                    async for rows in run(session, chunk_rows):
+                        count += len(rows)
+                        pending.extend(rows)
+                        while len(pending) >= chunk_rows:
+                            await self._put_chunk(store, job_id, written, codec, pending[:chunk_rows])
+                            written += 1
+                            pending = pending[chunk_rows:]
+                            if not await self._checkpoint(session_factory, job_id, written):
+                                await self._abandon(session_factory, store, job_id, written, codec)
+                                return
+                    # an empty result is still one (empty) page
+                    if pending or not written:
+                        await self._put_chunk(store, job_id, written, codec, pending)
+                        written += 1
+
+                async with session_factory() as session:
+                    job = await session.get(QueryJobDB, job_id)
+                    if job.status == "cancelled" or job.finished_at is not None:
+                        # cancelled from another process (or expired) while it ran
+                        await self._abandon(session_factory, store, job_id, written, codec)
+                        return
+                    await self._update(
+                        session, job_id, status="completed", result_count=count,
+                        chunks=written, finished_at=datetime.utcnow()
+                    )
+            logger.info("Query job completed", job_id=job_id, chunks=written)
+
+        except asyncio.CancelledError:
+            await self._finish_unsuccessful(session_factory, store, job_id, written, "cancelled", None)
+            raise
+        except Exception as e:
+            logger.error("Query job failed", exc_info=e, job_id=job_id)
+            # route helpers raise HTTPException: keep its detail
+            message = str(getattr(e, "detail", None) or e)
+            await self._finish_unsuccessful(session_factory, store, job_id, written, "failed", message)
+
+    async def _checkpoint(self, session_factory: sessionmaker, job_id: str, written: int) -> bool:
+        """Record progress and renew the lease; False once the job was cancelled or expired."""
+        async with session_factory() as session:
+            job = await session.get(QueryJobDB, job_id)
+            if job.status == "cancelled" or job.finished_at is not None:
+                return False
+            job.chunks = written
+            job.heartbeat_at = datetime.utcnow()
+            await session.commit()
+            return True
+
+    async def _abandon(
+        self, session_factory: sessionmaker, store: ObjectStore, job_id: str, written: int, codec: Optional[str]
+    ):
+        """Drop what a cancelled (or expired) run spooled and settle the job."""
+        await self._delete_chunks(store, job_id, written, codec)
+        async with session_factory() as session:
+            job = await session.get(QueryJobDB, job_id)
+            if job.finished_at is None:
+                await self._update(session, job_id, chunks=0, finished_at=datetime.utcnow())
+        logger.info("Query job stopped", job_id=job_id, status=job.status)
+
+    async def _finish_unsuccessful(
+        self,
+        session_factory: sessionmaker,
+        store: ObjectStore,
+        job_id: str,
+        written: int,
+        status: str,
+        error: Optional[str]
+    ):
+        async with session_factory() as session:
+            job = await session.get(QueryJobDB, job_id)
+            await self._delete_chunks(store, job_id, written, job.codec)
+            await self._update(
+                session, job_id, status=status, error=error, chunks=0, finished_at=datetime.utcnow()
+            )
+
+    @staticmethod
+    async def _put_chunk(
+        store: ObjectStore, job_id: str, index: int, codec: Optional[str], rows: List[Dict[str, Any]]
+    ):
+        body = dumps(rows)
+        if codec:
+            body = compress_bytes(body, codec)
+        await store.put(chunk_key(job_id, index, codec), body, "application/json")
+
+    @staticmethod
+    async def _delete_chunks(store: ObjectStore, job_id: str, written: int, codec: Optional[str]):
+        for index in range(written):
+            await store.delete(chunk_key(job_id, index, codec))
+
+    @staticmethod
+    async def _update(session: AsyncSession, job_id: str, **values):
+        job = await session.get(QueryJobDB, job_id)
+        for key, value in values.items():
+            setattr(job, key, value)
+        await session.commit()
+
+    # ---------------------------------------------------------
+    # Results
+    # ---------------------------------------------------------
+    async def read_chunk(self, store: ObjectStore, job: QueryJobDB, page: int) -> List[Dict[str, Any]]:
+        """Rows of page `page` (1-based); one page is one spooled chunk."""
+        if job.status != "completed":
+            raise ValueError(f"Query job {job.id} is {job.status}")
+        if not 1 <= page <= job.chunks:
+            raise LookupError(f"Page {page} out of range (1..{job.chunks})")
+        body = await store.get(chunk_key(job.id, page - 1, job.codec))
+        if job.codec:
+            body = decompress_bytes(body, job.codec)
+        return json.loads(body)
+
+    # ---------------------------------------------------------
+    # Retention
+    # ---------------------------------------------------------
+    async def sweep(
+        self, session_factory: sessionmaker, store: ObjectStore, ttl_s: int, lease_s: Optional[int] = None
+    ) -> int:
+        """
+        Settle unfinished jobs whose lease expired `lease_s` ago (failed,
+        or cancelled if that was asked for), then delete jobs finished
+        more than `ttl_s` ago, with their spooled chunks; returns the
+        number deleted.
+        """
+        now = datetime.utcnow()
+        lease_cutoff = now - timedelta(seconds=lease_s or settings.ASYNC_QUERY_LEASE_S)
+        async with session_factory() as session:
+            result = await session.execute(
+                select(QueryJobDB).where(QueryJobDB.finished_at.is_(None), QueryJobDB.heartbeat_at < lease_cutoff)
+            )
+            for job in result.scalars().all():
+                if job.id in self._tasks:
+                    continue
+                # the chunk being written when the process stopped may exist too
+                await self._delete_chunks(store, job.id, job.chunks + 1, job.codec)
+                if job.status != "cancelled":
+                    job.status, job.error = "failed", "Query job lost its worker (lease expired)"
+                job.chunks, job.finished_at = 0, now
+                await session.commit()
+                logger.warning("Query job lease expired", job_id=job.id, status=job.status)
+
+        cutoff = now - timedelta(seconds=ttl_s)
+        async with session_factory() as session:
+            result = await session.execute(
+                select(QueryJobDB).where(QueryJobDB.status.in_(FINISHED), QueryJobDB.finished_at < cutoff)
+            )
+            expired = result.scalars().all()
+            for job in expired:
+                await self._delete_chunks(store, job.id, job.chunks, job.codec)
+                await session.delete(job)
+                # commit per job: chunks already deleted are not listed again
+                await session.commit()
+        if expired:
+            logger.info("Query job results expired", jobs=len(expired))
+        return len(expired)
+
+    async def run_sweeper(self, registry, every_s: int, ttl_s: int):
+        """Background loop started from the app lifespan."""
+        while True:
+            await asyncio.sleep(every_s)
+            try:
+                await self.sweep(registry.session_factory, registry.s3.store, ttl_s)
+            except Exception as e:
+                logger.error("Query job sweep failed", exc_info=e)
+
+    # ---------------------------------------------------------
+    # Lease
+    # ---------------------------------------------------------
+    async def heartbeat(self, session_factory: sessionmaker):
+        """Renew the lease of the jobs this process holds (queued or running)."""
+        if not self._tasks:
+            return
+        async with session_factory() as session:
+            await session.execute(
+                update(QueryJobDB)
+                .where(QueryJobDB.id.in_(list(self._tasks)), QueryJobDB.finished_at.is_(None))
+                .values(heartbeat_at=datetime.utcnow())
+            )
+            await session.commit()
+
+    async def run_heartbeat(self, registry, every_s: int):
+        """Background loop started from the app lifespan."""
+        while True:
+            await asyncio.sleep(every_s)
+            try:
+                await self.heartbeat(registry.session_factory)
+            except Exception as e:
+                logger.error("Query job heartbeat failed", exc_info=e)
+
+
+# Shared manager — concurrency is bounded per process
+query_jobs = QueryJobManager(
+    max_concurrent=settings.ASYNC_QUERY_MAX_CONCURRENT,
+    chunk_rows=settings.ASYNC_QUERY_CHUNK_ROWS
+)
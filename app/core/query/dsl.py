@@ -0,0 +1,455 @@
+# app/core/query/dsl.py
+import json
+import operator
+import re
+import structlog
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.schema.migration import EXTRAS_COLUMN
+from app.core.schema.versioning import projector
+from app.models.query_models import AggregateSpec, FieldFilter, SortKey
+
+logger = structlog.get_logger()
+
+# Operators in the order they are compiled (keeps output deterministic)
+OPERATORS = ("eq", "ne", "gt", "gte", "lt", "lte", "in", "between", "prefix", "is_null")
+
+# Fields every record has besides its schema fields
+SYSTEM_FIELDS = {"ingested_at": "datetime"}
+
+NUMERIC_TYPES = {"integer", "float"}
+
+# Casts for values read out of the hybrid extras JSONB column
+EXTRAS_CASTS = {"integer": "BIGINT", "float": "DOUBLE PRECISION", "boolean": "BOOLEAN"}
+
+_COMPARE_SQL = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+_COMPARE_PY = {"gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+_COMPARE_MONGO = {"ne": "$ne", "gt": "$gt", "gte": "$gte", "lt": "$lt", "lte": "$lte", "in": "$in"}
+
+
+class Condition(NamedTuple):
+    field: str
+    op: str
+    value: Any
+
+
+# ---------------------------------------------------------
+# Parsing + validation
+# ---------------------------------------------------------
+def parse_filters(filters: Optional[Dict[str, Any]]) -> List[Condition]:
+    """
+    {field: value} is equality (None → is_null); {field: {"gt": 5, ...}}
+    is validated as a FieldFilter and yields one condition per operator.
+    """
+    conditions = []
+    for field, spec in (filters or {}).items():
+        if isinstance(spec, dict) and any(op in spec for op in OPERATORS):
+            parsed = FieldFilter.model_validate(spec)
+            for op in OPERATORS:
+                value = getattr(parsed, "in_" if op == "in" else op)
+                if value is not None:
+                    conditions.append(Condition(field, op, value))
+        elif spec is None:
+            conditions.append(Condition(field, "is_null", True))
+        else:
+            conditions.append(Condition(field, "eq", spec))
+    return conditions
+
+
+def _coerce(value: Any, field_type: str) -> Any:
+    try:
+        if field_type == "integer" and not isinstance(value, bool):
+            return int(value)
+        if field_type == "float" and not isinstance(value, bool):
+            return float(value)
+        if field_type == "boolean" and isinstance(value, str):
+            return value.strip().lower() in ("true", "yes", "1")
+        if field_type == "datetime" and isinstance(value, str):
+            return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Value {value!r} does not fit field type {field_type}")
+    return value
+
+
+def typed_conditions(conditions: List[Condition], types: Dict[str, str]) -> List[Condition]:
+    """Coerce filter values to the fields' schema types (asyncpg binds strictly)."""
+    out = []
+    for c in conditions:
+        field_type = types.get(c.field, "string")
+        if c.op == "prefix" and field_type not in ("string", "date"):
+            raise ValueError(f"prefix needs a string field; {c.field} is {field_type}")
+        if c.op in ("in", "between"):
+            value = [_coerce(v, field_type) for v in c.value]
+        elif c.op == "is_null":
+            value = bool(c.value)
+        else:
+            value = _coerce(c.value, field_type)
+        out.append(Condition(c.field, c.op, value))
+    return out
+
+
+async def field_types(session: AsyncSession, source_id: str) -> Dict[str, str]:
+    """{field: type} of the latest schema (cached by the projector) plus system fields."""
+    version = await projector.latest_version(session, source_id)
+    if version is None:
+        raise LookupError(f"No schema found for source_id={source_id}")
+    schema = (await projector.load_schemas(session, source_id, [version])).get(version, {})
+    return {**{name: meta.get("type", "string") for name, meta in schema.items()}, **SYSTEM_FIELDS}
+
+
+def validate_fields(types: Dict[str, str], names: Iterable[str]):
+    unknown = sorted(set(names) - set(types))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+
+# ---------------------------------------------------------
+# SQL
+# ---------------------------------------------------------
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+class SqlFields:
+    """
+    How a dynamic table exposes each field. On hybrid tables a field
+    outside the typed columns is read from the extras JSONB column (cast
+    to its type; equality stays a containment test so the GIN index
+    applies); fields being promoted are read from both.
+    """
+
+    def __init__(
+        self,
+        columns: Set[str],
+        types: Dict[str, str],
+        column_name: Callable[[str], str],
+        promoting: Set[str] = frozenset()
+    ):
+        self.columns = columns
+        self.types = types
+        self.column_name = column_name
+        self.promoting = promoting
+        self.hybrid = EXTRAS_COLUMN in columns
+
+    def _typed(self, col: str) -> bool:
+        return col in self.columns and col not in self.promoting
+
+    def expr(self, field: str) -> str:
+        col = self.column_name(field)
+        if not self.hybrid or field in SYSTEM_FIELDS or self._typed(col):
+            return _ident(col)
+        cast = EXTRAS_CASTS.get(self.types.get(field))
+        from_extras = f"({_ident(EXTRAS_COLUMN)}->>{_quote(col)})"
+        if cast:
+            from_extras = f"CAST({from_extras} AS {cast})"
+        return f"COALESCE({_ident(col)}, {from_extras})" if col in self.columns else from_extras
+
+    def where(self, conditions: List[Condition], params: Dict[str, Any]) -> List[str]:
+        """WHERE clauses for `conditions`; bind values are added to `params`."""
+        clauses = []
+        for i, c in enumerate(conditions):
+            p, col = f"p{i}", self.column_name(c.field)
+            e = self.expr(c.field)
+            if c.op == "eq":
+                if self.hybrid and c.field not in SYSTEM_FIELDS and not self._typed(col):
+                    params[f"{p}_json"] = json.dumps({col: c.value}, default=str)
+                    contains = f"{_ident(EXTRAS_COLUMN)} @> CAST(:{p}_json AS JSONB)"
+                    if col in self.columns:
+                        params[p] = c.value
+                        contains = f"({_ident(col)} = :{p} OR {contains})"
+                    clauses.append(contains)
+                else:
+                    params[p] = c.value
+                    clauses.append(f"{e} = :{p}")
+            elif c.op == "ne":
+                params[p] = c.value
+                clauses.append(f"{e} IS DISTINCT FROM :{p}")
+            elif c.op in _COMPARE_SQL:
+                params[p] = c.value
+                clauses.append(f"{e} {_COMPARE_SQL[c.op]} :{p}")
+            elif c.op == "in":
+                params[p] = list(c.value)
+                clauses.append(f"{e} = ANY(:{p})")
+            elif c.op == "between":
+                params[f"{p}_lo"], params[f"{p}_hi"] = c.value
+                clauses.append(f"{e} BETWEEN :{p}_lo AND :{p}_hi")
+            elif c.op == "prefix":
+                params[p] = _escape_like(c.value)
+                clauses.append(f"{e} LIKE :{p}")
+            elif c.op == "is_null":
+                clauses.append(f"{e} IS NULL" if c.value else f"{e} IS NOT NULL")
+        return clauses
+
+
+def compile_sql(
+    table: str,
+    conditions: List[Condition],
+    sort: Optional[List[SortKey]],
+    fields: List[str],
+    columns: Set[str],
+    types: Dict[str, str],
+    column_name: Callable[[str], str],
+    promoting: Set[str] = frozenset(),
+    where: Iterable[str] = (),
+    params: Optional[Dict[str, Any]] = None,
+    limit: int = 100
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Parameterized SELECT for a dynamic table (see SqlFields for hybrid
+    tables). `where` adds raw clauses whose values are already in `params`.
+    """
+    params = dict(params or {})
+    table_fields = SqlFields(columns, types, column_name, promoting)
+    clauses = table_fields.where(conditions, params) + list(where)
+
+    if fields:
+        wanted = [column_name(f) for f in fields]
+        select = [c for c in wanted if c in columns] if table_fields.hybrid else wanted
+        if table_fields.hybrid and (len(select) < len(wanted) or promoting & set(select)):
+            select.append(EXTRAS_COLUMN)
+        select_sql = ", ".join(_ident(c) for c in dict.fromkeys(select))
+    else:
+        select_sql = "*"
+
+    sql = f"SELECT {select_sql}\nFROM {_ident(table)}"
+    if clauses:
+        sql += "\nWHERE " + "\n  AND ".join(clauses)
+    if sort:
+        order = [f"{table_fields.expr(k.field)} {k.direction.upper()} NULLS LAST" for k in sort]
+        if "id" in columns:
+            order.append('"id"')       # tie-breaker → stable pages
+        sql += "\nORDER BY " + ", ".join(order)
+    sql += "\nLIMIT :limit"
+    params["limit"] = limit
+    return sql, params
+
+
+def aggregate_alias(spec: AggregateSpec) -> str:
+    return spec.alias or (f"{spec.fn}_{spec.field}" if spec.field else spec.fn)
+
+
+def validate_aggregates(types: Dict[str, str], group_by: List[str], aggregates: List[AggregateSpec]):
+    validate_fields(types, list(group_by) + [a.field for a in aggregates if a.field])
+    for a in aggregates:
+        if a.fn in ("sum", "avg") and types.get(a.field) not in NUMERIC_TYPES:
+            raise ValueError(f"{a.fn} needs a numeric field; {a.field} is {types.get(a.field)}")
+        if a.fn != "count" and not a.field:
+            raise ValueError(f"{a.fn} needs a field")
+
+
+def compile_aggregate_sql(
+    table: str,
+    conditions: List[Condition],
+    group_by: List[str],
+    aggregates: List[AggregateSpec],
+    columns: Set[str],
+    types: Dict[str, str],
+    column_name: Callable[[str], str],
+    time_bucket: Optional[str] = None,
+    promoting: Set[str] = frozenset(),
+    where: Iterable[str] = (),
+    params: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = 1000
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    GROUP BY query: optional `bucket` (date_trunc of ingested_at, UTC),
+    the group fields, then one column per aggregate (named by
+    aggregate_alias); groups come back ordered by their keys.
+    """
+    params = dict(params or {})
+    table_fields = SqlFields(columns, types, column_name, promoting)
+    clauses = table_fields.where(conditions, params) + list(where)
+
+    keys = []
+    if time_bucket:
+        keys.append(f"date_trunc({_quote(time_bucket)}, \"ingested_at\" AT TIME ZONE 'UTC') AS \"bucket\"")
+    keys += [f"{table_fields.expr(g)} AS {_ident(g)}" for g in group_by]
+
+    values = []
+    for a in aggregates:
+        arg = "*" if a.fn == "count" and not a.field else table_fields.expr(a.field)
+        values.append(f"{a.fn.upper()}({arg}) AS {_ident(aggregate_alias(a))}")
+
+    sql = f"SELECT {', '.join(keys + values)}\nFROM {_ident(table)}"
+    if clauses:
+        sql += "\nWHERE " + "\n  AND ".join(clauses)
+    if keys:
+        positions = ", ".join(str(i) for i in range(1, len(keys) + 1))
+        sql += f"\nGROUP BY {positions}\nORDER BY {positions}"
+    if limit is not None:
+        sql += "\nLIMIT :limit"
+        params["limit"] = limit
+    return sql, params
+
+
+# ---------------------------------------------------------
+# Mongo
+# ---------------------------------------------------------
+def mongo_filter(conditions: List[Condition], prefix: str = "record.") -> Dict[str, Any]:
+    by_field: Dict[str, Dict[str, Any]] = {}
+    for c in conditions:
+        ops = by_field.setdefault(f"{prefix}{c.field}" if c.field not in SYSTEM_FIELDS else c.field, {})
+        if c.op == "eq":
+            ops["$eq"] = c.value
+        elif c.op in _COMPARE_MONGO:
+            ops[_COMPARE_MONGO[c.op]] = list(c.value) if c.op == "in" else c.value
+        elif c.op == "between":
+            ops["$gte"], ops["$lte"] = c.value
+        elif c.op == "prefix":
+            ops["$regex"] = "^" + re.escape(c.value)
+        elif c.op == "is_null":
+            ops["$eq" if c.value else "$ne"] = None
+    # a lone equality stays a plain value (simplest plan, same index use)
+    return {k: (v["$eq"] if list(v) == ["$eq"] else v) for k, v in by_field.items()}
+
+
+def mongo_sort(sort: Optional[List[SortKey]], prefix: str = "record.") -> List[Tuple[str, int]]:
+    if not sort:
+        return []
+    keys = [
+        (f"{prefix}{k.field}" if k.field not in SYSTEM_FIELDS else k.field, 1 if k.direction == "asc" else -1)
+        for k in sort
+    ]
+    return keys + [("_id", 1)]
+
+
+def mongo_projection(fields: List[str], prefix: str = "record.") -> Optional[Dict[str, int]]:
+    if not fields:
+        return None
+    return {"schema_version": 1, "ingested_at": 1, **{f"{prefix}{f}": 1 for f in fields}}
+
+
+def compile_mongo(
+    conditions: List[Condition],
+    sort: Optional[List[SortKey]],
+    fields: List[str],
+    window: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """`find` arguments for single-record documents ({filter, sort, projection})."""
+    query = mongo_filter(conditions)
+    if window:
+        current = query.get("ingested_at")
+        if current is not None and not isinstance(current, dict):
+            current = {"$eq": current}
+        query["ingested_at"] = {**(current or {}), **window}
+    return {"filter": query, "sort": mongo_sort(sort), "projection": mongo_projection(fields)}
+
+
+def unwind_stages(prefilter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Turn bucket documents into one {schema_version, ingested_at, record} per record."""
+    stages: List[Dict[str, Any]] = []
+    if prefilter:
+        stages.append({"$match": prefilter})
+    return stages + [
+        {"$project": {
+            "schema_version": 1,
+            "items": {"$ifNull": ["$records", [{"t": "$ingested_at", "r": "$record"}]]},
+        }},
+        {"$unwind": "$items"},
+        {"$project": {"schema_version": 1, "ingested_at": "$items.t", "record": "$items.r"}},
+    ]
+
+
+def compile_mongo_pipeline(
+    conditions: List[Condition],
+    sort: Optional[List[SortKey]],
+    fields: List[str],
+    prefilter: Optional[Dict[str, Any]] = None,
+    window: Optional[Dict[str, Any]] = None,
+    limit: int = 100
+) -> List[Dict[str, Any]]:
+    """
+    Aggregation for bucketed collections: buckets (pruned by `prefilter`,
+    typically the bucket layout's summary query) are unwound into one
+    document per record, then filtered, sorted, limited and projected
+    on the server. Single-record documents pass through unchanged.
+    """
+    stages = unwind_stages(prefilter)
+    match = compile_mongo(conditions, None, [], window)["filter"]
+    if match:
+        stages.append({"$match": match})
+    if sort:
+        stages.append({"$sort": dict(mongo_sort(sort))})
+    stages.append({"$limit": limit})
+    projection = mongo_projection(fields)
+    if projection:
+        stages.append({"$project": projection})
+    return stages
+
+
+def compile_mongo_group(
+    conditions: List[Condition],
+    group_by: List[str],
+    aggregates: List[AggregateSpec],
+    time_bucket: Optional[str] = None,
+    window: Optional[Dict[str, Any]] = None,
+    bucketed: bool = False,
+    prefilter: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = 1000
+) -> List[Dict[str, Any]]:
+    """$group pipeline mirroring compile_aggregate_sql (rows via mongo_group_row)."""
+    stages = unwind_stages(prefilter) if bucketed else []
+    match = compile_mongo(conditions, None, [], window)["filter"]
+    if match:
+        stages.append({"$match": match})
+
+    key: Dict[str, Any] = {}
+    if time_bucket:
+        key["bucket"] = {"$dateTrunc": {"date": "$ingested_at", "unit": time_bucket, "startOfWeek": "monday"}}
+    key.update({g: f"$record.{g}" for g in group_by})
+
+    group: Dict[str, Any] = {"_id": key}
+    for a in aggregates:
+        path = f"$record.{a.field}" if a.field else None
+        if a.fn == "count" and not a.field:
+            group[aggregate_alias(a)] = {"$sum": 1}
+        elif a.fn == "count":
+            group[aggregate_alias(a)] = {"$sum": {"$cond": [{"$eq": [{"$ifNull": [path, None]}, None]}, 0, 1]}}
+        else:
+            group[aggregate_alias(a)] = {f"${a.fn}": path}
+
+    stages += [{"$group": group}, {"$sort": {"_id": 1}}]
+    if limit is not None:
+        stages.append({"$limit": limit})
+    return stages
+
+
+def mongo_group_row(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {**doc["_id"], **{k: v for k, v in doc.items() if k != "_id"}}
+
+
+# ---------------------------------------------------------
+# In-process evaluation (cold tier rows)
+# ---------------------------------------------------------
+def matches(conditions: List[Condition], row: Dict[str, Any], key: Callable[[str], str] = lambda f: f) -> bool:
+    for c in conditions:
+        value = row.get(key(c.field))
+        try:
+            if c.op == "eq" and value != c.value:
+                return False
+            if c.op == "ne" and value == c.value:
+                return False
+            if c.op in _COMPARE_PY and (value is None or not _COMPARE_PY[c.op](value, c.value)):
+                return False
+            if c.op == "in" and value not in c.value:
+                return False
+            if c.op == "between" and (value is None or not c.value[0] <= value <= c.value[1]):
+                return False
+            if c.op == "prefix" and not (isinstance(value, str) and value.startswith(c.value)):
+                return False
+            if c.op == "is_null" and (value is None) != c.value:
+                return False
+        except TypeError:
+            return False
+    return True
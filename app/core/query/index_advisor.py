@@ -0,0 +1,357 @@
+# app/core/query/index_advisor.py
+
+import asyncio
+import hashlib
+import structlog
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select, update, text as sql_text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine
+
+from app.config import settings
+from app.core.query.dsl import SqlFields, field_types
+from app.core.schema.migration import EXTRAS_COLUMN
+from app.core.schema.statistics import fill_absent
+from app.models.query_models import IndexCandidateDB, IndexCandidate
+from app.models.schema_models import FieldSketchDB, FieldStatsDB
+from app.storage.mongo_buckets import bucket_layout
+from app.storage.postgres import sanitize_column_name
+
+logger = structlog.get_logger()
+
+# Postgres truncates identifiers past this length
+MAX_IDENTIFIER = 63
+
+
+def fit_identifier(name: str) -> str:
+    """Names past MAX_IDENTIFIER are cut and keep a hash suffix to stay unique."""
+    if len(name) > MAX_IDENTIFIER:
+        digest = hashlib.sha1(name.encode()).hexdigest()[:8]
+        name = f"{name[:MAX_IDENTIFIER - 9]}_{digest}"
+    return name
+
+
+def index_name_for(source_id: str, backend: str, field: str) -> str:
+    """Deterministic index name."""
+    name = f"ix_{source_id}_{sanitize_column_name(field)}"
+    if backend == "mongodb":
+        name = f"ix_record_{sanitize_column_name(field)}"
+    return fit_identifier(name)
+
+
+def index_expression(field: str, columns: Set[str], field_type: Optional[str] = None) -> Optional[str]:
+    """
+    What to index for `field` in a dynamic table with `columns`: its
+    column (also while it is being promoted into it), or on hybrid tables
+    the expression the query compiler reads it from extras with, cast to
+    `field_type` (SqlFields.expr). Equality on extras is a containment
+    test the GIN index already serves. None if the field is neither.
+    """
+    column = sanitize_column_name(field)
+    if column in columns:
+        return f'"{column}"'
+    if EXTRAS_COLUMN in columns:
+        return SqlFields({EXTRAS_COLUMN}, {field: field_type}, sanitize_column_name).expr(field)
+    return None
+
+
+class IndexAdvisor:
+    """
+    Learns which fields /query filters and sorts on, ranks them as index
+    candidates and builds approved ones online.
+
+    Recording is an in-memory counter bump; counts are flushed into the
+    index_candidates table (hits += delta) periodically from the app
+    lifespan and whenever candidates are listed, so they survive restarts
+    without a write per query.
+    """
+
+    def __init__(self):
+        self._filter_hits: Counter = Counter()
+        self._sort_hits: Counter = Counter()
+
+    # ---------------------------------------------------------
+    # Traffic recording
+    # ---------------------------------------------------------
+    def record(
+        self,
+        source_id: str,
+        backend: str,
+        filter_fields: Iterable[str] = (),
+        sort_fields: Iterable[str] = ()
+    ):
+        for field in filter_fields:
+            self._filter_hits[(source_id, backend, field)] += 1
+        for field in sort_fields:
+            self._sort_hits[(source_id, backend, field)] += 1
+
+    async def flush(self, session: AsyncSession):
+        keys = set(self._filter_hits) | set(self._sort_hits)
+        if not keys:
+            return
+
+        for source_id, backend, field in keys:
+            filter_hits = self._filter_hits.pop((source_id, backend, field), 0)
+            sort_hits = self._sort_hits.pop((source_id, backend, field), 0)
+            stmt = pg_insert(IndexCandidateDB).values(
+                source_id=source_id,
+                backend=backend,
+                field=field,
+                filter_hits=filter_hits,
+                sort_hits=sort_hits,
+                status="candidate"
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["source_id", "backend", "field"],
+                set_={
+                    "filter_hits": IndexCandidateDB.filter_hits + filter_hits,
+                    "sort_hits": IndexCandidateDB.sort_hits + sort_hits,
+                }
+            )
+            await session.execute(stmt)
+
+        await session.commit()
+
+    async def run_flush(self, session_factory, every_s: int):
+        """Background loop started from the app lifespan; flushes once more when cancelled."""
+        try:
+            while True:
+                await asyncio.sleep(every_s)
+                await self._flush_logged(session_factory)
+        finally:
+            await self._flush_logged(session_factory)
+
+    async def _flush_logged(self, session_factory):
+        try:
+            async with session_factory() as session:
+                await self.flush(session)
+        except Exception as e:
+            logger.error("Index hit flush failed", exc_info=e)
+
+    # ---------------------------------------------------------
+    # Ranking
+    # ---------------------------------------------------------
+    @staticmethod
+    def selectivity(field_summary: Optional[Dict]) -> Optional[float]:
+        """distinct / non-null values from the field's sketches (1.0 = unique)."""
+        if not field_summary:
+            return None
+        non_null = field_summary.get("count", 0) - field_summary.get("null_count", 0)
+        if non_null <= 0:
+            return 0.0
+        return min(1.0, field_summary.get("distinct_estimate", 0) / non_null)
+
+    @classmethod
+    def score(cls, row: IndexCandidateDB, selectivity: Optional[float]) -> float:
+        # Unknown selectivity is treated as middling rather than ignored
+        return (row.filter_hits + row.sort_hits) * (0.5 if selectivity is None else selectivity)
+
+    async def candidates(
+        self, session: AsyncSession, source_id: Optional[str] = None
+    ) -> List[IndexCandidate]:
+        await self.flush(session)
+
+        query = select(IndexCandidateDB)
+        if source_id:
+            query = query.where(IndexCandidateDB.source_id == source_id)
+        rows = (await session.execute(query)).scalars().all()
+
+        stats_query = (
+            select(FieldSketchDB.source_id, FieldSketchDB.field, FieldSketchDB.summary, FieldStatsDB.records)
+            .join(FieldStatsDB, FieldStatsDB.source_id == FieldSketchDB.source_id)
+        )
+        if source_id:
+            stats_query = stats_query.where(FieldSketchDB.source_id == source_id)
+        summaries = {
+            (sid, field): fill_absent(summary, records)
+            for sid, field, summary, records in (await session.execute(stats_query)).all()
+        }
+
+        out = []
+        for row in rows:
+            sel = self.selectivity(summaries.get((row.source_id, row.field)))
+            candidate = IndexCandidate.model_validate(row)
+            candidate.selectivity = sel
+            candidate.score = self.score(row, sel)
+            out.append(candidate)
+
+        out.sort(key=lambda c: c.score, reverse=True)
+        return out
+
+    async def get(self, session: AsyncSession, candidate_id: int) -> Optional[IndexCandidateDB]:
+        return await session.get(IndexCandidateDB, candidate_id)
+
+    async def claim(self, session: AsyncSession, candidate_id: int) -> bool:
+        """
+        Mark a candidate "building" unless it already is (or is built).
+        One conditional UPDATE, so of two concurrent approvals only one
+        gets to start a build.
+        """
+        row = await self.get(session, candidate_id)
+        if row is None:
+            return False
+        result = await session.execute(
+            update(IndexCandidateDB)
+            .where(IndexCandidateDB.id == candidate_id, IndexCandidateDB.status.notin_(("building", "built")))
+            .values(
+                status="building",
+                error=None,
+                index_name=index_name_for(row.source_id, row.backend, row.field)
+            )
+        )
+        await session.commit()
+        await session.refresh(row)
+        return result.rowcount == 1
+
+    # ---------------------------------------------------------
+    # Build / drop (online)
+    # ---------------------------------------------------------
+    async def build(self, session: AsyncSession, engine: AsyncEngine, mongo_db, candidate_id: int):
+        """
+        Build the index for a claimed candidate without blocking writers:
+        CREATE INDEX CONCURRENTLY in Postgres (per partition for
+        partitioned tables), a background build in Mongo.
+        """
+        row = await self.get(session, candidate_id)
+        if row is None or row.status != "building":
+            return
+
+        try:
+            if row.backend == "postgresql":
+                field_type = (await field_types(session, row.source_id)).get(row.field)
+                await self._build_postgres(engine, f"data_{row.source_id}", row.index_name, row.field, field_type)
+            else:
+                # bucketed collections keep records under records[].r
+                prefix = "records.r." if bucket_layout.enabled_for(row.source_id) else "record."
+                await mongo_db[f"{row.source_id}_records"].create_index(
+                    [(f"{prefix}{row.field}", 1)], name=row.index_name, background=True
+                )
+
+            row.status = "built"
+            logger.info("Index built", source_id=row.source_id, backend=row.backend, index=row.index_name)
+
+        except Exception as e:
+            # A failed CONCURRENTLY build leaves an INVALID index → drop it
+            row.status = "failed"
+            row.error = str(e)
+            logger.error("Index build failed", exc_info=e, index=row.index_name)
+            if row.backend == "postgresql":
+                await self._drop_postgres(engine, f"data_{row.source_id}", row.index_name)
+
+        await session.commit()
+
+    async def drop(self, session: AsyncSession, engine: AsyncEngine, mongo_db, candidate_id: int):
+        row = await self.get(session, candidate_id)
+        if row is None or not row.index_name:
+            return row
+
+        if row.backend == "postgresql":
+            await self._drop_postgres(engine, f"data_{row.source_id}", row.index_name)
+        else:
+            collection = mongo_db[f"{row.source_id}_records"]
+            if row.index_name in await collection.index_information():
+                await collection.drop_index(row.index_name)
+
+        row.status = "dropped"
+        await session.commit()
+        logger.info("Index dropped", source_id=row.source_id, backend=row.backend, index=row.index_name)
+        return row
+
+    # ---------------------------------------------------------
+    # Postgres helpers
+    # ---------------------------------------------------------
+    @staticmethod
+    def partition_index_name(index_name: str, partition: str) -> str:
+        return fit_identifier(f"{index_name}_{partition}")
+
+    @staticmethod
+    async def _table_info(conn, table_name: str) -> Tuple[Optional[str], Set[str], List[str]]:
+        """(relkind, columns, partitions) of a table; relkind None if it does not exist."""
+        relkind = (await conn.execute(
+            sql_text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:t)"),
+            {"t": f'"{table_name}"'}
+        )).scalar()
+        if relkind is None:
+            return None, set(), []
+
+        columns = {c for (c,) in (await conn.execute(
+            sql_text(
+                "SELECT attname FROM pg_attribute "
+                "WHERE attrelid = to_regclass(:t) AND attnum > 0 AND NOT attisdropped"
+            ),
+            {"t": f'"{table_name}"'}
+        )).all()}
+        partitions = [p for (p,) in (await conn.execute(
+            sql_text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(:t) ORDER BY c.relname"
+            ),
+            {"t": f'"{table_name}"'}
+        )).all()]
+        return relkind, columns, partitions
+
+    async def _build_postgres(
+        self, engine: AsyncEngine, table_name: str, index_name: str, field: str, field_type: Optional[str] = None
+    ):
+        # CONCURRENTLY cannot run inside a transaction block
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            relkind, columns, partitions = await self._table_info(conn, table_name)
+            if relkind is None:
+                raise LookupError(f"Table {table_name} does not exist")
+            expression = index_expression(field, columns, field_type)
+            if expression is None:
+                raise LookupError(f"Field {field} is neither a column nor stored in extras of {table_name}")
+
+            if relkind != "p":
+                await conn.exec_driver_sql(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{index_name}" ON "{table_name}" ({expression})'
+                )
+                return
+
+            # Partitioned parents cannot be indexed CONCURRENTLY: create the
+            # parent index ON ONLY (invalid, no build), build each partition's
+            # concurrently and attach it; the parent turns valid once all are.
+            # Partitions created later get the index from the parent.
+            await conn.exec_driver_sql(
+                f'CREATE INDEX IF NOT EXISTS "{index_name}" ON ONLY "{table_name}" ({expression})'
+            )
+            for partition in partitions:
+                child = self.partition_index_name(index_name, partition)
+                await conn.exec_driver_sql(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{child}" ON "{partition}" ({expression})'
+                )
+                await conn.exec_driver_sql(f'ALTER INDEX "{index_name}" ATTACH PARTITION "{child}"')
+
+    async def _drop_postgres(self, engine: AsyncEngine, table_name: str, index_name: str):
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            relkind, _, partitions = await self._table_info(conn, table_name)
+            if relkind != "p":
+                await conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}"')
+                return
+
+            # Partition indexes not attached yet (a failed build) go on their
+            # own; a partitioned index cannot be dropped CONCURRENTLY, so the
+            # parent (and the attached ones with it) is dropped under a short
+            # lock_timeout.
+            for partition in partitions:
+                child = self.partition_index_name(index_name, partition)
+                attached = (await conn.execute(
+                    sql_text(
+                        "SELECT 1 FROM pg_inherits "
+                        "WHERE inhrelid = to_regclass(:child) AND inhparent = to_regclass(:parent)"
+                    ),
+                    {"child": f'"{child}"', "parent": f'"{index_name}"'}
+                )).scalar()
+                if not attached:
+                    await conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS "{child}"')
+            async with conn.begin():
+                await conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{settings.MIGRATION_LOCK_TIMEOUT_MS}ms'")
+                await conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{index_name}"')
+
+
+# Shared advisor — /query records into it, /admin reads from it
+index_advisor = IndexAdvisor()
@@ -1,91 +1,282 @@
 # app/core/query/llm_translator.py
+import hashlib
+import json
+import re
 import structlog
-from typing import Optional
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Protocol, Tuple
+
+import redis.asyncio as aioredis
 from anthropic import AsyncAnthropic
 from app.config import settings
+from app.core.query.schema_pruner import estimate_tokens, schema_pruner
 from app.models.schema_models import SchemaResponse
+from app.storage.redis_cache import TranslationCache, translation_cache
+from app.utils.metrics import NL_PROMPT_FIELDS, NL_PROMPT_TOKENS, NL_TRANSLATIONS
 
 logger = structlog.get_logger()
 
 
+# Quoted strings, ISO dates/timestamps and standalone numbers
+_LITERAL = re.compile(
+    r"'(?P<sq>[^']*)'"
+    r'|"(?P<dq>[^"]*)"'
+    r"|(?P<date>\b\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2})?)?\b)"
+    r"|(?P<num>(?<![\w.:])-?\d+(?:\.\d+)?(?![\w.]))"
+)
+_PARAM = re.compile(r"(?<![:\w]):(p\d+)\b")
+
+
+def _literal_value(match: re.Match) -> Any:
+    if match.group("sq") is not None:
+        return match.group("sq")
+    if match.group("dq") is not None:
+        return match.group("dq")
+    if match.group("date") is not None:
+        return datetime.fromisoformat(match.group("date"))
+    num = match.group("num")
+    return float(num) if "." in num else int(num)
+
+
+def normalize_question(question: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Replace literals with bind params and normalize the rest, so
+    "Orders over 100?" and "orders  over 500" share the template
+    "orders over :p0". Returns (template, {"p0": 100, ...}).
+    """
+    params: Dict[str, Any] = {}
+
+    def bind(match: re.Match) -> str:
+        name = f"p{len(params)}"
+        params[name] = _literal_value(match)
+        return f":{name}"
+
+    template = _LITERAL.sub(bind, question.strip())
+    template = " ".join(template.lower().split()).rstrip("?.! ")
+    return template, params
+
+
+def schema_fingerprint(schema: SchemaResponse) -> str:
+    """Stable hash of the table name and field names/types (not examples)."""
+    fields = {name: meta.get("type", "string") for name, meta in schema.schema.items()}
+    payload = json.dumps({"source_id": schema.source_id, "fields": fields}, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def bind_mongo_params(query: Any, params: Dict[str, Any]) -> Any:
+    """Substitute ":pN" placeholder strings in a parsed Mongo filter."""
+    if isinstance(query, dict):
+        return {k: bind_mongo_params(v, params) for k, v in query.items()}
+    if isinstance(query, list):
+        return [bind_mongo_params(v, params) for v in query]
+    if isinstance(query, str) and query.startswith(":") and query[1:] in params:
+        return params[query[1:]]
+    return query
+
+
+class Translation(NamedTuple):
+    query: str                  # SQL / Mongo filter with :pN placeholders
+    params: Dict[str, Any]      # literal values pulled out of the question
+    template: str               # normalized question the cache is keyed by
+    cached: bool
+
+
+# ---------------------------------------------------------
+# Model clients (swappable; tests pass a local fake)
+# ---------------------------------------------------------
+class ModelClient(Protocol):
+    async def complete(self, prompt: str, max_tokens: int) -> str:
+        ...
+
+
+class AnthropicModelClient:
+    """Claude Messages API"""
+
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
+        self.client = AsyncAnthropic(api_key=api_key or settings.ANTHROPIC_API_KEY)
+        self.model = model or settings.LLM_MODEL
+
+    async def complete(self, prompt: str, max_tokens: int) -> str:
+        response = await self.client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        )
+        return response.content[0].text
+
+
 class LLMQueryTranslator:
     """Translate natural language queries to database queries using LLM"""
-    
-    def __init__(self):
-        self.client = AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY)
-    
+
+    def __init__(self, client: Optional[ModelClient] = None, cache: TranslationCache = translation_cache):
+        self._client = client
+        self.cache = cache
+
+    @property
+    def client(self) -> ModelClient:
+        # created on first use, so importing never needs an API key
+        if self._client is None:
+            self._client = AnthropicModelClient()
+        return self._client
+
     async def translate(
         self,
         nl_query: str,
         schema: SchemaResponse,
-        target_db: str = "postgresql"
-    ) -> str:
+        target_db: str = "postgresql",
+        redis: Optional[aioredis.Redis] = None,
+        field_stats: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Translation:
         """
-        Translate natural language to database query
-        
+        Translate natural language to a parameterized database query
+
         Args:
             nl_query: Natural language query
             schema: Current schema for the source
             target_db: Target database type (postgresql, mongodb)
-        
+            redis: Shared client for the cross-worker translation cache
+            field_stats: Per-field statistics summary (prunes wide schemas)
+
         Returns:
-            Database query string
+            Translation (query with :pN placeholders + their values)
+        """
+        return (await self.translate_many([nl_query], schema, target_db, redis, field_stats))[0]
+
+    async def translate_many(
+        self,
+        nl_queries: List[str],
+        schema: SchemaResponse,
+        target_db: str = "postgresql",
+        redis: Optional[aioredis.Redis] = None,
+        field_stats: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> List[Translation]:
+        """
+        Translate several questions; cache misses share ONE model call
+        (the reply is a JSON array). Returns translations in input order.
         """
+        if target_db not in ("postgresql", "mongodb"):
+            raise ValueError(f"Unsupported target_db: {target_db}")
+
+        fingerprint = schema_fingerprint(schema)
+        normalized = [normalize_question(q) for q in nl_queries]
+        out: List[Optional[Translation]] = [None] * len(normalized)
+        misses: Dict[str, List[int]] = {}       # template → question positions
+
+        for i, (template, params) in enumerate(normalized):
+            query = await self.cache.get(redis, self.cache.key(fingerprint, target_db, template))
+            if query is not None:
+                out[i] = Translation(query, params, template, cached=True)
+                NL_TRANSLATIONS.labels(target_db=target_db, origin="cache").inc()
+            else:
+                misses.setdefault(template, []).append(i)
+
+        if not misses:
+            return out
+
+        templates = list(misses)
+        params_list = [normalized[misses[t][0]][1] for t in templates]
         try:
-            # Build schema context
-            schema_context = self._build_schema_context(schema, target_db)
-            
-            # Create prompt
-            prompt = self._create_prompt(nl_query, schema_context, target_db)
-            
-            # Call Claude API
-            response = await self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1000,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            query = response.content[0].text.strip()
-            
-            # Extract query from code blocks if present
-            if "```" in query:
-                query = self._extract_query_from_codeblock(query)
-            
+            # Create prompt (the model only ever sees the templates)
+            prompt = self._fit_prompt(templates, params_list, schema, target_db, field_stats)
+
+            reply = (await self.client.complete(prompt, settings.LLM_MAX_TOKENS * len(templates))).strip()
+            if len(templates) == 1:
+                queries = [self._extract_query_from_codeblock(reply) if "```" in reply else reply]
+            else:
+                queries = self._parse_batch_reply(reply, len(templates))
+
+            for query, params in zip(queries, params_list):
+                unknown = set(_PARAM.findall(query)) - set(params)
+                if unknown:
+                    raise ValueError(f"Generated query uses unknown parameters: {sorted(unknown)}")
+
             logger.info(
                 "Query translated",
-                nl_query=nl_query,
+                nl_queries=templates,
                 target_db=target_db,
-                generated_query=query[:200]
+                generated_queries=[q[:200] for q in queries]
             )
-            
-            return query
-            
+
         except Exception as e:
             logger.error("Query translation failed", exc_info=e)
             raise
-    
-    def _build_schema_context(self, schema: SchemaResponse, target_db: str) -> str:
+
+        NL_TRANSLATIONS.labels(target_db=target_db, origin="model").inc(len(templates))
+        for template, query in zip(templates, queries):
+            await self.cache.set(redis, self.cache.key(fingerprint, target_db, template), query)
+            for i in misses[template]:
+                out[i] = Translation(query, normalized[i][1], template, cached=False)
+        return out
+
+    def _fit_prompt(
+        self,
+        templates: List[str],
+        params_list: List[Dict[str, Any]],
+        schema: SchemaResponse,
+        target_db: str,
+        field_stats: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> str:
+        """
+        Prompt with the pruned schema, kept under NL_PROMPT_TOKEN_BUDGET:
+        examples go first, then the least relevant fields.
+        """
+        budget = settings.NL_PROMPT_TOKEN_BUDGET
+        fields = schema_pruner.rank(schema.schema, templates, params_list, field_stats)
+        examples = True
+
+        while True:
+            context = self._build_schema_context(schema, target_db, fields, examples)
+            if len(templates) == 1:
+                prompt = self._create_prompt(templates[0], sorted(params_list[0]), context, target_db)
+            else:
+                prompt = self._create_batch_prompt(templates, context, target_db)
+
+            tokens = estimate_tokens(prompt)
+            if tokens <= budget:
+                break
+            if examples:
+                examples = False
+            elif fields:
+                keep = int(len(fields) * budget / tokens)
+                fields = fields[: min(keep, len(fields) - 1)]
+            else:
+                raise ValueError(f"Prompt needs ~{tokens} tokens, over the budget of {budget}")
+
+        mode = "single" if len(templates) == 1 else "batch"
+        NL_PROMPT_TOKENS.labels(target_db=target_db, mode=mode).observe(tokens)
+        NL_PROMPT_FIELDS.labels(target_db=target_db).observe(len(fields))
+        return prompt
+
+    def _build_schema_context(
+        self,
+        schema: SchemaResponse,
+        target_db: str,
+        fields: Optional[List[str]] = None,
+        examples: bool = True
+    ) -> str:
         """Build schema description for LLM"""
+        fields = list(schema.schema) if fields is None else fields
         lines = [f"Table/Collection: data_{schema.source_id}", ""]
-        lines.append("Fields:")
-        
-        for field in schema.fields:
-            field_type = field.type
-            if target_db == "postgresql":
-                field_type = getattr(field, 'sql_type', field.type)
-            
-            nullable = "NULL" if field.nullable else "NOT NULL"
-            lines.append(f"  - {field.name}: {field_type} {nullable}")
-            
-            if field.example_value:
-                lines.append(f"    Example: {field.example_value[:50]}")
-        
+        if len(fields) < len(schema.schema):
+            lines.append(f"Fields (the {len(fields)} of {len(schema.schema)} relevant to the question):")
+        else:
+            lines.append("Fields:")
+
+        for name in fields:
+            meta = schema.schema[name]
+            nullable = "NULL" if meta.get("nullable", True) else "NOT NULL"
+            lines.append(f"  - {name}: {meta.get('type', 'string')} {nullable}")
+
+            if examples and meta.get("example") is not None:
+                lines.append(f"    Example: {str(meta['example'])[:50]}")
+
         return "\n".join(lines)
-    
-    def _create_prompt(self, nl_query: str, schema_context: str, target_db: str) -> str:
+
+    def _create_prompt(self, nl_query: str, param_names: list, schema_context: str, target_db: str) -> str:
         """Create prompt for LLM"""
+        placeholders = ", ".join(f":{p}" for p in param_names) or "none"
         if target_db == "postgresql":
             return f"""You are a SQL expert. Convert the following natural language query to a PostgreSQL SQL query.
 
@@ -94,9 +285,12 @@ Schema:
 
 Natural language query: {nl_query}
 
+Values in the query were replaced by bind parameters ({placeholders}).
+Use them exactly as written (e.g. WHERE amount > :p0) and never inline their values.
+
 Return ONLY the SQL query, no explanations. Use proper SQL syntax.
 Example format: SELECT field1, field2 FROM table WHERE condition;"""
-        
+
         elif target_db == "mongodb":
             return f"""You are a MongoDB expert. Convert the following natural language query to a MongoDB query.
 
@@ -105,17 +299,60 @@ Collection Schema:
 
 Natural language query: {nl_query}
 
+Values in the query were replaced by bind parameters ({placeholders}).
+Write each one as a quoted string in place of the value, e.g. {{"amount": {{"$gt": ":p0"}}}}.
+
 Return ONLY the MongoDB query as a Python dict, no explanations.
 Example format: {{"field": {{"$gt": value}}}}"""
-        
+
+        else:
+            raise ValueError(f"Unsupported target_db: {target_db}")
+
+    def _create_batch_prompt(self, nl_queries: List[str], schema_context: str, target_db: str) -> str:
+        """One prompt for several questions; placeholders are numbered per question"""
+        numbered = "\n".join(f"{i}. {q}" for i, q in enumerate(nl_queries, 1))
+        if target_db == "postgresql":
+            role, target, hint = "a SQL expert", "a PostgreSQL SQL query", "Use them exactly as written (e.g. WHERE amount > :p0)"
+        elif target_db == "mongodb":
+            role, target, hint = (
+                "a MongoDB expert", "a MongoDB query (a Python dict literal)",
+                'Write each one as a quoted string in place of the value, e.g. {"amount": {"$gt": ":p0"}}'
+            )
         else:
             raise ValueError(f"Unsupported target_db: {target_db}")
-    
+
+        return f"""You are {role}. Convert each of the following natural language queries to {target}.
+
+Schema:
+{schema_context}
+
+Natural language queries:
+{numbered}
+
+Values in each query were replaced by bind parameters (:p0, :p1, ... numbered per query).
+{hint} and never inline their values.
+
+Return ONLY a JSON array of strings, one query per item in the same order, no explanations."""
+
+    def _parse_batch_reply(self, text: str, expected: int) -> List[str]:
+        if "```" in text:
+            text = self._extract_query_from_codeblock(text)
+        try:
+            queries = json.loads(text)
+        except ValueError:
+            raise ValueError("Batch translation reply is not a JSON array")
+        if not isinstance(queries, list) or len(queries) != expected:
+            raise ValueError(f"Batch translation returned {len(queries) if isinstance(queries, list) else 0} queries, expected {expected}")
+        return [str(q).strip() for q in queries]
+
     def _extract_query_from_codeblock(self, text: str) -> str:
         """Extract query from markdown code block"""
-        import re
-        pattern = r'```(?:sql|python|mongodb)?\n(.*?)\n```'
+        pattern = r'```(?:sql|python|mongodb|json)?\n(.*?)\n```'
         match = re.search(pattern, text, re.DOTALL)
         if match:
             return match.group(1).strip()
-        return text.strip()
\ No newline at end of file
+        return text.strip()
+
+
+# Shared translator — /query/nl uses it (tests override get_translator)
+llm_translator = LLMQueryTranslator()
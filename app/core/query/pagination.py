@@ -0,0 +1,46 @@
+# app/core/query/pagination.py
+
+import base64
+import json
+import structlog
+from typing import Any, Dict, NamedTuple, Optional
+
+logger = structlog.get_logger()
+
+
+class PageCursor(NamedTuple):
+    """
+    Keyset position: the last key returned (Mongo `_id` as a string, or
+    the Postgres `id`), the entry inside that document for buckets, the
+    page number reached so far, and the passed buckets that may still get
+    appends ({_id: entries read}, see MongoDBStorage.page_after).
+    """
+    backend: str
+    key: Any
+    entry: Optional[int] = None
+    page: int = 1
+    open: Optional[Dict[str, int]] = None
+
+
+def encode_cursor(cursor: PageCursor) -> str:
+    """Opaque, URL-safe token; clients pass it back unchanged."""
+    payload = {"b": cursor.backend, "k": cursor.key, "e": cursor.entry, "p": cursor.page}
+    if cursor.open:
+        payload["o"] = cursor.open
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, backend: str) -> PageCursor:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        cursor = PageCursor(
+            payload["b"], payload["k"], payload.get("e"), int(payload.get("p", 1)),
+            {str(k): int(v) for k, v in payload["o"].items()} if payload.get("o") else None
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if cursor.backend != backend:
+        raise ValueError(f"Cursor was issued for {cursor.backend}, not {backend}")
+    return cursor
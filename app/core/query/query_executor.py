@@ -1,75 +1,270 @@
 # app/core/query/query_executor.py
+import json
+import re
 import structlog
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from app.models.database import get_mongo
+from sqlalchemy.exc import DBAPIError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import ExecutionTimeout
+
+from app.config import settings
+from app.core.query.llm_translator import bind_mongo_params
+from app.storage.mongo_buckets import bucket_layout
 
 logger = structlog.get_logger()
 
+_TRAILING_LIMIT = re.compile(r"\blimit\s+(\d+|:\w+|all)(\s+offset\s+(\d+|:\w+))?\s*$", re.IGNORECASE)
+_READ_ONLY = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+
+class QueryRejected(ValueError):
+    """Generated SQL whose estimated plan is over budget; carries the plan summary."""
+
+    def __init__(self, message: str, plan: Dict[str, Any]):
+        super().__init__(message)
+        self.plan = plan
+
+
+def inject_limit(query: str, limit: int) -> str:
+    """Append LIMIT to a statement without a trailing one."""
+    query = query.strip().rstrip(";").rstrip()
+    if _TRAILING_LIMIT.search(query):
+        return query
+    return f"{query}\nLIMIT {int(limit)}"
+
+
+def prefix_fields(query: Dict[str, Any], prefix: str = "record.") -> Dict[str, Any]:
+    """
+    Point a generated Mongo filter's field names (the bare schema names the
+    prompt lists) at where records are stored. Logical operators are
+    followed; names already carrying the prefix are kept.
+    """
+    out = {}
+    for key, value in query.items():
+        if key in ("$and", "$or", "$nor") and isinstance(value, list):
+            out[key] = [prefix_fields(v, prefix) if isinstance(v, dict) else v for v in value]
+        elif key.startswith("$") or key.startswith(prefix):
+            out[key] = value
+        else:
+            out[prefix + key] = value
+    return out
+
+
+def summarize_plan(plan: Any) -> Dict[str, Any]:
+    """
+    Compact view of an EXPLAIN (FORMAT JSON) plan: root estimates, the
+    sequential scans and the nested loops with no join condition (the
+    signature of an accidental cross join).
+    """
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]["Plan"]
+    seq_scans, cross_joins = [], 0
+
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        children = node.get("Plans", [])
+        if node["Node Type"] == "Seq Scan":
+            seq_scans.append({
+                "relation": node.get("Relation Name"),
+                "rows": node.get("Plan Rows"),
+                "filter": node.get("Filter"),
+            })
+        if node["Node Type"] == "Nested Loop" and not node.get("Join Filter") and not any(
+            "Index Cond" in c or "Filter" in c for c in children
+        ):
+            cross_joins += 1
+        stack.extend(children)
+
+    return {
+        "node_type": root["Node Type"],
+        "total_cost": root.get("Total Cost"),
+        "plan_rows": root.get("Plan Rows"),
+        "seq_scans": seq_scans,
+        "cross_joins": cross_joins,
+    }
+
 
 class QueryExecutor:
-    """Execute database queries"""
-    
+    """
+    Execute database queries.
+
+    Generated SQL is guarded before it runs: a LIMIT is injected when the
+    statement has none, `EXPLAIN (FORMAT JSON)` must come in under
+    `max_cost` and `max_rows`, and every statement runs with a
+    transaction-local `statement_timeout` (Mongo finds get `maxTimeMS`).
+    """
+
+    def __init__(
+        self,
+        max_cost: Optional[float] = None,
+        max_rows: Optional[int] = None,
+        timeout_ms: Optional[int] = None,
+        default_limit: Optional[int] = None
+    ):
+        self.max_cost = max_cost if max_cost is not None else settings.SQL_MAX_PLAN_COST
+        self.max_rows = max_rows if max_rows is not None else settings.SQL_MAX_PLAN_ROWS
+        self.timeout_ms = timeout_ms if timeout_ms is not None else settings.SQL_STATEMENT_TIMEOUT_MS
+        self.default_limit = default_limit if default_limit is not None else settings.SQL_DEFAULT_LIMIT
+
     async def execute(
         self,
         query: str,
         source_id: str,
         target_db: str,
-        db_session: AsyncSession
+        db_session: AsyncSession,
+        mongo_db: Optional[AsyncIOMotorDatabase] = None,
+        params: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
-        """Execute query and return results"""
+        """Execute query and return results (`params` bind the :pN placeholders)"""
         try:
             if target_db == "postgresql":
-                return await self._execute_sql(query, source_id, db_session)
+                return await self._execute_sql(query, source_id, db_session, params)
             elif target_db == "mongodb":
-                return await self._execute_mongo(query, source_id)
+                return await self._execute_mongo(query, source_id, mongo_db, params)
             else:
                 raise ValueError(f"Unsupported database: {target_db}")
-                
+
+        except QueryRejected as e:
+            logger.warning("Query rejected by cost guardrail", reason=str(e), plan=e.plan, query=query)
+            raise
         except Exception as e:
             logger.error("Query execution failed", exc_info=e, query=query)
             raise
-    
+
     async def _execute_sql(
         self,
         query: str,
         source_id: str,
-        db_session: AsyncSession
+        db_session: AsyncSession,
+        params: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
         """Execute SQL query"""
         # Security: Basic SQL injection prevention
         if any(keyword in query.upper() for keyword in ['DROP', 'DELETE', 'TRUNCATE', 'ALTER']):
             raise ValueError("Destructive SQL operations not allowed")
-        
-        result = await db_session.execute(text(query))
-        rows = result.fetchall()
-        
+
+        if not _READ_ONLY.match(query):
+            raise ValueError("Only SELECT / WITH queries can be executed")
+
+        statement = inject_limit(query, self.default_limit)
+        if ";" in statement:
+            raise ValueError("Only a single statement can be executed")
+        # whole placeholder names only: :p1 must not pick up :p10
+        params = {k: v for k, v in (params or {}).items() if re.search(rf":{re.escape(k)}\b", statement)}
+
+        # A transaction of its own, READ ONLY: writes the checks above miss
+        # (a data-modifying CTE, SELECT ... INTO) fail in Postgres itself
+        await db_session.commit()
+        try:
+            await db_session.execute(text("SET TRANSACTION READ ONLY"))
+            # Cost guardrail: the timeout also bounds EXPLAIN itself
+            await db_session.execute(text(f"SET LOCAL statement_timeout = {int(self.timeout_ms)}"))
+            plan = summarize_plan((await db_session.execute(text(f"EXPLAIN (FORMAT JSON) {statement}"), params)).scalar())
+            reasons = self._over_budget(plan)
+            if reasons:
+                plan["indexed_columns"] = await self._indexed_columns(db_session, f"data_{source_id}")
+                raise QueryRejected(self._rejection(reasons, plan), plan)
+
+            try:
+                result = await db_session.execute(text(statement), params)
+            except DBAPIError as e:
+                if "QueryCanceled" in type(e.orig).__name__ or "statement timeout" in str(e.orig):
+                    raise TimeoutError(f"Query exceeded statement_timeout ({self.timeout_ms} ms)")
+                if "ReadOnlySqlTransaction" in type(e.orig).__name__ or "read-only transaction" in str(e.orig):
+                    raise ValueError("Generated SQL tries to write; only reads can be executed")
+                raise
+            rows = result.fetchall()
+        finally:
+            await db_session.rollback()
+
         # Convert to list of dicts
         if rows:
             columns = result.keys()
             return [dict(zip(columns, row)) for row in rows]
-        
+
         return []
-    
-    async def _execute_mongo(self, query: str, source_id: str) -> List[Dict[str, Any]]:
-        """Execute MongoDB query"""
+
+    def _over_budget(self, plan: Dict[str, Any]) -> List[str]:
+        reasons = []
+        if plan["total_cost"] is not None and plan["total_cost"] > self.max_cost:
+            reasons.append(f"estimated cost {plan['total_cost']:.0f} > {self.max_cost:.0f}")
+        if plan["plan_rows"] is not None and plan["plan_rows"] > self.max_rows:
+            reasons.append(f"estimated rows {plan['plan_rows']} > {self.max_rows}")
+        return reasons
+
+    @staticmethod
+    def _rejection(reasons: List[str], plan: Dict[str, Any]) -> str:
+        hints = []
+        if plan["cross_joins"]:
+            hints.append("add a join condition between the joined tables")
+        if any(s["filter"] is None for s in plan["seq_scans"]):
+            indexed = ", ".join(plan.get("indexed_columns") or []) or "an indexed column"
+            hints.append(f"filter on {indexed}")
+        message = "Query over budget: " + ", ".join(reasons)
+        if hints:
+            message += " (" + "; ".join(hints) + ")"
+        return message
+
+    @staticmethod
+    async def _indexed_columns(db_session: AsyncSession, table: str) -> List[str]:
+        result = await db_session.execute(
+            text(
+                "SELECT DISTINCT a.attname FROM pg_index i "
+                "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+                "WHERE i.indrelid = to_regclass(:table) ORDER BY a.attname"
+            ),
+            {"table": f'"{table}"'}
+        )
+        return [r[0] for r in result.fetchall()]
+
+    async def _execute_mongo(
+        self,
+        query: str,
+        source_id: str,
+        mongo_db: AsyncIOMotorDatabase,
+        params: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Execute MongoDB query (async Motor — never blocks the loop)"""
         import ast
-        
+
         # Parse query string to dict
         try:
             query_dict = ast.literal_eval(query)
-        except:
-            query_dict = {}
-        
-        mongo_db = get_mongo()
-        collection = mongo_db.parsed_data
-        
-        cursor = collection.find({"source_id": source_id, **query_dict})
-        results = await cursor.to_list(length=100)
-        
+        except (ValueError, SyntaxError) as e:
+            raise ValueError(f"Generated MongoDB query is not a dict literal: {e}")
+        if not isinstance(query_dict, dict):
+            raise ValueError("Generated MongoDB query is not a dict literal")
+        query_dict = prefix_fields(bind_mongo_params(query_dict, params or {}))
+
+        collection = mongo_db[f"{source_id}_records"]
+
+        if bucket_layout.enabled_for(source_id):
+            # unwind buckets into the single-record shape, then match on it
+            cursor = collection.aggregate([
+                {"$match": {"source_id": source_id}},
+                {"$unwind": {"path": "$records", "preserveNullAndEmptyArrays": True}},
+                {"$project": {
+                    "source_id": 1,
+                    "schema_version": 1,
+                    "ingested_at": {"$ifNull": ["$records.t", "$ingested_at"]},
+                    "record": {"$ifNull": ["$records.r", "$record"]},
+                }},
+                {"$match": query_dict},
+                {"$limit": 100},
+            ], maxTimeMS=self.timeout_ms)
+        else:
+            cursor = collection.find({"source_id": source_id, **query_dict}).max_time_ms(self.timeout_ms)
+        try:
+            results = await cursor.to_list(length=100)
+        except ExecutionTimeout:
+            raise TimeoutError(f"Query exceeded maxTimeMS ({self.timeout_ms} ms)")
+
         # Remove MongoDB _id
         for result in results:
             result.pop('_id', None)
-        
-        return results
\ No newline at end of file
+
+        return results
@@ -0,0 +1,133 @@
+# app/core/query/result_normalizer.py
+
+import base64
+import json
+import structlog
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Type, TypeVar
+from uuid import UUID
+
+from bson import ObjectId
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # optional dependency → stdlib json
+    orjson = None
+
+from app.config import settings
+from app.storage.compression import available_codecs, compress_bytes
+
+logger = structlog.get_logger()
+
+M = TypeVar("M", bound=BaseModel)
+
+# HTTP Content-Encoding token per codec
+CONTENT_ENCODINGS = {"zstd": "zstd", "gzip": "gzip"}
+
+
+def _default(value: Any) -> Any:
+    """Driver types the JSON encoders do not know (asyncpg NUMERIC, Mongo ids, ...)."""
+    if isinstance(value, Decimal):
+        if not value.is_finite():
+            return None
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (ObjectId, UUID)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(payload: Any) -> bytes:
+    """
+    Serialize in one pass: orjson when installed (native datetime/UUID),
+    else stdlib json; both fall back to `_default` for the rest.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+def to_columns(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Column-oriented shape: keys once, then one list per row (columns in first-seen order)."""
+    columns: Dict[str, None] = {}
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns[key] = None
+    names = list(columns)
+    return {"columns": names, "rows": [[row.get(c) for c in names] for row in rows]}
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick a codec from an Accept-Encoding header: the highest q-value among
+    the codecs available here, zstd first on ties; None for identity.
+    """
+    weights: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[token.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for codec in available_codecs():
+        q = weights.get(CONTENT_ENCODINGS[codec], weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = codec, q
+    return best
+
+
+def build_response(model: Type[M], rows: List[Dict[str, Any]], **fields: Any) -> M:
+    """
+    Response model for `rows`; past RESULT_VALIDATE_MAX_ROWS the rows
+    are trusted (they come from our own queries) and validation is skipped.
+    """
+    if len(rows) > settings.RESULT_VALIDATE_MAX_ROWS:
+        return model.model_construct(**fields)
+    return model(**fields)
+
+
+def render(
+    payload: Dict[str, Any],
+    accept_encoding: Optional[str] = None,
+    shape: str = "rows",
+    rows_key: str = "records",
+    status_code: int = 200
+) -> Response:
+    """
+    Serialized (and, past RESPONSE_COMPRESS_MIN_BYTES, compressed) JSON
+    response. `shape="columns"` replaces `payload[rows_key]` with
+    `columns` + `rows`. Returning a Response skips FastAPI's
+    response_model pass over the rows.
+    """
+    if shape == "columns":
+        rows = payload.get(rows_key) or []
+        payload = {k: v for k, v in payload.items() if k != rows_key}
+        payload.update(to_columns(rows))
+
+    body = dumps(payload)
+    headers = {"Vary": "Accept-Encoding"}
+    codec = negotiate_encoding(accept_encoding) if len(body) >= settings.RESPONSE_COMPRESS_MIN_BYTES else None
+    if codec:
+        body = compress_bytes(body, codec)
+        headers["Content-Encoding"] = CONTENT_ENCODINGS[codec]
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
@@ -0,0 +1,346 @@
+# app/core/query/rollups.py
+
+import json
+import structlog
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, func, select, text as sql_text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core.query.dsl import Condition, aggregate_alias, compile_aggregate_sql
+from app.models.query_models import AggregateRequest, AggregateSpec, RollupValueDB
+from app.models.source_models import TieringStateDB
+from app.storage.partitions import interval_start
+from app.storage.postgres import migrations, sanitize_column_name
+from app.storage.tiering import tiering
+
+logger = structlog.get_logger()
+
+TIME_BUCKETS = ("hour", "day", "week", "month")
+ROW_COUNT = "*"
+
+
+class RollupSpec(NamedTuple):
+    name: str                   # "orders:day:status"
+    source_id: str
+    time_bucket: str
+    group_by: Tuple[str, ...]
+    metrics: Tuple[str, ...]    # numeric fields with count/sum/min/max kept
+
+
+def parse_rollups(spec: str) -> List[RollupSpec]:
+    """
+    'orders:day:status+region:amount,...' → specs; the metrics part is
+    optional ("orders:day:status" keeps only row counts).
+    """
+    rollups = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        parts = [p.strip() for p in item.split(":")]
+        if len(parts) not in (3, 4) or parts[1] not in TIME_BUCKETS:
+            raise ValueError(f"Bad rollup spec {item!r}; expected source:bucket:group[+group][:metric[+metric]]")
+        group_by = tuple(g for g in parts[2].split("+") if g)
+        metrics = tuple(m for m in parts[3].split("+") if m) if len(parts) == 4 else ()
+        rollups.append(RollupSpec(":".join(parts[:3]), parts[0], parts[1], group_by, metrics))
+    return rollups
+
+
+def bucket_start(ts: datetime, bucket: str) -> datetime:
+    ts = ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    if bucket == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return interval_start(ts, bucket)
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
+class RollupManager:
+    """
+    Declared rollups (ROLLUPS setting), e.g. a daily count per status,
+    kept in `rollup_values` and updated incrementally in the same
+    transaction that inserts a batch's rows (write_postgres), so live
+    writes and spool replays alike are counted exactly once per row write.
+
+    A per-source advisory lock orders batch upserts against `rebuild`
+    (which recomputes a rollup, e.g. after a backfill: the hot table from
+    the tiering watermark on, the cold tier below it). Rollup rows
+    outlive tiering: moving rows to the cold tier does not touch them.
+
+    `/query/aggregate` asks `match` whether a rollup can answer a request
+    (group fields, bucket and metrics covered; only equality filters on
+    group fields; window on bucket boundaries) and then reads O(groups ×
+    buckets) rollup rows instead of scanning records.
+    """
+
+    def __init__(self, specs: List[RollupSpec]):
+        self.specs = specs
+
+    def for_source(self, source_id: str) -> List[RollupSpec]:
+        return [s for s in self.specs if s.source_id == source_id]
+
+    def get(self, name: str) -> Optional[RollupSpec]:
+        return next((s for s in self.specs if s.name == name), None)
+
+    @staticmethod
+    async def _lock(conn, source_id: str):
+        await conn.execute(sql_text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"rollup:{source_id}"})
+
+    # ---------------------------------------------------------
+    # Incremental maintenance
+    # ---------------------------------------------------------
+    @staticmethod
+    def fold(
+        spec: RollupSpec,
+        batches: List[Tuple[List[Dict[str, Any]], datetime]]
+    ) -> List[Dict[str, Any]]:
+        """Pre-aggregate batches into rollup rows (deltas), sorted by key."""
+        acc: Dict[Tuple, Dict[str, Any]] = {}
+        for records, ingested_at in batches:
+            start = bucket_start(ingested_at, spec.time_bucket)
+            for rec in records:
+                values = {g: rec.get(g) for g in spec.group_by}
+                group_key = json.dumps([values[g] for g in spec.group_by], default=str)
+                for metric in (ROW_COUNT,) + spec.metrics:
+                    key = (start, group_key, metric)
+                    row = acc.get(key)
+                    if row is None:
+                        row = acc[key] = {
+                            "rollup": spec.name, "source_id": spec.source_id, "bucket_start": start,
+                            "group_key": group_key, "group_values": values, "metric": metric,
+                            "count": 0, "sum": None, "min": None, "max": None,
+                        }
+                    if metric == ROW_COUNT:
+                        row["count"] += 1
+                        continue
+                    value = _number(rec.get(metric))
+                    if value is None:
+                        continue
+                    row["count"] += 1
+                    row["sum"] = (row["sum"] or 0.0) + value
+                    row["min"] = value if row["min"] is None else min(row["min"], value)
+                    row["max"] = value if row["max"] is None else max(row["max"], value)
+        return [acc[k] for k in sorted(acc, key=lambda k: (k[0], k[1], k[2]))]
+
+    async def apply(
+        self,
+        session: AsyncSession,
+        source_id: str,
+        batches: List[Tuple[List[Dict[str, Any]], datetime]]
+    ):
+        """Upsert the batches' deltas; commits with the caller's transaction."""
+        specs = self.for_source(source_id)
+        if not specs:
+            return
+        await self._lock(session, source_id)
+        for spec in specs:
+            rows = self.fold(spec, batches)
+            if not rows:
+                continue
+            stmt = pg_insert(RollupValueDB).values(rows)
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=["rollup", "bucket_start", "group_key", "metric"],
+                set_={
+                    "count": RollupValueDB.count + stmt.excluded.count,
+                    "sum": func.coalesce(RollupValueDB.sum, 0) + func.coalesce(stmt.excluded.sum, 0),
+                    "min": func.least(RollupValueDB.min, stmt.excluded.min),
+                    "max": func.greatest(RollupValueDB.max, stmt.excluded.max),
+                }
+            ))
+
+    @staticmethod
+    def _merge(acc: Dict[Tuple, Dict[str, Any]], rows: List[Dict[str, Any]]):
+        """Add rollup rows into `acc` (keyed by bucket, group, metric)."""
+        for row in rows:
+            key = (row["bucket_start"], row["group_key"], row["metric"])
+            have = acc.get(key)
+            if have is None:
+                acc[key] = dict(row)
+                continue
+            have["count"] += row["count"]
+            if row["sum"] is not None:
+                have["sum"] = (have["sum"] or 0.0) + row["sum"]
+            if row["min"] is not None:
+                have["min"] = row["min"] if have["min"] is None else min(have["min"], row["min"])
+            if row["max"] is not None:
+                have["max"] = row["max"] if have["max"] is None else max(have["max"], row["max"])
+
+    async def _fold_cold(
+        self,
+        registry,
+        spec: RollupSpec,
+        acc: Dict[Tuple, Dict[str, Any]],
+        watermark: datetime,
+        ingested_from: Optional[datetime] = None
+    ):
+        """Fold cold-tier rows ingested in [ingested_from, watermark) into `acc`."""
+        fields = spec.group_by + spec.metrics
+        batch = []
+        async for cold in tiering.cold_rows(registry.cold, spec.source_id, watermark, ingested_from=ingested_from):
+            row = cold["row"]
+            batch.append(([{f: row.get(sanitize_column_name(f)) for f in fields}], row["ingested_at"]))
+            if len(batch) >= settings.MIGRATION_BATCH_SIZE:
+                self._merge(acc, self.fold(spec, batch))
+                batch = []
+        if batch:
+            self._merge(acc, self.fold(spec, batch))
+
+    async def rebuild(self, registry, spec: RollupSpec) -> int:
+        """
+        Recompute a rollup in one transaction: hot rows from the tiering
+        watermark on, plus the cold tier below it (so tiered-out history
+        is kept). Returns rows written.
+        """
+        engine = registry.engine
+        table = f"data_{spec.source_id}"
+        columns = await migrations.columns(engine, table) or {}
+        types = {**{g: "string" for g in spec.group_by}, **{m: "float" for m in spec.metrics}}
+        aggregates = [AggregateSpec(fn="count", alias="rows")]
+        for m in spec.metrics:
+            aggregates += [
+                AggregateSpec(fn="count", field=m, alias=f"count:{m}"),
+                AggregateSpec(fn="sum", field=m, alias=f"sum:{m}"),
+                AggregateSpec(fn="min", field=m, alias=f"min:{m}"),
+                AggregateSpec(fn="max", field=m, alias=f"max:{m}"),
+            ]
+
+        # the cold scan runs outside the lock: it may be long, and ingestion waits on the lock
+        acc: Dict[Tuple, Dict[str, Any]] = {}
+        async with registry.session_factory() as session:
+            watermark = await tiering.watermark(session, spec.source_id)
+        if watermark is not None:
+            await self._fold_cold(registry, spec, acc, watermark)
+
+        async with engine.begin() as conn:
+            await self._lock(conn, spec.source_id)
+            # days tiered out meanwhile were read neither hot nor cold yet
+            moved = await conn.scalar(
+                select(TieringStateDB.watermark).where(TieringStateDB.source_id == spec.source_id)
+            )
+            if moved is not None and moved != watermark:
+                await self._fold_cold(registry, spec, acc, moved, ingested_from=watermark)
+                watermark = moved
+
+            await conn.execute(delete(RollupValueDB).where(RollupValueDB.rollup == spec.name))
+
+            if columns:
+                where, params = [], {}
+                if watermark is not None:
+                    where.append('"ingested_at" >= :watermark')
+                    params["watermark"] = watermark
+                sql, params = compile_aggregate_sql(
+                    table, [], list(spec.group_by), aggregates, set(columns), types,
+                    sanitize_column_name, time_bucket=spec.time_bucket, where=where, params=params, limit=None
+                )
+                hot = []
+                for g in (await conn.execute(sql_text(sql), params)).mappings().all():
+                    values = {f: g[f] for f in spec.group_by}
+                    base = {
+                        "rollup": spec.name, "source_id": spec.source_id,
+                        "bucket_start": g["bucket"].replace(tzinfo=timezone.utc),
+                        "group_key": json.dumps([values[f] for f in spec.group_by], default=str),
+                        "group_values": values,
+                    }
+                    hot.append({**base, "metric": ROW_COUNT, "count": g["rows"], "sum": None, "min": None, "max": None})
+                    for m in spec.metrics:
+                        hot.append({
+                            **base, "metric": m, "count": g[f"count:{m}"],
+                            "sum": g[f"sum:{m}"], "min": g[f"min:{m}"], "max": g[f"max:{m}"],
+                        })
+                self._merge(acc, hot)
+
+            rows = [acc[k] for k in sorted(acc, key=lambda k: (k[0], k[1], k[2]))]
+            batch = settings.MIGRATION_BATCH_SIZE
+            for i in range(0, len(rows), batch):
+                await conn.execute(pg_insert(RollupValueDB).values(rows[i:i + batch]))
+
+        logger.info("Rollup rebuilt", rollup=spec.name, rows=len(rows))
+        return len(rows)
+
+    # ---------------------------------------------------------
+    # Answering /query/aggregate
+    # ---------------------------------------------------------
+    def match(self, request: AggregateRequest, conditions: List[Condition]) -> Optional[RollupSpec]:
+        for spec in self.for_source(request.source):
+            if not set(request.group_by) <= set(spec.group_by):
+                continue
+            if request.time_bucket not in (None, spec.time_bucket):
+                continue
+            if any(c.op != "eq" or c.field not in spec.group_by for c in conditions):
+                continue
+            if any(a.field and a.field not in spec.metrics for a in request.aggregates):
+                continue
+            if any(
+                ts is not None and bucket_start(ts, spec.time_bucket) != ts.replace(tzinfo=ts.tzinfo or timezone.utc)
+                for ts in (request.ingested_from, request.ingested_to)
+            ):
+                continue
+            return spec
+        return None
+
+    async def answer(
+        self,
+        session: AsyncSession,
+        spec: RollupSpec,
+        request: AggregateRequest,
+        conditions: List[Condition]
+    ) -> List[Dict[str, Any]]:
+        metrics = {a.field or ROW_COUNT for a in request.aggregates}
+        stmt = select(RollupValueDB).where(RollupValueDB.rollup == spec.name, RollupValueDB.metric.in_(metrics))
+        if request.ingested_from is not None:
+            stmt = stmt.where(RollupValueDB.bucket_start >= request.ingested_from)
+        if request.ingested_to is not None:
+            stmt = stmt.where(RollupValueDB.bucket_start < request.ingested_to)
+
+        wanted = {c.field: c.value for c in conditions}
+        groups: Dict[Tuple, Dict[str, Any]] = {}
+        for row in (await session.execute(stmt)).scalars():
+            values = row.group_values or {}
+            if any(values.get(f) != v for f, v in wanted.items()):
+                continue
+            key = ((row.bucket_start,) if request.time_bucket else ()) + tuple(
+                json.dumps(values.get(g), default=str) for g in request.group_by
+            )
+            group = groups.setdefault(key, {
+                "keys": {**({"bucket": row.bucket_start} if request.time_bucket else {}),
+                         **{g: values.get(g) for g in request.group_by}},
+                "metrics": {},
+            })
+            m = group["metrics"].setdefault(row.metric, {"count": 0, "sum": 0.0, "min": None, "max": None})
+            m["count"] += row.count
+            m["sum"] += row.sum or 0.0
+            if row.min is not None:
+                m["min"] = row.min if m["min"] is None else min(m["min"], row.min)
+            if row.max is not None:
+                m["max"] = row.max if m["max"] is None else max(m["max"], row.max)
+
+        out = []
+        for key in sorted(groups):
+            group = groups[key]
+            result = dict(group["keys"])
+            for a in request.aggregates:
+                m = group["metrics"].get(a.field or ROW_COUNT, {"count": 0, "sum": 0.0, "min": None, "max": None})
+                if a.fn == "count":
+                    value = m["count"]
+                elif a.fn == "avg":
+                    value = m["sum"] / m["count"] if m["count"] else None
+                elif a.fn == "sum":
+                    value = m["sum"] if m["count"] else None
+                else:
+                    value = m[a.fn]
+                result[aggregate_alias(a)] = value
+            out.append(result)
+            if request.limit is not None and len(out) >= request.limit:
+                break
+        return out
+
+
+# Shared manager — write_postgres applies, /query/aggregate answers
+rollups = RollupManager(parse_rollups(settings.ROLLUPS))
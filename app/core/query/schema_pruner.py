@@ -0,0 +1,151 @@
+# app/core/query/schema_pruner.py
+import re
+import structlog
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.config import settings
+
+logger = structlog.get_logger()
+
+NUMERIC_TYPES = {"integer", "float", "number"}
+TIME_TYPES = {"datetime", "date", "timestamp"}
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CAMEL = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_STOP = {
+    "the", "and", "for", "all", "with", "from", "where", "over", "under", "than",
+    "show", "list", "find", "get", "what", "which", "how", "many", "record", "each", "per",
+}
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ies", "es", "s", "ed", "ing"):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[: -len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+
+def tokens(text: str) -> List[str]:
+    """Lower-cased, stemmed words; snake_case and camelCase are split."""
+    return [_stem(w) for w in _WORD.findall(_CAMEL.sub(" ", text).lower())]
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token — close enough to budget prompts."""
+    return len(text) // 4 + 1
+
+
+class SchemaPruner:
+    """
+    Picks the schema fields worth sending with a translation prompt.
+
+    Each field is scored against the question:
+      - lexical: the share of the field name's words found in the
+        question (exact matches count 1, prefix matches 0.5)
+      - statistical: a quoted literal among the field's top values (1.0),
+        a number inside its [min, max] (0.3), a date for a time field (0.3)
+    Fields scoring at least `min_score` are kept (best first, up to
+    `max_fields`), plus a few key fields — ids, timestamps and the
+    densest columns — so joins and time filters still resolve.
+    Small schemas are returned whole.
+    """
+
+    def __init__(
+        self,
+        max_fields: int = 40,
+        key_fields: int = 5,
+        min_score: float = 0.5,
+        prune_over: int = 30
+    ):
+        self.max_fields = max_fields
+        self.key_fields = key_fields
+        self.min_score = min_score
+        self.prune_over = prune_over
+
+    def score(
+        self,
+        name: str,
+        meta: Dict[str, Any],
+        words: Iterable[str],
+        params: Dict[str, Any],
+        stats: Optional[Dict[str, Any]] = None
+    ) -> float:
+        words = set(words)
+        name_words = set(tokens(name))
+        score = 0.0
+
+        if name_words:
+            exact = len(name_words & words)
+            prefix = sum(
+                1 for n in name_words - words
+                if any((w.startswith(n) or n.startswith(w)) and min(len(w), len(n)) >= 3 for w in words)
+            )
+            score += (exact + 0.5 * prefix) / len(name_words)
+
+        field_type = meta.get("type", "string")
+        for value in params.values():
+            if isinstance(value, str) and stats:
+                top = {str(t.get("value")).lower() for t in stats.get("top_k", [])}
+                if value.lower() in top:
+                    score += 1.0
+            elif isinstance(value, datetime) and field_type in TIME_TYPES:
+                score += 0.3
+            elif isinstance(value, (int, float)) and field_type in NUMERIC_TYPES and stats:
+                lo, hi = stats.get("min"), stats.get("max")
+                if isinstance(lo, (int, float)) and isinstance(hi, (int, float)) and lo <= value <= hi:
+                    score += 0.3
+        return score
+
+    def key_field_names(
+        self,
+        schema: Dict[str, Dict[str, Any]],
+        field_stats: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> List[str]:
+        keys = [
+            name for name, meta in schema.items()
+            if name.lower() == "id" or name.lower().endswith("_id") or meta.get("type") in TIME_TYPES
+        ][: self.key_fields]
+
+        if field_stats and len(keys) < self.key_fields:
+            def density(name: str) -> float:
+                s = field_stats.get(name) or {}
+                return s.get("count", 0) * (1.0 - s.get("null_ratio", 1.0))
+            dense = sorted((n for n in schema if n not in keys and density(n) > 0), key=density, reverse=True)
+            keys += dense[: self.key_fields - len(keys)]
+        return keys
+
+    def rank(
+        self,
+        schema: Dict[str, Dict[str, Any]],
+        questions: List[str],
+        params: List[Dict[str, Any]],
+        field_stats: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> List[str]:
+        """
+        Field names to include: relevant ones best first, then key fields.
+        A prompt over its token budget drops fields from the end.
+        """
+        if len(schema) <= self.prune_over:
+            return list(schema)
+
+        field_stats = field_stats or {}
+        scored = {}
+        for q, p in zip(questions, params):
+            words = [w for w in tokens(q) if w not in _STOP]
+            for name, meta in schema.items():
+                s = self.score(name, meta, words, p, field_stats.get(name))
+                if s >= self.min_score:
+                    scored[name] = max(scored.get(name, 0.0), s)
+
+        relevant = sorted(scored, key=lambda n: (-scored[n], n))[: self.max_fields]
+        keys = [k for k in self.key_field_names(schema, field_stats) if k not in relevant]
+        return relevant + keys
+
+
+# Shared pruner — the translator uses it for every prompt
+schema_pruner = SchemaPruner(
+    max_fields=settings.NL_PROMPT_MAX_FIELDS,
+    key_fields=settings.NL_PROMPT_KEY_FIELDS,
+    prune_over=settings.NL_PROMPT_PRUNE_OVER
+)
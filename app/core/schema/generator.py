@@ -15,6 +15,42 @@ from app.models.database import AsyncSessionLocal
 logger = structlog.get_logger()
 
 
+# -------------------------------------------------------------
+# Type widening lattice
+#   integer → float → string
+#   date / boolean / json → string
+# Any two types meet at their closest common ancestor.
+# -------------------------------------------------------------
+WIDENS_TO = {
+    "integer": "float",
+    "float": "string",
+    "date": "string",
+    "boolean": "string",
+    "json": "string",
+}
+
+
+def _widening_chain(field_type: str) -> list:
+    chain = [field_type]
+    while chain[-1] != "string":
+        chain.append(WIDENS_TO.get(chain[-1], "string"))
+    return chain
+
+
+def widen_type(a: Optional[str], b: Optional[str]) -> str:
+    """Return the narrowest type both `a` and `b` can be stored as."""
+    if a in (None, "null"):
+        return b or "null"
+    if b in (None, "null") or a == b:
+        return a
+
+    chain_a = _widening_chain(a)
+    for t in _widening_chain(b):
+        if t in chain_a:
+            return t
+    return "string"
+
+
 # -------------------------------------------------------------
 # Merge logic (safe + deterministic)
 # -------------------------------------------------------------
@@ -31,11 +67,8 @@ def merge_field_definitions(
 
         current = merged[name]
 
-        # Type harmonization
-        if current.get("type") != meta.get("type"):
-            # Fallback to string if incompatible
-            if "string" in (current.get("type"), meta.get("type")):
-                current["type"] = "string"
+        # Type harmonization (widen along the lattice)
+        current["type"] = widen_type(current.get("type"), meta.get("type"))
 
         # Nullable handling (nullable only if both say nullable)
         current["nullable"] = current.get("nullable", True) and meta.get("nullable", True)
@@ -136,3 +169,48 @@ class SchemaGenerator:
             await session.refresh(row)
 
             return version, diff
+
+    # ---------------------------------------------------------
+    async def declare_field(
+        self,
+        source_id: str,
+        field: str,
+        renamed_from: Optional[str] = None,
+        default: Any = None
+    ) -> Tuple[int, Dict[str, Dict[str, Any]]]:
+        """
+        Record that `field` was renamed from `renamed_from` and/or gets
+        `default` when missing. Stored versions are immutable, so the
+        declaration is written as a new version; read-time projection
+        (app/core/schema/versioning.py) applies it to every older one.
+        Later versions inherit it through merge_field_definitions.
+        """
+        async with AsyncSessionLocal() as session:
+            latest = await self._get_latest_version(session, source_id)
+            if latest is None:
+                raise LookupError(f"No schema found for source_id={source_id}")
+
+            schema = {k: dict(v) for k, v in (latest.schema or {}).items()}
+            if field not in schema:
+                raise LookupError(f"Field {field!r} not in schema for source_id={source_id}")
+
+            meta = schema[field]
+            if renamed_from is not None:
+                if renamed_from == field or renamed_from not in schema:
+                    raise ValueError(f"Cannot rename {field!r} from {renamed_from!r}")
+                meta["renamed_from"] = renamed_from
+            if default is not None:
+                meta["default"] = default
+
+            row = SchemaVersionDB(
+                source_id=source_id,
+                version=latest.version + 1,
+                schema=schema,
+                comment=f"declare {field}"
+            )
+            session.add(row)
+            await session.commit()
+
+            logger.info("Field declared", source_id=source_id, field=field,
+                        renamed_from=renamed_from, version=row.version)
+            return row.version, schema
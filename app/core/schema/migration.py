@@ -0,0 +1,546 @@
+# app/core/schema/migration.py
+
+import asyncio
+import structlog
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple, Type, Union
+
+from sqlalchemy import (
+    MetaData, Table, Column, Index, Integer, DateTime, delete, func, select,
+    inspect as sa_inspect, text as sql_text
+)
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.engine import Connection, Dialect
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+from sqlalchemy.types import TypeEngine
+
+from app.core.schema.generator import widen_type
+from app.models.schema_models import ColumnWideningDB, MigrationProgress
+
+logger = structlog.get_logger()
+
+# Suffix of the temporary column a widening backfills into
+SHADOW_SUFFIX = "__widen"
+
+# Column holding the long tail of fields in hybrid-layout tables
+EXTRAS_COLUMN = "extras"
+
+# Columns dynamic tables are created with; never planned or widened from data
+SYSTEM_COLUMNS = {"id": "integer", "ingested_at": "timestamp", EXTRAS_COLUMN: "jsonb"}
+
+# session.info key of the widening routes loaded by the current transaction
+_ROUTES_INFO = "widening_routes"
+
+
+def widening_lock_key(table_name: str) -> str:
+    """Advisory lock key: inserts hold it shared, adding or swapping a shadow exclusively."""
+    return f"widen:{table_name}"
+
+
+# ---------------------------------------------------------
+# COLUMN CATALOG — in-memory view of dynamic table columns
+# ---------------------------------------------------------
+class ColumnCatalog:
+    """
+    Caches the columns of each dynamic table as {column: logical_type}.
+
+    A table missing from the catalog is "unknown" and will be reflected
+    from the database on next use. Entries are only ever dropped on a DDL
+    error, which forces a lazy refresh.
+    """
+
+    def __init__(self):
+        self._tables: Dict[str, Dict[str, str]] = {}
+
+    def get(self, table_name: str) -> Optional[Dict[str, str]]:
+        return self._tables.get(table_name)
+
+    def set(self, table_name: str, columns: Dict[str, str]):
+        self._tables[table_name] = dict(columns)
+
+    def add(self, table_name: str, columns: Dict[str, str]):
+        self._tables.setdefault(table_name, {}).update(columns)
+
+    def invalidate(self, table_name: str):
+        self._tables.pop(table_name, None)
+
+
+# ---------------------------------------------------------
+# MIGRATION ENGINE — incremental DDL for dynamic tables
+# ---------------------------------------------------------
+class MigrationEngine:
+    """
+    Brings a dynamic table in line with a desired {column: logical_type}
+    mapping using the fewest possible statements:
+
+      - table unknown to the database → CREATE TABLE
+      - columns missing               → one ALTER TABLE with every ADD COLUMN
+      - catalog already up to date    → nothing (no round trip at all)
+
+    Columns whose type must widen (integer → float → string, ...) are
+    migrated online: a shadow column is added alongside the new columns,
+    new writes are routed to it immediately, existing rows are backfilled
+    in bounded id-range batches in the background, and the shadow is
+    swapped in with a short, lock-timeout-guarded transaction. Until the
+    swap, reads of the old column do not see rows written after it began.
+
+    Routing state lives in `column_widenings`, so writers in every worker
+    agree on it: an insert transaction takes the table's advisory lock
+    shared and reads the routes once; adding a shadow (with its route) and
+    the swap (DROP + RENAME + route delete) take it exclusively, so no
+    insert can hold a route that is being created or retired. One worker
+    runs each backfill, the one holding its session-level advisory lock.
+    """
+
+    def __init__(
+        self,
+        type_map: Dict[str, Type[TypeEngine]],
+        batch_size: int = 5000,
+        lock_timeout_ms: int = 2000
+    ):
+        self.type_map = type_map
+        self.batch_size = batch_size
+        self.lock_timeout_ms = lock_timeout_ms
+        self.catalog = ColumnCatalog()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+        # Columns with a route in column_widenings, as last read: {table: {column}}
+        self._pending: Dict[str, Set[str]] = {}
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.progress: Dict[Tuple[str, str], MigrationProgress] = {}
+
+    def _lock(self, table_name: str) -> asyncio.Lock:
+        if table_name not in self._locks:
+            self._locks[table_name] = asyncio.Lock()
+        return self._locks[table_name]
+
+    # ---------------------------------------------------------
+    # Type helpers
+    # ---------------------------------------------------------
+    def _sa_type(self, logical_type: str) -> Type[TypeEngine]:
+        return self.type_map.get(logical_type, self.type_map["string"])
+
+    def sql_type(self, logical_type: str, dialect: Dialect) -> str:
+        """Column type DDL for a logical type (e.g. "float" → "FLOAT")."""
+        return self._sa_type(logical_type)().compile(dialect=dialect)
+
+    def canonical(self, logical_type: str) -> str:
+        """Collapse aliases that share a column type ("date", "null" → "string")."""
+        return self.logical_type(self._sa_type(logical_type)())
+
+    def logical_type(self, sa_type: Any) -> str:
+        """
+        Map a reflected SQLAlchemy type back to the first logical type
+        that produces it (e.g. DOUBLE_PRECISION → "float", VARCHAR → "string").
+        """
+        for name, cls in self.type_map.items():
+            if isinstance(sa_type, cls):
+                return name
+        return "string"
+
+    # ---------------------------------------------------------
+    # Planning
+    # ---------------------------------------------------------
+    @staticmethod
+    def plan(current: Dict[str, str], desired: Dict[str, str]) -> Dict[str, str]:
+        """Return the columns in `desired` that the table does not have yet."""
+        return {col: t for col, t in desired.items() if col not in current}
+
+    def plan_widenings(
+        self, table_name: str, current: Dict[str, str], desired: Dict[str, str]
+    ) -> Dict[str, Tuple[str, str]]:
+        """
+        Return {column: (old_type, new_type)} for existing columns whose
+        type must widen to hold `desired`. Columns already being widened
+        (here or in another worker) and the primary key are left alone.
+        """
+        pending = self._pending.get(table_name, set())
+        widenings = {}
+        for col, t in desired.items():
+            if col in SYSTEM_COLUMNS or col not in current or col in pending or (table_name, col) in self._tasks:
+                continue
+            target = self.canonical(widen_type(current[col], t))
+            if target != current[col]:
+                widenings[col] = (current[col], target)
+        return widenings
+
+    @staticmethod
+    def shadow_name(column: str) -> str:
+        return f"{column}{SHADOW_SUFFIX}"
+
+    def build_add_columns(self, table_name: str, columns: Dict[str, str], dialect: Dialect) -> str:
+        """Render a single ALTER TABLE statement adding every column in `columns`."""
+        clauses = [
+            f'ADD COLUMN IF NOT EXISTS "{col}" {self._sa_type(t)().compile(dialect=dialect)}'
+            for col, t in columns.items()
+        ]
+        return f'ALTER TABLE "{table_name}" ' + ", ".join(clauses)
+
+    # ---------------------------------------------------------
+    # Entry point
+    # ---------------------------------------------------------
+    async def ensure_table(
+        self,
+        engine: AsyncEngine,
+        table_name: str,
+        desired: Dict[str, str],
+        partition_by: Optional[str] = None,
+        extras: bool = False
+    ):
+        """
+        Make sure `table_name` exists and has every column in `desired`.
+        `partition_by` (e.g. "RANGE (ingested_at)") and `extras` (hybrid
+        layout: an extras JSONB column with a GIN index) only apply on creation.
+        """
+        current = self.catalog.get(table_name)
+        if (
+            current is not None
+            and not self.plan(current, desired)
+            and not self.plan_widenings(table_name, current, desired)
+        ):
+            return
+
+        async with self._lock(table_name):
+            try:
+                await self._apply(engine, table_name, desired, partition_by, extras)
+            except DBAPIError as e:
+                # Catalog may be stale (table changed by another worker) →
+                # refresh from the database and retry once.
+                logger.warning("DDL failed, refreshing column catalog", table=table_name, error=str(e))
+                self.catalog.invalidate(table_name)
+                await self._apply(engine, table_name, desired, partition_by, extras)
+
+    async def _apply(
+        self,
+        engine: AsyncEngine,
+        table_name: str,
+        desired: Dict[str, str],
+        partition_by: Optional[str] = None,
+        extras: bool = False
+    ):
+        current = self.catalog.get(table_name)
+        missing: Dict[str, str] = {}
+        widenings: Dict[str, Tuple[str, str]] = {}
+        routed: List[ColumnWideningDB] = []
+
+        async with engine.begin() as conn:
+            if current is None:
+                current = await conn.run_sync(self._reflect, table_name)
+
+            if current is None:
+                await conn.run_sync(self._create, table_name, desired, partition_by, extras)
+            else:
+                routed = await self._load_widenings(conn, table_name)
+                missing = self.plan(current, desired)
+                widenings = self.plan_widenings(table_name, current, desired)
+                shadows = {self.shadow_name(col): new for col, (_, new) in widenings.items()}
+                if shadows:
+                    # waits out open insert transactions; later ones see the routes
+                    await conn.execute(
+                        sql_text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+                        {"key": widening_lock_key(table_name)}
+                    )
+                if missing or shadows:
+                    await conn.exec_driver_sql(
+                        self.build_add_columns(table_name, {**missing, **shadows}, conn.dialect)
+                    )
+                if widenings:
+                    await conn.execute(
+                        pg_insert(ColumnWideningDB).values([
+                            {
+                                "table_name": table_name, "column": col, "shadow": self.shadow_name(col),
+                                "from_type": old, "to_type": new,
+                            }
+                            for col, (old, new) in widenings.items()
+                        ]).on_conflict_do_nothing()
+                    )
+
+        # Catalog only advances once the transaction has committed
+        missing = {col: self.canonical(t) for col, t in missing.items()}
+        if current is None:
+            created = {
+                col.name: SYSTEM_COLUMNS.get(col.name) or self.canonical(desired[col.name])
+                for col in self.build_table(table_name, desired, partition_by, extras).columns
+            }
+            self.catalog.set(table_name, created)
+            logger.info(
+                "Dynamic table created",
+                table=table_name,
+                columns=len(desired),
+                partition_by=partition_by,
+                extras=extras
+            )
+            return
+
+        self.catalog.set(table_name, {**current, **missing})
+        if missing:
+            logger.info("Dynamic table altered", table=table_name, added=list(missing))
+
+        self._pending.setdefault(table_name, set()).update(widenings)
+        # new widenings, and ones left behind by a worker that stopped
+        # (a backfill already running elsewhere keeps its lock; ours exits)
+        resumable = {w.column: (w.from_type, w.to_type) for w in routed}
+        for col, (old, new) in {**resumable, **widenings}.items():
+            if (table_name, col) not in self._tasks:
+                self._start_widening(engine, table_name, col, old, new)
+
+    # ---------------------------------------------------------
+    # Write routing (used by inserts while a widening runs)
+    # ---------------------------------------------------------
+    async def _load_widenings(
+        self, conn: Union[AsyncConnection, AsyncSession], table_name: str
+    ) -> List[ColumnWideningDB]:
+        """Routes of `table_name` from column_widenings; notices swaps done by other workers."""
+        result = await conn.execute(
+            select(ColumnWideningDB.__table__).where(ColumnWideningDB.table_name == table_name)
+        )
+        widenings = list(result.all())
+        columns = {w.column for w in widenings}
+        if self._pending.get(table_name, set()) - columns:
+            # swapped elsewhere → the cached column types are stale
+            self.catalog.invalidate(table_name)
+        self._pending[table_name] = columns
+        return widenings
+
+    async def route_record(
+        self, session: AsyncSession, table_name: str, record: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Redirect values of columns being widened to their shadow columns.
+
+        The first call in a transaction takes the table's widening lock
+        shared (held until commit, so no swap can retire a route this
+        transaction uses) and reads the routes; later calls reuse them.
+        """
+        state = session.info.get(_ROUTES_INFO)
+        current = session.sync_session.get_transaction()
+        if state is None or current is None or state[0] is not current:
+            state = None
+
+        routes = state[1].get(table_name) if state else None
+        if routes is None:
+            await session.execute(
+                sql_text("SELECT pg_advisory_xact_lock_shared(hashtext(:key))"),
+                {"key": widening_lock_key(table_name)}
+            )
+            routes = {w.column: w.shadow for w in await self._load_widenings(session, table_name)}
+            if state is None:
+                state = (session.sync_session.get_transaction(), {})
+                session.info[_ROUTES_INFO] = state
+            state[1][table_name] = routes
+
+        if not routes:
+            return record
+        return {routes.get(k, k): v for k, v in record.items()}
+
+    async def columns(self, engine: AsyncEngine, table_name: str) -> Optional[Dict[str, str]]:
+        """Cached {column: logical_type} for a table, reflected on a miss (None = no table)."""
+        current = self.catalog.get(table_name)
+        if current is None:
+            async with engine.connect() as conn:
+                current = await conn.run_sync(self._reflect, table_name)
+            if current is not None:
+                self.catalog.set(table_name, current)
+        return current
+
+    async def wait_idle(self, table_name: str):
+        """Wait for every widening running on `table_name` to finish."""
+        tasks = [t for (table, _), t in list(self._tasks.items()) if table == table_name]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def forget(self, table_name: str):
+        """Drop cached state for a table that was renamed or dropped."""
+        self.catalog.invalidate(table_name)
+        self._pending.pop(table_name, None)
+
+    def list_progress(self, table_name: Optional[str] = None) -> List[MigrationProgress]:
+        return [
+            p for (table, _), p in self.progress.items()
+            if table_name is None or table == table_name
+        ]
+
+    # ---------------------------------------------------------
+    # Online widening: shadow column → batched backfill → swap
+    # ---------------------------------------------------------
+    def _start_widening(self, engine: AsyncEngine, table_name: str, column: str, old: str, new: str):
+        progress = MigrationProgress(
+            table=table_name,
+            column=column,
+            from_type=old,
+            to_type=new,
+            status="backfilling",
+            started_at=datetime.utcnow()
+        )
+        self.progress[(table_name, column)] = progress
+
+        task = asyncio.create_task(self._widen_column(engine, table_name, column, progress))
+        self._tasks[(table_name, column)] = task
+        task.add_done_callback(lambda _: self._tasks.pop((table_name, column), None))
+        logger.info("Column widening started", table=table_name, column=column, from_type=old, to_type=new)
+
+    async def _widen_column(
+        self, engine: AsyncEngine, table_name: str, column: str, progress: MigrationProgress
+    ):
+        shadow = self.shadow_name(column)
+        target = self.sql_type(progress.to_type, engine.dialect)
+        backfill = sql_text(
+            f'UPDATE "{table_name}" SET "{shadow}" = CAST("{column}" AS {target}) '
+            f'WHERE id > :lo AND id <= :hi AND "{column}" IS NOT NULL AND "{shadow}" IS NULL'
+        )
+        task_key = {"key": f"widen-task:{table_name}.{column}"}
+
+        try:
+            # One backfill per column across workers: the holder of this
+            # session-level lock runs it; it is released with the connection
+            async with engine.connect() as owner:
+                acquired = (await owner.execute(
+                    sql_text("SELECT pg_try_advisory_lock(hashtext(:key))"), task_key
+                )).scalar()
+                await owner.commit()
+                if not acquired:
+                    progress.status = "running_elsewhere"
+                    logger.info("Column widening runs in another worker", table=table_name, column=column)
+                    return
+                try:
+                    await self._backfill(engine, table_name, column, shadow, backfill, progress)
+                finally:
+                    await owner.execute(sql_text("SELECT pg_advisory_unlock(hashtext(:key))"), task_key)
+                    await owner.commit()
+
+        except (SQLAlchemyError, OSError) as e:
+            # Route stays in place; the next ensure_table resumes it
+            progress.status = "failed"
+            progress.error = str(e)
+            logger.error("Column widening failed", exc_info=e, table=table_name, column=column)
+
+        finally:
+            progress.finished_at = datetime.utcnow()
+
+    async def _backfill(
+        self, engine: AsyncEngine, table_name: str, column: str, shadow: str, backfill,
+        progress: MigrationProgress
+    ):
+        async with engine.connect() as conn:
+            row = (await conn.execute(sql_text(f'SELECT min(id), max(id) FROM "{table_name}"'))).first()
+        lo, hi = (row[0] or 1) - 1, row[1] or 0
+        start = lo
+
+        # Chase the tail until what is left fits in the swap transaction
+        while hi - lo > self.batch_size:
+            while lo < hi:
+                upper = min(lo + self.batch_size, hi)
+                async with engine.begin() as conn:
+                    await conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{self.lock_timeout_ms}ms'")
+                    await conn.execute(backfill, {"lo": lo, "hi": upper})
+                lo = upper
+                progress.rows_done, progress.rows_total = lo - start, hi - start
+                await asyncio.sleep(0)
+
+            async with engine.connect() as conn:
+                hi = (await conn.execute(sql_text(f'SELECT max(id) FROM "{table_name}"'))).scalar() or hi
+
+        progress.status = "swapping"
+        await self._swap(engine, table_name, column, shadow, backfill, lo)
+
+        progress.rows_done = progress.rows_total = hi - start
+        progress.status = "completed"
+        logger.info("Column widening completed", table=table_name, column=column, to_type=progress.to_type)
+
+    async def _swap(
+        self, engine: AsyncEngine, table_name: str, column: str, shadow: str, backfill, lo: int,
+        attempts: int = 3
+    ):
+        """
+        Backfill the tail, drop the old column, rename the shadow into
+        place and retire the route, in one transaction under the table's
+        widening lock: inserts that already read the route finish first,
+        later ones see the renamed column and no route.
+        """
+        for attempt in range(attempts):
+            try:
+                async with engine.begin() as conn:
+                    await conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{self.lock_timeout_ms}ms'")
+                    await conn.execute(
+                        sql_text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+                        {"key": widening_lock_key(table_name)}
+                    )
+                    await conn.execute(backfill, {"lo": lo, "hi": 2 ** 62})
+                    await conn.exec_driver_sql(f'ALTER TABLE "{table_name}" DROP COLUMN "{column}"')
+                    await conn.exec_driver_sql(
+                        f'ALTER TABLE "{table_name}" RENAME COLUMN "{shadow}" TO "{column}"'
+                    )
+                    await conn.execute(
+                        delete(ColumnWideningDB).where(
+                            ColumnWideningDB.table_name == table_name, ColumnWideningDB.column == column
+                        )
+                    )
+                break
+            except DBAPIError:
+                # Most likely lock_timeout under write pressure → back off
+                if attempt == attempts - 1:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+
+        self._pending.get(table_name, set()).discard(column)
+        self.catalog.add(table_name, {column: self.progress[(table_name, column)].to_type})
+
+    # ---------------------------------------------------------
+    # Sync helpers (run inside conn.run_sync)
+    # ---------------------------------------------------------
+    def _reflect(self, sync_conn: Connection, table_name: str) -> Optional[Dict[str, str]]:
+        inspector = sa_inspect(sync_conn)
+        if not inspector.has_table(table_name):
+            return None
+        return {
+            col["name"]: SYSTEM_COLUMNS.get(col["name"]) or self.logical_type(col["type"])
+            for col in inspector.get_columns(table_name)
+            if not col["name"].endswith(SHADOW_SUFFIX)
+        }
+
+    def build_table(
+        self,
+        table_name: str,
+        desired: Dict[str, str],
+        partition_by: Optional[str] = None,
+        extras: bool = False
+    ) -> Table:
+        # A partitioned table's primary key must include the partition key
+        columns = [
+            Column("id", Integer, primary_key=True, autoincrement=True),
+            Column(
+                "ingested_at",
+                DateTime(timezone=True),
+                nullable=False,
+                server_default=func.now(),
+                primary_key=partition_by is not None
+            ),
+        ]
+        columns += [
+            Column(col, self._sa_type(t), nullable=True)
+            for col, t in desired.items() if col not in SYSTEM_COLUMNS
+        ]
+        if extras:
+            columns.append(
+                Column(EXTRAS_COLUMN, JSONB, nullable=False, server_default=sql_text("'{}'::jsonb"))
+            )
+            # jsonb_path_ops: smaller index, serves the @> containment filters
+            columns.append(Index(
+                f"ix_{table_name}_{EXTRAS_COLUMN}"[:63],
+                EXTRAS_COLUMN,
+                postgresql_using="gin",
+                postgresql_ops={EXTRAS_COLUMN: "jsonb_path_ops"}
+            ))
+        kwargs = {"postgresql_partition_by": partition_by} if partition_by else {}
+        return Table(table_name, MetaData(), *columns, **kwargs)
+
+    def _create(
+        self,
+        sync_conn: Connection,
+        table_name: str,
+        desired: Dict[str, str],
+        partition_by: Optional[str] = None,
+        extras: bool = False
+    ):
+        self.build_table(table_name, desired, partition_by, extras).create(sync_conn, checkfirst=True)
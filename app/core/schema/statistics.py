@@ -0,0 +1,423 @@
+# app/core/schema/statistics.py
+
+import base64
+import hashlib
+import math
+import structlog
+from bisect import bisect_left
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.schema_models import FieldSketchDB, FieldStatsDB
+
+logger = structlog.get_logger()
+
+
+# -------------------------------------------------------------
+# HyperLogLog — distinct count estimate in 2^p bytes
+# -------------------------------------------------------------
+class HyperLogLog:
+    """HyperLogLog with 64-bit hashes; p=10 → ~3% standard error in 1 KiB."""
+
+    def __init__(self, p: int = 10, registers: Optional[bytearray] = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    @staticmethod
+    def _hash(value: Any) -> int:
+        digest = hashlib.blake2b(repr(value).encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def add(self, value: Any):
+        h = self._hash(value)
+        idx = h >> (64 - self.p)
+        rest = (h << self.p) & 0xFFFFFFFFFFFFFFFF
+        rank = (64 - self.p + 1) if rest == 0 else (64 - rest.bit_length() + 1)
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def estimate(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * self.m and zeros:
+            # small-range correction: linear counting
+            return round(self.m * math.log(self.m / zeros))
+        return round(raw)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"p": self.p, "registers": base64.b64encode(bytes(self.registers)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        return cls(data["p"], bytearray(base64.b64decode(data["registers"])))
+
+
+# -------------------------------------------------------------
+# t-digest — mergeable quantile sketch for numeric values
+# -------------------------------------------------------------
+class TDigest:
+    """
+    Merging t-digest. Values are buffered and folded into centroids in
+    sorted order, bounding centroid weight by q(1-q) so the tails stay
+    precise.
+    """
+
+    def __init__(self, compression: int = 100, centroids: Optional[List[List[float]]] = None):
+        self.compression = compression
+        self.centroids: List[List[float]] = centroids or []   # [[mean, weight], ...] sorted by mean
+        self._buffer: List[float] = []
+
+    @property
+    def count(self) -> float:
+        self._flush()
+        return sum(w for _, w in self.centroids)
+
+    def add(self, value: float):
+        self._buffer.append(value)
+        if len(self._buffer) >= self.compression * 5:
+            self._flush()
+
+    def merge(self, other: "TDigest"):
+        other._flush()
+        self._flush()
+        self._compress(self.centroids + other.centroids)
+
+    def _flush(self):
+        if self._buffer:
+            self._compress(self.centroids + [[v, 1.0] for v in self._buffer])
+            self._buffer = []
+
+    def _compress(self, points: List[List[float]]):
+        points.sort(key=lambda c: c[0])
+        total = sum(w for _, w in points)
+        merged: List[List[float]] = []
+        seen = 0.0
+
+        for mean, weight in points:
+            if merged:
+                last = merged[-1]
+                q = (seen + (last[1] + weight) / 2) / total
+                limit = 4 * total * q * (1 - q) / self.compression
+                if last[1] + weight <= max(limit, 1.0):
+                    last[0] += (mean - last[0]) * weight / (last[1] + weight)
+                    last[1] += weight
+                    continue
+                seen += last[1]
+            merged.append([mean, weight])
+
+        self.centroids = merged
+
+    def quantile(self, q: float) -> Optional[float]:
+        self._flush()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+
+        total = sum(w for _, w in self.centroids)
+        target = q * total
+        cumulative = []
+        running = 0.0
+        for _, w in self.centroids:
+            cumulative.append(running + w / 2)
+            running += w
+
+        i = bisect_left(cumulative, target)
+        if i == 0:
+            return self.centroids[0][0]
+        if i == len(cumulative):
+            return self.centroids[-1][0]
+
+        lo, hi = cumulative[i - 1], cumulative[i]
+        frac = (target - lo) / (hi - lo) if hi > lo else 0.0
+        return self.centroids[i - 1][0] + frac * (self.centroids[i][0] - self.centroids[i - 1][0])
+
+    def to_dict(self) -> Dict[str, Any]:
+        self._flush()
+        return {"compression": self.compression, "centroids": self.centroids}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TDigest":
+        return cls(data["compression"], [list(c) for c in data["centroids"]])
+
+
+# -------------------------------------------------------------
+# Top-k — Space-Saving heavy hitters for string values
+# -------------------------------------------------------------
+class TopK:
+    """Space-Saving counter tracking `capacity` candidates to report the top `k`."""
+
+    def __init__(self, k: int = 10, capacity: int = 64, counts: Optional[Dict[str, int]] = None):
+        self.k = k
+        self.capacity = capacity
+        self.counts: Dict[str, int] = counts or {}
+
+    def add(self, value: str, weight: int = 1):
+        if value in self.counts or len(self.counts) < self.capacity:
+            self.counts[value] = self.counts.get(value, 0) + weight
+            return
+        # evict the smallest counter; the newcomer inherits its count
+        victim = min(self.counts, key=self.counts.get)
+        self.counts[value] = self.counts.pop(victim) + weight
+
+    def merge(self, other: "TopK"):
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        if len(self.counts) > self.capacity:
+            keep = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:self.capacity]
+            self.counts = dict(keep)
+
+    def top(self) -> List[Dict[str, Any]]:
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:self.k]
+        return [{"value": v, "count": c} for v, c in ranked]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"k": self.k, "capacity": self.capacity, "counts": self.counts}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TopK":
+        return cls(data["k"], data["capacity"], dict(data["counts"]))
+
+
+# -------------------------------------------------------------
+# Per-field and per-source statistics
+# -------------------------------------------------------------
+class FieldStats:
+    """All sketches for one field."""
+
+    def __init__(self):
+        self.count = 0
+        self.null_count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.distinct = HyperLogLog()
+        self.quantiles = TDigest()
+        self.top_k = TopK()
+
+    def add(self, value: Any):
+        self.count += 1
+        if value is None:
+            self.null_count += 1
+            return
+
+        self.distinct.add(value)
+
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+            self.quantiles.add(float(value))
+        elif isinstance(value, str):
+            self.top_k.add(value)
+
+    def merge(self, other: "FieldStats"):
+        self.count += other.count
+        self.null_count += other.null_count
+        for attr, pick in (("min", min), ("max", max)):
+            mine, theirs = getattr(self, attr), getattr(other, attr)
+            setattr(self, attr, theirs if mine is None else mine if theirs is None else pick(mine, theirs))
+        self.distinct.merge(other.distinct)
+        self.quantiles.merge(other.quantiles)
+        self.top_k.merge(other.top_k)
+
+    def summary(self) -> Dict[str, Any]:
+        numeric = bool(self.quantiles.count)
+        return {
+            "count": self.count,
+            "null_count": self.null_count,
+            "null_ratio": (self.null_count / self.count) if self.count else 0.0,
+            "distinct_estimate": self.distinct.estimate(),
+            "min": self.min,
+            "max": self.max,
+            "quantiles": {
+                "p50": self.quantiles.quantile(0.5),
+                "p90": self.quantiles.quantile(0.9),
+                "p99": self.quantiles.quantile(0.99),
+            } if numeric else None,
+            "top_k": self.top_k.top(),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "null_count": self.null_count,
+            "min": self.min,
+            "max": self.max,
+            "distinct": self.distinct.to_dict(),
+            "quantiles": self.quantiles.to_dict(),
+            "top_k": self.top_k.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FieldStats":
+        stats = cls()
+        stats.count = data["count"]
+        stats.null_count = data["null_count"]
+        stats.min = data["min"]
+        stats.max = data["max"]
+        stats.distinct = HyperLogLog.from_dict(data["distinct"])
+        stats.quantiles = TDigest.from_dict(data["quantiles"])
+        stats.top_k = TopK.from_dict(data["top_k"])
+        return stats
+
+
+class SourceStats:
+    """
+    Field statistics for one source. A batch is sketched on its own and
+    then merged into the stored state, so concurrent writers only
+    serialize on the (cheap) merge.
+    """
+
+    def __init__(self, fields: Optional[Dict[str, FieldStats]] = None, records: int = 0):
+        self.fields: Dict[str, FieldStats] = fields or {}
+        self.records = records
+
+    def update(self, records: List[Dict[str, Any]]):
+        """Fold a batch of cleaned records in. Fields missing from a record count as null."""
+        self.records += len(records)
+        names = set(self.fields)
+        for rec in records:
+            names.update(rec)
+
+        for name in names:
+            stats = self.fields.get(name)
+            if stats is None:
+                stats = self.fields[name] = FieldStats()
+                # earlier records never had this field
+                stats.count = stats.null_count = self.records - len(records)
+            for rec in records:
+                stats.add(rec.get(name))
+
+    def merge(self, other: "SourceStats"):
+        for name, stats in self.fields.items():
+            if name not in other.fields:
+                stats.count += other.records
+                stats.null_count += other.records
+
+        for name, stats in other.fields.items():
+            if name in self.fields:
+                self.fields[name].merge(stats)
+            else:
+                stats.count += self.records
+                stats.null_count += self.records
+                self.fields[name] = stats
+
+        self.records += other.records
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stats.summary() for name, stats in self.fields.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "records": self.records,
+            "fields": {name: stats.to_dict() for name, stats in self.fields.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "SourceStats":
+        data = data or {}
+        fields = {name: FieldStats.from_dict(d) for name, d in data.get("fields", {}).items()}
+        return cls(fields, data.get("records", 0))
+
+
+# -------------------------------------------------------------
+# Persistence — one row per source, one row per field
+# -------------------------------------------------------------
+def fill_absent(summary: Dict[str, Any], records: int) -> Dict[str, Any]:
+    """A field's summary counted over all `records`: batches without the field add nulls."""
+    missing = records - summary.get("count", 0)
+    if missing <= 0:
+        return summary
+    null_count = summary.get("null_count", 0) + missing
+    return {**summary, "count": records, "null_count": null_count, "null_ratio": null_count / records}
+
+
+class StoredStats(NamedTuple):
+    """What /schema/stats and the planners read: the summary is {records, fields}."""
+    source_id: str
+    schema_version: int
+    updated_at: Optional[datetime]
+    summary: Dict[str, Any]
+
+
+class StatisticsStore:
+    """
+    Sketches each ingested batch in memory, then merges it into the
+    stored state. Only the fields present in the batch are locked and
+    rewritten (in name order, so concurrent batches cannot deadlock);
+    fields a batch lacks are left alone and its records count as nulls
+    for them when read. Each field row carries its precomputed summary,
+    so reads never decode a sketch.
+    """
+
+    async def update(
+        self,
+        session: AsyncSession,
+        source_id: str,
+        schema_version: int,
+        records: List[Dict[str, Any]]
+    ):
+        batch = SourceStats()
+        batch.update(records)
+        names = sorted(batch.fields)
+
+        if names:
+            await session.execute(
+                pg_insert(FieldSketchDB)
+                .values([{"source_id": source_id, "field": name, "sketch": {}, "summary": {}} for name in names])
+                .on_conflict_do_nothing(index_elements=["source_id", "field"])
+            )
+            result = await session.execute(
+                select(FieldSketchDB)
+                .where(FieldSketchDB.source_id == source_id, FieldSketchDB.field.in_(names))
+                .order_by(FieldSketchDB.field)
+                .with_for_update()
+            )
+            for row in result.scalars():
+                stats = batch.fields[row.field]
+                if row.sketch:
+                    stats = FieldStats.from_dict(row.sketch)
+                    stats.merge(batch.fields[row.field])
+                row.sketch = stats.to_dict()
+                row.summary = stats.summary()
+
+        # the source row last and as one statement: held only until commit
+        await session.execute(
+            pg_insert(FieldStatsDB)
+            .values(source_id=source_id, schema_version=schema_version, records=len(records))
+            .on_conflict_do_update(
+                index_elements=["source_id"],
+                set_={
+                    "records": FieldStatsDB.records + len(records),
+                    "schema_version": func.greatest(FieldStatsDB.schema_version, schema_version),
+                    "updated_at": datetime.utcnow(),
+                }
+            )
+        )
+        await session.commit()
+
+    async def get(self, session: AsyncSession, source_id: str) -> Optional[StoredStats]:
+        row = (await session.execute(
+            select(FieldStatsDB).where(FieldStatsDB.source_id == source_id)
+        )).scalars().first()
+        if row is None:
+            return None
+
+        result = await session.execute(
+            select(FieldSketchDB.field, FieldSketchDB.summary).where(FieldSketchDB.source_id == source_id)
+        )
+        fields = {name: fill_absent(summary, row.records) for name, summary in result.all()}
+        return StoredStats(
+            source_id=row.source_id,
+            schema_version=row.schema_version,
+            updated_at=row.updated_at,
+            summary={"records": row.records, "fields": fields},
+        )
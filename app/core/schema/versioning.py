@@ -0,0 +1,225 @@
+# app/core/schema/versioning.py
+
+import structlog
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, desc
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.schema_models import SchemaVersionDB
+
+logger = structlog.get_logger()
+
+Projection = Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]
+
+
+# -------------------------------------------------------------
+# Coercions applied when a field's type differs between versions
+# -------------------------------------------------------------
+def _safe(fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    def coerce(value: Any) -> Any:
+        try:
+            return fn(value)
+        except (TypeError, ValueError):
+            return value
+    return coerce
+
+
+COERCIONS: Dict[str, Callable[[Any], Any]] = {
+    "integer": _safe(int),
+    "float": _safe(float),
+    "string": _safe(str),
+    "date": _safe(str),
+    "boolean": _safe(lambda v: v if isinstance(v, bool) else str(v).strip().lower() in ("true", "yes", "1")),
+}
+
+
+# -------------------------------------------------------------
+# Projection compiler
+# -------------------------------------------------------------
+def compile_projection(
+    from_schema: Dict[str, Dict[str, Any]],
+    to_schema: Dict[str, Dict[str, Any]],
+    source_key: Callable[[str], str] = lambda name: name
+) -> Projection:
+    """
+    Build a function that reshapes a batch of records written under
+    `from_schema` into `to_schema`:
+
+      - fields present in both are copied (coerced if the type changed)
+      - fields with `renamed_from` are read from their old name when the
+        new one is missing (SchemaGenerator.declare_field sets it)
+      - missing values take the field's declared `default` (or None)
+      - fields absent from `to_schema` are dropped
+
+    The projection works a column at a time over the whole batch: each
+    stored key is read once, then renamed, coerced and defaulted as a
+    list before the rows are zipped back together.
+
+    `source_key` maps a schema field name to the key used in the stored
+    records (e.g. the sanitized column name for Postgres rows).
+    """
+    plan: List[Tuple[str, Tuple[str, ...], Any, Optional[Callable[[Any], Any]]]] = []
+
+    for name, meta in to_schema.items():
+        old = meta.get("renamed_from")
+        sources = [n for n in (name, old) if n is not None and n in from_schema]
+
+        coerce = None
+        if any(from_schema[n].get("type") != meta.get("type") for n in sources):
+            coerce = COERCIONS.get(meta.get("type"))
+        plan.append((name, tuple(source_key(n) for n in sources), meta.get("default"), coerce))
+
+    targets = tuple(p[0] for p in plan)
+    plan_t = tuple(plan)
+
+    def project(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not plan_t:
+            return [{} for _ in records]
+
+        read: Dict[str, List[Any]] = {}
+
+        def column(key: str) -> List[Any]:
+            if key not in read:
+                read[key] = [rec.get(key) for rec in records]
+            return read[key]
+
+        columns = []
+        for _, sources, default, coerce in plan_t:
+            if not sources:
+                columns.append([default] * len(records))
+                continue
+
+            values = column(sources[0])
+            for fallback in sources[1:]:
+                values = [v if v is not None else w for v, w in zip(values, column(fallback))]
+            if coerce is not None:
+                values = [v if v is None else coerce(v) for v in values]
+            if default is not None:
+                values = [default if v is None else v for v in values]
+            columns.append(values)
+
+        return [dict(zip(targets, row)) for row in zip(*columns)]
+
+    return project
+
+
+# -------------------------------------------------------------
+# Projector — caches schemas and compiled projections
+# -------------------------------------------------------------
+class SchemaProjector:
+    """
+    Upcasts (or downcasts) stored records to a target schema version at
+    read time. Schema versions are immutable, so both the schemas and the
+    projections compiled from them are cached for the process lifetime
+    (projections in a bounded LRU).
+    """
+
+    def __init__(self, max_projections: int = 256):
+        self.max_projections = max_projections
+        self._schemas: Dict[Tuple[str, int], Dict[str, Dict[str, Any]]] = {}
+        self._projections: "OrderedDict[Tuple, Projection]" = OrderedDict()
+
+    # ---------------------------------------------------------
+    async def load_schemas(
+        self, session: AsyncSession, source_id: str, versions: Iterable[int]
+    ) -> Dict[int, Dict[str, Dict[str, Any]]]:
+        """Fetch the given versions, hitting Postgres once for any not cached."""
+        versions = set(versions)
+        missing = [v for v in versions if (source_id, v) not in self._schemas]
+
+        if missing:
+            result = await session.execute(
+                select(SchemaVersionDB.version, SchemaVersionDB.schema).where(
+                    SchemaVersionDB.source_id == source_id,
+                    SchemaVersionDB.version.in_(missing)
+                )
+            )
+            for version, schema in result.all():
+                self._schemas[(source_id, version)] = schema or {}
+
+        return {
+            v: self._schemas[(source_id, v)]
+            for v in versions if (source_id, v) in self._schemas
+        }
+
+    async def latest_version(self, session: AsyncSession, source_id: str) -> Optional[int]:
+        result = await session.execute(
+            select(SchemaVersionDB.version)
+            .where(SchemaVersionDB.source_id == source_id)
+            .order_by(desc(SchemaVersionDB.version))
+            .limit(1)
+        )
+        return result.scalar()
+
+    def _projection(self, key: Tuple, build: Callable[[], Projection]) -> Projection:
+        fn = self._projections.get(key)
+        if fn is None:
+            fn = build()
+            self._projections[key] = fn
+            if len(self._projections) > self.max_projections:
+                self._projections.popitem(last=False)
+        else:
+            self._projections.move_to_end(key)
+        return fn
+
+    # ---------------------------------------------------------
+    async def project_documents(
+        self,
+        session: AsyncSession,
+        source_id: str,
+        documents: List[Dict[str, Any]],
+        target_version: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Project Mongo documents ({schema_version, record}) to `target_version`.
+        Records are projected one version group at a time; order is kept.
+        """
+        groups: Dict[int, List[int]] = {}
+        for i, doc in enumerate(documents):
+            groups.setdefault(doc.get("schema_version") or target_version, []).append(i)
+
+        schemas = await self.load_schemas(session, source_id, [*groups, target_version])
+        if target_version not in schemas:
+            raise LookupError(f"Schema version {target_version} not found for source_id={source_id}")
+
+        out: List[Optional[Dict[str, Any]]] = [None] * len(documents)
+        for version, indices in groups.items():
+            from_schema = schemas.get(version, schemas[target_version])
+            project = self._projection(
+                (source_id, version, target_version),
+                lambda: compile_projection(from_schema, schemas[target_version])
+            )
+            batch = project([documents[i].get("record", {}) for i in indices])
+            for i, rec in zip(indices, batch):
+                out[i] = rec
+
+        return out
+
+    async def project_rows(
+        self,
+        session: AsyncSession,
+        source_id: str,
+        rows: List[Dict[str, Any]],
+        target_version: int,
+        source_key: Callable[[str], str]
+    ) -> List[Dict[str, Any]]:
+        """
+        Project dynamic-table rows (which always carry the latest shape)
+        to `target_version`.
+        """
+        latest = await self.latest_version(session, source_id)
+        schemas = await self.load_schemas(session, source_id, {latest, target_version} - {None})
+        if target_version not in schemas:
+            raise LookupError(f"Schema version {target_version} not found for source_id={source_id}")
+
+        project = self._projection(
+            (source_id, "table", latest, target_version),
+            lambda: compile_projection(schemas[latest], schemas[target_version], source_key)
+        )
+        return project(rows)
+
+
+# Shared projector — compiled projections are reused across requests
+projector = SchemaProjector()
@@ -2,16 +2,26 @@
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from contextlib import asynccontextmanager
+import asyncio
 import structlog
 
 from app.utils.logging import setup_logging
 from app.config import settings
 from app.models.database import init_db
+from app.storage.registry import ConnectionRegistry
+from app.storage.partitions import partition_manager
+from app.storage.hybrid import hybrid_layout
+from app.storage.tiering import tiering
+from app.storage.spool import spool
+from app.core.etl.pipeline import sink_writers
+from app.core.query.async_jobs import query_jobs
+from app.core.query.index_advisor import index_advisor
 
 # Routers are imported later to avoid premature model loading
-from app.api.routes import upload, schema, query, records
+from app.api.routes import upload, schema, query, records, admin
 
 
 # ---------------------------------------------------------
@@ -40,9 +50,70 @@ async def lifespan(app: FastAPI):
         logger.error("Database initialization failed", exc_info=e)
         raise
 
+    # Pooled clients shared by every route and the pipeline
+    app.state.registry = await ConnectionRegistry.open()
+
+    # Finish extras → column promotions a stopped worker left unfinished
+    await hybrid_layout.resume(app.state.registry.engine)
+
+    # Premake partitions + retention for partitioned dynamic tables
+    maintenance = asyncio.create_task(
+        partition_manager.run_maintenance(
+            app.state.registry.engine, settings.PARTITION_MAINTENANCE_INTERVAL_S
+        )
+    )
+
+    # Merge small Parquet lake files
+    compaction = asyncio.create_task(
+        app.state.registry.lake.run_compaction(app.state.registry.engine, settings.LAKE_COMPACTION_INTERVAL_S)
+    )
+
+    # Move records past their source's threshold to the cold tier
+    tiering_loop = asyncio.create_task(
+        tiering.run_tiering(app.state.registry, settings.TIERING_INTERVAL_S)
+    )
+
+    # Drain spooled sink writes once the sinks are back; pending counts
+    # are loaded first so uploads keep per-sink order after a restart
+    await spool.open()
+    replay = asyncio.create_task(
+        spool.run_replay(
+            sink_writers(app.state.registry.mongo, app.state.registry.redis, app.state.registry.lake),
+            settings.SPOOL_REPLAY_INTERVAL_S,
+            settings.SPOOL_REPLAY_BATCH
+        )
+    )
+
+    # Drop async query results past their TTL (and jobs whose worker is gone);
+    # the heartbeat keeps this process's jobs from looking abandoned
+    query_sweeper = asyncio.create_task(
+        query_jobs.run_sweeper(
+            app.state.registry, settings.ASYNC_QUERY_SWEEP_INTERVAL_S, settings.ASYNC_QUERY_RESULT_TTL_S
+        )
+    )
+    query_heartbeat = asyncio.create_task(
+        query_jobs.run_heartbeat(app.state.registry, settings.ASYNC_QUERY_HEARTBEAT_S)
+    )
+
+    # Persist /query filter + sort counters for the index advisor
+    index_flush = asyncio.create_task(
+        index_advisor.run_flush(app.state.registry.session_factory, settings.INDEX_HITS_FLUSH_INTERVAL_S)
+    )
+
     yield
 
     logger.info("Shutting down Dynamic ETL Pipeline")
+    maintenance.cancel()
+    compaction.cancel()
+    tiering_loop.cancel()
+    replay.cancel()
+    query_sweeper.cancel()
+    query_heartbeat.cancel()
+    index_flush.cancel()
+    # the loop's last flush needs the registry still open
+    await asyncio.gather(index_flush, return_exceptions=True)
+    await spool.close()
+    await app.state.registry.close()
 
 
 # ---------------------------------------------------------
@@ -84,6 +155,7 @@ app.include_router(upload.router, prefix="/upload", tags=["Upload"])
 app.include_router(schema.router, prefix="/schema", tags=["Schema"])
 app.include_router(query.router, prefix="/query", tags=["Query"])
 app.include_router(records.router, prefix="/records", tags=["Records"])
+app.include_router(admin.router, prefix="/admin", tags=["Admin"])
 
 # ---------------------------------------------------------
 # Endpoints
@@ -100,3 +172,8 @@ async def root():
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -2,20 +2,23 @@
 
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
-import redis.asyncio as aioredis
-from pymongo import MongoClient
 from app.config import settings
-import os
 
 # ---------------------------
 # PostgreSQL (async)
 # ---------------------------
 DATABASE_URL = settings.DATABASE_URL
 
+# Lazy pool: no connection is opened until first use. Its lifecycle
+# (disposal on shutdown) is owned by the ConnectionRegistry.
 engine = create_async_engine(
     DATABASE_URL,
     echo=False,
-    future=True
+    future=True,
+    pool_size=settings.PG_POOL_SIZE,
+    max_overflow=settings.PG_MAX_OVERFLOW,
+    pool_timeout=settings.PG_POOL_TIMEOUT,
+    pool_pre_ping=True
 )
 
 AsyncSessionLocal = sessionmaker(
@@ -31,35 +34,29 @@ async def get_db():
         yield session
 
 
-# ---------------------------
-# MongoDB
-# ---------------------------
-mongo_client = MongoClient(settings.MONGODB_URL)
-mongo_db = mongo_client.get_default_database()
-
-def get_mongo():
-    return mongo_db
+# MongoDB, Redis and object storage clients live in
+# app.storage.registry.ConnectionRegistry (created in lifespan).
 
 
 # ---------------------------
-# Redis
+# Init DB
 # ---------------------------
-redis_client = aioredis.from_url(
-    os.getenv("REDIS_URL", "redis://redis:6379/0"),
-    decode_responses=True
-)
+# create_all never alters an existing table: changes to tables that may
+# already exist are applied here, each statement idempotent, in order.
+SCHEMA_UPGRADES = [
+    # source_files: compressed raw archive (app/storage/s3_handler.py)
+    "ALTER TABLE source_files ADD COLUMN IF NOT EXISTS codec VARCHAR",
+    "ALTER TABLE source_files ADD COLUMN IF NOT EXISTS original_size BIGINT",
+]
 
-async def get_redis():
-    return redis_client
 
-
-# ---------------------------
-# Init DB
-# ---------------------------
 async def init_db():
     """
-    Create all SQLAlchemy tables that inherit from Base
+    Create all SQLAlchemy tables that inherit from Base, then bring
+    existing tables up to date (SCHEMA_UPGRADES)
     """
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        for statement in SCHEMA_UPGRADES:
+            await conn.exec_driver_sql(statement)
     return True
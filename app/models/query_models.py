@@ -1,12 +1,127 @@
-from pydantic import BaseModel
-from typing import Any, Dict, List, Optional
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional, Tuple
+from sqlalchemy import Column, Integer, BigInteger, Float, String, DateTime, JSON, Text, UniqueConstraint
+from app.models.database import Base
+
+
+# ---------- SQLAlchemy Model (stored in Postgres) ----------
+
+class IndexCandidateDB(Base):
+    __tablename__ = "index_candidates"
+    __table_args__ = (UniqueConstraint("source_id", "backend", "field"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_id = Column(String, index=True, nullable=False)
+    backend = Column(String, nullable=False)          # "postgresql" | "mongodb"
+    field = Column(String, nullable=False)
+    filter_hits = Column(Integer, nullable=False, default=0)
+    sort_hits = Column(Integer, nullable=False, default=0)
+    status = Column(String, nullable=False, default="candidate")  # candidate, building, built, failed, dropped
+    index_name = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# Incrementally maintained rollups (app/core/query/rollups.py): one row per
+# rollup × time bucket × group × metric; metric "*" carries the row count
+class RollupValueDB(Base):
+    __tablename__ = "rollup_values"
+    __table_args__ = (UniqueConstraint("rollup", "bucket_start", "group_key", "metric"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    rollup = Column(String, nullable=False)
+    source_id = Column(String, index=True, nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    group_key = Column(String, nullable=False)          # canonical JSON of the group values
+    group_values = Column(JSON, nullable=False)         # {field: value}
+    metric = Column(String, nullable=False)
+    count = Column(BigInteger, nullable=False, default=0)   # non-null values (rows for "*")
+    sum = Column(Float, nullable=True)
+    min = Column(Float, nullable=True)
+    max = Column(Float, nullable=True)
+
+
+# Asynchronous /query jobs (app/core/query/async_jobs.py); results are
+# spooled to the object store in chunks of `chunk_rows` rows
+class QueryJobDB(Base):
+    __tablename__ = "query_jobs"
+
+    id = Column(String, primary_key=True)              # uuid hex
+    source_id = Column(String, index=True, nullable=False)
+    backend = Column(String, nullable=False)           # "postgresql" | "mongodb"
+    request = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, default="queued")  # queued | running | completed | failed | cancelled
+    error = Column(Text, nullable=True)
+    result_count = Column(BigInteger, nullable=False, default=0)
+    chunks = Column(Integer, nullable=False, default=0)   # spooled so far while running
+    chunk_rows = Column(Integer, nullable=False)
+    codec = Column(String, nullable=True)              # chunk compression; None = plain JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)     # lease renewed by the owning process
+    finished_at = Column(DateTime, nullable=True)      # None until the job's chunks are settled
+
+
+# ---------- Pydantic Models ----------
+
+
+class FieldFilter(BaseModel):
+    """Typed operators for one field; several combine with AND."""
+    eq: Optional[Any] = None
+    ne: Optional[Any] = None
+    gt: Optional[Any] = None
+    gte: Optional[Any] = None
+    lt: Optional[Any] = None
+    lte: Optional[Any] = None
+    in_: Optional[List[Any]] = Field(None, alias="in")
+    between: Optional[Tuple[Any, Any]] = None   # inclusive bounds
+    prefix: Optional[str] = None
+    is_null: Optional[bool] = None
+
+    class Config:
+        extra = "forbid"
+        populate_by_name = True
+
+
+class SortKey(BaseModel):
+    field: str
+    direction: Literal["asc", "desc"] = "asc"
 
 
 class QueryRequest(BaseModel):
     source: str
     fields: List[str]
-    filters: Optional[Dict[str, Any]] = None
+    filters: Optional[Dict[str, Any]] = None   # {field: value} (equality) or {field: FieldFilter}
+    sort: Optional[List[SortKey]] = None
     limit: Optional[int] = 100
+    target_version: Optional[int] = None   # project records to this schema version
+    ingested_from: Optional[datetime] = None  # ingested_at >= (prunes partitions)
+    ingested_to: Optional[datetime] = None    # ingested_at <
+
+
+class AggregateSpec(BaseModel):
+    fn: Literal["count", "sum", "avg", "min", "max"]
+    field: Optional[str] = None        # count without a field counts rows
+    alias: Optional[str] = None        # defaults to "<fn>_<field>" / "count"
+
+
+class AggregateRequest(BaseModel):
+    source: str
+    group_by: List[str] = []
+    aggregates: List[AggregateSpec]
+    time_bucket: Optional[Literal["hour", "day", "week", "month"]] = None   # groups by ingested_at
+    filters: Optional[Dict[str, Any]] = None
+    ingested_from: Optional[datetime] = None
+    ingested_to: Optional[datetime] = None
+    limit: Optional[int] = 1000
+
+
+class AggregateResponse(BaseModel):
+    count: int
+    groups: List[Dict[str, Any]]
+    answered_by: str                   # "postgresql" | "mongodb" | "rollup:<name>"
 
 
 class QueryResponse(BaseModel):
@@ -14,10 +129,33 @@ class QueryResponse(BaseModel):
     records: List[Dict[str, Any]]
 
 
+class NLQueryRequest(BaseModel):
+    source: str
+    question: str
+    target_db: str = "postgresql"     # "postgresql" | "mongodb"
+
+
+class NLBatchRequest(BaseModel):
+    source: str
+    questions: List[str]
+    target_db: str = "postgresql"
+
+
+class NLQueryResponse(BaseModel):
+    question: str
+    query: str                          # generated, with :pN placeholders
+    params: Dict[str, Any]              # literals bound to the placeholders
+    cached: bool                        # translation served from the cache
+    count: int
+    records: List[Dict[str, Any]]
+
+
 class PaginatedQueryResponse(BaseModel):
     page: int
     page_size: int
-    total_count: int
+    total_count: Optional[int] = None     # only when asked for (?total=exact|estimate)
+    total_estimated: bool = False
+    next_cursor: Optional[str] = None     # opaque; None on the last page
     results: List[Dict[str, Any]]
 
 
@@ -32,4 +170,28 @@ class QueryStatus(BaseModel):
     status: str              # e.g., "running", "completed", "failed"
     message: Optional[str] = None  # additional info or error message
     executed_at: Optional[str] = None
-    duration_ms: Optional[float] = None
\ No newline at end of file
+    duration_ms: Optional[float] = None
+
+
+class AsyncQueryResponse(BaseModel):
+    id: str
+    status: QueryStatus
+    execution: Optional[QueryExecution] = None      # once completed
+    results: Optional[PaginatedQueryResponse] = None
+
+
+class IndexCandidate(BaseModel):
+    id: int
+    source_id: str
+    backend: str
+    field: str
+    filter_hits: int
+    sort_hits: int
+    selectivity: Optional[float] = None
+    score: float = 0.0
+    status: str
+    index_name: Optional[str] = None
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
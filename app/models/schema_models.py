@@ -4,7 +4,7 @@ from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel
 from sqlalchemy import (
-    Column, Integer, String, DateTime, JSON, Text
+    Column, Integer, BigInteger, String, DateTime, JSON, Text, UniqueConstraint
 )
 from app.models.database import Base
 
@@ -21,6 +21,56 @@ class SchemaVersionDB(Base):
     comment = Column(Text, nullable=True)
 
 
+# Column widenings in flight (app/core/schema/migration.py): while a row
+# exists, every writer sends the column's values to its shadow column.
+# Read inside the insert transaction, under the table's widening lock.
+class ColumnWideningDB(Base):
+    __tablename__ = "column_widenings"
+
+    table_name = Column(String, primary_key=True)
+    column = Column(String, primary_key=True)
+    shadow = Column(String, nullable=False)
+    from_type = Column(String, nullable=False)
+    to_type = Column(String, nullable=False)
+    started_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Hybrid-table fields being moved out of extras (app/storage/hybrid.py):
+# recorded before the typed column is added and deleted once every row is
+# moved, so every worker reads such a column from both places meanwhile.
+class FieldPromotionDB(Base):
+    __tablename__ = "field_promotions"
+
+    table_name = Column(String, primary_key=True)
+    column = Column(String, primary_key=True)
+    sql_type = Column(String, nullable=False)
+    started_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Per-source field statistics, maintained incrementally during ingestion:
+# the record count here, each field's sketches in its own row so a batch
+# only locks and rewrites the fields it contains
+class FieldStatsDB(Base):
+    __tablename__ = "field_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_id = Column(String, unique=True, index=True, nullable=False)
+    schema_version = Column(Integer, nullable=False)
+    records = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class FieldSketchDB(Base):
+    __tablename__ = "field_sketches"
+    __table_args__ = (UniqueConstraint("source_id", "field"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_id = Column(String, index=True, nullable=False)
+    field = Column(String, nullable=False)
+    sketch = Column(JSON, nullable=False)     # mergeable sketch state
+    summary = Column(JSON, nullable=False)    # precomputed for /schema/stats
+
+
 # Pydantic models used by API and internal code
 class FieldMetadata(BaseModel):
     name: str
@@ -61,3 +111,28 @@ class SchemaDiff(BaseModel):
     added: Dict[str, Dict[str, Any]]
     removed: Dict[str, Dict[str, Any]]
     changed: Dict[str, Dict[str, Any]]
+
+class FieldDeclaration(BaseModel):
+    source_id: str
+    field: str
+    renamed_from: Optional[str] = None
+    default: Optional[Any] = None
+
+class FieldStatsResponse(BaseModel):
+    source_id: str
+    schema_version: int
+    records: int
+    updated_at: Optional[datetime] = None
+    fields: Dict[str, Dict[str, Any]]
+
+class MigrationProgress(BaseModel):
+    table: str
+    column: str
+    from_type: str
+    to_type: str
+    status: str              # "backfilling", "swapping", "completed", "failed", "running_elsewhere"
+    rows_done: int = 0
+    rows_total: int = 0
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
@@ -1,6 +1,7 @@
 from datetime import datetime
 from pydantic import BaseModel
-from sqlalchemy import Column, Integer, String, DateTime
+from typing import Optional
+from sqlalchemy import Column, Integer, BigInteger, Boolean, String, DateTime, JSON, Text
 from app.models.database import Base
 
 # ---------- SQLAlchemy Model (stored in Postgres) ----------
@@ -13,9 +14,47 @@ class SourceFile(Base):
     filename = Column(String, nullable=False)
     file_type = Column(String, nullable=False)
     storage_path = Column(String, nullable=False)
+    codec = Column(String, nullable=True)              # None = stored uncompressed
+    original_size = Column(BigInteger, nullable=True)  # bytes before compression
     uploaded_at = Column(DateTime, default=datetime.utcnow)
 
 
+# Re-derivation of a source's records from its archived files. Progress
+# is checkpointed here so an interrupted backfill resumes after the last
+# committed file.
+class BackfillJobDB(Base):
+    __tablename__ = "backfill_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_id = Column(String, index=True, nullable=False)
+    generation = Column(Integer, nullable=False)          # live table = generation 0
+    status = Column(String, nullable=False, default="pending")  # pending | running | swapping | done | failed
+    schema = Column(JSON, nullable=False, default=dict)    # union schema derived so far
+    last_file_id = Column(Integer, nullable=False, default=0)  # checkpoint (SourceFile.id)
+    files_total = Column(Integer, nullable=False, default=0)
+    files_done = Column(Integer, nullable=False, default=0)
+    records_written = Column(BigInteger, nullable=False, default=0)
+    schema_version = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+# Hot/cold tiering progress per source: rows ingested before `watermark`
+# live only in the cold tier (Parquet files in the object store).
+class TieringStateDB(Base):
+    __tablename__ = "tiering_state"
+
+    source_id = Column(String, primary_key=True)
+    watermark = Column(DateTime(timezone=True), nullable=True)
+    rows_moved = Column(BigInteger, nullable=False, default=0)
+    files_written = Column(Integer, nullable=False, default=0)
+    exported_at = Column(DateTime(timezone=True), nullable=True)    # start of the last day export
+    rewrite_cold = Column(Boolean, nullable=False, default=False)   # set by a backfill swap
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 # ---------- Pydantic Models (returned in API responses) ----------
 
 class UploadResponse(BaseModel):
@@ -24,7 +63,39 @@ class UploadResponse(BaseModel):
     filename: str
     file_type: str
     storage_path: str
+    codec: Optional[str] = None
+    original_size: Optional[int] = None
     uploaded_at: datetime
 
     class Config:
         orm_mode = True
+
+
+class BackfillJob(BaseModel):
+    id: int
+    source_id: str
+    generation: int
+    status: str
+    last_file_id: int
+    files_total: int
+    files_done: int
+    records_written: int
+    schema_version: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class TieringState(BaseModel):
+    source_id: str
+    watermark: Optional[datetime] = None
+    rows_moved: int
+    files_written: int
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
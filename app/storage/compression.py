@@ -0,0 +1,115 @@
+# app/storage/compression.py
+
+import zlib
+import structlog
+from typing import AsyncIterator, List, Optional
+
+try:
+    import zstandard as zstd
+except ImportError:  # optional dependency → fall back to gzip
+    zstd = None
+
+logger = structlog.get_logger()
+
+# Object key suffix per codec (None = stored as received)
+EXTENSIONS = {"zstd": ".zst", "gzip": ".gz"}
+
+
+def resolve_codec(name: Optional[str]) -> Optional[str]:
+    """
+    Map the configured codec ("auto" | "zstd" | "gzip" | "none") to the one
+    actually used: "auto" prefers zstd and falls back to gzip.
+    """
+    name = (name or "none").lower()
+    if name == "none":
+        return None
+    if name == "auto":
+        return "zstd" if zstd is not None else "gzip"
+    if name == "zstd" and zstd is None:
+        logger.warning("zstandard not installed, using gzip")
+        return "gzip"
+    if name not in EXTENSIONS:
+        raise ValueError(f"Unknown compression codec: {name}")
+    return name
+
+
+def codec_for_path(storage_path: str) -> Optional[str]:
+    """Infer the codec from the object key (for rows written before codecs were recorded)."""
+    for codec, ext in EXTENSIONS.items():
+        if storage_path.endswith(ext):
+            return codec
+    return None
+
+
+def available_codecs() -> List[str]:
+    """Codecs usable here, preferred first."""
+    return ["zstd", "gzip"] if zstd is not None else ["gzip"]
+
+
+def _compressor(codec: str, level: Optional[int]):
+    if codec == "zstd":
+        return zstd.ZstdCompressor(level=level or 3).compressobj()
+    # wbits=31 → gzip container, readable by any gzip tool
+    return zlib.compressobj(level if level is not None else 6, zlib.DEFLATED, 31)
+
+
+def _decompressor(codec: str):
+    if codec == "zstd":
+        return zstd.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+
+def compress_bytes(data: bytes, codec: str, level: Optional[int] = None) -> bytes:
+    """One-shot compression (same containers as CompressingStream)."""
+    compressor = _compressor(codec, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress_bytes(data: bytes, codec: str) -> bytes:
+    decompressor = _decompressor(codec)
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+class CompressingStream:
+    """
+    Wraps a chunk stream, compressing it on the fly and counting the
+    original size as it goes (known once the stream is exhausted).
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], codec: Optional[str], level: Optional[int] = None):
+        self.chunks = chunks
+        self.codec = codec
+        self.level = level
+        self.original_size = 0
+        self.stored_size = 0
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        compressor = _compressor(self.codec, self.level) if self.codec else None
+        async for chunk in self.chunks:
+            self.original_size += len(chunk)
+            out = compressor.compress(chunk) if compressor else chunk
+            if out:
+                self.stored_size += len(out)
+                yield out
+        if compressor:
+            tail = compressor.flush()
+            if tail:
+                self.stored_size += len(tail)
+                yield tail
+
+
+async def decompress_stream(chunks: AsyncIterator[bytes], codec: Optional[str]) -> AsyncIterator[bytes]:
+    """Decompress a chunk stream incrementally; memory stays bounded by the chunk size."""
+    if not codec:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    decompressor = _decompressor(codec)
+    async for chunk in chunks:
+        out = decompressor.decompress(chunk)
+        if out:
+            yield out
+    tail = decompressor.flush()
+    if tail:
+        yield tail
@@ -0,0 +1,264 @@
+# app/storage/hybrid.py
+
+import asyncio
+import json
+import structlog
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from sqlalchemy import delete, distinct, select, text as sql_text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from app.config import settings
+from app.core.schema.migration import EXTRAS_COLUMN
+from app.models.schema_models import FieldPromotionDB
+
+logger = structlog.get_logger()
+
+
+class HybridLayout:
+    """
+    Hybrid storage for sources with a long tail of sparse fields: fields
+    that are frequent enough (non-null in at least `min_ratio` of records,
+    judged from the field statistics) get typed columns, everything else
+    lives in an `extras` JSONB column with a GIN index.
+
+    Fields are promoted as their frequency grows: the promotion is
+    recorded (field_promotions), the column is added, new writes go to it
+    at once, and existing rows are moved out of `extras` in id-range
+    batches in the background. Until the record is deleted, filters on
+    the field check both places, in every worker. One worker moves a
+    table's rows at a time; unfinished promotions resume at startup.
+    """
+
+    def __init__(self, min_ratio: float = 0.2, min_records: int = 100, batch_size: int = 5000):
+        self.min_ratio = min_ratio
+        self.min_records = min_records
+        self.batch_size = batch_size
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def enabled_for(self, source_id: str) -> bool:
+        """HYBRID_SOURCES is a comma-separated list of source ids, or "*"."""
+        sources = {s.strip() for s in settings.HYBRID_SOURCES.split(",") if s.strip()}
+        return "*" in sources or source_id in sources
+
+    # ---------------------------------------------------------
+    # Column selection
+    # ---------------------------------------------------------
+    def choose_columns(
+        self,
+        schema: Dict[str, Dict[str, Any]],
+        summary: Optional[Dict[str, Any]],
+        current: Set[str],
+        column_name: Callable[[str], str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        The part of `schema` stored as typed columns: fields that already
+        have one, plus non-JSON fields whose density passed the threshold.
+        """
+        summary = summary or {}
+        records = summary.get("records", 0)
+        fields = summary.get("fields", {})
+
+        chosen = {}
+        for name, meta in schema.items():
+            if column_name(name) in current:
+                chosen[name] = meta
+                continue
+            if meta.get("type") == "json" or records < self.min_records:
+                continue
+            stats = fields.get(name)
+            if stats and (stats["count"] - stats["null_count"]) / records >= self.min_ratio:
+                chosen[name] = meta
+        return chosen
+
+    @staticmethod
+    def split(record: Dict[str, Any], columns: Set[str]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Split a sanitized record into (typed column values, extras)."""
+        typed, extras = {}, {}
+        for key, value in record.items():
+            if key in columns and key != EXTRAS_COLUMN:
+                typed[key] = value
+            elif value is not None:
+                extras[key] = value
+        return typed, extras
+
+    # ---------------------------------------------------------
+    # Reads
+    # ---------------------------------------------------------
+    @staticmethod
+    async def promoting(conn: Union[AsyncConnection, AsyncSession], table_name: str) -> Set[str]:
+        """Columns of `table_name` still (partly) in extras; read per query, other workers promote too."""
+        result = await conn.execute(
+            select(FieldPromotionDB.column).where(FieldPromotionDB.table_name == table_name)
+        )
+        return {r[0] for r in result.all()}
+
+    @staticmethod
+    def build_filters(
+        filters: Dict[str, Any],
+        columns: Set[str],
+        column_name: Callable[[str], str],
+        promoting: Set[str] = frozenset()
+    ) -> Tuple[List[str], Dict[str, Any]]:
+        """
+        WHERE clauses + params for equality filters on fields stored in
+        either place (`promoting`: columns being promoted). Extras use
+        containment (@>) so the GIN index applies.
+        """
+        clauses, params = [], {}
+
+        for i, (field, value) in enumerate(filters.items()):
+            col = column_name(field)
+            col_param, json_param = f"p{i}", f"p{i}_json"
+            in_extras = f'"{EXTRAS_COLUMN}" @> CAST(:{json_param} AS JSONB)'
+
+            if col in columns and col not in promoting:
+                clauses.append(f'"{col}" = :{col_param}')
+                params[col_param] = value
+            elif col in columns:
+                clauses.append(f'("{col}" = :{col_param} OR {in_extras})')
+                params[col_param] = value
+                params[json_param] = json.dumps({col: value}, default=str)
+            else:
+                clauses.append(in_extras)
+                params[json_param] = json.dumps({col: value}, default=str)
+
+        return clauses, params
+
+    @staticmethod
+    def flatten(row: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge the extras object into the row (typed columns win)."""
+        row = dict(row)
+        extras = row.pop(EXTRAS_COLUMN, None) or {}
+        if isinstance(extras, str):
+            extras = json.loads(extras)
+        for key, value in extras.items():
+            # mid-promotion a value may still sit in extras
+            if row.get(key) is None:
+                row[key] = value
+        return row
+
+    # ---------------------------------------------------------
+    # Promotion: extras → typed column
+    # ---------------------------------------------------------
+    @staticmethod
+    async def record_promotion(engine: AsyncEngine, table_name: str, columns: Dict[str, str]):
+        """
+        Record `columns` ({column: SQL type}) as being promoted. Done
+        before the columns are added, so no worker ever sees a new column
+        without also reading its values from extras.
+        """
+        async with engine.begin() as conn:
+            await conn.execute(
+                pg_insert(FieldPromotionDB)
+                .values([{"table_name": table_name, "column": c, "sql_type": t} for c, t in columns.items()])
+                .on_conflict_do_nothing()
+            )
+
+    def start_promotion(self, engine: AsyncEngine, table_name: str):
+        """Move the recorded columns of `table_name` out of extras in the background."""
+        previous = self._tasks.get(table_name)
+        task = asyncio.create_task(self._promote(engine, table_name, previous))
+        self._tasks[table_name] = task
+
+    async def resume(self, engine: AsyncEngine):
+        """Restart promotions left unfinished (by this or a stopped worker); called at startup."""
+        async with engine.connect() as conn:
+            tables = (await conn.execute(select(distinct(FieldPromotionDB.table_name)))).scalars().all()
+        for table_name in tables:
+            self.start_promotion(engine, table_name)
+        if tables:
+            logger.info("Field promotions resumed", tables=list(tables))
+
+    @staticmethod
+    async def rename_promotions(conn: AsyncConnection, old: str, new: str):
+        """Carry `old`'s promotions over to `new` (in the caller's transaction, next to the table rename)."""
+        await conn.execute(delete(FieldPromotionDB).where(FieldPromotionDB.table_name == new))
+        await conn.execute(
+            update(FieldPromotionDB).where(FieldPromotionDB.table_name == old).values(table_name=new)
+        )
+
+    async def _promote(self, engine: AsyncEngine, table_name: str, previous: Optional[asyncio.Task]):
+        # one promotion per table at a time in this process...
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+
+        lock_key = {"key": f"promote:{table_name}"}
+        try:
+            # ...and across workers: the holder of this session-level lock
+            # moves every recorded column, re-reading until none are left
+            async with engine.connect() as owner:
+                await owner.execute(sql_text("SELECT pg_advisory_lock(hashtext(:key))"), lock_key)
+                await owner.commit()
+                try:
+                    while True:
+                        columns = await self._recorded(engine, table_name)
+                        if not columns:
+                            break
+                        await self._move(engine, table_name, columns)
+                        async with engine.begin() as conn:
+                            await conn.execute(delete(FieldPromotionDB).where(
+                                FieldPromotionDB.table_name == table_name,
+                                FieldPromotionDB.column.in_(list(columns))
+                            ))
+                        logger.info("Field promotion finished", table=table_name, columns=list(columns))
+                finally:
+                    await owner.execute(sql_text("SELECT pg_advisory_unlock(hashtext(:key))"), lock_key)
+                    await owner.commit()
+
+        except Exception as e:
+            # Values stay readable from extras (filters keep checking both);
+            # the record stays, so the next start resumes the move
+            logger.error("Field promotion failed", exc_info=e, table=table_name)
+        finally:
+            if self._tasks.get(table_name) is asyncio.current_task():
+                self._tasks.pop(table_name, None)
+
+    @staticmethod
+    async def _recorded(engine: AsyncEngine, table_name: str) -> Dict[str, str]:
+        """Recorded columns of `table_name` that exist by now ({column: SQL type})."""
+        async with engine.connect() as conn:
+            recorded = (await conn.execute(
+                select(FieldPromotionDB.column, FieldPromotionDB.sql_type)
+                .where(FieldPromotionDB.table_name == table_name)
+            )).all()
+            existing = set((await conn.execute(
+                sql_text("SELECT column_name FROM information_schema.columns WHERE table_name = :t"),
+                {"t": table_name}
+            )).scalars().all())
+        # a column recorded but not added yet is promoted by the worker adding it
+        return {col: sql_type for col, sql_type in recorded if col in existing}
+
+    async def _move(self, engine: AsyncEngine, table_name: str, columns: Dict[str, str]):
+        keys = list(columns)
+        sets = ", ".join(
+            f'"{col}" = COALESCE("{col}", CAST("{EXTRAS_COLUMN}" ->> :k{i} AS {sql_type}))'
+            for i, (col, sql_type) in enumerate(columns.items())
+        )
+        key_params = {f"k{i}": col for i, col in enumerate(keys)}
+        move = sql_text(
+            f'UPDATE "{table_name}" SET {sets}, "{EXTRAS_COLUMN}" = "{EXTRAS_COLUMN}" - CAST(:keys AS TEXT[]) '
+            f'WHERE id > :lo AND id <= :hi AND "{EXTRAS_COLUMN}" ?| CAST(:keys AS TEXT[])'
+        )
+
+        lo = 0
+        while True:
+            async with engine.connect() as conn:
+                max_id = await conn.scalar(sql_text(f'SELECT max(id) FROM "{table_name}"')) or 0
+            # chase rows written with the old layout until caught up
+            if lo >= max_id:
+                break
+            while lo < max_id:
+                hi = lo + self.batch_size
+                async with engine.begin() as conn:
+                    await conn.execute(move, {"keys": keys, "lo": lo, "hi": hi, **key_params})
+                lo = hi
+
+
+# Shared layout — PostgresStorage writes through it, /query reads through it
+hybrid_layout = HybridLayout(
+    min_ratio=settings.HYBRID_PROMOTE_MIN_RATIO,
+    min_records=settings.HYBRID_PROMOTE_MIN_RECORDS,
+    batch_size=settings.MIGRATION_BATCH_SIZE
+)
@@ -0,0 +1,557 @@
+# app/storage/lake.py
+
+import asyncio
+import json
+import struct
+import uuid
+import structlog
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:     # optional: the lake sink is disabled without it
+    pa = None
+    pq = None
+
+from app.config import settings
+from app.storage.object_store import LocalObjectStore, ObjectStore
+
+logger = structlog.get_logger()
+
+LAKE_PREFIX = "lake"
+COLD_PREFIX = "cold"      # hot/cold tiering (app/storage/tiering.py)
+
+# System column holding the batch ingestion time
+INGESTED_AT = "_ingested_at"
+
+# Logical schema types → Arrow types; anything else is written as a string
+ARROW_TYPES = {
+    "integer": "int64",
+    "float": "float64",
+    "boolean": "bool",
+}
+
+
+# ---------------------------------------------------------
+# Layout: lake/source=<id>/date=<YYYY-MM-DD>/<kind>-<time>-<id>.parquet
+# ---------------------------------------------------------
+def partition_prefix(source_id: str, day: Optional[str] = None, root: str = LAKE_PREFIX) -> str:
+    prefix = f"{root}/source={source_id}/"
+    return f"{prefix}date={day}/" if day else prefix
+
+
+def file_key(
+    source_id: str, ts: datetime, kind: str = "part", root: str = LAKE_PREFIX, token: Optional[str] = None
+) -> str:
+    """`token` (default: random) makes the key stable, e.g. across retries of one batch."""
+    day = partition_prefix(source_id, f"{ts:%Y-%m-%d}", root)
+    return f"{day}{kind}-{ts:%H%M%S%f}-{token or uuid.uuid4().hex[:8]}.parquet"
+
+
+def key_date(key: str) -> Optional[str]:
+    for segment in key.split("/"):
+        if segment.startswith("date="):
+            return segment[len("date="):]
+    return None
+
+
+# ---------------------------------------------------------
+# Arrow conversion
+# ---------------------------------------------------------
+def as_utc(ts: Optional[datetime]) -> Optional[datetime]:
+    if ts is None or ts.tzinfo:
+        return ts
+    return ts.replace(tzinfo=timezone.utc)
+
+
+def _fits(value: Any, arrow_type: str) -> bool:
+    if value is None:
+        return True
+    if arrow_type == "bool":
+        return isinstance(value, bool)
+    if isinstance(value, bool):
+        return False
+    if arrow_type == "int64":
+        return isinstance(value, int)
+    return isinstance(value, (int, float))
+
+
+def _arrow_type(name: str) -> "pa.DataType":
+    return pa.bool_() if name == "bool" else getattr(pa, name)()
+
+
+def _as_string(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+def records_to_table(
+    records: List[Dict[str, Any]],
+    schema: Dict[str, Dict[str, Any]],
+    ingested_at: Union[datetime, List[datetime]],
+    metadata: Optional[Dict[str, str]] = None
+) -> "pa.Table":
+    """
+    Build an Arrow table with one column per schema field. A column whose
+    values do not fit the logical type (cleaner fallbacks) is written as
+    strings rather than failing the batch. `ingested_at` is one time for
+    the whole batch or one per record.
+    """
+    fields = list(schema) + [k for rec in records for k in rec if k not in schema]
+    columns, arrow_fields = [], []
+
+    for name in dict.fromkeys(fields):
+        values = [rec.get(name) for rec in records]
+        arrow_type = ARROW_TYPES.get((schema.get(name) or {}).get("type"), "string")
+        if arrow_type != "string" and all(_fits(v, arrow_type) for v in values):
+            if arrow_type == "float64":
+                values = [None if v is None else float(v) for v in values]
+            typ = _arrow_type(arrow_type)
+        else:
+            values = [_as_string(v) for v in values]
+            typ = pa.string()
+        columns.append(pa.array(values, type=typ))
+        arrow_fields.append(pa.field(name, typ))
+
+    stamps = ingested_at if isinstance(ingested_at, list) else [ingested_at] * len(records)
+    stamps = [as_utc(ts) for ts in stamps]
+    columns.append(pa.array(stamps, type=pa.timestamp("us", tz="UTC")))
+    arrow_fields.append(pa.field(INGESTED_AT, pa.timestamp("us", tz="UTC")))
+
+    return pa.Table.from_arrays(columns, schema=pa.schema(arrow_fields, metadata=metadata))
+
+
+def unify_schemas(schemas: List["pa.Schema"]) -> "pa.Schema":
+    """
+    Union of columns across files (schema versions). A column whose type
+    differs between files becomes float64 if all variants are numeric,
+    otherwise string.
+    """
+    types: Dict[str, List[Any]] = {}
+    for schema in schemas:
+        for field in schema:
+            types.setdefault(field.name, []).append(field.type)
+
+    fields = []
+    for name, variants in types.items():
+        if all(t == variants[0] for t in variants):
+            typ = variants[0]
+        elif all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in variants):
+            typ = pa.float64()
+        else:
+            typ = pa.string()
+        fields.append(pa.field(name, typ))
+    return pa.schema(fields)
+
+
+def conform(table: "pa.Table", schema: "pa.Schema") -> "pa.Table":
+    """Reorder/cast `table` to `schema`, filling missing columns with nulls."""
+    columns = []
+    for field in schema:
+        if field.name in table.column_names:
+            column = table.column(field.name)
+            columns.append(column if column.type == field.type else column.cast(field.type))
+        else:
+            columns.append(pa.nulls(table.num_rows, type=field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def export_schema(schema: Dict[str, Dict[str, Any]]) -> "pa.Schema":
+    """Fixed Arrow schema for an export: every field with its declared type, then ingestion time."""
+    fields = [pa.field(name, _arrow_type(ARROW_TYPES.get(meta.get("type"), "string"))) for name, meta in schema.items()]
+    return pa.schema(fields + [pa.field(INGESTED_AT, pa.timestamp("us", tz="UTC"))])
+
+
+def records_to_batch(
+    records: List[Dict[str, Any]],
+    schema: "pa.Schema",
+    ingested_at: List[Optional[datetime]]
+) -> "pa.RecordBatch":
+    """
+    Record batch in a fixed schema (see export_schema). Unlike
+    records_to_table the column types cannot vary per batch, so values
+    that do not fit their declared type are written as null.
+    """
+    columns = []
+    for field in schema:
+        if field.name == INGESTED_AT:
+            columns.append(pa.array([as_utc(ts) for ts in ingested_at], type=field.type))
+            continue
+        values = [rec.get(field.name) for rec in records]
+        if pa.types.is_string(field.type):
+            values = [_as_string(v) for v in values]
+        else:
+            arrow_type = {"double": "float64"}.get(str(field.type), str(field.type))
+            values = [v if _fits(v, arrow_type) else None for v in values]
+            if arrow_type == "float64":
+                values = [None if v is None else float(v) for v in values]
+        columns.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+class _Drain:
+    """Write-only file object whose bytes are taken out as they are written."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks = []
+        return out
+
+
+async def stream_ipc(
+    batches: AsyncIterator[Tuple[List[Dict[str, Any]], List[Optional[datetime]]]],
+    schema: "pa.Schema"
+) -> AsyncIterator[bytes]:
+    """Arrow IPC stream of (records, ingestion times) batches, flushed one batch at a time."""
+    drain = _Drain()
+    writer = pa.ipc.new_stream(drain, schema)
+    try:
+        async for records, stamps in batches:
+            writer.write_batch(records_to_batch(records, schema, stamps))
+            yield drain.take()
+    finally:
+        writer.close()
+    yield drain.take()
+
+
+# ---------------------------------------------------------
+# Lake sink
+# ---------------------------------------------------------
+class ParquetLake:
+    """
+    Columnar copy of ingested batches for analytics, so wide scans stay
+    off the live Postgres tables and Mongo collections.
+
+      - every batch of an enabled source becomes one Parquet file under
+        lake/source=<id>/date=<day>/, with source_id and schema_version
+        in the file metadata
+      - `compact` merges a day's small part files (per schema version)
+        into one compact file; the merged file lists its inputs so an
+        interrupted compaction is finished on the next run
+      - `stream_export` streams the files back as a single Parquet file,
+        one row group per lake file
+
+    Arrow encoding/decoding runs on a small dedicated thread pool.
+    """
+
+    def __init__(
+        self,
+        store: ObjectStore,
+        owns_store: bool = False,
+        compact_min_files: int = 8,
+        root: str = LAKE_PREFIX
+    ):
+        self.store = store
+        self.root = root
+        self.owns_store = owns_store
+        self.compact_min_files = compact_min_files
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="lake")
+
+    @property
+    def available(self) -> bool:
+        return pa is not None
+
+    def enabled_for(self, source_id: str) -> bool:
+        """LAKE_SOURCES is a comma-separated list of source ids, or "*"."""
+        sources = {s.strip() for s in settings.LAKE_SOURCES.split(",") if s.strip()}
+        return self.available and ("*" in sources or source_id in sources)
+
+    async def _cpu(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    async def close(self):
+        self._executor.shutdown(wait=True)
+        if self.owns_store:
+            await self.store.close()
+
+    # ---------------------------------------------------------
+    # Writes
+    # ---------------------------------------------------------
+    @staticmethod
+    def _encode(table: "pa.Table") -> bytes:
+        sink = pa.BufferOutputStream()
+        pq.write_table(table, sink, compression="zstd")
+        return sink.getvalue().to_pybytes()
+
+    async def write_batch(
+        self,
+        source_id: str,
+        schema_version: int,
+        records: List[Dict[str, Any]],
+        schema: Dict[str, Dict[str, Any]],
+        ingested_at: datetime,
+        batch_id: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Write one batch as a Parquet file; returns its key. With
+        `batch_id` the key is fixed, so a replayed batch overwrites its file.
+        """
+        if not records:
+            return None
+        metadata = {"source_id": source_id, "schema_version": str(schema_version)}
+        table = await self._cpu(records_to_table, records, schema, ingested_at, metadata)
+        key = file_key(source_id, ingested_at, root=self.root, token=batch_id)
+        await self.store.put(key, await self._cpu(self._encode, table))
+        logger.info("Lake file written", key=key, rows=table.num_rows, schema_version=schema_version)
+        return key
+
+    # ---------------------------------------------------------
+    # Reads
+    # ---------------------------------------------------------
+    async def files(
+        self,
+        source_id: str,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None
+    ) -> List[str]:
+        """Lake files of a source, oldest day first; dates are inclusive YYYY-MM-DD."""
+        keys = [k for k in await self.store.list(partition_prefix(source_id, root=self.root)) if k.endswith(".parquet")]
+        if date_from:
+            keys = [k for k in keys if (key_date(k) or "") >= date_from]
+        if date_to:
+            keys = [k for k in keys if (key_date(k) or "") <= date_to]
+        return keys
+
+    async def read_footer(self, key: str) -> "pq.FileMetaData":
+        """File metadata from two ranged reads of the tail — no full download."""
+        size = await self.store.size(key)
+        length = struct.unpack("<I", (await self.store.get(key, size - 8, 8))[:4])[0]
+        tail = await self.store.get(key, size - length - 8, length + 8)
+        return await self._cpu(pq.read_metadata, pa.BufferReader(b"PAR1" + tail))
+
+    @staticmethod
+    def file_metadata(footer: "pq.FileMetaData") -> Dict[str, str]:
+        return {k.decode(): v.decode() for k, v in (footer.metadata or {}).items()}
+
+    async def read_table(self, key: str) -> "pa.Table":
+        raw = await self.store.get(key)
+        return await self._cpu(pq.read_table, pa.BufferReader(raw))
+
+    async def stream_export(self, keys: List[str], limit: Optional[int] = None) -> AsyncIterator[bytes]:
+        """
+        Stream `keys` as one Parquet file. The schema is the union of the
+        file schemas (read from footers up front); each lake file then
+        becomes a row group and is flushed as soon as it is written.
+        """
+        footers = [await self.read_footer(k) for k in keys]
+        schema = unify_schemas([f.schema.to_arrow_schema() for f in footers])
+        versions = sorted({self.file_metadata(f).get("schema_version", "") for f in footers} - {""})
+        schema = schema.with_metadata({"schema_versions": ",".join(versions)})
+
+        drain = _Drain()
+        writer = pq.ParquetWriter(drain, schema, compression="zstd")
+        remaining = limit
+        try:
+            for key in keys:
+                if remaining is not None and remaining <= 0:
+                    break
+                table = conform(await self.read_table(key), schema)
+                if remaining is not None:
+                    table = table.slice(0, remaining)
+                    remaining -= table.num_rows
+                await self._cpu(writer.write_table, table)
+                yield drain.take()
+        finally:
+            writer.close()
+        yield drain.take()
+
+    async def write_tables(
+        self,
+        key: str,
+        schema: "pa.Schema",
+        tables: AsyncIterator["pa.Table"]
+    ) -> int:
+        """
+        Write a stream of tables as one Parquet file (a row group each),
+        uploading bytes as they are produced. Returns rows written.
+        """
+        drain = _Drain()
+        writer = pq.ParquetWriter(drain, schema, compression="zstd")
+        state = {"rows": 0, "open": True}
+
+        async def chunks() -> AsyncIterator[bytes]:
+            async for table in tables:
+                await self._cpu(writer.write_table, conform(table, schema))
+                state["rows"] += table.num_rows
+                yield drain.take()
+            writer.close()
+            state["open"] = False
+            yield drain.take()
+
+        try:
+            await self.store.put_stream(key, chunks())
+        finally:
+            if state["open"]:
+                writer.close()
+        return state["rows"]
+
+    async def iter_rows(
+        self,
+        keys: List[str],
+        filters: Optional[Dict[str, Any]] = None,
+        ingested_from: Optional[datetime] = None,
+        ingested_to: Optional[datetime] = None,
+        prepare: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream rows of `keys` (in order) matching equality `filters` and the
+        ingestion window; `prepare` reshapes each row before filtering.
+        Without it, a file lacking a filtered column cannot match and is
+        skipped after its footer is read.
+        """
+        filters = filters or {}
+        lo, hi = as_utc(ingested_from), as_utc(ingested_to)
+        for key in keys:
+            if filters and prepare is None:
+                names = set((await self.read_footer(key)).schema.to_arrow_schema().names)
+                if not names.issuperset(filters):
+                    continue
+            table = await self.read_table(key)
+            for row in table.to_pylist():
+                ts = row.get(INGESTED_AT)
+                if lo and ts is not None and ts < lo:
+                    continue
+                if hi and ts is not None and ts >= hi:
+                    continue
+                if prepare is not None:
+                    row = prepare(row)
+                if all(row.get(k) == v for k, v in filters.items()):
+                    yield row
+
+    # ---------------------------------------------------------
+    # Compaction
+    # ---------------------------------------------------------
+    async def sources(self) -> List[str]:
+        found = set()
+        for key in await self.store.list(f"{self.root}/source="):
+            found.add(key.split("/")[1][len("source="):])
+        return sorted(found)
+
+    async def compact(self, source_id: str, engine: Optional[AsyncEngine] = None) -> int:
+        """
+        Merge small part files per day and schema version; returns files
+        merged. With `engine`, one worker at a time compacts a source (a
+        session-level advisory lock); the others skip it.
+        """
+        if engine is None:
+            return await self._compact(source_id)
+
+        lock_key = {"key": f"lake-compact:{self.root}:{source_id}"}
+        async with engine.connect() as owner:
+            acquired = (await owner.execute(
+                sql_text("SELECT pg_try_advisory_lock(hashtext(:key))"), lock_key
+            )).scalar()
+            await owner.commit()
+            if not acquired:
+                logger.info("Lake compaction runs in another worker", source_id=source_id)
+                return 0
+            try:
+                return await self._compact(source_id)
+            finally:
+                await owner.execute(sql_text("SELECT pg_advisory_unlock(hashtext(:key))"), lock_key)
+                await owner.commit()
+
+    async def _compact(self, source_id: str) -> int:
+        by_day: Dict[str, List[str]] = {}
+        for key in await self.files(source_id):
+            by_day.setdefault(key_date(key), []).append(key)
+
+        merged = 0
+        for day, keys in sorted(by_day.items()):
+            parts = set(await self._finish_interrupted(keys))
+            if len(parts) < self.compact_min_files:
+                continue
+
+            groups: Dict[str, List[str]] = {}
+            for key in sorted(parts):
+                version = self.file_metadata(await self.read_footer(key)).get("schema_version", "")
+                groups.setdefault(version, []).append(key)
+
+            for version, group in groups.items():
+                if len(group) < 2:
+                    continue
+                tables = [await self.read_table(k) for k in group]
+                schema = unify_schemas([t.schema for t in tables])
+                table = pa.concat_tables([conform(t, schema) for t in tables]).replace_schema_metadata({
+                    "source_id": source_id,
+                    "schema_version": version,
+                    "compacted_from": json.dumps(group),
+                })
+
+                # write the merged file first; the inputs go only once it exists
+                ts = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+                key = file_key(source_id, ts, kind="compact", root=self.root)
+                await self.store.put(key, await self._cpu(self._encode, table))
+                for old in group:
+                    await self.store.delete(old)
+
+                merged += len(group)
+                logger.info("Lake files compacted", source_id=source_id, day=day, files=len(group), into=key)
+        return merged
+
+    async def _finish_interrupted(self, keys: List[str]) -> List[str]:
+        """Delete inputs an earlier compaction already merged; return the remaining part files."""
+        present = set(keys)
+        for key in keys:
+            if key.rsplit("/", 1)[-1].startswith("compact-"):
+                done = json.loads(self.file_metadata(await self.read_footer(key)).get("compacted_from", "[]"))
+                for old in present.intersection(done):
+                    await self.store.delete(old)
+                    present.discard(old)
+        return [k for k in present if k.rsplit("/", 1)[-1].startswith("part-")]
+
+    async def compact_all(self, engine: Optional[AsyncEngine] = None):
+        for source_id in await self.sources():
+            try:
+                await self.compact(source_id, engine)
+            except Exception as e:
+                logger.error("Lake compaction failed", exc_info=e, source_id=source_id)
+
+    async def run_compaction(self, engine: AsyncEngine, every_s: int):
+        """Background loop started from the app lifespan (in every worker; the lock keeps one per source)."""
+        while True:
+            await asyncio.sleep(every_s)
+            try:
+                await self.compact_all(engine)
+            except Exception as e:
+                logger.error("Lake compaction failed", exc_info=e)
+
+
+def create_lake(store: ObjectStore) -> ParquetLake:
+    """Lake on LAKE_LOCAL_PATH when set, otherwise on the raw-file object store."""
+    if settings.LAKE_LOCAL_PATH:
+        return ParquetLake(
+            LocalObjectStore(settings.LAKE_LOCAL_PATH), owns_store=True,
+            compact_min_files=settings.LAKE_COMPACT_MIN_FILES
+        )
+    return ParquetLake(store, compact_min_files=settings.LAKE_COMPACT_MIN_FILES)
@@ -0,0 +1,175 @@
+# app/storage/mongo_buckets.py
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from pymongo import UpdateOne
+
+from app.config import settings
+from app.storage.lake import as_utc
+
+
+class BucketLayout:
+    """
+    Bucketed Mongo layout: up to `size` records per document, grouped by
+    source, schema version and ingestion window.
+
+        {
+          "source_id", "schema_version", "window_start", "count",
+          "min_t", "max_t",                       # ingestion time bounds
+          "summary": {field: {"min", "max"}},     # scalar bounds for pruning
+          "records": [{"t": ingested_at, "r": record}, ...]
+        }
+
+    Buckets fill through ordered upserts that match a bucket with room
+    (`count < size`), so a batch costs one bulk_write round trip. Readers
+    unpack buckets into the same {schema_version, ingested_at, record}
+    shape as single-record documents, so both layouts can share a
+    collection.
+    """
+
+    def __init__(self, size: int = 200, window_s: int = 3600):
+        self.size = size
+        self.window_s = window_s
+        self.indexed: Set[str] = set()    # collections with the bucket index
+
+    def enabled_for(self, source_id: str) -> bool:
+        """MONGO_BUCKETED_SOURCES is a comma-separated list of source ids, or "*"."""
+        sources = {s.strip() for s in settings.MONGO_BUCKETED_SOURCES.split(",") if s.strip()}
+        return "*" in sources or source_id in sources
+
+    def forget(self, collection: str):
+        self.indexed.discard(collection)
+
+    def window_start(self, ts: datetime) -> datetime:
+        ts = ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+        epoch = int(ts.timestamp())
+        return datetime.fromtimestamp(epoch - epoch % self.window_s, tz=timezone.utc)
+
+    def accepting(self, doc: Dict[str, Any], now: datetime) -> bool:
+        """
+        Whether a bucket may still get appends: it has room and its window
+        is the current one (or the previous one, for batches stamped just
+        before it closed). Writers fill buckets of their batch's window.
+        """
+        if doc.get("count", 0) >= self.size or doc.get("window_start") is None:
+            return False
+        return as_utc(doc["window_start"]) >= self.window_start(now) - timedelta(seconds=self.window_s)
+
+    # ---------------------------------------------------------
+    # Writes
+    # ---------------------------------------------------------
+    @staticmethod
+    def _summarizable(key: str, value: Any) -> bool:
+        if "." in key or key.startswith("$"):
+            return False
+        return isinstance(value, (int, float, str, datetime)) and not isinstance(value, bool)
+
+    def build_updates(
+        self,
+        source_id: str,
+        schema_version: int,
+        records: List[Dict[str, Any]],
+        ingested_at: datetime,
+        bucket_key: Optional[Dict[str, Any]] = None
+    ) -> List[UpdateOne]:
+        """One upsert per record; run them as a single ordered bulk_write."""
+        key = {
+            "source_id": source_id,
+            "schema_version": schema_version,
+            "window_start": self.window_start(ingested_at),
+            **(bucket_key or {}),
+        }
+
+        ops = []
+        for rec in records:
+            mins = {f"summary.{k}.min": v for k, v in rec.items() if self._summarizable(k, v)}
+            maxs = {f"summary.{k}.max": v for k, v in rec.items() if self._summarizable(k, v)}
+            ops.append(UpdateOne(
+                {**key, "count": {"$lt": self.size}},
+                {
+                    "$push": {"records": {"t": ingested_at, "r": rec}},
+                    "$inc": {"count": 1},
+                    "$min": {"min_t": ingested_at, **mins},
+                    "$max": {"max_t": ingested_at, **maxs},
+                },
+                upsert=True
+            ))
+        return ops
+
+    @staticmethod
+    def index_keys() -> List:
+        """Index serving the "bucket with room" lookup of every upsert."""
+        return [("source_id", 1), ("schema_version", 1), ("window_start", 1), ("count", 1)]
+
+    # ---------------------------------------------------------
+    # Reads
+    # ---------------------------------------------------------
+    def document_query(
+        self,
+        filters: Optional[Dict[str, Any]] = None,
+        ingested_from: Optional[datetime] = None,
+        ingested_to: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        Mongo filter matching single-record documents and buckets that may
+        hold a match. Bucket min/max summaries prune on top of the
+        element match; records are re-checked after unpacking.
+        """
+        filters = filters or {}
+        single: Dict[str, Any] = {f"record.{k}": v for k, v in filters.items()}
+        bucket: Dict[str, Any] = {f"records.r.{k}": v for k, v in filters.items()}
+
+        for k, v in filters.items():
+            if self._summarizable(k, v):
+                bucket[f"summary.{k}.min"] = {"$lte": v}
+                bucket[f"summary.{k}.max"] = {"$gte": v}
+
+        window: Dict[str, Any] = {}
+        if ingested_from:
+            window["$gte"] = ingested_from
+            bucket["max_t"] = {"$gte": ingested_from}
+        if ingested_to:
+            window["$lt"] = ingested_to
+            bucket["min_t"] = {"$lt": ingested_to}
+        if window:
+            single["ingested_at"] = window
+
+        if not single:
+            return {}
+        return {"$or": [single, bucket]}
+
+    @staticmethod
+    def unpack(
+        doc: Dict[str, Any],
+        filters: Optional[Dict[str, Any]] = None,
+        ingested_from: Optional[datetime] = None,
+        ingested_to: Optional[datetime] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield {schema_version, ingested_at, record} for each matching record of a document."""
+        if "records" not in doc:
+            yield doc
+            return
+
+        filters = filters or {}
+        # Mongo hands back naive UTC datetimes; callers may pass aware ones
+        ingested_from, ingested_to = as_utc(ingested_from), as_utc(ingested_to)
+        for entry in doc["records"]:
+            rec, stored = entry.get("r", {}), entry.get("t")
+            ts = as_utc(stored)
+            if any(rec.get(k) != v for k, v in filters.items()):
+                continue
+            if ts is not None and ingested_from and ts < ingested_from:
+                continue
+            if ts is not None and ingested_to and ts >= ingested_to:
+                continue
+            yield {
+                "source_id": doc.get("source_id"),
+                "schema_version": doc.get("schema_version"),
+                "ingested_at": stored,
+                "record": rec,
+            }
+
+
+# Shared layout settings
+bucket_layout = BucketLayout(size=settings.MONGO_BUCKET_SIZE, window_s=settings.MONGO_BUCKET_WINDOW_S)
@@ -1,17 +1,243 @@
-from typing import Any, Dict, List, Optional
-from motor.motor_asyncio import AsyncIOMotorClient
-from app.config import settings
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.storage.lake import as_utc
+from app.storage.mongo_buckets import bucket_layout
 
 
 class MongoDBStorage:
-    def __init__(self):
-        self.client = AsyncIOMotorClient(settings.MONGODB_URL)
-        self.db = self.client.get_default_database()
+    """
+    Thin wrapper over a Motor database. The client (and its pool) is
+    owned by the ConnectionRegistry; this class never opens connections.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
 
     async def insert_record(self, collection: str, document: Dict[str, Any]) -> str:
         result = await self.db[collection].insert_one(document)
         return str(result.inserted_id)
 
+    async def insert_bucketed(
+        self,
+        collection: str,
+        source_id: str,
+        schema_version: Optional[int],
+        records: List[Dict[str, Any]],
+        ingested_at: datetime,
+        bucket_key: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """Append records to bucket documents (see BucketLayout); one round trip per batch."""
+        if not records:
+            return 0
+        if collection not in bucket_layout.indexed:
+            await self.db[collection].create_index(bucket_layout.index_keys())
+            bucket_layout.indexed.add(collection)
+
+        ops = bucket_layout.build_updates(source_id, schema_version, records, ingested_at, bucket_key)
+        await self.db[collection].bulk_write(ops, ordered=True)
+        return len(ops)
+
+    async def iter_documents(
+        self,
+        collection: str,
+        filters: Optional[Dict[str, Any]] = None,
+        ingested_from: Optional[datetime] = None,
+        ingested_to: Optional[datetime] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        bucketed: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream {schema_version, ingested_at, record} documents. For bucketed
+        collections, buckets are unpacked and skip/limit count records,
+        not documents.
+        """
+        filters = filters or {}
+
+        if not bucketed:
+            query = {f"record.{k}": v for k, v in filters.items()}
+            window = {}
+            if ingested_from:
+                window["$gte"] = ingested_from
+            if ingested_to:
+                window["$lt"] = ingested_to
+            if window:
+                query["ingested_at"] = window
+            cursor = self.db[collection].find(query).skip(skip)
+            if limit is not None:
+                cursor = cursor.limit(limit)
+            async for doc in cursor:
+                yield doc
+            return
+
+        query = bucket_layout.document_query(filters, ingested_from, ingested_to)
+        seen = 0
+        async for doc in self.db[collection].find(query):
+            for unpacked in bucket_layout.unpack(doc, filters, ingested_from, ingested_to):
+                if seen >= skip:
+                    yield unpacked
+                seen += 1
+                if limit is not None and seen >= skip + limit:
+                    return
+
+    async def page_after(
+        self,
+        collection: str,
+        after: Optional[Tuple[Any, Optional[int]]] = None,
+        limit: int = 100,
+        ingested_from: Optional[datetime] = None,
+        open_buckets: Optional[Dict[str, int]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[Tuple[Tuple[Any, Optional[int]], Dict[str, int]]]]:
+        """
+        One keyset page in `_id` order, resuming after an (_id, entry)
+        position. Buckets are unpacked and their records keep their array
+        position, so appends never shift earlier pages. Records ingested
+        before `ingested_from` are skipped.
+
+        A bucket the scan has moved past can still get appends while it
+        has room and its window is current (BucketLayout.accepting).
+        `open_buckets` maps each such bucket to the entries already read;
+        their new entries lead the next page.
+
+        Returns (documents, next), next being the (position, open_buckets)
+        to resume from, or None after the last page.
+        """
+        now = datetime.now(timezone.utc)
+        ingested_from = as_utc(ingested_from)
+        coll = self.db[collection]
+        docs: List[Dict[str, Any]] = []
+        full = False
+
+        def take(unpacked: Dict[str, Any]) -> bool:
+            nonlocal full
+            stamp = as_utc(unpacked.get("ingested_at"))
+            if ingested_from is not None and stamp is not None and stamp < ingested_from:
+                return True
+            if len(docs) == limit:
+                full = True
+                return False
+            docs.append(unpacked)
+            return True
+
+        # 1. entries appended to buckets already passed
+        next_open: Dict[str, int] = {}
+        if open_buckets:
+            ids = [ObjectId(key) for key in open_buckets]
+            async for doc in coll.find({"_id": {"$in": ids}}).sort("_id", 1):
+                key, entries = str(doc["_id"]), list(bucket_layout.unpack(doc))
+                stop = open_buckets[key]
+                while stop < len(entries) and not full and take(entries[stop]):
+                    stop += 1
+                if stop < len(entries) or bucket_layout.accepting(doc, now):
+                    next_open[key] = stop
+            if full:
+                # buckets not reached on this page keep their position
+                for key, seen in open_buckets.items():
+                    next_open.setdefault(key, seen)
+
+        # 2. keyset scan
+        position = after
+        passed: List[Tuple[Any, int]] = []
+        if not full:
+            query: Dict[str, Any] = {}
+            if after is not None:
+                query["_id"] = {"$gte" if after[1] is not None else "$gt": after[0]}
+            if ingested_from is not None:
+                query["$or"] = [{"ingested_at": {"$gte": ingested_from}}, {"max_t": {"$gte": ingested_from}}]
+
+            async for doc in coll.find(query).sort("_id", 1):
+                resume = after is not None and doc["_id"] == after[0]
+                entries = enumerate(bucket_layout.unpack(doc)) if "records" in doc else [(None, doc)]
+                for i, unpacked in entries:
+                    if resume and (i is None or i <= after[1]):
+                        continue
+                    taken = len(docs)
+                    if not take(unpacked):
+                        break
+                    if len(docs) > taken:
+                        position = (doc["_id"], i)
+                if full:
+                    break
+                if "records" in doc and bucket_layout.accepting(doc, now):
+                    passed.append((doc["_id"], len(doc["records"])))
+
+        if not full:
+            return docs, None
+        # the position's own bucket resumes through the position itself
+        for bucket_id, seen in passed:
+            if position is not None and bucket_id < position[0]:
+                next_open[str(bucket_id)] = seen
+        return docs, (position, next_open)
+
+    async def count_records(
+        self,
+        collection: str,
+        bucketed: bool = False,
+        estimate: bool = False,
+        ingested_from: Optional[datetime] = None
+    ) -> int:
+        """
+        Records in a collection (ingested at or after `ingested_from`).
+        `estimate` reads collection metadata (for buckets: the bucket count
+        times the mean fill of a small sample) instead of scanning.
+        """
+        coll = self.db[collection]
+        if estimate:
+            documents = await coll.estimated_document_count()
+            if not bucketed or not documents:
+                return documents
+            sample = [d async for d in coll.aggregate([
+                {"$sample": {"size": 100}},
+                {"$group": {"_id": None, "fill": {"$avg": {"$ifNull": ["$count", 1]}}}},
+            ])]
+            return int(documents * (sample[0]["fill"] if sample else 1))
+
+        if ingested_from is None:
+            if not bucketed:
+                return await coll.count_documents({})
+            per_document: Any = {"$ifNull": ["$count", 1]}
+            match: Dict[str, Any] = {}
+        else:
+            if not bucketed:
+                return await coll.count_documents({"ingested_at": {"$gte": ingested_from}})
+            # a bucket straddling the bound counts only its later records
+            per_document = {"$cond": [
+                {"$isArray": "$records"},
+                {"$size": {"$filter": {"input": "$records", "cond": {"$gte": ["$$this.t", ingested_from]}}}},
+                1,
+            ]}
+            match = {"$or": [{"ingested_at": {"$gte": ingested_from}}, {"max_t": {"$gte": ingested_from}}]}
+
+        totals = [d async for d in coll.aggregate([
+            {"$match": match},
+            {"$group": {"_id": None, "n": {"$sum": per_document}}},
+        ])]
+        return totals[0]["n"] if totals else 0
+
+    async def iter_query(
+        self,
+        collection: str,
+        filter: Optional[Dict[str, Any]] = None,
+        sort: Optional[List[Tuple[str, int]]] = None,
+        projection: Optional[Dict[str, int]] = None,
+        limit: Optional[int] = None,
+        pipeline: Optional[List[Dict[str, Any]]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a compiled query (see app.core.query.dsl): a find, or an aggregation pipeline."""
+        if pipeline is not None:
+            cursor = self.db[collection].aggregate(pipeline)
+        else:
+            cursor = self.db[collection].find(filter or {}, projection)
+            if sort:
+                cursor = cursor.sort(sort)
+            if limit is not None:
+                cursor = cursor.limit(limit)
+        async for doc in cursor:
+            yield doc
+
     async def find_records(
         self,
         collection: str,
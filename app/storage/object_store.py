@@ -0,0 +1,336 @@
+# app/storage/object_store.py
+
+import abc
+import asyncio
+import io
+import os
+import structlog
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Callable, List, Optional
+
+import urllib3
+from minio import Minio
+from minio.error import S3Error
+
+from app.config import settings
+
+logger = structlog.get_logger()
+
+# S3 error codes worth retrying (throttling / transient server faults)
+RETRYABLE_S3_CODES = {"InternalError", "SlowDown", "ServiceUnavailable", "RequestTimeout"}
+
+# S3 rejects multipart parts smaller than this (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+async def iter_bytes(content: bytes, chunk_size: int) -> AsyncIterator[bytes]:
+    """Adapt an in-memory payload to the streaming upload API."""
+    for i in range(0, len(content), chunk_size):
+        yield content[i:i + chunk_size]
+
+
+class ObjectStore(abc.ABC):
+    """
+    Async object storage interface. Blocking SDK / filesystem calls run on
+    a bounded, dedicated thread pool (never the default executor) and are
+    retried with exponential backoff.
+    """
+
+    def __init__(self, max_workers: int = 8, retries: int = 3, backoff: float = 0.2):
+        self.retries = retries
+        self.backoff = backoff
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="object-store")
+
+    # ---------------------------------------------------------
+    # Thread pool + retries
+    # ---------------------------------------------------------
+    def _retryable(self, exc: Exception) -> bool:
+        return False
+
+    async def _call(self, fn: Callable, *args, **kwargs):
+        """Run once on the pool (for non-idempotent calls such as stream reads/writes)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    async def _run(self, fn: Callable, *args, **kwargs):
+        """Run on the pool, retrying transient failures with exponential backoff."""
+        for attempt in range(self.retries):
+            try:
+                return await self._call(fn, *args, **kwargs)
+            except Exception as e:
+                if attempt == self.retries - 1 or not self._retryable(e):
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                logger.warning("Object store call failed, retrying", error=str(e), attempt=attempt + 1, delay=delay)
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        self._executor.shutdown(wait=True)
+
+    # ---------------------------------------------------------
+    # API
+    # ---------------------------------------------------------
+    @abc.abstractmethod
+    async def ensure_bucket(self):
+        """Create the bucket (or root directory) if it does not exist."""
+
+    async def put(self, key: str, content: bytes, content_type: str = "application/octet-stream") -> str:
+        return await self.put_stream(key, iter_bytes(content, MIN_PART_SIZE), content_type)
+
+    @abc.abstractmethod
+    async def put_stream(
+        self,
+        key: str,
+        chunks: AsyncIterator[bytes],
+        content_type: str = "application/octet-stream"
+    ) -> str:
+        """Write an object of unknown length from a stream of chunks."""
+
+    @abc.abstractmethod
+    def stream(
+        self,
+        key: str,
+        offset: int = 0,
+        length: Optional[int] = None,
+        chunk_size: int = 1024 * 1024
+    ) -> AsyncIterator[bytes]:
+        """Yield the object (or the byte range offset..offset+length) in chunks."""
+
+    async def get(self, key: str, offset: int = 0, length: Optional[int] = None) -> bytes:
+        return b"".join([chunk async for chunk in self.stream(key, offset, length)])
+
+    @abc.abstractmethod
+    async def size(self, key: str) -> int:
+        """Object size in bytes (for ranged reads from the end)."""
+
+    @abc.abstractmethod
+    async def delete(self, key: str):
+        """Remove an object; missing objects are not an error."""
+
+    @abc.abstractmethod
+    async def list(self, prefix: str = "") -> List[str]:
+        """Keys under `prefix`."""
+
+
+class StreamReader(io.RawIOBase):
+    """
+    Blocking file-like view of an async chunk stream, for SDK calls that
+    read from a file object on a worker thread: each read pulls the next
+    chunks from the event loop. `close()` makes further reads fail, which
+    ends (and aborts) an upload whose caller went away.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop):
+        super().__init__()
+        self._chunks = chunks.__aiter__()
+        self._loop = loop
+        self._buffer = bytearray()
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _next_chunk(self) -> Optional[bytes]:
+        future = asyncio.run_coroutine_threadsafe(self._chunks.__anext__(), self._loop)
+        try:
+            return future.result()
+        except StopAsyncIteration:
+            return None
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            if self.closed:
+                raise ValueError("Stream closed")
+            chunk = self._next_chunk()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer.extend(chunk)
+        size = len(self._buffer) if size < 0 else min(size, len(self._buffer))
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+# ---------------------------------------------------------
+# S3 / MinIO
+# ---------------------------------------------------------
+class S3ObjectStore(ObjectStore):
+    """
+    MinIO/S3 backend. Streams of unknown length go through the SDK's
+    public `put_object(length=-1)`: it cuts `part_size` parts, uploads up
+    to `parallel_parts` of them at once (so memory stays bounded), sends
+    a single PUT for small objects and aborts a failed multipart upload
+    so no orphaned parts are billed.
+    """
+
+    def __init__(
+        self,
+        client: Minio,
+        bucket: str,
+        part_size: int = 8 * 1024 * 1024,
+        parallel_parts: int = 4,
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.client = client
+        self.bucket = bucket
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.parallel_parts = parallel_parts
+
+    def _retryable(self, exc: Exception) -> bool:
+        if isinstance(exc, S3Error):
+            return exc.code in RETRYABLE_S3_CODES
+        return isinstance(exc, (urllib3.exceptions.HTTPError, OSError))
+
+    async def ensure_bucket(self):
+        if not await self._run(self.client.bucket_exists, self.bucket):
+            await self._run(self.client.make_bucket, self.bucket)
+            logger.info(f"Created bucket: {self.bucket}")
+
+    async def put_stream(self, key, chunks, content_type="application/octet-stream") -> str:
+        reader = StreamReader(chunks, asyncio.get_running_loop())
+        try:
+            # the stream is consumed as it uploads → run once, never retried
+            await self._call(
+                self.client.put_object, self.bucket, key, reader, -1,
+                content_type=content_type,
+                part_size=self.part_size,
+                num_parallel_uploads=self.parallel_parts
+            )
+        finally:
+            reader.close()
+        logger.info("Object uploaded", key=key)
+        return key
+
+    async def stream(self, key, offset=0, length=None, chunk_size=1024 * 1024):
+        response = await self._run(self.client.get_object, self.bucket, key, offset=offset, length=length or 0)
+        try:
+            while True:
+                chunk = await self._call(response.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            response.close()
+            response.release_conn()
+
+    async def size(self, key: str) -> int:
+        return (await self._run(self.client.stat_object, self.bucket, key)).size
+
+    async def delete(self, key: str):
+        await self._run(self.client.remove_object, self.bucket, key)
+
+    async def list(self, prefix: str = "") -> List[str]:
+        objects = await self._run(
+            lambda: list(self.client.list_objects(self.bucket, prefix=prefix, recursive=True))
+        )
+        return [o.object_name for o in objects]
+
+
+# ---------------------------------------------------------
+# Local filesystem (tests / single-node deployments)
+# ---------------------------------------------------------
+class LocalObjectStore(ObjectStore):
+    """Stores objects as files under `root`; writes are atomic (temp file + rename)."""
+
+    def __init__(self, root: str, **kwargs):
+        super().__init__(**kwargs)
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    def _retryable(self, exc: Exception) -> bool:
+        return isinstance(exc, OSError) and not isinstance(exc, FileNotFoundError)
+
+    async def ensure_bucket(self):
+        await self._run(os.makedirs, self.root, exist_ok=True)
+
+    async def put_stream(self, key, chunks, content_type="application/octet-stream") -> str:
+        path = self._path(key)
+        tmp = f"{path}.part"
+        await self._run(os.makedirs, os.path.dirname(path), exist_ok=True)
+
+        fh = await self._run(open, tmp, "wb")
+        try:
+            async for chunk in chunks:
+                await self._call(fh.write, chunk)
+            await self._call(fh.close)
+            await self._run(os.replace, tmp, path)
+        except BaseException:
+            fh.close()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return key
+
+    async def stream(self, key, offset=0, length=None, chunk_size=1024 * 1024):
+        fh = await self._run(open, self._path(key), "rb")
+        try:
+            await self._call(fh.seek, offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                size = chunk_size if remaining is None else min(chunk_size, remaining)
+                chunk = await self._call(fh.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            fh.close()
+
+    async def size(self, key: str) -> int:
+        return await self._run(os.path.getsize, self._path(key))
+
+    async def delete(self, key: str):
+        try:
+            await self._run(os.remove, self._path(key))
+        except FileNotFoundError:
+            pass
+
+    async def list(self, prefix: str = "") -> List[str]:
+        def walk() -> List[str]:
+            keys = []
+            for dirpath, _, files in os.walk(self.root):
+                for name in files:
+                    if name.endswith(".part"):
+                        continue
+                    key = os.path.relpath(os.path.join(dirpath, name), self.root).replace(os.sep, "/")
+                    if key.startswith(prefix):
+                        keys.append(key)
+            return sorted(keys)
+        return await self._run(walk)
+
+
+# ---------------------------------------------------------
+# Factory
+# ---------------------------------------------------------
+def create_object_store() -> ObjectStore:
+    """Build the configured backend (OBJECT_STORE_BACKEND = "s3" | "local")."""
+    common = dict(
+        max_workers=settings.OBJECT_STORE_MAX_WORKERS,
+        retries=settings.OBJECT_STORE_RETRIES
+    )
+
+    if settings.OBJECT_STORE_BACKEND == "local":
+        return LocalObjectStore(settings.OBJECT_STORE_LOCAL_PATH, **common)
+
+    client = Minio(
+        settings.MINIO_ENDPOINT,
+        access_key=settings.MINIO_ACCESS_KEY,
+        secret_key=settings.MINIO_SECRET_KEY,
+        secure=settings.MINIO_SECURE
+    )
+    return S3ObjectStore(
+        client,
+        settings.MINIO_BUCKET,
+        part_size=settings.OBJECT_STORE_PART_SIZE,
+        parallel_parts=settings.OBJECT_STORE_PARALLEL_PARTS,
+        **common
+    )
@@ -0,0 +1,245 @@
+# app/storage/partitions.py
+
+import asyncio
+import re
+import structlog
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+
+logger = structlog.get_logger()
+
+# Partition key of every partitioned dynamic table
+PARTITION_KEY = "ingested_at"
+PARTITION_BY = f"RANGE ({PARTITION_KEY})"
+
+INTERVALS = ("day", "week", "month")
+
+_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+# ---------------------------------------------------------
+# Interval arithmetic (UTC)
+# ---------------------------------------------------------
+def interval_start(ts: datetime, interval: str) -> datetime:
+    """Start of the partition interval containing `ts`."""
+    ts = ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    day = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "day":
+        return day
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown partition interval: {interval}")
+
+
+def shift(start: datetime, interval: str, steps: int = 1) -> datetime:
+    """Move an interval start by `steps` intervals (negative = back)."""
+    if interval == "day":
+        return start + timedelta(days=steps)
+    if interval == "week":
+        return start + timedelta(weeks=steps)
+    months = start.year * 12 + start.month - 1 + steps
+    return start.replace(year=months // 12, month=months % 12 + 1)
+
+
+def partition_name(table_name: str, start: datetime) -> str:
+    return f"{table_name}_p{start:%Y%m%d}"
+
+
+def build_create_partition(table_name: str, start: datetime, interval: str) -> str:
+    end = shift(start, interval)
+    return (
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(table_name, start)}" '
+        f'PARTITION OF "{table_name}" '
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+def parse_bound(bound: str) -> Optional[Tuple[datetime, datetime]]:
+    """Parse pg_get_expr(relpartbound) → (from, to); None for DEFAULT partitions."""
+    match = _BOUND.search(bound or "")
+    if not match:
+        return None
+    lo, hi = (datetime.fromisoformat(v) for v in match.groups())
+    return lo.astimezone(timezone.utc), hi.astimezone(timezone.utc)
+
+
+# ---------------------------------------------------------
+# Partition manager
+# ---------------------------------------------------------
+class PartitionManager:
+    """
+    Keeps range-partitioned dynamic tables (PARTITION BY RANGE (ingested_at))
+    supplied with partitions and enforces retention:
+
+      - `ensure` makes sure the interval holding `at` (default: now) and
+        the next `premake` intervals exist; covered intervals are cached,
+        so the per-batch call is free once partitions are made
+      - `enforce_retention` detaches (CONCURRENTLY) and drops partitions
+        that ended more than `retention` intervals ago — no bulk DELETE
+      - `maintain` does both for every partitioned table and runs
+        periodically from the app lifespan
+
+    Bounds are read from the catalog, not parsed from names, so tables
+    renamed by a backfill swap keep working.
+    """
+
+    def __init__(self, interval: str = "month", premake: int = 3, retention: int = 0):
+        if interval not in INTERVALS:
+            raise ValueError(f"Unknown partition interval: {interval}")
+        self.interval = interval
+        self.premake = premake
+        self.retention = retention
+        self._covered: Dict[str, Set[datetime]] = {}
+        self._plain: Set[str] = set()     # tables that turned out not to be partitioned
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def enabled_for(self, source_id: str) -> bool:
+        """PARTITIONED_SOURCES is a comma-separated list of source ids, or "*"."""
+        sources = {s.strip() for s in settings.PARTITIONED_SOURCES.split(",") if s.strip()}
+        return "*" in sources or source_id in sources
+
+    def forget(self, table_name: str):
+        self._covered.pop(table_name, None)
+        self._plain.discard(table_name)
+
+    def _lock(self, table_name: str) -> asyncio.Lock:
+        if table_name not in self._locks:
+            self._locks[table_name] = asyncio.Lock()
+        return self._locks[table_name]
+
+    # ---------------------------------------------------------
+    # Catalog reads
+    # ---------------------------------------------------------
+    async def partitions(self, engine: AsyncEngine, table_name: str) -> List[Tuple[str, datetime, datetime]]:
+        """(name, from, to) for each range partition of `table_name`, oldest first."""
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                sql_text(
+                    "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+                    "FROM pg_inherits i "
+                    "JOIN pg_class c ON c.oid = i.inhrelid "
+                    "WHERE i.inhparent = to_regclass(:t)"
+                ),
+                {"t": f'"{table_name}"'}
+            )
+            rows = result.all()
+
+        out = []
+        for name, bound in rows:
+            parsed = parse_bound(bound)
+            if parsed:
+                out.append((name, *parsed))
+        return sorted(out, key=lambda p: p[1])
+
+    async def partitioned_tables(self, engine: AsyncEngine) -> List[str]:
+        async with engine.connect() as conn:
+            result = await conn.execute(sql_text(
+                "SELECT c.relname FROM pg_partitioned_table pt "
+                "JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname LIKE 'data\\_%'"
+            ))
+            return [r[0] for r in result.all()]
+
+    # ---------------------------------------------------------
+    # Premake
+    # ---------------------------------------------------------
+    def _wanted(self, at: Optional[datetime]) -> Set[datetime]:
+        now = interval_start(datetime.now(timezone.utc), self.interval)
+        wanted = {shift(now, self.interval, k) for k in range(self.premake + 1)}
+        if at is not None:
+            wanted.add(interval_start(at, self.interval))
+        return wanted
+
+    async def ensure(self, engine: AsyncEngine, table_name: str, at: Optional[datetime] = None):
+        """Create any missing partition for `at` and now..now+premake."""
+        if table_name in self._plain:
+            return
+        wanted = self._wanted(at)
+        if wanted <= self._covered.get(table_name, set()):
+            return
+
+        async with self._lock(table_name):
+            async with engine.connect() as conn:
+                relkind = await conn.scalar(
+                    sql_text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:t)"),
+                    {"t": f'"{table_name}"'}
+                )
+            if relkind != "p":
+                logger.warning("Table is not partitioned; skipping partition upkeep", table=table_name)
+                self._plain.add(table_name)
+                return
+
+            existing = await self.partitions(engine, table_name)
+            missing = sorted(
+                start for start in wanted
+                if not any(lo <= start < hi for _, lo, hi in existing)
+            )
+
+            if missing:
+                async with engine.begin() as conn:
+                    for start in missing:
+                        await conn.exec_driver_sql(build_create_partition(table_name, start, self.interval))
+                logger.info(
+                    "Partitions created",
+                    table=table_name,
+                    partitions=[partition_name(table_name, s) for s in missing]
+                )
+
+            self._covered.setdefault(table_name, set()).update(wanted)
+
+    # ---------------------------------------------------------
+    # Retention
+    # ---------------------------------------------------------
+    async def enforce_retention(self, engine: AsyncEngine, table_name: str) -> List[str]:
+        """Detach + drop partitions that ended before the retention window."""
+        if self.retention <= 0:
+            return []
+
+        cutoff = shift(interval_start(datetime.now(timezone.utc), self.interval), self.interval, -self.retention)
+        expired = [name for name, _, hi in await self.partitions(engine, table_name) if hi <= cutoff]
+
+        for name in expired:
+            await self.drop_partition(engine, table_name, name)
+        return expired
+
+    async def drop_partition(self, engine: AsyncEngine, table_name: str, name: str):
+        """Detach (CONCURRENTLY) and drop one partition."""
+        # DETACH ... CONCURRENTLY cannot run inside a transaction block
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.exec_driver_sql(f'ALTER TABLE "{table_name}" DETACH PARTITION "{name}" CONCURRENTLY')
+            await conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{name}"')
+        self._covered.pop(table_name, None)
+        logger.info("Partition dropped", table=table_name, partition=name)
+
+    async def maintain(self, engine: AsyncEngine):
+        for table_name in await self.partitioned_tables(engine):
+            try:
+                await self.ensure(engine, table_name)
+                await self.enforce_retention(engine, table_name)
+            except Exception as e:
+                logger.error("Partition maintenance failed", exc_info=e, table=table_name)
+
+    async def run_maintenance(self, engine: AsyncEngine, every_s: int):
+        """Background loop started from the app lifespan."""
+        while True:
+            try:
+                await self.maintain(engine)
+            except Exception as e:
+                logger.error("Partition maintenance failed", exc_info=e)
+            await asyncio.sleep(every_s)
+
+
+# Shared manager — PostgresStorage, the backfill and the lifespan loop use it
+partition_manager = PartitionManager(
+    interval=settings.PARTITION_INTERVAL,
+    premake=settings.PARTITION_PREMAKE,
+    retention=settings.PARTITION_RETENTION
+)
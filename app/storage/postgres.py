@@ -1,13 +1,19 @@
 # app/storage/postgres.py
 
-from typing import Dict, Any
+import json
+from datetime import datetime
+from typing import Dict, Any, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine
 from sqlalchemy import (
-    MetaData, Table, Column,
     Integer, String, Float, Boolean, JSON, text as sql_text
 )
 import structlog
 
+from app.config import settings
+from app.core.schema.migration import MigrationEngine, EXTRAS_COLUMN
+from app.storage.hybrid import hybrid_layout
+from app.storage.partitions import partition_manager, PARTITION_BY
+
 logger = structlog.get_logger()
 
 
@@ -24,6 +30,19 @@ TYPE_MAP = {
     "null": String,
 }
 
+# Shared by every PostgresStorage instance so the column catalog
+# survives across requests.
+migrations = MigrationEngine(
+    TYPE_MAP,
+    batch_size=settings.MIGRATION_BATCH_SIZE,
+    lock_timeout_ms=settings.MIGRATION_LOCK_TIMEOUT_MS
+)
+
+
+def sanitize_column_name(field_name: str) -> str:
+    """Normalize a field name into a dynamic table column name."""
+    return field_name.strip().lower().replace(" ", "_")
+
 
 class PostgresStorage:
     """
@@ -35,59 +54,162 @@ class PostgresStorage:
         self.engine = engine
 
     # ---------------------------------------------------------
-    # CREATE DYNAMIC TABLE FROM SCHEMA
+    # CREATE / EVOLVE DYNAMIC TABLE FROM SCHEMA
     # ---------------------------------------------------------
-    async def create_table_for_schema(self, table_name: str, schema: Dict[str, Dict[str, Any]]):
+    async def create_table_for_schema(
+        self,
+        table_name: str,
+        schema: Dict[str, Dict[str, Any]],
+        partitioned: bool = False,
+        ingested_at: Optional[datetime] = None,
+        hybrid: bool = False,
+        field_stats: Optional[Dict[str, Any]] = None
+    ):
         """
-        Create a SQL table based on an inferred schema.
+        Create a SQL table based on an inferred schema, or add any columns
+        it is missing. DDL is skipped entirely when the cached column
+        catalog already covers the schema.
+
+        With partitioned=True a new table is range-partitioned by
+        ingested_at, and the partitions for `ingested_at` (default: now)
+        and the next PARTITION_PREMAKE intervals are made to exist.
+
+        With hybrid=True only fields dense enough according to
+        `field_stats` (the /schema/stats summary) get columns; the rest
+        go to the extras JSONB column. Newly promoted fields are moved
+        out of extras in the background.
         schema example:
         {
             "age": {"type": "integer", "nullable": True},
             "email": {"type": "string", "nullable": False}
         }
         """
-        metadata = MetaData()
-
-        columns = [
-            Column("id", Integer, primary_key=True, autoincrement=True)
-        ]
-
-        for field_name, meta in schema.items():
-            col_name = field_name.strip().lower().replace(" ", "_")
-
-            sa_type = TYPE_MAP.get(meta.get("type", "string"), String)
-            nullable = meta.get("nullable", True)
-
-            columns.append(Column(col_name, sa_type, nullable=True))
-
-        table = Table(table_name, metadata, *columns)
-
-        # IMPORTANT: async engine must be used like this
-        async with self.engine.begin() as conn:
-            await conn.run_sync(metadata.create_all)
+        before = None
+        if hybrid:
+            before = await migrations.columns(self.engine, table_name)
+            if before is not None and EXTRAS_COLUMN not in before:
+                # created before the source was switched to hybrid → keep the plain layout
+                hybrid = False
+        if hybrid:
+            schema = hybrid_layout.choose_columns(
+                schema, field_stats, set(before or {}), sanitize_column_name
+            )
+
+        columns = {
+            sanitize_column_name(field_name): meta.get("type", "string")
+            for field_name, meta in schema.items()
+        }
 
-        logger.info("Dynamic table created", table=table_name)
+        promoted = {}
+        if before is not None and EXTRAS_COLUMN in before:
+            promoted = {
+                col: migrations.sql_type(t, self.engine.dialect)
+                for col, t in columns.items() if col not in before
+            }
+            if promoted:
+                # recorded first: readers must never see the new column as fully promoted
+                await hybrid_layout.record_promotion(self.engine, table_name, promoted)
+
+        await migrations.ensure_table(
+            self.engine,
+            table_name,
+            columns,
+            partition_by=PARTITION_BY if partitioned else None,
+            extras=hybrid
+        )
+
+        if promoted:
+            hybrid_layout.start_promotion(self.engine, table_name)
+            logger.info("Field promotion started", table=table_name, columns=list(promoted))
+        if partitioned:
+            await partition_manager.ensure(self.engine, table_name, ingested_at)
 
     # ---------------------------------------------------------
     # INSERT RECORD INTO DYNAMIC TABLE
     # ---------------------------------------------------------
-    async def insert_record(self, table_name: str, record: Dict[str, Any]):
+    async def insert_record(self, table_name: str, record: Dict[str, Any], commit: bool = True):
         """
         Insert a row into a dynamic table.
         Keys must match schema column names.
+        Pass commit=False to batch rows into the caller's transaction.
         """
         sanitized = {
-            k.strip().lower().replace(" ", "_"): v
+            sanitize_column_name(k): v
             for k, v in record.items()
         }
 
-        cols = ", ".join(f'"{c}"' for c in sanitized.keys())
-        vals = ", ".join(f":{c}" for c in sanitized.keys())
+        # hybrid tables: fields without a column go to extras
+        current = migrations.catalog.get(table_name)
+        extras = None
+        if current and EXTRAS_COLUMN in current:
+            sanitized, extras = hybrid_layout.split(sanitized, set(current))
+
+        # columns mid-widening are written to their shadow column
+        sanitized = await migrations.route_record(self.session, table_name, sanitized)
+
+        cols = [f'"{c}"' for c in sanitized.keys()]
+        vals = [f":{c}" for c in sanitized.keys()]
+        if extras:
+            cols.append(f'"{EXTRAS_COLUMN}"')
+            vals.append("CAST(:__extras AS JSONB)")
+            sanitized["__extras"] = json.dumps(extras, default=str)
+        cols, vals = ", ".join(cols), ", ".join(vals)
 
         stmt = sql_text(f'INSERT INTO "{table_name}" ({cols}) VALUES ({vals})')
 
         await self.session.execute(stmt, sanitized)
-        await self.session.commit()
+        if commit:
+            await self.session.commit()
+
+    # ---------------------------------------------------------
+    # KEYSET READS
+    # ---------------------------------------------------------
+    async def rows_after(
+        self,
+        table_name: str,
+        after_id: Optional[int],
+        limit: int,
+        ingested_from: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Rows in `id` order after `after_id` — an index range scan, whatever
+        the page — ingested at or after `ingested_from` if given.
+        """
+        clauses = []
+        if after_id is not None:
+            clauses.append('"id" > :after')
+        if ingested_from is not None:
+            clauses.append('"ingested_at" >= :ingested_from')
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        stmt = sql_text(f'SELECT * FROM "{table_name}" {where}ORDER BY "id" LIMIT :limit')
+        result = await self.session.execute(
+            stmt, {"after": after_id, "ingested_from": ingested_from, "limit": limit}
+        )
+        return [dict(r) for r in result.mappings().all()]
+
+    async def count_rows(
+        self, table_name: str, estimate: bool = False, ingested_from: Optional[datetime] = None
+    ) -> int:
+        """
+        COUNT(*) (of rows ingested at or after `ingested_from`), or the
+        planner's row estimate (pg_class.reltuples, summed over partitions)
+        when `estimate` is set.
+        """
+        if not estimate:
+            where = ' WHERE "ingested_at" >= :ingested_from' if ingested_from is not None else ""
+            result = await self.session.execute(
+                sql_text(f'SELECT COUNT(*) FROM "{table_name}"{where}'), {"ingested_from": ingested_from}
+            )
+            return result.scalar() or 0
+        result = await self.session.execute(
+            sql_text(
+                "SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0) FROM pg_class c "
+                "WHERE c.oid = to_regclass(:t) "
+                "OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(:t))"
+            ),
+            {"t": f'"{table_name}"'}
+        )
+        return int(result.scalar() or 0)
 
     # ---------------------------------------------------------
     # CHECK IF TABLE EXISTS
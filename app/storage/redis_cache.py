@@ -1,8 +1,17 @@
 # app/storage/redis_cache.py
+import base64
+import hashlib
 import json
+import time
+import zlib
 import structlog
-from typing import Any, Optional
-from app.models.database import get_redis
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+import redis.asyncio as aioredis
+
+from app.config import settings
+from app.core.query.result_normalizer import dumps
 
 logger = structlog.get_logger()
 
@@ -10,14 +19,14 @@ logger = structlog.get_logger()
 class RedisCache:
     """Redis caching utilities"""
     
-    def __init__(self):
+    def __init__(self, redis: aioredis.Redis):
+        self.redis = redis
         self.ttl = 3600  # 1 hour default TTL
     
     async def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
         try:
-            redis = await get_redis()
-            value = await redis.get(key)
+            value = await self.redis.get(key)
             if value:
                 return json.loads(value)
             return None
@@ -28,8 +37,7 @@ class RedisCache:
     async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
         """Set value in cache"""
         try:
-            redis = await get_redis()
-            await redis.set(
+            await self.redis.set(
                 key,
                 json.dumps(value),
                 ex=ttl or self.ttl
@@ -42,9 +50,222 @@ class RedisCache:
     async def delete(self, key: str) -> bool:
         """Delete key from cache"""
         try:
-            redis = await get_redis()
-            await redis.delete(key)
+            await self.redis.delete(key)
             return True
         except Exception as e:
             logger.warning("Cache delete failed", exc_info=e, key=key)
-            return False
\ No newline at end of file
+            return False
+
+
+# ---------------------------------------------------------
+# Query result cache
+# ---------------------------------------------------------
+def normalize_request(request: Dict[str, Any], backend: str) -> str:
+    """
+    Canonical JSON of a query request: filter keys sorted, fields as a
+    sorted set, datetimes as ISO strings — equivalent requests share it.
+    """
+    normalized = dict(request)
+    normalized["fields"] = sorted(set(normalized.get("fields") or []))
+    normalized["filters"] = normalized.get("filters") or {}
+    normalized["backend"] = backend
+    return json.dumps(normalized, sort_keys=True, separators=(",", ":"), default=_iso)
+
+
+def _iso(value: Any) -> str:
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def encode_value(value: Any, compress_over: int) -> str:
+    """
+    JSON, zlib-compressed (and base64'd, the client decodes strings) when
+    large. Encoded like a response body (`result_normalizer.dumps`), so a
+    cache hit answers with the same types as a miss.
+    """
+    raw = dumps(value)
+    if len(raw) <= compress_over:
+        return "j:" + raw.decode("utf-8")
+    return "z:" + base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+
+
+def decode_value(stored: str) -> Any:
+    if stored.startswith("z:"):
+        return json.loads(zlib.decompress(base64.b64decode(stored[2:])))
+    return json.loads(stored[2:])
+
+
+class QueryResultCache:
+    """
+    Cache of POST /query results.
+
+    Keys are built from the normalized request, the backend, the source's
+    current schema version and its ingestion watermark — a counter bumped
+    after every write to the source. A write therefore makes every older
+    entry unreachable without deleting anything; stale entries age out
+    through the per-source LRU budget (or their TTL).
+
+    Per source, a sorted set orders entries by last access and a hash
+    records their sizes; once the source's total passes `budget_bytes`,
+    the least recently used entries are evicted.
+    """
+
+    PREFIX = "qc"
+
+    def __init__(self, ttl: int = 300, budget_bytes: int = 8 * 1024 * 1024, compress_over: int = 16 * 1024):
+        self.ttl = ttl
+        self.budget_bytes = budget_bytes
+        self.compress_over = compress_over
+
+    # ---------------------------------------------------------
+    # Keys
+    # ---------------------------------------------------------
+    def _state_keys(self, source_id: str) -> Tuple[str, str]:
+        return f"{self.PREFIX}:wm:{source_id}", f"{self.PREFIX}:ver:{source_id}"
+
+    def _lru_keys(self, source_id: str) -> Tuple[str, str, str]:
+        p = f"{self.PREFIX}:lru:{source_id}"
+        return p, f"{p}:size", f"{p}:bytes"
+
+    async def key(
+        self,
+        redis: aioredis.Redis,
+        source_id: str,
+        request: Dict[str, Any],
+        backend: str
+    ) -> str:
+        """Cache key for a request at the source's current version + watermark."""
+        watermark, version = await redis.mget(*self._state_keys(source_id))
+        digest = hashlib.sha1(normalize_request(request, backend).encode("utf-8")).hexdigest()
+        return f"{self.PREFIX}:{source_id}:{digest}:v{version or 0}:w{watermark or 0}"
+
+    async def bump(self, redis: aioredis.Redis, source_id: str, schema_version: Optional[int] = None):
+        """Advance the watermark after a write (and record the schema version)."""
+        wm_key, ver_key = self._state_keys(source_id)
+        try:
+            if schema_version is not None:
+                await redis.set(ver_key, schema_version)
+            await redis.incr(wm_key)
+        except Exception as e:
+            logger.warning("Cache watermark bump failed", exc_info=e, source_id=source_id)
+
+    # ---------------------------------------------------------
+    # Get / set with LRU accounting
+    # ---------------------------------------------------------
+    async def get(self, redis: aioredis.Redis, source_id: str, key: str) -> Optional[Any]:
+        try:
+            stored = await redis.get(key)
+            if stored is None:
+                return None
+            lru, _, _ = self._lru_keys(source_id)
+            await redis.zadd(lru, {key: time.time()})
+            return decode_value(stored)
+        except Exception as e:
+            logger.warning("Cache get failed", exc_info=e, key=key)
+            return None
+
+    async def set(self, redis: aioredis.Redis, source_id: str, key: str, value: Any) -> bool:
+        stored = encode_value(value, self.compress_over)
+        size = len(stored)
+        if size > self.budget_bytes:
+            return False
+
+        lru, sizes, total = self._lru_keys(source_id)
+        try:
+            pipe = redis.pipeline(transaction=True)
+            pipe.set(key, stored, ex=self.ttl)
+            pipe.zadd(lru, {key: time.time()})
+            pipe.hset(sizes, key, size)
+            pipe.incrby(total, size)
+            used = (await pipe.execute())[-1]
+            if int(used) > self.budget_bytes:
+                await self._evict(redis, source_id, int(used))
+            return True
+        except Exception as e:
+            logger.warning("Cache set failed", exc_info=e, key=key)
+            return False
+
+    async def _evict(self, redis: aioredis.Redis, source_id: str, used: int):
+        lru, sizes, total = self._lru_keys(source_id)
+        while used > self.budget_bytes:
+            candidates = await redis.zrange(lru, 0, 15)
+            if not candidates:
+                break
+            victims, freed = [], 0
+            for key, size in zip(candidates, await redis.hmget(sizes, candidates)):
+                victims.append(key)
+                freed += int(size or 0)
+                if used - freed <= self.budget_bytes:
+                    break
+
+            pipe = redis.pipeline(transaction=True)
+            pipe.delete(*victims)
+            pipe.zrem(lru, *victims)
+            pipe.hdel(sizes, *victims)
+            pipe.decrby(total, freed)
+            used = int((await pipe.execute())[-1])
+            logger.info("Query cache evicted", source_id=source_id, entries=len(victims), bytes=freed)
+
+
+# Shared cache settings — /query reads through it, writers bump watermarks
+query_cache = QueryResultCache(
+    ttl=settings.QUERY_CACHE_TTL_S,
+    budget_bytes=settings.QUERY_CACHE_SOURCE_BUDGET_BYTES,
+    compress_over=settings.QUERY_CACHE_COMPRESS_BYTES
+)
+
+
+
+# ---------------------------------------------------------
+# NL → query translation cache
+# ---------------------------------------------------------
+class TranslationCache:
+    """
+    Translated query templates keyed by schema fingerprint, target DB and
+    the normalized question (literals already replaced by bind params).
+    A small in-process LRU sits in front of Redis, which shares entries
+    across workers; Redis failures only cost a model call.
+    """
+
+    PREFIX = "nl"
+
+    def __init__(self, ttl: int = 86400, local_size: int = 1024):
+        self.ttl = ttl
+        self.local_size = local_size
+        self._local: "OrderedDict[str, str]" = OrderedDict()
+
+    def key(self, fingerprint: str, target_db: str, template: str) -> str:
+        digest = hashlib.sha1(template.encode("utf-8")).hexdigest()
+        return f"{self.PREFIX}:{fingerprint}:{target_db}:{digest}"
+
+    def _remember(self, key: str, query: str):
+        self._local[key] = query
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    async def get(self, redis: Optional[aioredis.Redis], key: str) -> Optional[str]:
+        if key in self._local:
+            self._local.move_to_end(key)
+            return self._local[key]
+        if redis is None:
+            return None
+        try:
+            query = await redis.get(key)
+        except Exception as e:
+            logger.warning("Translation cache get failed", error=str(e))
+            return None
+        if query is not None:
+            self._remember(key, query)
+        return query
+
+    async def set(self, redis: Optional[aioredis.Redis], key: str, query: str):
+        self._remember(key, query)
+        if redis is None:
+            return
+        try:
+            await redis.set(key, query, ex=self.ttl)
+        except Exception as e:
+            logger.warning("Translation cache set failed", error=str(e))
+
+
+translation_cache = TranslationCache(ttl=settings.NL_TRANSLATION_TTL_S)
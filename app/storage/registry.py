@@ -0,0 +1,111 @@
+# app/storage/registry.py
+
+import structlog
+from typing import Optional
+
+import redis.asyncio as aioredis
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.models.database import engine, AsyncSessionLocal
+from app.storage.lake import COLD_PREFIX, ParquetLake, create_lake
+from app.storage.mongodb import MongoDBStorage
+from app.storage.object_store import create_object_store
+from app.storage.s3_handler import S3Handler
+
+logger = structlog.get_logger()
+
+
+class ConnectionRegistry:
+    """
+    Owns every pooled client the app uses: Postgres engine + session
+    factory, Motor (async Mongo), Redis, the object store and the Parquet
+    lake. Created once in the FastAPI lifespan, shared by all routes and
+    the ETL pipeline, and closed on shutdown.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        session_factory: sessionmaker,
+        mongo_client: AsyncIOMotorClient,
+        redis: aioredis.Redis,
+        s3: S3Handler,
+        lake: Optional[ParquetLake] = None
+    ):
+        self.engine = engine
+        self.session_factory = session_factory
+        self.mongo_client = mongo_client
+        self.redis = redis
+        self.s3 = s3
+        self.lake = lake or create_lake(s3.store)
+        # cold tier shares the raw-file store
+        self.cold = ParquetLake(s3.store, root=COLD_PREFIX)
+
+    @property
+    def mongo_db(self) -> AsyncIOMotorDatabase:
+        return self.mongo_client.get_default_database()
+
+    @property
+    def mongo(self) -> MongoDBStorage:
+        return MongoDBStorage(self.mongo_db)
+
+    # ---------------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------------
+    @classmethod
+    async def open(cls) -> "ConnectionRegistry":
+        mongo_client = AsyncIOMotorClient(
+            settings.MONGODB_URL,
+            maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE
+        )
+        redis = aioredis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            max_connections=settings.REDIS_MAX_CONNECTIONS
+        )
+        s3 = S3Handler(create_object_store())
+
+        # Runs once here rather than on every handler construction
+        await s3.ensure_bucket()
+
+        registry = cls(engine, AsyncSessionLocal, mongo_client, redis, s3)
+        set_registry(registry)
+        logger.info(
+            "Connection registry opened",
+            pg_pool_size=settings.PG_POOL_SIZE,
+            mongo_max_pool_size=settings.MONGO_MAX_POOL_SIZE,
+            redis_max_connections=settings.REDIS_MAX_CONNECTIONS
+        )
+        return registry
+
+    async def close(self):
+        self.mongo_client.close()
+        await self.redis.aclose()
+        await self.lake.close()
+        await self.cold.close()
+        await self.s3.store.close()
+        await self.engine.dispose()
+        set_registry(None)
+        logger.info("Connection registry closed")
+
+
+# ---------------------------------------------------------
+# Process-wide access for code that runs outside a request
+# (background tasks, scripts)
+# ---------------------------------------------------------
+_registry: Optional[ConnectionRegistry] = None
+
+
+def set_registry(registry: Optional[ConnectionRegistry]):
+    global _registry
+    _registry = registry
+
+
+def get_registry() -> ConnectionRegistry:
+    if _registry is None:
+        raise RuntimeError("ConnectionRegistry is not open")
+    return _registry
@@ -1,61 +1,77 @@
 # app/storage/s3_handler.py
 import structlog
-from minio import Minio
-from minio.error import S3Error
+from typing import AsyncIterator, NamedTuple, Optional
 from app.config import settings
-import io
+from app.storage.compression import (
+    CompressingStream, EXTENSIONS, codec_for_path, decompress_stream, resolve_codec
+)
+from app.storage.object_store import ObjectStore, iter_bytes
 
 logger = structlog.get_logger()
 
 
+class StoredFile(NamedTuple):
+    storage_path: str
+    codec: Optional[str]        # None = stored as received
+    original_size: int
+    stored_size: int
+
+
 class S3Handler:
-    """Handle file storage in MinIO/S3"""
-    
-    def __init__(self):
-        self.client = Minio(
-            settings.MINIO_ENDPOINT,
-            access_key=settings.MINIO_ACCESS_KEY,
-            secret_key=settings.MINIO_SECRET_KEY,
-            secure=settings.MINIO_SECURE
-        )
-        self._ensure_bucket()
-    
-    def _ensure_bucket(self):
+    """Raw-file archival on top of the async object store (MinIO/S3 or local)"""
+
+    def __init__(
+        self,
+        store: ObjectStore,
+        chunk_size: int = 1024 * 1024,
+        codec: Optional[str] = None,
+        level: Optional[int] = None
+    ):
+        self.store = store
+        self.chunk_size = chunk_size
+        self.codec = resolve_codec(codec if codec is not None else settings.RAW_COMPRESSION)
+        self.level = level if level is not None else settings.RAW_COMPRESSION_LEVEL
+
+    async def ensure_bucket(self):
         """Ensure bucket exists"""
-        try:
-            if not self.client.bucket_exists(settings.MINIO_BUCKET):
-                self.client.make_bucket(settings.MINIO_BUCKET)
-                logger.info(f"Created bucket: {settings.MINIO_BUCKET}")
-        except S3Error as e:
-            logger.error("Bucket creation failed", exc_info=e)
-    
-    async def upload_file(self, file_id: str, content: bytes, filename: str) -> str:
+        await self.store.ensure_bucket()
+
+    async def upload_file(self, file_id: str, content: bytes, filename: str) -> StoredFile:
         """Upload file to S3/MinIO"""
+        return await self.upload_stream(file_id, iter_bytes(content, self.chunk_size), filename)
+
+    async def upload_stream(self, file_id: str, chunks: AsyncIterator[bytes], filename: str) -> StoredFile:
+        """Upload a file from a stream of chunks, compressing on the fly"""
+        object_name = f"uploads/{file_id}/{filename}{EXTENSIONS.get(self.codec, '')}"
+        stream = CompressingStream(chunks, self.codec, self.level)
         try:
-            object_name = f"uploads/{file_id}/{filename}"
-            
-            self.client.put_object(
-                settings.MINIO_BUCKET,
-                object_name,
-                io.BytesIO(content),
-                length=len(content)
-            )
-            
-            logger.info("File uploaded", object_name=object_name)
-            return object_name
-            
-        except S3Error as e:
-            logger.error("File upload failed", exc_info=e)
+            await self.store.put_stream(object_name, stream)
+        except Exception as e:
+            logger.error("File upload failed", exc_info=e, object_name=object_name)
             raise
-    
-    async def download_file(self, storage_path: str) -> bytes:
+
+        logger.info(
+            "File uploaded",
+            object_name=object_name,
+            codec=self.codec,
+            original_size=stream.original_size,
+            stored_size=stream.stored_size
+        )
+        return StoredFile(object_name, self.codec, stream.original_size, stream.stored_size)
+
+    def stream_file(self, storage_path: str, codec: Optional[str] = None) -> AsyncIterator[bytes]:
+        """
+        Stream a stored file's original bytes, decompressing as chunks
+        arrive. `codec` comes from SourceFile; when unknown it is inferred
+        from the object key.
+        """
+        codec = codec or codec_for_path(storage_path)
+        return decompress_stream(self.store.stream(storage_path, chunk_size=self.chunk_size), codec)
+
+    async def download_file(self, storage_path: str, codec: Optional[str] = None) -> bytes:
         """Download file from S3/MinIO"""
         try:
-            response = self.client.get_object(settings.MINIO_BUCKET, storage_path)
-            content = response.read()
-            response.close()
-            response.release_conn()
-            return content
-        except S3Error as e:
-            logger.error("File download failed", exc_info=e)
+            return b"".join([chunk async for chunk in self.stream_file(storage_path, codec)])
+        except Exception as e:
+            logger.error("File download failed", exc_info=e, storage_path=storage_path)
             raise
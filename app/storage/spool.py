@@ -0,0 +1,388 @@
+# app/storage/spool.py
+
+import asyncio
+import fcntl
+import json
+import mmap
+import os
+import struct
+import zlib
+import structlog
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.utils.metrics import SPOOL_PENDING_BATCHES, SPOOL_PENDING_BYTES
+
+logger = structlog.get_logger()
+
+# Frame header: payload length, crc32(payload)
+FRAME = struct.Struct("<II")
+
+# (segment number, byte offset) just past an entry
+Position = Tuple[int, int]
+
+
+# ---------------------------------------------------------
+# Entry encoding (JSON; datetimes survive the round trip)
+# ---------------------------------------------------------
+def _default(value: Any):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    return str(value)
+
+
+def _hook(obj: Dict[str, Any]):
+    if len(obj) == 1 and "$dt" in obj:
+        return datetime.fromisoformat(obj["$dt"])
+    return obj
+
+
+def encode_entry(entry: Dict[str, Any]) -> bytes:
+    return json.dumps(entry, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+def decode_entry(payload: bytes) -> Dict[str, Any]:
+    return json.loads(payload, object_hook=_hook)
+
+
+def scan_frames(buf, offset: int = 0) -> Iterator[Tuple[bytes, int]]:
+    """
+    Yield (payload, end offset) for each intact frame from `offset`. Stops
+    at the first short or corrupt frame — the torn tail of a crashed write.
+    """
+    size = len(buf)
+    while offset + FRAME.size <= size:
+        length, crc = FRAME.unpack_from(buf, offset)
+        start, end = offset + FRAME.size, offset + FRAME.size + length
+        if end > size:
+            return
+        payload = bytes(buf[start:end])
+        if zlib.crc32(payload) != crc:
+            return
+        yield payload, end
+        offset = end
+
+
+class LocalSpool:
+    """
+    Append-only on-disk spool for sink writes that failed (sink down),
+    shared by every worker process on the host.
+
+      - entries are length + crc32 framed and appended to numbered
+        segment files under an exclusive file lock (append.lock), fsync'd
+        before `append` returns; a segment is sealed once it passes
+        `segment_bytes`, and a torn tail left by a writer that crashed is
+        cut before the next frame goes in
+      - every sink has its own cursor (cursor.json); replay reads
+        segments through mmap from it, strictly in order, and only moves
+        it past entries the sink accepted (at-least-once), so a sink that
+        is down never holds back the others; segments no sink still
+        needs are deleted
+      - one process replays at a time (replay.lock); the others refresh
+        their pending counts from the files
+
+    All file I/O of a process runs on one dedicated thread.
+    """
+
+    def __init__(self, path: str, segment_bytes: int = 64 * 1024 * 1024):
+        self.path = os.path.abspath(path)
+        self.segment_bytes = segment_bytes
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spool")
+        self._opened = False
+        self._append_lock: Optional[int] = None
+        self._replay_lock: Optional[int] = None
+        self._floor: Position = (0, 0)          # cursor of sinks without their own
+        self._cursors: Dict[str, Position] = {}
+        self._index: List[Tuple[Position, str]] = []   # (end, sink) of every frame on disk
+        self._scanned: Position = (0, 0)
+        self._tail: Position = (0, 0)            # last known clean end of the active segment
+        self.pending: Dict[str, int] = {}       # {sink: entries not yet replayed}
+
+    async def _io(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    # ---------------------------------------------------------
+    # Files (spool thread only)
+    # ---------------------------------------------------------
+    def _segment_path(self, n: int) -> str:
+        return os.path.join(self.path, f"seg-{n:012d}.log")
+
+    def _segments(self) -> List[int]:
+        return sorted(
+            int(name[4:-4]) for name in os.listdir(self.path)
+            if name.startswith("seg-") and name.endswith(".log")
+        )
+
+    def _frames(self, n: int, offset: int = 0) -> Iterator[Tuple[bytes, int]]:
+        path = self._segment_path(n)
+        if not os.path.exists(path) or os.path.getsize(path) <= offset:
+            return
+        with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            yield from scan_frames(buf, offset)
+
+    def cursor(self, sink: str) -> Position:
+        return max(self._cursors.get(sink, self._floor), self._floor)
+
+    def _open_sync(self):
+        if self._opened:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        self._append_lock = os.open(os.path.join(self.path, "append.lock"), os.O_RDWR | os.O_CREAT)
+        self._replay_lock = os.open(os.path.join(self.path, "replay.lock"), os.O_RDWR | os.O_CREAT)
+        self._opened = True
+        self._refresh_sync()
+
+    def _load_cursors(self):
+        cursor_path = os.path.join(self.path, "cursor.json")
+        if not os.path.exists(cursor_path):
+            return
+        with open(cursor_path) as fh:
+            state = json.load(fh)
+        self._floor = tuple(state.get("floor", (0, 0)))
+        self._cursors = {sink: tuple(pos) for sink, pos in state.get("sinks", {}).items()}
+
+    def _scan_sync(self):
+        """Index frames appended (by any process) since the last scan."""
+        seg, offset = self._scanned
+        for n in self._segments():
+            if n < seg:
+                continue
+            for payload, end in self._frames(n, offset if n == seg else 0):
+                self._index.append(((n, end), decode_entry(payload).get("sink", "")))
+                self._scanned = (n, end)
+
+    def _refresh_sync(self):
+        self._load_cursors()
+        segments = self._segments()
+        if segments and self._scanned < (segments[0], 0):
+            self._scanned = (segments[0], 0)
+        self._index = [(pos, sink) for pos, sink in self._index if segments and pos[0] >= segments[0]]
+        self._scan_sync()
+        self._recount()
+
+    def _recount(self):
+        pending: Dict[str, int] = {sink: 0 for sink in self.pending}
+        for pos, sink in self._index:
+            if pos > self.cursor(sink):
+                pending[sink] = pending.get(sink, 0) + 1
+        self.pending = pending
+        self._publish()
+
+    def _valid_end(self, n: int) -> int:
+        """End of the last intact frame of segment `n` (append lock held)."""
+        start = self._tail[1] if self._tail[0] == n else 0
+        end = start
+        for _, end in self._frames(n, start):
+            pass
+        self._tail = (n, end)
+        return end
+
+    def _append_sync(self, payload: bytes):
+        self._open_sync()
+        fcntl.flock(self._append_lock, fcntl.LOCK_EX)
+        try:
+            segments = self._segments()
+            active = segments[-1] if segments else self._floor[0]
+            path = self._segment_path(active)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+
+            # cut a torn tail so the new frame starts on a clean boundary
+            end = self._valid_end(active)
+            if size > end:
+                logger.warning("Spool tail truncated", segment=active, size=size, valid=end)
+                with open(path, "r+b") as fh:
+                    fh.truncate(end)
+                    os.fsync(fh.fileno())
+
+            rolled = end >= self.segment_bytes
+            if rolled:
+                active += 1
+                path = self._segment_path(active)
+
+            with open(path, "ab") as fh:
+                fh.write(FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+                fh.flush()
+                os.fsync(fh.fileno())
+            if rolled or not segments:
+                self._fsync_dir()
+        finally:
+            fcntl.flock(self._append_lock, fcntl.LOCK_UN)
+
+        self._scan_sync()
+        self._recount()
+
+    def _try_replay_lock(self) -> bool:
+        self._open_sync()
+        try:
+            fcntl.flock(self._replay_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _release_replay_lock(self):
+        fcntl.flock(self._replay_lock, fcntl.LOCK_UN)
+
+    def _read_sync(self, max_entries: int) -> Dict[str, List[Tuple[Dict[str, Any], Position]]]:
+        """Up to `max_entries` pending entries per sink, each sink's in log order."""
+        self._open_sync()
+        sinks = [sink for sink, count in self.pending.items() if count]
+        if not sinks:
+            return {}
+        out: Dict[str, List[Tuple[Dict[str, Any], Position]]] = {sink: [] for sink in sinks}
+
+        seg, offset = min(self.cursor(sink) for sink in sinks)
+        for n in self._segments():
+            if n < seg:
+                continue
+            for payload, end in self._frames(n, offset if n == seg else 0):
+                entry = decode_entry(payload)
+                batch = out.get(entry.get("sink"))
+                if batch is None or len(batch) >= max_entries or (n, end) <= self.cursor(entry["sink"]):
+                    continue
+                batch.append((entry, (n, end)))
+                if all(len(b) >= max_entries for b in out.values()):
+                    return out
+        return out
+
+    def _commit_sync(self, sink: str, position: Position):
+        """Move `sink`'s cursor (replay lock held) and delete segments no sink needs."""
+        self._cursors[sink] = position
+        self._recount()
+
+        segments = self._segments()
+        waiting = [pos[0] for pos, s in self._index if self.pending.get(s) and pos > self.cursor(s)]
+        # the newest segment stays: appends go there
+        keep_from = min(waiting + segments[-1:]) if segments else self._floor[0]
+        if keep_from > self._floor[0]:
+            self._floor = (keep_from, 0)
+            self._cursors = {s: pos for s, pos in self._cursors.items() if pos > self._floor}
+
+        cursor_path = os.path.join(self.path, "cursor.json")
+        with open(f"{cursor_path}.tmp", "w") as fh:
+            json.dump({"floor": list(self._floor), "sinks": {s: list(p) for s, p in self._cursors.items()}}, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(f"{cursor_path}.tmp", cursor_path)
+
+        for n in segments:
+            if n < keep_from:
+                os.remove(self._segment_path(n))
+        self._fsync_dir()
+        self._index = [(pos, s) for pos, s in self._index if pos[0] >= keep_from]
+        self._publish()
+
+    def _fsync_dir(self):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _publish(self):
+        for sink, count in self.pending.items():
+            SPOOL_PENDING_BATCHES.labels(sink=sink).set(count)
+        SPOOL_PENDING_BYTES.set(sum(os.path.getsize(self._segment_path(n)) for n in self._segments()))
+
+    # ---------------------------------------------------------
+    # API
+    # ---------------------------------------------------------
+    async def open(self):
+        """Load cursors and count pending entries (called at startup; other calls open lazily)."""
+        await self._io(self._open_sync)
+
+    def depth(self, sink: Optional[str] = None) -> int:
+        if sink is not None:
+            return self.pending.get(sink, 0)
+        return sum(self.pending.values())
+
+    async def append(self, sink: str, batch: Dict[str, Any]):
+        """Durably record a batch for `sink`; returns once it is fsync'd."""
+        await self._io(self._append_sync, encode_entry({"sink": sink, "batch": batch}))
+
+    async def refresh(self):
+        """Pick up entries appended and cursors moved by other processes."""
+        await self._io(self._open_sync)
+        await self._io(self._refresh_sync)
+
+    async def close(self):
+        def shut():
+            for fd in (self._append_lock, self._replay_lock):
+                if fd is not None:
+                    os.close(fd)
+            self._append_lock = self._replay_lock = None
+            self._opened = False
+        await self._io(shut)
+        self._executor.shutdown(wait=True)
+
+    # ---------------------------------------------------------
+    # Replay
+    # ---------------------------------------------------------
+    async def replay_once(
+        self,
+        writers: Dict[str, Callable[[List[Dict[str, Any]]], Awaitable[None]]],
+        max_entries: int
+    ) -> int:
+        """
+        Replay up to `max_entries` per sink, each sink in its own order.
+        Consecutive entries for the same source go to the writer as one
+        batch. A failing sink stops only its own replay; the first failure
+        is raised once the other sinks are done. Returns entries replayed
+        (0 if another process holds the replay lock).
+        """
+        if not await self._io(self._try_replay_lock):
+            await self.refresh()
+            return 0
+
+        done, failure = 0, None
+        try:
+            await self._io(self._refresh_sync)
+            for sink, entries in (await self._io(self._read_sync, max_entries)).items():
+                i = 0
+                try:
+                    while i < len(entries):
+                        source_id = entries[i][0]["batch"].get("source_id")
+                        j = i
+                        while j < len(entries) and entries[j][0]["batch"].get("source_id") == source_id:
+                            j += 1
+
+                        group = entries[i:j]
+                        await writers[sink]([e["batch"] for e, _ in group])
+                        await self._io(self._commit_sync, sink, group[-1][1])
+                        done += len(group)
+                        i = j
+                except Exception as e:
+                    # this sink is still down; the others keep replaying
+                    logger.warning("Spool replay failed for sink", sink=sink, error=str(e))
+                    failure = failure or e
+        finally:
+            await self._io(self._release_replay_lock)
+
+        if failure is not None:
+            raise failure
+        return done
+
+    async def run_replay(
+        self,
+        writers: Dict[str, Callable[[List[Dict[str, Any]]], Awaitable[None]]],
+        every_s: float,
+        max_entries: int
+    ):
+        """Background loop started from the app lifespan (in every worker; one replays at a time)."""
+        while True:
+            replayed = 0
+            try:
+                replayed = await self.replay_once(writers, max_entries)
+                if replayed:
+                    logger.info("Spool replayed", entries=replayed, pending=self.depth())
+            except Exception as e:
+                logger.warning("Spool replay stopped; sink still unavailable", error=str(e), pending=self.depth())
+            if not replayed:
+                await asyncio.sleep(every_s)
+
+
+# Shared spool — the pipeline appends, the lifespan loop replays
+spool = LocalSpool(settings.SPOOL_DIR, segment_bytes=settings.SPOOL_SEGMENT_BYTES)
@@ -0,0 +1,362 @@
+# app/storage/tiering.py
+
+import asyncio
+import structlog
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from bson import ObjectId
+from sqlalchemy import func, select, distinct, text as sql_text, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.config import settings
+from app.core.schema.versioning import projector
+from app.models.source_models import SourceFile, TieringStateDB
+from app.storage.hybrid import hybrid_layout
+from app.storage.lake import (
+    ARROW_TYPES, COLD_PREFIX, INGESTED_AT, ParquetLake, as_utc, conform, key_date, partition_prefix,
+    records_to_table, unify_schemas
+)
+from app.storage.partitions import interval_start, partition_manager
+from app.storage.postgres import migrations, sanitize_column_name
+from app.storage.redis_cache import query_cache
+
+logger = structlog.get_logger()
+
+try:
+    import pyarrow as pa
+except ImportError:     # optional: tiering is disabled without it
+    pa = None
+
+
+def parse_policy(spec: str) -> Dict[str, int]:
+    """'events:30,*:90' → {source_id: days}; "*" is the default for other sources."""
+    policy = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        source_id, _, days = item.partition(":")
+        policy[source_id.strip()] = int(days)
+    return policy
+
+
+def day_key(source_id: str, day: datetime) -> str:
+    """One cold file per source and day, rewritten in place if a move is retried."""
+    return f"{partition_prefix(source_id, f'{day:%Y-%m-%d}', COLD_PREFIX)}tier.parquet"
+
+
+class TieringManager:
+    """
+    Hot/cold tiering: records older than a per-source threshold move out
+    of `data_<source>` and `<source>_records` into one zstd Parquet file
+    per day in the object store (cold/source=<id>/date=<day>/).
+
+    A move goes day by day, oldest first. Each day runs in one REPEATABLE
+    READ transaction: its rows are written to the day's file, the same
+    snapshot's rows are deleted, and the source's watermark
+    (TieringStateDB) advances with the commit. Rows committed meanwhile
+    are neither exported nor deleted. Hot reads always add
+    `ingested_at >= watermark`.
+
+    Rows that land below the watermark later (spool replays, old
+    `ingested_at` values) are merged into their day's file on the next
+    run. After a backfill swap (`rewrite_cold`) the regenerated rows
+    replace their day's file instead. Mongo documents and buckets below
+    the watermark are deleted only once their batch predates the last
+    export (`exported_at`): the Postgres copy of the batch was exported
+    by then, or is merged in when its spooled write replays.
+
+    Readers use `needs_cold` / `cold_rows` to fan out only when the
+    requested ingestion window reaches below the watermark.
+    """
+
+    def __init__(self, policy: Dict[str, int], batch_size: int = 5000):
+        self.policy = policy
+        self.batch_size = batch_size
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def threshold_days(self, source_id: str) -> Optional[int]:
+        return self.policy.get(source_id, self.policy.get("*"))
+
+    def _lock(self, source_id: str) -> asyncio.Lock:
+        if source_id not in self._locks:
+            self._locks[source_id] = asyncio.Lock()
+        return self._locks[source_id]
+
+    # ---------------------------------------------------------
+    # Watermark
+    # ---------------------------------------------------------
+    async def watermark(self, session: AsyncSession, source_id: str) -> Optional[datetime]:
+        """
+        Rows ingested before this live only in the cold tier. Read from
+        tiering_state on every call (a primary-key lookup): another worker
+        may have advanced it.
+        """
+        return await session.scalar(
+            select(TieringStateDB.watermark).where(TieringStateDB.source_id == source_id)
+        )
+
+    @staticmethod
+    def needs_cold(watermark: Optional[datetime], ingested_from: Optional[datetime]) -> bool:
+        if watermark is None:
+            return False
+        return ingested_from is None or as_utc(ingested_from) < watermark
+
+    # ---------------------------------------------------------
+    # Moving hot → cold
+    # ---------------------------------------------------------
+    async def tier(self, registry, source_id: str) -> Optional[TieringStateDB]:
+        """Move every full day older than the threshold to the cold tier."""
+        days = self.threshold_days(source_id)
+        if days is None:
+            raise LookupError(f"No tiering policy for source_id={source_id}")
+        if pa is None:
+            raise RuntimeError("Tiering requires pyarrow")
+
+        table = f"data_{source_id}"
+        engine = registry.engine
+        cutoff = interval_start(datetime.now(timezone.utc) - timedelta(days=days), "day")
+
+        async with self._lock(source_id), registry.session_factory() as session:
+            await migrations.wait_idle(table)
+            columns = await migrations.columns(engine, table)
+            if not columns or "ingested_at" not in columns:
+                raise LookupError(f"Table {table} has no ingested_at column to tier by")
+
+            state = await session.get(TieringStateDB, source_id)
+            if state is None:
+                state = TieringStateDB(source_id=source_id, rows_moved=0, files_written=0)
+                session.add(state)
+                await session.commit()
+
+            version = await projector.latest_version(session, source_id)
+
+            # late rows below the watermark: merged into (after a backfill: replacing) their day file
+            if state.watermark is not None:
+                merge = not state.rewrite_cold
+                while True:
+                    oldest = await self._oldest(engine, table, None, state.watermark)
+                    if oldest is None:
+                        break
+                    day = interval_start(oldest, "day")
+                    rows = await self._move_day(
+                        registry, table, columns, source_id, version, day, day + timedelta(days=1), merge
+                    )
+                    await query_cache.bump(registry.redis, source_id)
+                    logger.info("Late rows moved to cold tier", source_id=source_id, day=f"{day:%Y-%m-%d}",
+                                rows=rows, merged=merge)
+                if state.rewrite_cold:
+                    state.rewrite_cold = False
+                    await session.commit()
+
+            while True:
+                oldest = await self._oldest(engine, table, state.watermark, cutoff)
+                if oldest is None:
+                    break
+                day = interval_start(oldest, "day")
+                rows = await self._move_day(
+                    registry, table, columns, source_id, version, day, day + timedelta(days=1),
+                    merge=False, watermark=day + timedelta(days=1)
+                )
+                await session.refresh(state)
+                await query_cache.bump(registry.redis, source_id)
+                logger.info("Day moved to cold tier", source_id=source_id, day=f"{day:%Y-%m-%d}", rows=rows)
+
+            await session.refresh(state)
+            if state.watermark is not None:
+                for name, _, hi in await partition_manager.partitions(engine, table):
+                    if hi <= state.watermark:
+                        await self._drop_if_empty(engine, table, name)
+            await self._delete_mongo(registry, source_id, state)
+            return state
+
+    @staticmethod
+    async def _drop_if_empty(engine, table: str, partition: str):
+        """Drop a partition emptied by moves; one still receiving late rows stays for the next run."""
+        try:
+            async with engine.begin() as conn:
+                await conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{settings.MIGRATION_LOCK_TIMEOUT_MS}ms'")
+                # blocks inserts into it until commit, so the check stays true
+                await conn.exec_driver_sql(f'LOCK TABLE "{partition}" IN ACCESS EXCLUSIVE MODE')
+                if await conn.scalar(sql_text(f'SELECT EXISTS (SELECT 1 FROM "{partition}")')):
+                    return
+                await conn.exec_driver_sql(f'ALTER TABLE "{table}" DETACH PARTITION "{partition}"')
+                await conn.exec_driver_sql(f'DROP TABLE "{partition}"')
+        except DBAPIError as e:
+            logger.warning("Emptied partition not dropped", table=table, partition=partition, error=str(e))
+            return
+        partition_manager.forget(table)
+        logger.info("Emptied partition dropped", table=table, partition=partition)
+
+    @staticmethod
+    async def _oldest(
+        engine, table: str, lo: Optional[datetime], hi: datetime
+    ) -> Optional[datetime]:
+        """Oldest hot `ingested_at` in [lo, hi)."""
+        async with engine.connect() as conn:
+            return await conn.scalar(
+                sql_text(f'SELECT min(ingested_at) FROM "{table}" WHERE ingested_at < :hi AND ingested_at >= :lo'),
+                {"hi": hi, "lo": lo or datetime.min.replace(tzinfo=timezone.utc)}
+            )
+
+    async def _move_day(
+        self,
+        registry,
+        table: str,
+        columns: Dict[str, str],
+        source_id: str,
+        version: Optional[int],
+        lo: datetime,
+        hi: datetime,
+        merge: bool,
+        watermark: Optional[datetime] = None
+    ) -> int:
+        """
+        Export and delete the hot rows in [lo, hi) from one snapshot; with
+        `merge` the day file's current rows are kept. Returns rows moved.
+        """
+        existing = None
+        if merge:
+            key = day_key(source_id, lo)
+            if key in await registry.cold.files(source_id, f"{lo:%Y-%m-%d}", f"{lo:%Y-%m-%d}"):
+                existing = await registry.cold.read_table(key)
+
+        async with registry.engine.connect() as conn:
+            # the rows deleted are exactly the rows exported: same snapshot
+            conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+            async with conn.begin():
+                rows = await self._export_day(registry.cold, conn, table, columns, source_id, version, lo, hi, existing)
+                await conn.execute(
+                    sql_text(f'DELETE FROM "{table}" WHERE ingested_at >= :lo AND ingested_at < :hi'),
+                    {"lo": lo, "hi": hi}
+                )
+                values = {
+                    "rows_moved": TieringStateDB.rows_moved + rows,
+                    "files_written": TieringStateDB.files_written + 1,
+                    "exported_at": func.now(),
+                }
+                if watermark is not None:
+                    values["watermark"] = watermark
+                await conn.execute(
+                    update(TieringStateDB).where(TieringStateDB.source_id == source_id).values(**values)
+                )
+        return rows
+
+    async def _export_day(
+        self,
+        cold: ParquetLake,
+        conn: AsyncConnection,
+        table: str,
+        columns: Dict[str, str],
+        source_id: str,
+        version: Optional[int],
+        lo: datetime,
+        hi: datetime,
+        existing: Optional["pa.Table"] = None
+    ) -> int:
+        schema = {col: {"type": t} for col, t in columns.items() if col not in ("id", "ingested_at")}
+        arrow_schema = pa.schema(
+            [pa.field(col, getattr(pa, ARROW_TYPES.get(meta["type"], "string"))()) for col, meta in schema.items()]
+            + [pa.field(INGESTED_AT, pa.timestamp("us", tz="UTC"))]
+        )
+        if existing is not None:
+            arrow_schema = unify_schemas([arrow_schema, existing.schema])
+        arrow_schema = arrow_schema.with_metadata(
+            {"source_id": source_id, "schema_version": str(version or ""), "tier": "cold"}
+        )
+
+        async def tables() -> AsyncIterator["pa.Table"]:
+            if existing is not None:
+                yield conform(existing, arrow_schema)
+            result = await conn.stream(
+                sql_text(
+                    f'SELECT * FROM "{table}" '
+                    'WHERE ingested_at >= :lo AND ingested_at < :hi ORDER BY id'
+                ),
+                {"lo": lo, "hi": hi}
+            )
+            async for part in result.mappings().partitions(self.batch_size):
+                rows = [dict(r) for r in part]
+                stamps = [r.pop("ingested_at") for r in rows]
+                for r in rows:
+                    r.pop("id", None)
+                yield records_to_table(rows, schema, stamps)
+
+        written = await cold.write_tables(day_key(source_id, lo), arrow_schema, tables())
+        return written - (existing.num_rows if existing is not None else 0)
+
+    @staticmethod
+    async def _delete_mongo(registry, source_id: str, state: TieringStateDB):
+        """Single-record documents and buckets that ended before the watermark, written before the last export."""
+        if state.watermark is None or state.exported_at is None:
+            return
+        await registry.mongo_db[f"{source_id}_records"].delete_many({
+            "_id": {"$lt": ObjectId.from_datetime(state.exported_at)},
+            "$or": [{"ingested_at": {"$lt": state.watermark}}, {"max_t": {"$lt": state.watermark}}],
+        })
+
+    # ---------------------------------------------------------
+    # Reading the cold tier
+    # ---------------------------------------------------------
+    async def cold_rows(
+        self,
+        cold: ParquetLake,
+        source_id: str,
+        watermark: datetime,
+        filters: Optional[Dict[str, Any]] = None,
+        ingested_from: Optional[datetime] = None,
+        ingested_to: Optional[datetime] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream cold rows (newest day first) as {"schema_version", "row"};
+        rows are keyed by column name, with extras flattened and
+        `ingested_at` restored. Only day files inside the window are read.
+        """
+        ingested_from, ingested_to = as_utc(ingested_from), as_utc(ingested_to)
+        hi = min(ingested_to, watermark) if ingested_to else watermark
+        keys = await cold.files(
+            source_id,
+            date_from=f"{ingested_from:%Y-%m-%d}" if ingested_from else None,
+            date_to=f"{hi - timedelta(microseconds=1):%Y-%m-%d}"
+        )
+        filters = {sanitize_column_name(k): v for k, v in (filters or {}).items()}
+
+        def prepare(row: Dict[str, Any]) -> Dict[str, Any]:
+            row = hybrid_layout.flatten(row)
+            row["ingested_at"] = row.pop(INGESTED_AT, None)
+            return row
+
+        for key in sorted(keys, key=key_date, reverse=True):
+            footer = await cold.read_footer(key)
+            version = cold.file_metadata(footer).get("schema_version")
+            async for row in cold.iter_rows([key], filters, ingested_from, hi, prepare=prepare):
+                yield {"schema_version": int(version) if version else None, "row": row}
+
+    # ---------------------------------------------------------
+    # Background loop
+    # ---------------------------------------------------------
+    async def sources(self, session: AsyncSession) -> List[str]:
+        if "*" not in self.policy:
+            return list(self.policy)
+        result = await session.execute(select(distinct(SourceFile.source_id)))
+        return [r[0] for r in result.all()]
+
+    async def run_tiering(self, registry, every_s: int):
+        """Background loop started from the app lifespan."""
+        while True:
+            await asyncio.sleep(every_s)
+            try:
+                async with registry.session_factory() as session:
+                    sources = await self.sources(session)
+                for source_id in sources:
+                    try:
+                        await self.tier(registry, source_id)
+                    except Exception as e:
+                        logger.error("Tiering failed", exc_info=e, source_id=source_id)
+            except Exception as e:
+                logger.error("Tiering failed", exc_info=e)
+
+
+# Shared manager — the lifespan loop, admin route and query router use it
+tiering = TieringManager(parse_policy(settings.TIERING_POLICY), batch_size=settings.MIGRATION_BATCH_SIZE)
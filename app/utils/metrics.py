@@ -0,0 +1,33 @@
+# app/utils/metrics.py
+"""Prometheus metrics (served at /metrics)"""
+from prometheus_client import Counter, Gauge, Histogram
+
+# Durable local spool (app/storage/spool.py)
+SPOOL_PENDING_BATCHES = Gauge(
+    "etl_spool_pending_batches",
+    "Sink writes waiting in the local spool for replay",
+    ["sink"]
+)
+SPOOL_PENDING_BYTES = Gauge(
+    "etl_spool_pending_bytes",
+    "Bytes of spool segments not yet replayed"
+)
+
+# NL → query translation prompts (app/core/query/llm_translator.py)
+NL_PROMPT_TOKENS = Histogram(
+    "etl_nl_prompt_tokens",
+    "Estimated tokens per translation prompt sent to the model",
+    ["target_db", "mode"],
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+)
+NL_PROMPT_FIELDS = Histogram(
+    "etl_nl_prompt_fields",
+    "Schema fields included in a translation prompt",
+    ["target_db"],
+    buckets=(5, 10, 20, 40, 80, 160, 320, 640)
+)
+NL_TRANSLATIONS = Counter(
+    "etl_nl_translations_total",
+    "Questions translated, by where the translation came from",
+    ["target_db", "origin"]         # origin: "cache" | "model"
+)
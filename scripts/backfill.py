@@ -0,0 +1,41 @@
+# scripts/backfill.py
+
+import argparse
+import asyncio
+import sys
+import os
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.models.database import init_db
+from app.core.etl.backfill import backfill_engine
+from app.storage.registry import ConnectionRegistry
+
+
+async def main(source_id: str):
+    await init_db()
+    registry = await ConnectionRegistry.open()
+    try:
+        async with registry.session_factory() as session:
+            job = await backfill_engine.start(session, source_id)
+        print(f"Backfill job {job.id}: source={source_id} generation={job.generation} "
+              f"resuming after file {job.last_file_id}")
+
+        await backfill_engine.run(registry, job.id)
+
+        async with registry.session_factory() as session:
+            job = await backfill_engine.get(session, job.id)
+        print(f"Backfill job {job.id}: {job.status} — {job.files_done}/{job.files_total} files, "
+              f"{job.records_written} records" + (f" ({job.error})" if job.error else ""))
+        return 0 if job.status == "done" else 1
+    finally:
+        await registry.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-derive a source's records from its archived files")
+    parser.add_argument("source_id")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.source_id)))
@@ -50,9 +50,10 @@ async def test_db(test_engine):
 
 @pytest.fixture
 async def client():
-    """Create test client"""
-    async with AsyncClient(app=app, base_url="http://test") as ac:
-        yield ac
+    """Create test client (runs the app lifespan, which opens the connection registry)"""
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            yield ac
 
 
 # tests/test_ingestion.py
@@ -44,3 +44,33 @@ async def test_schema_endpoint(client):
     schema = response.json()
     assert "fields" in schema
     assert len(schema["fields"]) > 0
+
+
+@pytest.mark.asyncio
+async def test_registry_shares_pooled_clients(tmp_path):
+    """Dependencies hand out the registry's clients instead of new ones"""
+    import redis.asyncio as aioredis
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from app.api.dependencies import get_pipeline, get_mongo
+    from app.models.database import engine, AsyncSessionLocal
+    from app.storage.object_store import LocalObjectStore
+    from app.storage.registry import ConnectionRegistry
+    from app.storage.s3_handler import S3Handler
+
+    # none of these clients connect until first use
+    registry = ConnectionRegistry(
+        engine,
+        AsyncSessionLocal,
+        AsyncIOMotorClient("mongodb://localhost:27017/etl_test_db", maxPoolSize=5),
+        aioredis.from_url("redis://localhost:6379/0"),
+        S3Handler(LocalObjectStore(str(tmp_path)))
+    )
+
+    first, second = get_pipeline(registry), get_pipeline(registry)
+    assert first.s3 is second.s3 is registry.s3
+    assert first.mongo.db.client is second.mongo.db.client is registry.mongo_client
+    assert get_mongo(registry).db.name == "etl_test_db"
+
+    registry.mongo_client.close()
+    await registry.redis.aclose()
+    await registry.s3.store.close()
@@ -0,0 +1,32 @@
+# tests/test_ingestion.py
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from app.core.etl.backfill import BackfillEngine, generation_table
+from app.core.etl.pipeline import derive_records
+from app.models.source_models import SourceFile
+from app.storage.object_store import LocalObjectStore
+from app.storage.s3_handler import S3Handler
+
+
+@pytest.mark.asyncio
+async def test_backfill_derives_archived_file_in_process_pool(tmp_path):
+    """Archived (compressed) files are streamed back and parsed in worker processes"""
+    text = "name: John\nage: 42\n\nname: Jane\nage: 37\n"
+    s3 = S3Handler(LocalObjectStore(str(tmp_path)), codec="gzip")
+    stored = await s3.upload_file("f1", text.encode(), "people.txt")
+    source_file = SourceFile(
+        id=1, source_id="people", filename="people.txt", file_type="text/plain",
+        storage_path=stored.storage_path, codec=stored.codec, original_size=stored.original_size
+    )
+
+    engine = BackfillEngine(workers=1, window=2)
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        records, schema = await engine._derive(s3, pool, asyncio.get_running_loop(), source_file)
+
+    assert (records, schema) == derive_records(text)
+    assert generation_table("people", 2) == "data_people__g2"
+    await s3.store.close()
@@ -75,3 +75,333 @@ async def test_schema_evolution(test_db):
     
     assert schema_v2.version == 2
     assert "Added fields: email" in schema_v2.migration_notes
+
+
+def test_migration_plan_and_alter_ddl():
+    """Only missing columns are added, in a single ALTER TABLE"""
+    from sqlalchemy.dialects import postgresql
+    from app.storage.postgres import migrations
+
+    current = {"id": "integer", "name": "string"}
+    desired = {"name": "string", "age": "integer", "score": "float"}
+
+    missing = migrations.plan(current, desired)
+    assert missing == {"age": "integer", "score": "float"}
+
+    ddl = migrations.build_add_columns("data_test", missing, postgresql.dialect())
+    assert ddl == (
+        'ALTER TABLE "data_test" '
+        'ADD COLUMN IF NOT EXISTS "age" INTEGER, '
+        'ADD COLUMN IF NOT EXISTS "score" FLOAT'
+    )
+
+
+@pytest.mark.asyncio
+async def test_migration_skips_ddl_when_catalog_current():
+    """A fully cached table never touches the database"""
+    from app.core.schema.migration import MigrationEngine
+    from app.storage.postgres import TYPE_MAP
+
+    engine = MigrationEngine(TYPE_MAP)
+    engine.catalog.set("data_test", {"id": "integer", "name": "string"})
+
+    # engine=None would blow up if any connection were opened
+    await engine.ensure_table(None, "data_test", {"name": "string"})
+
+
+def test_partitioned_table_ddl_and_partition_bounds():
+    """Partitioned tables key on ingested_at; partitions cover whole intervals"""
+    from datetime import datetime, timezone
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.schema import CreateTable
+    from app.storage.partitions import (
+        PARTITION_BY, build_create_partition, interval_start, parse_bound, shift
+    )
+    from app.storage.postgres import migrations
+
+    ddl = str(CreateTable(migrations.build_table("data_big", {"name": "string"}, PARTITION_BY))
+              .compile(dialect=postgresql.dialect()))
+    assert "PARTITION BY RANGE (ingested_at)" in ddl
+    assert "PRIMARY KEY (id, ingested_at)" in ddl
+
+    ts = datetime(2026, 12, 17, 15, 30, tzinfo=timezone.utc)
+    start = interval_start(ts, "month")
+    assert start == datetime(2026, 12, 1, tzinfo=timezone.utc)
+    assert shift(start, "month") == datetime(2027, 1, 1, tzinfo=timezone.utc)
+    assert shift(start, "month", -12) == datetime(2025, 12, 1, tzinfo=timezone.utc)
+    assert interval_start(ts, "week") == datetime(2026, 12, 14, tzinfo=timezone.utc)
+
+    assert build_create_partition("data_big", start, "month") == (
+        'CREATE TABLE IF NOT EXISTS "data_big_p20261201" PARTITION OF "data_big" '
+        "FOR VALUES FROM ('2026-12-01T00:00:00+00:00') TO ('2027-01-01T00:00:00+00:00')"
+    )
+    assert parse_bound(
+        "FOR VALUES FROM ('2026-12-01 00:00:00+00') TO ('2027-01-01 00:00:00+00')"
+    ) == (start, shift(start, "month"))
+    assert parse_bound("DEFAULT") is None
+
+
+def test_migration_logical_type_roundtrip():
+    """Reflected column types map back to canonical logical types"""
+    from sqlalchemy.dialects import postgresql
+    from app.storage.postgres import migrations
+
+    assert migrations.logical_type(postgresql.DOUBLE_PRECISION()) == "float"
+    assert migrations.logical_type(postgresql.VARCHAR()) == "string"
+    assert migrations.logical_type(postgresql.INTEGER()) == "integer"
+    assert migrations.canonical("date") == "string"
+
+
+def test_type_widening_lattice():
+    """integer → float → string, date → string, null widens to anything"""
+    from app.core.schema.generator import widen_type, merge_field_definitions
+
+    assert widen_type("integer", "float") == "float"
+    assert widen_type("float", "integer") == "float"
+    assert widen_type("integer", "string") == "string"
+    assert widen_type("date", "integer") == "string"
+    assert widen_type("null", "integer") == "integer"
+    assert widen_type("boolean", "boolean") == "boolean"
+
+    merged = merge_field_definitions(
+        {"age": {"type": "integer", "nullable": True}},
+        {"age": {"type": "float", "nullable": True}}
+    )
+    assert merged["age"]["type"] == "float"
+
+
+@pytest.mark.asyncio
+async def test_migration_plans_widening_and_routes_writes():
+    """Widened columns get a shadow column that new writes are routed to"""
+    from app.core.schema.migration import MigrationEngine
+    from app.storage.postgres import TYPE_MAP
+
+    engine = MigrationEngine(TYPE_MAP)
+    current = {"id": "integer", "age": "integer", "name": "string"}
+    desired = {"id": "string", "age": "float", "name": "date", "city": "null"}
+
+    assert engine.plan_widenings("data_test", current, desired) == {"age": ("integer", "float")}
+
+    # routes come from column_widenings, read once per insert transaction
+    from types import SimpleNamespace
+
+    class FakeResult:
+        def all(self):
+            return [SimpleNamespace(column="age", shadow=engine.shadow_name("age"))]
+
+    class FakeSession:
+        def __init__(self):
+            self.info = {}
+            self.statements = []
+            transaction = object()
+            self.sync_session = SimpleNamespace(get_transaction=lambda: transaction)
+
+        async def execute(self, statement, params=None):
+            self.statements.append(statement)
+            return FakeResult()
+
+    session = FakeSession()
+    routed = await engine.route_record(session, "data_test", {"age": 1.5, "name": "x"})
+    assert routed == {"age__widen": 1.5, "name": "x"}
+    assert "pg_advisory_xact_lock_shared" in str(session.statements[0])
+
+    again = await engine.route_record(session, "data_test", {"age": 2.5})
+    assert again == {"age__widen": 2.5}
+    assert len(session.statements) == 2
+    # another worker now owns the widening → not planned again here
+    assert engine.plan_widenings("data_test", current, desired) == {}
+
+
+def test_compile_projection_renames_defaults_and_coercions():
+    """Projection applies renames, defaults and type coercions column by column"""
+    from app.core.schema.versioning import compile_projection
+
+    v1 = {"name": {"type": "string"}, "age": {"type": "integer"}, "zip": {"type": "integer"}}
+    v2 = {
+        "full_name": {"type": "string", "renamed_from": "name"},
+        "age": {"type": "float"},
+        "zip": {"type": "string"},
+        "city": {"type": "string", "default": "unknown"},
+    }
+
+    project = compile_projection(v1, v2)
+    rows = project([{"name": "Ann", "age": 30, "zip": 12345}, {"name": "Bo"}])
+
+    assert rows[0] == {"full_name": "Ann", "age": 30.0, "zip": "12345", "city": "unknown"}
+    assert rows[1] == {"full_name": "Bo", "age": None, "zip": None, "city": "unknown"}
+    assert project([]) == []
+
+    # table rows carry both columns: the new name wins, the old one fills gaps
+    merged = {**v1, **v2}
+    rows = compile_projection(merged, v2)([{"full_name": "Cy", "name": "x"}, {"name": "Di"}])
+    assert [r["full_name"] for r in rows] == ["Cy", "Di"]
+
+
+@pytest.mark.asyncio
+async def test_projector_groups_documents_by_version():
+    """Documents from several versions come back in order, in the target shape"""
+    from app.core.schema.versioning import SchemaProjector
+
+    projector = SchemaProjector()
+    projector._schemas[("src", 1)] = {"age": {"type": "integer"}}
+    projector._schemas[("src", 2)] = {"age": {"type": "float"}, "city": {"type": "string"}}
+
+    docs = [
+        {"schema_version": 2, "record": {"age": 1.5, "city": "NYC"}},
+        {"schema_version": 1, "record": {"age": 3}},
+    ]
+
+    # every schema is cached, so no session is needed
+    out = await projector.project_documents(None, "src", docs, target_version=2)
+    assert out == [{"age": 1.5, "city": "NYC"}, {"age": 3.0, "city": None}]
+    assert ("src", 1, 2) in projector._projections
+
+
+def test_field_sketches_accuracy():
+    """HyperLogLog, t-digest and top-k stay close to exact answers"""
+    from app.core.schema.statistics import HyperLogLog, TDigest, TopK
+
+    hll = HyperLogLog()
+    for i in range(20000):
+        hll.add(f"user-{i % 5000}")
+    assert abs(hll.estimate() - 5000) / 5000 < 0.1
+
+    digest = TDigest()
+    for i in range(10001):
+        digest.add(float(i))
+    assert abs(digest.quantile(0.5) - 5000) < 150
+    assert abs(digest.quantile(0.99) - 9900) < 50
+
+    top = TopK(k=2)
+    for value in ["a"] * 50 + ["b"] * 30 + [f"x{i}" for i in range(200)]:
+        top.add(value)
+    assert [t["value"] for t in top.top()] == ["a", "b"]
+
+
+def test_source_stats_merge_and_roundtrip():
+    """Batches merge into stored state; fields absent from a batch count as null"""
+    from app.core.schema.statistics import SourceStats
+
+    stored = SourceStats()
+    stored.update([{"age": 30, "city": "NYC"}, {"age": 40, "city": None}])
+
+    batch = SourceStats()
+    batch.update([{"age": 20}, {"age": 50, "status": "new"}])
+
+    merged = SourceStats.from_dict(stored.to_dict())
+    merged.merge(batch)
+    summary = merged.summary()
+
+    assert merged.records == 4
+    assert summary["age"]["min"] == 20 and summary["age"]["max"] == 50
+    assert summary["city"]["null_count"] == 3
+    assert summary["status"]["count"] == 4 and summary["status"]["null_count"] == 3
+    assert summary["city"]["top_k"] == [{"value": "NYC", "count": 1}]
+
+
+def test_fill_absent_counts_untouched_fields_as_null():
+    """A field left alone by later batches reads as if they had merged nulls in"""
+    from app.core.schema.statistics import SourceStats, fill_absent
+
+    stored = SourceStats()
+    stored.update([{"age": 30, "city": "NYC"}, {"age": 40, "city": None}])
+    batch = SourceStats()
+    batch.update([{"age": 20}, {"age": 50}])
+
+    merged = SourceStats.from_dict(stored.to_dict())
+    merged.merge(batch)
+
+    city = fill_absent(stored.fields["city"].summary(), merged.records)
+    assert city["count"] == merged.fields["city"].count == 4
+    assert city["null_count"] == merged.fields["city"].null_count == 3
+    assert city["null_ratio"] == 0.75
+    assert fill_absent(city, 4) is city
+
+
+@pytest.mark.asyncio
+async def test_hybrid_promotion_is_recorded_before_the_column_exists(monkeypatch):
+    """A promoted field is recorded (shared with every worker) before its column is added"""
+    from types import SimpleNamespace
+    from sqlalchemy.dialects import postgresql
+    from app.storage import postgres
+    from app.storage.postgres import PostgresStorage
+
+    calls = []
+
+    async def columns(engine, table):
+        return {"id": "integer", "name": "string", "extras": "json"}
+
+    async def record_promotion(engine, table, promoted):
+        calls.append(("record", table, promoted))
+
+    async def ensure_table(engine, table, cols, partition_by=None, extras=False):
+        calls.append(("ensure", table, sorted(cols)))
+
+    monkeypatch.setattr(postgres.migrations, "columns", columns)
+    monkeypatch.setattr(postgres.migrations, "ensure_table", ensure_table)
+    monkeypatch.setattr(postgres.hybrid_layout, "record_promotion", record_promotion)
+    monkeypatch.setattr(postgres.hybrid_layout, "start_promotion", lambda engine, table: calls.append(("start", table)))
+
+    pg = PostgresStorage(None, SimpleNamespace(dialect=postgresql.dialect()))
+    summary = {"records": 1000, "fields": {"age": {"count": 1000, "null_count": 0}}}
+    await pg.create_table_for_schema(
+        "data_t", {"name": {"type": "string"}, "age": {"type": "integer"}}, hybrid=True, field_stats=summary
+    )
+    assert calls == [
+        ("record", "data_t", {"age": "INTEGER"}),
+        ("ensure", "data_t", ["age", "name"]),
+        ("start", "data_t"),
+    ]
+
+
+def test_hybrid_layout_promotes_dense_fields_and_filters_both_places():
+    """Dense fields get columns, the tail goes to extras, filters cover both"""
+    import json
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.schema import CreateIndex, CreateTable
+    from app.storage.hybrid import HybridLayout
+    from app.storage.postgres import migrations, sanitize_column_name
+
+    layout = HybridLayout(min_ratio=0.5, min_records=10)
+    schema = {
+        "name": {"type": "string"},
+        "note 7": {"type": "string"},
+        "meta": {"type": "json"},
+        "age": {"type": "integer"},
+    }
+    summary = {"records": 100, "fields": {
+        "name": {"count": 100, "null_count": 0},
+        "note 7": {"count": 100, "null_count": 98},
+        "meta": {"count": 100, "null_count": 0},
+        "age": {"count": 100, "null_count": 90},
+    }}
+    # "age" is sparse but already has a column → stays
+    chosen = layout.choose_columns(schema, summary, {"id", "age"}, sanitize_column_name)
+    assert set(chosen) == {"name", "age"}
+    assert layout.choose_columns(schema, {"records": 5, "fields": summary["fields"]}, set(),
+                                 sanitize_column_name) == {}
+
+    typed, extras = layout.split({"name": "Ann", "note_7": "x", "meta": {"a": 1}, "age": None},
+                                 {"id", "name", "age", "extras"})
+    assert typed == {"name": "Ann", "age": None}
+    assert extras == {"note_7": "x", "meta": {"a": 1}}
+
+    clauses, params = layout.build_filters(
+        {"name": "Ann", "note 7": "x", "age": 3}, {"id", "name", "age", "extras"},
+        sanitize_column_name, promoting={"age"}
+    )
+    assert clauses == [
+        '"name" = :p0',
+        '"extras" @> CAST(:p1_json AS JSONB)',
+        '("age" = :p2 OR "extras" @> CAST(:p2_json AS JSONB))',
+    ]
+    assert json.loads(params["p1_json"]) == {"note_7": "x"}
+
+    assert layout.flatten({"id": 1, "name": "Ann", "age": None, "extras": {"age": 3, "note_7": "x"}}) == \
+        {"id": 1, "name": "Ann", "age": 3, "note_7": "x"}
+
+    table = migrations.build_table("data_t", {"name": "string"}, extras=True)
+    ddl = str(CreateTable(table).compile(dialect=postgresql.dialect()))
+    assert "extras JSONB DEFAULT '{}'::jsonb NOT NULL" in ddl
+    index = str(CreateIndex(next(iter(table.indexes))).compile(dialect=postgresql.dialect()))
+    assert "USING gin (extras jsonb_path_ops)" in index
@@ -0,0 +1,616 @@
+# tests/test_storage.py
+import pytest
+
+from app.storage.object_store import LocalObjectStore, S3ObjectStore, iter_bytes, MIN_PART_SIZE
+from app.storage.s3_handler import S3Handler
+
+
+@pytest.mark.asyncio
+async def test_local_object_store_roundtrip(tmp_path):
+    """Streaming put, ranged reads, list and delete on the local backend"""
+    store = LocalObjectStore(str(tmp_path))
+    await store.ensure_bucket()
+
+    payload = bytes(range(256)) * 100
+    await store.put_stream("a/b.bin", iter_bytes(payload, 1000))
+
+    assert await store.get("a/b.bin") == payload
+    assert await store.get("a/b.bin", offset=10, length=20) == payload[10:30]
+    chunks = [c async for c in store.stream("a/b.bin", chunk_size=4096)]
+    assert len(chunks) > 1 and b"".join(chunks) == payload
+    assert await store.list("a/") == ["a/b.bin"]
+
+    with pytest.raises(ValueError):
+        await store.put("../escape", b"x")
+
+    await store.delete("a/b.bin")
+    assert await store.list() == []
+    await store.close()
+
+
+class FakeMinio:
+    """put_object(length=-1) as the SDK runs it: reads part_size parts until a short one."""
+
+    def __init__(self):
+        self.parts = []
+        self.calls = []
+
+    def put_object(self, bucket, key, data, length, content_type=None, part_size=0, num_parallel_uploads=3):
+        self.calls.append((key, length, part_size, num_parallel_uploads))
+        while True:
+            part = data.read(part_size)
+            self.parts.append(part)
+            if len(part) < part_size:
+                return
+
+
+@pytest.mark.asyncio
+async def test_s3_object_store_streams_through_put_object():
+    """Streams of unknown length go to the public put_object in part_size reads"""
+    client = FakeMinio()
+    store = S3ObjectStore(client, "raw", part_size=MIN_PART_SIZE, parallel_parts=2)
+
+    payload = b"x" * (MIN_PART_SIZE * 2 + 123)
+    await store.put_stream("big", iter_bytes(payload, 1024 * 1024))
+
+    assert client.calls == [("big", -1, MIN_PART_SIZE, 2)]
+    assert [len(p) for p in client.parts] == [MIN_PART_SIZE, MIN_PART_SIZE, 123]
+    assert b"".join(client.parts) == payload
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_s3_object_store_propagates_stream_errors():
+    """A failing source stream fails the SDK's read (which aborts the upload)"""
+    async def broken():
+        yield b"x" * 1024
+        raise RuntimeError("source failed")
+
+    store = S3ObjectStore(FakeMinio(), "raw", part_size=MIN_PART_SIZE)
+    with pytest.raises(RuntimeError):
+        await store.put_stream("big", broken())
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_s3_handler_upload_and_download(tmp_path):
+    handler = S3Handler(LocalObjectStore(str(tmp_path)), codec="none")
+    await handler.ensure_bucket()
+
+    stored = await handler.upload_file("f1", b"key: value", "note.txt")
+    assert stored.storage_path == "uploads/f1/note.txt"
+    assert await handler.download_file(stored.storage_path) == b"key: value"
+    await handler.store.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("codec", ["gzip", "zstd", "none"])
+async def test_s3_handler_compresses_and_streams_back(tmp_path, codec):
+    """Uploads are compressed on write and decompressed chunk by chunk on read"""
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+
+    handler = S3Handler(LocalObjectStore(str(tmp_path)), chunk_size=4096, codec=codec)
+    text = ("name: John\nage: 42\ncity: Paris\n" * 2000).encode()
+
+    stored = await handler.upload_file("f1", text, "people.txt")
+    assert stored.codec == (None if codec == "none" else codec)
+    assert stored.original_size == len(text)
+    if stored.codec:
+        assert stored.stored_size < len(text) // 8
+        assert stored.storage_path.endswith({"gzip": ".gz", "zstd": ".zst"}[codec])
+
+    chunks = [c async for c in handler.stream_file(stored.storage_path, stored.codec)]
+    assert b"".join(chunks) == text
+    # codec inferred from the key when the row predates codec tracking
+    assert await handler.download_file(stored.storage_path) == text
+    await handler.store.close()
+
+
+def test_bucket_layout_updates_query_and_unpack():
+    """Bucket upserts carry min/max summaries; reads prune on them and unpack records"""
+    from datetime import datetime, timezone
+    from app.storage.mongo_buckets import BucketLayout
+
+    layout = BucketLayout(size=3, window_s=3600)
+    t = datetime(2024, 5, 1, 10, 42, tzinfo=timezone.utc)
+    ops = layout.build_updates("s1", 2, [{"age": 30, "name": "b"}, {"age": 20, "a.b": 1}], t)
+
+    assert len(ops) == 2
+    flt, upd = ops[1]._filter, ops[1]._doc
+    assert flt == {
+        "source_id": "s1", "schema_version": 2,
+        "window_start": datetime(2024, 5, 1, 10, tzinfo=timezone.utc), "count": {"$lt": 3},
+    }
+    assert upd["$push"] == {"records": {"t": t, "r": {"age": 20, "a.b": 1}}}
+    assert upd["$min"] == {"min_t": t, "summary.age.min": 20}
+    assert upd["$max"]["summary.age.max"] == 20
+
+    query = layout.document_query({"age": 30}, ingested_from=t)
+    single, bucket = query["$or"]
+    assert single == {"record.age": 30, "ingested_at": {"$gte": t}}
+    assert bucket["summary.age.min"] == {"$lte": 30} and bucket["max_t"] == {"$gte": t}
+    assert layout.document_query() == {}
+
+    doc = {
+        "source_id": "s1", "schema_version": 2,
+        "records": [{"t": t, "r": {"age": 30}}, {"t": t, "r": {"age": 20}}],
+    }
+    assert [d["record"] for d in layout.unpack(doc, {"age": 30})] == [{"age": 30}]
+    assert [d["schema_version"] for d in layout.unpack(doc)] == [2, 2]
+    # Mongo returns naive UTC datetimes; aware bounds still compare
+    naive = {"records": [{"t": datetime(2024, 5, 1, 10, 30), "r": {"age": 1}}]}
+    assert len(list(layout.unpack(naive, ingested_from=datetime(2024, 5, 1, 10, tzinfo=timezone.utc)))) == 1
+    assert list(layout.unpack(naive, ingested_to=datetime(2024, 5, 1, 10, tzinfo=timezone.utc))) == []
+    # single-record documents pass through untouched
+    plain = {"schema_version": 1, "record": {"age": 1}}
+    assert list(layout.unpack(plain)) == [plain]
+
+
+@pytest.mark.asyncio
+async def test_parquet_lake_write_export_and_compact(tmp_path):
+    """Batches land as partitioned Parquet files, export streams one file, compaction merges"""
+    pa = pytest.importorskip("pyarrow")
+    import io
+    import pyarrow.parquet as pq
+    from datetime import datetime, timezone
+    from app.storage.lake import ParquetLake
+
+    lake = ParquetLake(LocalObjectStore(str(tmp_path)), owns_store=True, compact_min_files=3)
+    t = datetime(2024, 5, 1, 10, tzinfo=timezone.utc)
+    v1 = {"name": {"type": "string"}, "age": {"type": "integer"}}
+    v2 = {**v1, "score": {"type": "float"}}
+
+    await lake.write_batch("s1", 1, [{"name": "a", "age": 1}, {"name": "b", "age": "n/a"}], v1, t)
+    await lake.write_batch("s1", 1, [{"name": "c", "age": 3}], v1, t)
+    await lake.write_batch("s1", 2, [{"name": "d", "age": 4, "score": 0.5}], v2, t)
+
+    keys = await lake.files("s1")
+    assert len(keys) == 3 and all("/source=s1/date=2024-05-01/part-" in k for k in keys)
+    footer = await lake.read_footer(keys[0])
+    assert lake.file_metadata(footer)["schema_version"] in {"1", "2"}
+
+    body = b"".join([chunk async for chunk in lake.stream_export(keys)])
+    table = pq.read_table(pa.BufferReader(body))
+    assert table.num_rows == 4
+    assert sorted(table.column("name").to_pylist()) == ["a", "b", "c", "d"]
+    # int vs string "age" across files unifies to string; missing columns are null
+    assert table.schema.field("age").type == pa.string()
+    assert table.column("score").null_count == 3
+
+    limited = b"".join([chunk async for chunk in lake.stream_export(keys, limit=2)])
+    assert pq.read_table(io.BytesIO(limited)).num_rows == 2
+
+    # a replayed batch (same batch id) overwrites its file instead of adding one
+    await lake.write_batch("s1", 1, [{"name": "e", "age": 5}], v1, t, batch_id="b1")
+    await lake.write_batch("s1", 1, [{"name": "e", "age": 5}], v1, t, batch_id="b1")
+    extra, = [k for k in await lake.files("s1") if k.endswith("-b1.parquet")]
+    await lake.store.delete(extra)
+
+    # another worker holds the source's compaction lock → this one skips it
+    class _Owner:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def execute(self, stmt, params=None):
+            return type("Result", (), {"scalar": lambda _: False})()
+
+        async def commit(self):
+            pass
+
+    engine = type("Engine", (), {"connect": lambda _: _Owner()})()
+    assert await lake.compact("s1", engine) == 0 and len(await lake.files("s1")) == 3
+
+    # only the two version-1 files merge; the version-2 file stays a part file
+    assert await lake.compact("s1") == 2
+    keys = await lake.files("s1")
+    assert len(keys) == 2 and sum("/compact-" in k for k in keys) == 1
+    body = b"".join([chunk async for chunk in lake.stream_export(keys)])
+    assert pq.read_table(pa.BufferReader(body)).num_rows == 4
+    await lake.close()
+
+
+@pytest.mark.asyncio
+async def test_cold_tier_day_files_and_router_reads(tmp_path):
+    """Tiered day files stream back newest first, filtered, with extras flattened"""
+    pa = pytest.importorskip("pyarrow")
+    from datetime import datetime, timedelta, timezone
+    from app.storage.lake import COLD_PREFIX, INGESTED_AT, ParquetLake, records_to_table
+    from app.storage.tiering import TieringManager, day_key, parse_policy
+
+    assert parse_policy("events:30, *:90") == {"events": 30, "*": 90}
+    manager = TieringManager(parse_policy("events:30"))
+    assert manager.threshold_days("events") == 30 and manager.threshold_days("other") is None
+
+    watermark = datetime(2024, 5, 3, tzinfo=timezone.utc)
+    assert manager.needs_cold(watermark, None)
+    assert manager.needs_cold(watermark, datetime(2024, 5, 2))
+    assert not manager.needs_cold(watermark, datetime(2024, 5, 3, 1))
+    assert not manager.needs_cold(None, None)
+
+    cold = ParquetLake(LocalObjectStore(str(tmp_path)), owns_store=True, root=COLD_PREFIX)
+    schema = {"name": {"type": "string"}, "age": {"type": "integer"}, "extras": {"type": "jsonb"}}
+    arrow_schema = pa.schema([
+        pa.field("name", pa.string()), pa.field("age", pa.int64()), pa.field("extras", pa.string()),
+        pa.field(INGESTED_AT, pa.timestamp("us", tz="UTC")),
+    ], metadata={"schema_version": "3"})
+
+    for day, names in ((1, ["a", "b"]), (2, ["c"])):
+        ts = datetime(2024, 5, day, 12, tzinfo=timezone.utc)
+        rows = [{"name": n, "age": 30, "extras": {"city": "Paris"}} for n in names]
+
+        async def tables(rows=rows, ts=ts):
+            # two row groups per file, as the streaming export writes them
+            for chunk in (rows[:1], rows[1:]):
+                if chunk:
+                    yield records_to_table(chunk, schema, [ts] * len(chunk))
+
+        assert await cold.write_tables(day_key("events", ts), arrow_schema, tables()) == len(rows)
+
+    out = [r async for r in manager.cold_rows(cold, "events", watermark)]
+    assert [r["row"]["name"] for r in out] == ["c", "a", "b"]
+    assert out[0]["schema_version"] == 3
+    assert out[0]["row"]["city"] == "Paris" and "extras" not in out[0]["row"]
+    assert out[0]["row"]["ingested_at"] == datetime(2024, 5, 2, 12, tzinfo=timezone.utc)
+
+    # filters on extras fields, ingestion window prunes day files
+    out = [r async for r in manager.cold_rows(
+        cold, "events", watermark, {"city": "Paris"}, ingested_from=datetime(2024, 5, 2)
+    )]
+    assert [r["row"]["name"] for r in out] == ["c"]
+    out = [r async for r in manager.cold_rows(
+        cold, "events", watermark, ingested_to=datetime(2024, 5, 1, 23) + timedelta(hours=1)
+    )]
+    assert [r["row"]["name"] for r in out] == ["a", "b"]
+
+    # late rows below the watermark are merged into their day's file
+    class _Stream:
+        def mappings(self):
+            return self
+
+        async def partitions(self, n):
+            yield [{"id": 9, "name": "late", "age": 31, "score": 0.5,
+                    "ingested_at": datetime(2024, 5, 1, 18, tzinfo=timezone.utc)}]
+
+    class _Conn:
+        async def stream(self, stmt, params):
+            return _Stream()
+
+    day = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    existing = await cold.read_table(day_key("events", day))
+    columns = {"id": "integer", "name": "string", "age": "integer", "score": "float", "ingested_at": "datetime"}
+    assert await manager._export_day(
+        cold, _Conn(), "data_events", columns, "events", 4, day, day + timedelta(days=1), existing
+    ) == 1
+    out = [r async for r in manager.cold_rows(cold, "events", watermark, ingested_to=day + timedelta(days=1))]
+    assert [r["row"]["name"] for r in out] == ["a", "b", "late"]
+    assert out[0]["row"]["city"] == "Paris" and out[2]["row"]["score"] == 0.5
+    await cold.close()
+
+
+@pytest.mark.asyncio
+async def test_spool_replays_in_order_and_survives_restart(tmp_path):
+    """Spooled batches replay in order per sink; a down sink holds back only itself; torn tails are cut"""
+    import os
+    from datetime import datetime
+    from app.storage.spool import LocalSpool
+
+    spool = LocalSpool(str(tmp_path), segment_bytes=200)
+    ts = datetime(2024, 5, 1, 10, 30)
+    for i in range(4):
+        await spool.append("postgres", {"source_id": "s1", "n": i, "ingested_at": ts})
+    await spool.append("mongo", {"source_id": "s1", "n": 4, "ingested_at": ts})
+    assert spool.depth() == 5 and spool.depth("postgres") == 4
+    assert len([n for n in os.listdir(tmp_path) if n.startswith("seg-")]) > 1   # rolled over
+
+    seen = []
+
+    async def ok(batches):
+        seen.append([b["n"] for b in batches])
+
+    async def down(batches):
+        raise ConnectionError("sink down")
+
+    # postgres is down → its entries stay, mongo's still replay
+    with pytest.raises(ConnectionError):
+        await spool.replay_once({"postgres": down, "mongo": ok}, 100)
+    assert seen == [[4]] and spool.depth("postgres") == 4 and spool.depth("mongo") == 0
+
+    assert await spool.replay_once({"postgres": ok, "mongo": down}, 3) == 3
+    assert seen == [[4], [0, 1, 2]]
+    await spool.close()
+
+    # simulate a crash mid-append: half a frame at the tail
+    last = sorted(n for n in os.listdir(tmp_path) if n.startswith("seg-"))[-1]
+    with open(tmp_path / last, "ab") as fh:
+        fh.write(b"\x40\x00\x00\x00garbage")
+
+    # pending is known as soon as the spool opens, before any append
+    reopened = LocalSpool(str(tmp_path), segment_bytes=200)
+    await reopened.open()
+    assert reopened.depth() == 1 and reopened.depth("postgres") == 1
+    await reopened.append("mongo", {"source_id": "s1", "n": 5, "ingested_at": ts})
+    assert reopened.depth() == 2
+
+    batches = []
+
+    async def collect(b):
+        batches.extend(b)
+
+    assert await reopened.replay_once({"postgres": collect, "mongo": collect}, 100) == 2
+    assert sorted(b["n"] for b in batches) == [3, 5]
+    assert batches[0]["ingested_at"] == ts
+    assert reopened.depth() == 0
+    # replayed sealed segments are gone
+    assert len([n for n in os.listdir(tmp_path) if n.startswith("seg-")]) == 1
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_spool_shared_by_workers_replays_each_entry_once(tmp_path):
+    """Two spools on one directory (two workers) interleave appends safely; one replays at a time"""
+    from app.storage.spool import LocalSpool
+
+    a = LocalSpool(str(tmp_path), segment_bytes=150)
+    b = LocalSpool(str(tmp_path), segment_bytes=150)
+    for i in range(6):
+        await (a if i % 2 else b).append("postgres", {"source_id": "s1", "n": i})
+
+    await a.refresh()
+    assert a.depth("postgres") == 6
+
+    seen = []
+
+    async def write(batches):
+        seen.extend(x["n"] for x in batches)
+        # the other worker tries meanwhile: the replay lock is taken
+        assert await b.replay_once({"postgres": write}, 100) == 0
+
+    assert await a.replay_once({"postgres": write}, 100) == 6
+    assert seen == [0, 1, 2, 3, 4, 5]
+    assert await b.replay_once({"postgres": write}, 100) == 0
+    assert b.depth() == 0
+    await a.close()
+    await b.close()
+
+
+class _FakeRedis:
+    """Just the commands QueryResultCache uses (strings, sorted set, hash)"""
+
+    def __init__(self):
+        self.kv, self.zsets, self.hashes = {}, {}, {}
+
+    async def get(self, key):
+        return self.kv.get(key)
+
+    async def mget(self, *keys):
+        return [self.kv.get(k) for k in keys]
+
+    async def set(self, key, value, ex=None):
+        self.kv[key] = str(value)
+
+    async def incr(self, key):
+        return await self.incrby(key, 1)
+
+    async def incrby(self, key, n):
+        self.kv[key] = str(int(self.kv.get(key, 0)) + n)
+        return int(self.kv[key])
+
+    async def decrby(self, key, n):
+        return await self.incrby(key, -n)
+
+    async def delete(self, *keys):
+        for k in keys:
+            self.kv.pop(k, None)
+
+    async def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    async def zrange(self, key, start, stop):
+        ordered = sorted(self.zsets.get(key, {}), key=self.zsets[key].get) if key in self.zsets else []
+        return ordered[start:stop + 1]
+
+    async def zrem(self, key, *members):
+        for m in members:
+            self.zsets.get(key, {}).pop(m, None)
+
+    async def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = str(value)
+
+    async def hmget(self, key, fields):
+        return [self.hashes.get(key, {}).get(f) for f in fields]
+
+    async def hdel(self, key, *fields):
+        for f in fields:
+            self.hashes.get(key, {}).pop(f, None)
+
+    def pipeline(self, transaction=True):
+        redis, calls = self, []
+
+        class Pipe:
+            def __getattr__(self, name):
+                return lambda *a, **kw: calls.append((name, a, kw))
+
+            async def execute(self):
+                return [await getattr(redis, n)(*a, **kw) for n, a, kw in calls]
+
+        return Pipe()
+
+
+@pytest.mark.asyncio
+async def test_query_cache_keys_compression_and_lru_budget():
+    """Writes move keys on; large values are compressed; the source budget evicts LRU entries"""
+    import asyncio
+    from app.storage.redis_cache import QueryResultCache, decode_value, encode_value, normalize_request
+
+    a = {"source": "s1", "fields": ["b", "a"], "filters": {"y": 1, "x": 2}, "limit": 10}
+    b = {"source": "s1", "fields": ["a", "b", "a"], "filters": {"x": 2, "y": 1}, "limit": 10}
+    assert normalize_request(a, "postgresql") == normalize_request(b, "postgresql")
+    assert normalize_request(a, "postgresql") != normalize_request(a, "mongodb")
+
+    big = {"records": [{"name": "x" * 10, "n": i} for i in range(500)]}
+    assert encode_value(big, 1024).startswith("z:") and decode_value(encode_value(big, 1024)) == big
+    assert encode_value({"a": 1}, 1024).startswith("j:")
+
+    redis = _FakeRedis()
+    cache = QueryResultCache(budget_bytes=200, compress_over=10_000)
+    key = await cache.key(redis, "s1", a, "postgresql")
+    assert await cache.key(redis, "s1", b, "postgresql") == key
+
+    await cache.set(redis, "s1", key, {"count": 1, "records": [{"a": 1}]})
+    assert await cache.get(redis, "s1", key) == {"count": 1, "records": [{"a": 1}]}
+
+    # a write bumps the watermark → new key, old entry simply unreachable
+    await cache.bump(redis, "s1", schema_version=2)
+    moved = await cache.key(redis, "s1", a, "postgresql")
+    assert moved != key and moved.endswith(":v2:w1")
+    assert await cache.get(redis, "s1", moved) is None
+
+    # LRU: touching `key` keeps it; the least recently used entries go first
+    keys = [f"k{i}" for i in range(4)]
+    for k in keys:
+        await cache.set(redis, "s1", k, {"v": "y" * 30})
+        await asyncio.sleep(0.001)
+    await cache.get(redis, "s1", key)
+    await cache.set(redis, "s1", "k4", {"v": "y" * 30})
+    assert await cache.get(redis, "s1", key) is not None
+    assert await cache.get(redis, "s1", "k0") is None
+    assert int(redis.kv["qc:lru:s1:bytes"]) <= 200
+
+
+@pytest.mark.asyncio
+async def test_query_cache_hit_answers_like_a_miss():
+    """Driver types (Decimal, bytes, datetimes) come back from the cache as the uncached response has them"""
+    from datetime import datetime
+    from decimal import Decimal
+    from app.core.query.result_normalizer import render
+    from app.storage.redis_cache import QueryResultCache
+
+    payload = {"count": 1, "records": [
+        {"amount": Decimal("12.50"), "n": Decimal("3"), "b": b"\x00", "at": datetime(2024, 5, 1, 10, 30)}
+    ]}
+    miss = render(payload).body
+
+    for compress_over in (10_000, 10):
+        cache = QueryResultCache(compress_over=compress_over)
+        redis = _FakeRedis()
+        await cache.set(redis, "s1", "k", payload)
+        assert render(await cache.get(redis, "s1", "k")).body == miss
+    assert b'"amount":12.5,"n":3,"b":"AA=="' in miss
+
+
+@pytest.mark.asyncio
+async def test_keyset_pages_resume_inside_buckets():
+    """page_after resumes after (_id, entry); appends to passed buckets still show up; cursors round-trip"""
+    from datetime import datetime, timezone
+    from bson import ObjectId
+    from app.core.query.pagination import PageCursor, decode_cursor, encode_cursor
+    from app.storage.mongo_buckets import bucket_layout
+    from app.storage.mongodb import MongoDBStorage
+
+    t = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    ids = [ObjectId() for _ in range(4)]
+    docs = [
+        {"_id": ids[0], "schema_version": 1, "ingested_at": t, "record": {"n": 0}},
+        # an open bucket of the current window
+        {"_id": ids[1], "schema_version": 1, "count": 2, "window_start": bucket_layout.window_start(datetime.now(timezone.utc)),
+         "records": [{"t": t, "r": {"n": i}} for i in (1, 2)]},
+        {"_id": ids[2], "schema_version": 2, "ingested_at": t, "record": {"n": 3}},
+        {"_id": ids[3], "schema_version": 2, "ingested_at": t, "record": {"n": 4}},
+    ]
+
+    class _Cursor:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def sort(self, key, direction):
+            self.rows = sorted(self.rows, key=lambda d: d[key], reverse=direction < 0)
+            return self
+
+        async def __aiter__(self):
+            for row in self.rows:
+                yield row
+
+    class _Collection:
+        def find(self, query):
+            bound = query.get("_id", {})
+            def keep(d):
+                return all(
+                    d["_id"] in v if op == "$in" else d["_id"] > v if op == "$gt" else d["_id"] >= v
+                    for op, v in bound.items()
+                )
+            return _Cursor([d for d in docs if keep(d)])
+
+    mongo = MongoDBStorage({"s_records": _Collection()})
+    pages, after, open_buckets = [], None, None
+    while True:
+        page, resume = await mongo.page_after("s_records", after, 2, open_buckets=open_buckets)
+        pages.append([doc["record"]["n"] for doc in page])
+        if resume is None:
+            break
+        after, open_buckets = resume
+        if len(pages) == 2:
+            # the scan moved past the bucket; a record appended to it leads the next page
+            assert open_buckets == {str(ids[1]): 2}
+            docs[1]["records"].append({"t": t, "r": {"n": 2.5}})
+            docs[1]["count"] = 3
+    assert pages == [[0, 1], [2, 3], [2.5, 4]]
+
+    # below the tiering watermark → skipped, bucket positions unchanged
+    docs[1]["records"][1]["t"] = datetime(2024, 5, 2)   # naive, as Mongo returns it
+    hot, resume = await mongo.page_after("s_records", None, 10, ingested_from=datetime(2024, 5, 2, tzinfo=timezone.utc))
+    assert [doc["record"]["n"] for doc in hot] == [2] and resume is None
+
+    token = encode_cursor(PageCursor("mongodb", str(ids[1]), 2, 3, {str(ids[0]): 4}))
+    assert decode_cursor(token, "mongodb") == PageCursor("mongodb", str(ids[1]), 2, 3, {str(ids[0]): 4})
+    with pytest.raises(ValueError):
+        decode_cursor(token, "postgresql")
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor", "mongodb")
+
+
+@pytest.mark.asyncio
+async def test_streaming_export_encoders():
+    """NDJSON/CSV/Arrow encoders stream batch by batch; CSV header and Arrow schema cover all fields"""
+    pa = pytest.importorskip("pyarrow")
+    from datetime import datetime, timezone
+    from app.api.routes.records import _batches, _csv_chunks, _ndjson_chunks
+    from app.storage.lake import INGESTED_AT, export_schema, stream_ipc
+
+    t = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    schema = {"name": {"type": "string"}, "age": {"type": "integer"}, "ok": {"type": "boolean"}, "tags": {"type": "json"}}
+    docs = [
+        {"ingested_at": t, "record": {"name": "a", "age": 1}},
+        {"ingested_at": t, "record": {"name": "b", "age": "n/a", "ok": True, "tags": ["x"]}},
+        {"ingested_at": t, "record": {"name": "c"}},
+    ]
+
+    async def documents():
+        for d in docs:
+            yield d
+
+    async def records():
+        for d in docs:
+            yield d["record"]
+
+    ndjson = [chunk async for chunk in _ndjson_chunks(records(), batch=2)]
+    assert len(ndjson) == 2 and "".join(ndjson).count("\n") == 3
+
+    csv_text = "".join([chunk async for chunk in _csv_chunks(records(), list(schema), batch=2)])
+    lines = csv_text.splitlines()
+    # the header comes from the schema, not the first record
+    assert lines[0] == "name,age,ok,tags"
+    assert lines[2] == 'b,n/a,True,"[""x""]"'
+
+    body = b"".join([chunk async for chunk in stream_ipc(_batches(documents(), batch=2), export_schema(schema))])
+    table = pa.ipc.open_stream(body).read_all()
+    assert table.num_rows == 3
+    assert table.schema.field("age").type == pa.int64()
+    assert table.schema.field("ok").type == pa.bool_()
+    # values that do not fit the declared type become null
+    assert table.column("age").to_pylist() == [1, None, None]
+    assert table.column("tags").to_pylist() == [None, '["x"]', None]
+    assert table.column(INGESTED_AT).to_pylist()[0] == t